@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления индексов на горячие колонки поиска
+
+Индексы совпадают по именам с объявленными в моделях, поэтому на новой БД
+(db.create_all()) и на старой (эта миграция) схема получается одинаковой.
+Работает на SQLite и PostgreSQL (CREATE INDEX IF NOT EXISTS);
+на PostgreSQL индексы строятся CONCURRENTLY, без блокировки записи в таблицы.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.core import get_db
+
+# (имя индекса, таблица, колонки)
+HOT_PATH_INDEXES = [
+    ('ix_payment_user_id_created_at', 'payment', ['user_id', 'created_at']),
+    ('ix_payment_status_created_at', 'payment', ['status', 'created_at']),
+    ('ix_payment_created_at', 'payment', ['created_at']),
+    ('ix_payment_payment_system_id', 'payment', ['payment_system_id']),
+    ('ix_user_referrer_id', 'user', ['referrer_id']),
+    ('ix_user_remnawave_uuid', 'user', ['remnawave_uuid']),
+    ('ix_user_role', 'user', ['role']),
+    ('ix_ticket_user_id_created_at', 'ticket', ['user_id', 'created_at']),
+    ('ix_ticket_message_ticket_id_created_at', 'ticket_message', ['ticket_id', 'created_at']),
+    ('ix_ticket_message_sender_id', 'ticket_message', ['sender_id']),
+    ('ix_casino_game_user_id_created_at', 'casino_game', ['user_id', 'created_at']),
+]
+
+
+def add_hot_path_indexes():
+    """Создать отсутствующие индексы"""
+    from sqlalchemy import inspect, text
+
+    db = get_db()
+    inspector = inspect(db.engine)
+    tables = inspector.get_table_names()
+    is_postgres = db.engine.dialect.name == 'postgresql'
+
+    created = []
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, table, columns in HOT_PATH_INDEXES:
+            if table not in tables:
+                continue
+            existing = {ix['name'] for ix in inspector.get_indexes(table)}
+            if name in existing:
+                continue
+
+            cols = ', '.join(f'"{c}"' for c in columns)
+            concurrently = 'CONCURRENTLY ' if is_postgres else ''
+            conn.execute(text(f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON "{table}" ({cols})'))
+            created.append(name)
+
+    if created:
+        print(f"✅ Созданы индексы: {', '.join(created)}")
+    else:
+        print("ℹ️  Все индексы уже существуют")
+    return created
+
+
+if __name__ == '__main__':
+    # То же приложение, что при запуске сервера (см. run_schema_migrations._create_app)
+    from app import app
+
+    with app.app_context():
+        try:
+            add_hot_path_indexes()
+        except Exception as e:
+            print(f"❌ Ошибка при создании индексов: {e}")
+            raise
@@ -15,8 +15,9 @@ StealthNET Admin Panel - Main Application
   - bot/              - Telegram бот интеграция
 """
 
-from flask import Flask, send_from_directory, request, jsonify
+from flask import Flask, request, jsonify
 import os
+import threading
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
@@ -36,7 +37,7 @@ db = get_db()
 # ИМПОРТ МОДЕЛЕЙ (для db.create_all())
 # ============================================================================
 from modules.models.user import User
-from modules.models.payment import Payment, PaymentSetting
+from modules.models.payment import Payment, PaymentSetting, DailyRevenue
 from modules.models.tariff import Tariff
 from modules.models.promo import PromoCode
 from modules.models.ticket import Ticket, TicketMessage
@@ -48,6 +49,10 @@ from modules.models.currency import CurrencyRate
 from modules.models.tariff_feature import TariffFeatureSetting
 from modules.models.auto_broadcast import AutoBroadcastMessage, AutoBroadcastSettings
 from modules.models.casino import CasinoGame, CasinoStats
+from modules.models.remnawave_user import RemnaWaveUserState
+from modules.models.broadcast import BroadcastJob, BroadcastRecipient
+from modules.models.schema_version import SchemaVersion
+from modules.models.payment_job import PaymentFulfilmentJob
 
 # ============================================================================
 # ИМПОРТ API МАРШРУТОВ
@@ -66,32 +71,23 @@ from modules.api.bot import routes as bot_routes
 # ADMIN PANEL - Отдача статических файлов админки
 # ============================================================================
 
+# Корни статики ищутся один раз и сканируются в манифест (modules/static_assets.py)
+from modules.static_assets import serve_static, find_asset, asset_response, load_static_manifests
+
+def _static_cors_preflight():
+    response = jsonify({})
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+    response.headers.add('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
+    return response
+
 @app.route('/payment-success.html')
 def payment_success():
     """Страница успешной оплаты с автоматическим редиректом в Telegram"""
-    # Пробуем найти payment-success.html в разных местах
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    possible_paths = [
-        # Docker путь (приоритет)
-        '/app/frontend/build/miniapp-v2/payment-success.html',
-        '/app/frontend/build/miniapp/payment-success.html',
-        # Относительные и универсальные пути через BASE_DIR 🔹
-        os.path.join(base_dir, 'frontend', 'build', 'miniapp-v2', 'payment-success.html'),
-        os.path.join(base_dir, 'frontend', 'build', 'miniapp', 'payment-success.html'),
-        os.path.join(base_dir, 'admin-panel', 'miniapp-v2', 'payment-success.html'),
-        os.path.join(base_dir, 'admin-panel', 'miniapp', 'payment-success.html'),
-        os.path.join(base_dir, 'admin-panel', 'payment-success.html')
-    ]
-
-    for path in possible_paths:
-        if os.path.exists(path):
-            dir_path = os.path.dirname(path)
-            file_name = os.path.basename(path)
-            response = send_from_directory(dir_path, file_name)
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            return response
+    for root_name in ('miniapp_v2', 'miniapp', 'admin'):
+        asset = find_asset(root_name, 'payment-success.html')
+        if asset:
+            return asset_response(asset)
 
     # Если не найдено, возвращаем 404
     return jsonify({"error": "payment-success.html not found"}), 404
@@ -102,77 +98,14 @@ def miniapp_v2_static(path):
     """Отдача статических файлов miniapp-v2 (новая версия)"""
     # Обработка CORS preflight
     if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
-        return response
-
-    def get_miniapp_v2_path():
-        """Получить путь к папке miniapp-v2"""
-        miniapp_path = os.getenv("MINIAPP_V2_PATH", "").strip()
-        if miniapp_path and os.path.exists(miniapp_path):
-            index_path = os.path.join(miniapp_path, 'index.html')
-            if os.path.exists(index_path):
-                return miniapp_path
-
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-
-        # Стандартные пути (в порядке приоритета) 🔹
-        possible_paths = [
-            '/app/frontend/build/miniapp-v2',  # Docker
-            os.path.join(base_dir, 'frontend', 'build', 'miniapp-v2'),
-            os.path.join(base_dir, 'admin-panel', 'miniapp-v2'),
-            os.path.join(base_dir, 'admin-panel', 'build', 'miniapp-v2')
-        ]
-
-        for p in possible_paths:
-            if os.path.exists(p) and os.path.exists(os.path.join(p, 'index.html')):
-                return p
-
-        return None
+        return _static_cors_preflight()
 
-    miniapp_dir = get_miniapp_v2_path()
-
-    if not miniapp_dir:
+    # Файл из сборки, иначе index.html (для SPA)
+    response = serve_static('miniapp_v2', path)
+    if response is None:
         from flask import abort
         abort(404)
-
-    # Если путь пустой или заканчивается на /, отдаем index.html
-    if not path or path.endswith('/'):
-        index_path = os.path.join(miniapp_dir, 'index.html')
-        if os.path.exists(index_path):
-            response = send_from_directory(miniapp_dir, 'index.html')
-            # Отключаем кэширование для index.html
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            return response
-        return jsonify({"error": "index.html not found"}), 404
-
-    # Безопасность: проверяем, что путь не выходит за пределы директории
-    file_path = os.path.join(miniapp_dir, path)
-    if not os.path.abspath(file_path).startswith(os.path.abspath(miniapp_dir)):
-        return jsonify({"error": "Invalid path"}), 403
-
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        response = send_from_directory(miniapp_dir, path)
-        if path.endswith('.html'):
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-        return response
-
-    # Если файл не найден, отдаем index.html (для SPA)
-    index_path = os.path.join(miniapp_dir, 'index.html')
-    if os.path.exists(index_path):
-        response = send_from_directory(miniapp_dir, 'index.html')
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-
-    return jsonify({"error": "File not found"}), 404
+    return response
 
 @app.route('/miniapp/', defaults={'path': ''}, methods=['GET', 'HEAD', 'POST', 'OPTIONS'])
 @app.route('/miniapp/<path:path>', methods=['GET', 'HEAD', 'POST', 'OPTIONS'])
@@ -180,64 +113,24 @@ def miniapp_static(path):
     """Отдача статических файлов miniapp"""
     # Обработка CORS preflight
     if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
-        return response
-
-    def get_miniapp_path():
-        """Получить путь к папке miniapp"""
-        miniapp_path = os.getenv("MINIAPP_PATH", "").strip()
-        if miniapp_path and os.path.exists(miniapp_path):
-            index_path = os.path.join(miniapp_path, 'index.html')
-            if os.path.exists(index_path):
-                return miniapp_path
-
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-
-        # Стандартные пути (в порядке приоритета) 🔹
-        possible_paths = [
-            '/app/frontend/build/miniapp',  # Docker
-            os.path.join(base_dir, 'frontend', 'build/miniapp'),
-            os.path.join(base_dir, 'admin-panel', 'miniapp'),
-            os.path.join(base_dir, 'admin-panel', 'build', 'miniapp'),
-            os.path.join(base_dir, 'miniapp')
-        ]
-
-        for p in possible_paths:
-            if os.path.exists(p) and os.path.exists(os.path.join(p, 'index.html')):
-                return p
+        return _static_cors_preflight()
 
-        return None
-
-    miniapp_dir = get_miniapp_path()
-
-    if not miniapp_dir:
+    # Файл из сборки, иначе index.html (для SPA)
+    response = serve_static('miniapp', path)
+    if response is None:
         from flask import abort
         abort(404)
+    return response
 
-    # Если путь пустой или заканчивается на /, отдаем index.html
-    if not path or path.endswith('/'):
-        index_path = os.path.join(miniapp_dir, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(miniapp_dir, 'index.html')
-        return jsonify({"error": "index.html not found"}), 404
-
-    # Безопасность: проверяем, что путь не выходит за пределы директории
-    file_path = os.path.join(miniapp_dir, path)
-    if not os.path.abspath(file_path).startswith(os.path.abspath(miniapp_dir)):
-        return jsonify({"error": "Invalid path"}), 403
-
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return send_from_directory(miniapp_dir, path)
-
-    # Если файл не найден, отдаем index.html (для SPA)
-    index_path = os.path.join(miniapp_dir, 'index.html')
-    if os.path.exists(index_path):
-        return send_from_directory(miniapp_dir, 'index.html')
+def serve_build_static(filename):
+    """/static/* сборки админки (файлы с хешем в имени кешируются как immutable)"""
+    response = serve_static('admin', f'static/{filename}', spa_fallback=False)
+    if response is None:
+        from flask import abort
+        abort(404)
+    return response
 
-    return jsonify({"error": "File not found"}), 404
+app.view_functions['static'] = serve_build_static
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -251,31 +144,24 @@ def serve_admin_panel(path):
         from flask import abort
         abort(404)
 
-    # Пробуем найти admin-panel или frontend/build 🔹
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    admin_panel_dir = None
-
-    # Сначала пробуем frontend/build (для Docker)
-    frontend_build = os.path.join(base_dir, 'frontend', 'build')
-    if os.path.exists(frontend_build) and os.path.exists(os.path.join(frontend_build, 'index.html')):
-        admin_panel_dir = frontend_build
-    else:
-        # Fallback на admin-panel/build
-        admin_panel_dir = os.path.join(base_dir, 'admin-panel', 'build')
-
-    # Если запрашивается конкретный файл
-    if path and os.path.exists(os.path.join(admin_panel_dir, path)):
-        return send_from_directory(admin_panel_dir, path)
-
-    # Для всех остальных запросов (React Router) отдаем index.html
-    return send_from_directory(admin_panel_dir, 'index.html')
+    # Файл из сборки, для остальных запросов (React Router) - index.html
+    response = serve_static('admin', path)
+    if response is None:
+        from flask import abort
+        abort(404)
+    return response
 
 # ============================================================================
 # ПЛАНИРОВЩИК АВТОМАТИЧЕСКОЙ РАССЫЛКИ
 # ============================================================================
 
+# Как часто процесс с планировщиком сверяет настройки рассылки (их могли сохранить в другом воркере)
+BROADCAST_SCHEDULE_CHECK_INTERVAL = int(os.getenv('BROADCAST_SCHEDULE_CHECK_INTERVAL', '30'))
+
 # Глобальная переменная для планировщика
 _scheduler = None
+_broadcast_schedule = None  # настройки, по которым созданы задачи рассылки
+_broadcast_schedule_lock = threading.Lock()
 
 def get_broadcast_settings():
     """Получить настройки автоматической рассылки из БД или переменных окружения"""
@@ -297,74 +183,225 @@ def get_broadcast_settings():
         'hours': os.getenv('AUTO_BROADCAST_HOURS', '9,14,19')
     }
 
+from modules.settings_registry import SettingsSnapshot, register_settings, get_settings, invalidate_settings
+register_settings('auto_broadcast', lambda: SettingsSnapshot(get_broadcast_settings()))
+
+def schedule_broadcast_jobs(settings):
+    """Пересоздать задачи автоматической рассылки по настройкам {'enabled', 'hours'}"""
+    global _broadcast_schedule
+    from apscheduler.triggers.cron import CronTrigger
+
+    with _broadcast_schedule_lock:
+        for job in _scheduler.get_jobs():
+            if job.id.startswith('auto_broadcast_'):
+                job.remove()
+
+        if settings['enabled']:
+            # Парсим часы
+            hours = [int(h.strip()) for h in settings['hours'].split(',')]
+
+            for hour in hours:
+                _scheduler.add_job(
+                    func=run_auto_broadcasts_job,
+                    trigger=CronTrigger(hour=hour, minute=0),
+                    id=f'auto_broadcast_{hour}',
+                    name=f'Auto Broadcast at {hour}:00',
+                    max_instances=1,
+                    coalesce=True,
+                    replace_existing=True
+                )
+            app.logger.info(f"📅 Планировщик автоматической рассылки: {settings['hours']}:00")
+        else:
+            app.logger.info("📅 Автоматическая рассылка отключена")
+
+        _broadcast_schedule = dict(settings)
+
+def run_broadcast_schedule_sync_job():
+    """Подхватить настройки рассылки, сохраненные в другом процессе"""
+    try:
+        settings = get_settings('auto_broadcast').to_dict()
+        if settings != _broadcast_schedule:
+            schedule_broadcast_jobs(settings)
+    except Exception as e:
+        app.logger.error(f"❌ Ошибка обновления расписания рассылки: {e}")
+
 def run_auto_broadcasts_job():
     """Задача для автоматической рассылки"""
     try:
-        with app.app_context():
-            from send_auto_broadcasts import send_auto_broadcasts
-            app.logger.info("📬 Запуск автоматической рассылки...")
-            send_auto_broadcasts()
-            app.logger.info("✅ Автоматическая рассылка завершена")
+        from send_auto_broadcasts import send_auto_broadcasts
+        app.logger.info("📬 Запуск автоматической рассылки...")
+        stats = send_auto_broadcasts(app)
+        if stats is not None:
+            app.logger.info(f"✅ Автоматическая рассылка завершена: {stats}")
     except Exception as e:
         app.logger.error(f"❌ Ошибка автоматической рассылки: {e}")
 
+def run_remnawave_sync_job():
+    """Задача синхронизации зеркала пользователей RemnaWave"""
+    try:
+        with app.app_context():
+            from modules.remnawave_mirror import sync_remnawave_users
+            sync_remnawave_users()
+    except Exception as e:
+        app.logger.error(f"❌ Ошибка синхронизации пользователей RemnaWave: {e}")
+
+def run_payment_fulfilment_job():
+    """Задача очереди выдачи заказов: повторы и прерванные задачи"""
+    try:
+        with app.app_context():
+            from modules.payment_fulfilment import process_due_fulfilment_jobs
+            process_due_fulfilment_jobs()
+    except Exception as e:
+        app.logger.error(f"❌ Ошибка очереди выдачи заказов: {e}")
+
+def run_payment_reconcile_job():
+    """Задача сверки ожидающих платежей с платёжными системами"""
+    try:
+        with app.app_context():
+            from modules.payment_reconciler import reconcile_pending_payments
+            reconcile_pending_payments()
+    except Exception as e:
+        app.logger.error(f"❌ Ошибка сверки платежей: {e}")
+
+def run_broadcast_resume_job():
+    """Задача продолжения ручных рассылок без действующей аренды"""
+    try:
+        from modules.broadcast_queue import resume_broadcast_jobs
+        resume_broadcast_jobs()
+    except Exception as e:
+        app.logger.error(f"❌ Ошибка продолжения рассылок: {e}")
+
 def start_scheduler():
-    """Запустить планировщик автоматической рассылки"""
+    """Запустить планировщик (синхронизация RemnaWave, автоматическая рассылка, выдача и сверка заказов)"""
     global _scheduler
 
     try:
         from apscheduler.schedulers.background import BackgroundScheduler
-        from apscheduler.triggers.cron import CronTrigger
+        from apscheduler.triggers.interval import IntervalTrigger
+        from datetime import datetime
+        from modules.remnawave_mirror import SYNC_INTERVAL
         import atexit
 
-        settings = get_broadcast_settings()
-
-        if not settings['enabled']:
-            app.logger.info("📅 Автоматическая рассылка отключена")
-            return
-
         _scheduler = BackgroundScheduler(daemon=True)
 
-        # Парсим часы
-        hours = [int(h.strip()) for h in settings['hours'].split(',')]
+        # Синхронизация зеркала RemnaWave работает всегда (первый запуск сразу)
+        if SYNC_INTERVAL > 0:
+            _scheduler.add_job(
+                func=run_remnawave_sync_job,
+                trigger=IntervalTrigger(seconds=SYNC_INTERVAL),
+                id='remnawave_sync',
+                name='RemnaWave users sync',
+                next_run_time=datetime.now(),
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
 
-        for hour in hours:
+        schedule_broadcast_jobs(get_settings('auto_broadcast').to_dict())
+
+        # Настройки рассылки могут сохранить в другом воркере - сверяем их периодически
+        _scheduler.add_job(
+            func=run_broadcast_schedule_sync_job,
+            trigger=IntervalTrigger(seconds=BROADCAST_SCHEDULE_CHECK_INTERVAL),
+            id='broadcast_schedule_sync',
+            name='Auto Broadcast schedule sync',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+        # Повторы выдачи оплаченных заказов (первый запуск сразу - задачи, прерванные перезапуском)
+        from modules.payment_fulfilment import FULFILMENT_POLL_INTERVAL
+        _scheduler.add_job(
+            func=run_payment_fulfilment_job,
+            trigger=IntervalTrigger(seconds=FULFILMENT_POLL_INTERVAL),
+            id='payment_fulfilment',
+            name='Payment fulfilment retries',
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+        # Сверка платежей PENDING с API платёжных систем (у каждого платежа свое расписание)
+        from modules.payment_reconciler import RECONCILE_INTERVAL
+        if RECONCILE_INTERVAL > 0:
             _scheduler.add_job(
-                func=run_auto_broadcasts_job,
-                trigger=CronTrigger(hour=hour, minute=0),
-                id=f'auto_broadcast_{hour}',
-                name=f'Auto Broadcast at {hour}:00',
+                func=run_payment_reconcile_job,
+                trigger=IntervalTrigger(seconds=RECONCILE_INTERVAL),
+                id='payment_reconcile',
+                name='Pending payments reconcile',
+                max_instances=1,
+                coalesce=True,
                 replace_existing=True
             )
 
+        # Ручные рассылки, прерванные перезапуском или остановкой другого процесса
+        # (продолжаются после истечения аренды; первый запуск сразу)
+        from modules.broadcast_queue import BROADCAST_LEASE_SECONDS
+        _scheduler.add_job(
+            func=run_broadcast_resume_job,
+            trigger=IntervalTrigger(seconds=BROADCAST_LEASE_SECONDS),
+            id='broadcast_resume',
+            name='Broadcast jobs resume',
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
         _scheduler.start()
-        app.logger.info(f"📅 Планировщик автоматической рассылки запущен: {settings['hours']}:00")
+        app.logger.info(f"📅 Синхронизация пользователей RemnaWave: каждые {SYNC_INTERVAL}с")
 
         # Останавливаем планировщик при выходе
         atexit.register(lambda: _scheduler.shutdown() if _scheduler else None)
 
     except ImportError:
-        app.logger.warning("⚠️  APScheduler не установлен. Автоматическая рассылка недоступна.")
+        app.logger.warning("⚠️  APScheduler не установлен. Автоматическая рассылка и синхронизация RemnaWave недоступны.")
     except Exception as e:
         app.logger.warning(f"⚠️  Ошибка запуска планировщика: {e}")
 
 def restart_scheduler():
-    """Перезапустить планировщик с новыми настройками"""
-    global _scheduler
+    """
+    Применить новые настройки автоматической рассылки
 
+    Планировщик работает в одном процессе (в gunicorn - в одном из воркеров), а
+    настройки сохраняет тот воркер, который обработал запрос. Поэтому настройки
+    сбрасываются через реестр, и процесс с планировщиком подхватывает их в течение
+    BROADCAST_SCHEDULE_CHECK_INTERVAL. Новый планировщик здесь не создается.
+    """
     try:
-        # Останавливаем текущий планировщик
-        if _scheduler:
-            _scheduler.shutdown(wait=False)
-            _scheduler = None
-            app.logger.info("📅 Планировщик остановлен для перезапуска")
+        invalidate_settings('auto_broadcast')
 
-        # Запускаем с новыми настройками
-        start_scheduler()
+        # Планировщик в этом процессе - применяем сразу
+        if _scheduler:
+            schedule_broadcast_jobs(get_settings('auto_broadcast').to_dict())
 
     except Exception as e:
         app.logger.error(f"❌ Ошибка перезапуска планировщика: {e}")
 
+# ============================================================================
+# ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ
+# ============================================================================
+
+def init_database():
+    """
+    Подготовка базы данных перед запуском: только миграции, которые еще не применены
+    (run_schema_migrations.SCHEMA_MIGRATIONS, версия в таблице schema_version).
+    Если схема актуальна - одно чтение версии.
+
+    Выполняется один раз на запуск: из __main__ (встроенный сервер) или
+    в master процессе gunicorn до форка воркеров (gunicorn_config.on_starting).
+    """
+    try:
+        from run_schema_migrations import run_pending_migrations
+        run_pending_migrations(app)
+    except Exception as e:
+        app.logger.warning(f"⚠️  Ошибка при выполнении миграций схемы: {e}")
+        import traceback
+        traceback.print_exc()
+        # Не прерываем запуск приложения, продолжаем работу
+
 # ============================================================================
 if __name__ == '__main__':
     import logging
@@ -392,129 +429,10 @@ if __name__ == '__main__':
     werkzeug_logger.addFilter(BadRequestVersionFilter())
 
     # Создаем таблицы базы данных и выполняем миграцию при необходимости
-    with app.app_context():
-        # Проверяем, нужна ли миграция с SQLite на PostgreSQL
-        use_postgresql = app.config.get('USE_POSTGRESQL', False)
-
-        if use_postgresql:
-            # Если используется PostgreSQL, проверяем миграцию
-            # Ищем SQLite базу в правильном порядке: instance/stealthnet.db, затем stealthnet.db
-            sqlite_paths = [
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'stealthnet.db'),
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stealthnet.db')
-            ]
-
-            sqlite_path = None
-            for path in sqlite_paths:
-                if os.path.exists(path):
-                    sqlite_path = path
-                    break
-
-            if sqlite_path:
-                # SQLite база найдена - проверяем миграцию
-                try:
-                    from migrate_to_postgresql import check_migration_needed, migrate_data
-                    needed, message = check_migration_needed()
-                    if needed:
-                        app.logger.info("=" * 60)
-                        app.logger.info(f"Обнаружена SQLite база данных: {sqlite_path}")
-                        app.logger.info("Запуск автоматической миграции в PostgreSQL...")
-                        app.logger.info("=" * 60)
-                        migration_success = migrate_data()
-                        if migration_success:
-                            app.logger.info("✅ Миграция завершена успешно")
-
-                            # После миграции данных исправляем sequences в PostgreSQL
-                            try:
-                                from fix_postgresql_sequences import fix_sequences
-                                app.logger.info("🔧 Исправление последовательностей PostgreSQL...")
-                                database_url = app.config.get('SQLALCHEMY_DATABASE_URI')
-                                if fix_sequences(database_url):
-                                    app.logger.info("✅ Последовательности обновлены")
-                                else:
-                                    app.logger.warning("⚠️  Ошибка при исправлении последовательностей")
-                            except Exception as e:
-                                app.logger.warning(f"⚠️  Ошибка при исправлении последовательностей: {e}")
-                        else:
-                            app.logger.warning("⚠️  Миграция завершилась с ошибками")
-                        app.logger.info("=" * 60)
-                    else:
-                        app.logger.info(f"ℹ️  {message}")
-                except Exception as e:
-                    app.logger.warning(f"⚠️  Ошибка при проверке миграции: {e}")
-            else:
-                # SQLite база не найдена - просто создаем новую базу в PostgreSQL
-                app.logger.info("ℹ️  SQLite база данных не найдена, создается новая база в PostgreSQL")
-
-        # Создаем таблицы в базе данных
-        db.create_all()
-
-        # Создаем дефолтные сообщения автоматических рассылок если их нет
-        try:
-            from modules.models.auto_broadcast import AutoBroadcastMessage
-
-            default_messages = {
-                'subscription_expiring_3days': {
-                    'text': 'Подписка заканчивается через 3 дня, не забудьте продлить',
-                    'enabled': True,
-                    'bot_type': 'both'
-                },
-                'trial_expiring': {
-                    'text': 'Тестовый период заканчивается, не желаете купить подписку?',
-                    'enabled': True,
-                    'bot_type': 'both'
-                },
-                'no_subscription': {
-                    'text': '🔔 Вы ещё не оформили VPN? Не теряйте время — подключитесь сейчас и защитите свой трафик!',
-                    'enabled': True,
-                    'bot_type': 'both'
-                },
-                'trial_not_used': {
-                    'text': '🚀 Бесплатная пробная подписка ждёт вас!\n\nМы заметили, что вы ещё не воспользовались пробным доступом. Активируйте его прямо сейчас и оцените все преимущества VPN! 🔥',
-                    'enabled': True,
-                    'bot_type': 'both'
-                },
-                'trial_active': {
-                    'text': '🎉 Ваш пробный доступ ещё активен!\n\nНе упустите возможность протестировать VPN бесплатно! Никаких обязательств — просто подключитесь и наслаждайтесь безопасным интернетом. 🌍',
-                    'enabled': True,
-                    'bot_type': 'both'
-                }
-            }
-
-            for msg_type, msg_data in default_messages.items():
-                existing_msg = AutoBroadcastMessage.query.filter_by(message_type=msg_type).first()
-                if not existing_msg:
-                    new_msg = AutoBroadcastMessage(
-                        message_type=msg_type,
-                        message_text=msg_data['text'],
-                        enabled=msg_data['enabled'],
-                        bot_type=msg_data['bot_type']
-                    )
-                    db.session.add(new_msg)
-                    app.logger.info(f"✅ Создано сообщение: {msg_type}")
-
-            db.session.commit()
-        except Exception as e:
-            app.logger.warning(f"⚠️  Ошибка при создании дефолтных сообщений: {e}")
-
-        # Запускаем миграции схемы базы данных (добавление новых колонок)
-        try:
-            from run_schema_migrations import run_all_schema_migrations
-            app.logger.info("🔧 Проверка миграций схемы базы данных...")
-            run_all_schema_migrations(app)
-        except Exception as e:
-            app.logger.warning(f"⚠️  Ошибка при выполнении миграций схемы: {e}")
-            # Не прерываем запуск приложения, продолжаем работу
-
-        # Исправляем encrypted_password для пользователей из бота (если нужно)
-        try:
-            from fix_encrypted_passwords import fix_encrypted_passwords
-            app.logger.info("🔧 Проверка encrypted_password для пользователей из бота...")
-            fix_encrypted_passwords(app)
-        except Exception as e:
-            app.logger.warning(f"⚠️  Ошибка при исправлении encrypted_password: {e}")
-            # Не прерываем запуск приложения, продолжаем работу
+    init_database()
+    load_static_manifests()
 
+    with app.app_context():
         app.logger.info("=" * 60)
         app.logger.info("StealthNET API Starting...")
         app.logger.info(f"Registered {len(list(app.url_map.iter_rules()))} endpoints")
@@ -523,5 +441,5 @@ if __name__ == '__main__':
         # Запускаем планировщик автоматических рассылок
         start_scheduler()
 
-    # Запускаем приложение
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    # Встроенный сервер Flask - для разработки. В production: gunicorn -c gunicorn_config.py wsgi:application
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true', use_reloader=False)
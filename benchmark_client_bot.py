@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пропускной способности client_bot.py при одновременных апдейтах
+
+Поднимает локальный "медленный" Flask API (заглушка на http.server с задержкой ответа)
+и прогоняет типичный обработчик бота (get-token + /api/client/me) N раз конкурентно:
+
+  sync   - прежняя схема: requests.Session внутри async обработчика (блокирует event loop)
+  async  - ClientBotAPI на httpx.AsyncClient
+
+Использование:
+    python3 benchmark_client_bot.py [--delay 0.2] [--levels 1,10,50,100]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("CLIENT_BOT_TOKEN", "0:benchmark")
+
+
+def start_stub_api(delay):
+    """Заглушка Flask API: отвечает на эндпоинты бота с задержкой delay секунд"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, payload):
+            time.sleep(delay)
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply({"response": {"uuid": "bench", "preferred_lang": "ru", "preferred_currency": "uah"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            self._reply({"token": "bench-token"})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def run_sync_handlers(api_url, concurrency):
+    """Прежняя схема: блокирующий requests внутри корутины"""
+    session = requests.Session()
+    latencies = []
+
+    async def handler(telegram_id):
+        started = time.perf_counter()
+        token = session.post(f"{api_url}/api/bot/get-token", json={"telegram_id": telegram_id}, timeout=10).json()["token"]
+        session.get(f"{api_url}/api/client/me", headers={"Authorization": f"Bearer {token}"}, timeout=15).json()
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(handler(i) for i in range(concurrency)))
+    session.close()
+    return latencies
+
+
+async def run_async_handlers(api_url, concurrency):
+    """Новая схема: ClientBotAPI на httpx.AsyncClient"""
+    from client_bot import ClientBotAPI
+
+    api = ClientBotAPI(api_url)
+    latencies = []
+
+    async def handler(telegram_id):
+        started = time.perf_counter()
+        token = await api.get_user_by_telegram_id(telegram_id)
+        await api.get_user_data(token)
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(handler(i) for i in range(concurrency)))
+    await api.close()
+    return latencies
+
+
+def report(mode, concurrency, elapsed, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{mode:<6} {concurrency:>6} {elapsed:>9.2f}s {concurrency / elapsed:>10.1f} "
+          f"{statistics.median(latencies) * 1000:>10.0f} {p95 * 1000:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конкурентной обработки апдейтов ботом")
+    parser.add_argument("--delay", type=float, default=0.2, help="задержка ответа API, сек")
+    parser.add_argument("--levels", default="1,10,50,100", help="число одновременных апдейтов")
+    args = parser.parse_args()
+
+    server, api_url = start_stub_api(args.delay)
+    levels = [int(x) for x in args.levels.split(",")]
+
+    print(f"API delay: {args.delay * 1000:.0f} ms per request, 2 requests per update")
+    print(f"{'mode':<6} {'updates':>6} {'elapsed':>10} {'upd/s':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for concurrency in levels:
+        for mode, runner in (("sync", run_sync_handlers), ("async", run_async_handlers)):
+            started = time.perf_counter()
+            latencies = asyncio.run(runner(api_url, concurrency))
+            report(mode, concurrency, time.perf_counter() - started, latencies)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
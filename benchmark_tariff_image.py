@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк генерации изображения тарифа (modules/image_generator)
+
+Рендерит карточку tier с 3, 5 и 8 строками тарифов и для каждого формата вывода
+печатает время на одну картинку, размер файла и пиковую память:
+
+  py peak  - пик Python-аллокаций (tracemalloc)
+  rss      - максимальный RSS процесса после прогона (растет монотонно; буферы Pillow
+             выделяются вне tracemalloc, поэтому смотрите обе колонки)
+
+Использование:
+    python3 benchmark_tariff_image.py [--runs 20] [--rows 3,5,8] [--formats PNG,WEBP,JPEG]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.image_generator.tariff_image import generate_tariff_image
+
+FEATURES = [
+    {"name": "Безлимитный трафик", "icon": "✓"},
+    {"name": "До 5 устройств", "icon": "✓"},
+    {"name": "Все локации", "icon": "✓"},
+    {"name": "Поддержка 24/7", "icon": "✓"},
+    {"name": "Без рекламы", "icon": "✓"}
+]
+DURATIONS = [7, 14, 30, 60, 90, 180, 270, 365]
+
+
+def make_tariffs(rows):
+    return [
+        {
+            "id": i + 1,
+            "name": f"{days} дней",
+            "duration_days": days,
+            "price_uah": days * 4,
+            "price_rub": days * 9,
+            "price_usd": round(days * 0.1, 2)
+        }
+        for i, days in enumerate(DURATIONS[:rows])
+    ]
+
+
+def render(tariffs, image_format):
+    return generate_tariff_image(
+        tier_name="Премиум",
+        tier_icon="⭐",
+        features=FEATURES,
+        tariffs=tariffs,
+        currency="uah",
+        currency_symbol="₴",
+        primary_color=(63, 105, 255),
+        image_format=image_format
+    )
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    # Linux - килобайты, macOS - байты
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк генерации изображения тарифа")
+    parser.add_argument("--runs", type=int, default=20, help="число рендеров на сценарий")
+    parser.add_argument("--rows", default="3,5,8", help="число строк тарифов")
+    parser.add_argument("--formats", default="PNG,WEBP,JPEG", help="форматы вывода")
+    args = parser.parse_args()
+
+    rows_list = [int(x) for x in args.rows.split(",")]
+    formats = [x.strip().upper() for x in args.formats.split(",")]
+
+    print(f"{'rows':>4} {'format':<6} {'p50 ms':>8} {'max ms':>8} {'size KB':>8} {'py peak MB':>11} {'rss MB':>8}")
+    for rows in rows_list:
+        tariffs = make_tariffs(rows)
+        for image_format in formats:
+            # Прогрев (ленивые инициализации кодеков)
+            render(tariffs, image_format)
+
+            timings = []
+            tracemalloc.start()
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                image_bytes = render(tariffs, image_format)
+                timings.append(time.perf_counter() - started)
+            _, py_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f"{rows:>4} {image_format:<6} {statistics.median(timings) * 1000:>8.1f} "
+                  f"{max(timings) * 1000:>8.1f} {len(image_bytes) / 1024:>8.1f} "
+                  f"{py_peak / (1024 * 1024):>11.2f} {max_rss_mb():>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
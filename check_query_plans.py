@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов (EXPLAIN)
+
+Для каждого известного горячего запроса (статус платежа, продажи, рефералы,
+тикеты, лимит казино) выводит план и помечает полные сканирования таблиц.
+
+На PostgreSQL перед EXPLAIN выполняется SET enable_seqscan = off: на маленькой
+тестовой базе планировщик и так выбрал бы Seq Scan, а нас интересует, может ли
+запрос вообще использовать индекс.
+
+Использование:
+    python3 check_query_plans.py
+
+Код выхода 1, если найдено хотя бы одно полное сканирование.
+"""
+
+import os
+import re
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.core import get_db
+
+# (описание, SQL, параметры)
+HOT_QUERIES = [
+    ("Статус платежа по order_id (miniapp_payment_status)",
+     'SELECT * FROM payment WHERE order_id = :v', {'v': 'x'}),
+    ("Статус платежа по payment_system_id",
+     'SELECT * FROM payment WHERE payment_system_id = :v', {'v': 'x'}),
+    ("Продажи (get_sales)",
+     "SELECT * FROM payment WHERE status = 'PAID' ORDER BY created_at DESC LIMIT 50", {}),
+    ("История платежей пользователя",
+     'SELECT * FROM payment WHERE user_id = :v ORDER BY created_at DESC LIMIT 50', {'v': 1}),
+    ("Число рефералов",
+     'SELECT count(*) FROM "user" WHERE referrer_id = :v', {'v': 1}),
+    ("Пользователь по remnawave_uuid",
+     'SELECT * FROM "user" WHERE remnawave_uuid = :v', {'v': 'x'}),
+    ("Администраторы",
+     'SELECT * FROM "user" WHERE role = :v', {'v': 'ADMIN'}),
+    ("Тикеты пользователя",
+     'SELECT * FROM ticket WHERE user_id = :v ORDER BY created_at DESC', {'v': 1}),
+    ("Сообщения тикета",
+     'SELECT * FROM ticket_message WHERE ticket_id = :v ORDER BY created_at ASC', {'v': 1}),
+    ("Лимит игр казино в день",
+     'SELECT count(*) FROM casino_game WHERE user_id = :v AND created_at >= :d', {'v': 1, 'd': '2000-01-01'}),
+]
+
+# Полное сканирование: "Seq Scan on payment" (PostgreSQL), "SCAN payment" без индекса (SQLite)
+SEQ_SCAN_PATTERNS = [
+    re.compile(r'Seq Scan on (\S+)'),
+    re.compile(r'^SCAN (?:TABLE )?(\S+)(?!.*USING (?:COVERING )?INDEX)'),
+]
+
+
+def explain(conn, sql, params, is_postgres):
+    from sqlalchemy import text
+    if is_postgres:
+        rows = conn.execute(text(f'EXPLAIN {sql}'), params).fetchall()
+        return [r[0] for r in rows]
+    rows = conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params).fetchall()
+    return [r[-1] for r in rows]
+
+
+def find_seq_scans(plan_lines):
+    scans = []
+    for line in plan_lines:
+        for pattern in SEQ_SCAN_PATTERNS:
+            match = pattern.search(line.strip())
+            if match:
+                scans.append(match.group(1).strip('"'))
+    return scans
+
+
+def main():
+    # То же приложение, что при запуске сервера (см. run_schema_migrations._create_app)
+    from app import app
+
+    flagged = 0
+    with app.app_context():
+        db = get_db()
+        is_postgres = db.engine.dialect.name == 'postgresql'
+        print(f"СУБД: {db.engine.dialect.name}")
+        print()
+
+        with db.engine.connect() as conn:
+            if is_postgres:
+                from sqlalchemy import text
+                conn.execute(text('SET enable_seqscan = off'))
+
+            for title, sql, params in HOT_QUERIES:
+                try:
+                    plan = explain(conn, sql, params, is_postgres)
+                except Exception as e:
+                    print(f"⚠️  {title}: не удалось получить план ({e})")
+                    if is_postgres:
+                        conn.rollback()
+                        conn.execute(text('SET enable_seqscan = off'))
+                    continue
+
+                scans = find_seq_scans(plan)
+                if scans:
+                    flagged += 1
+                    print(f"❌ {title}: полное сканирование {', '.join(scans)}")
+                else:
+                    print(f"✅ {title}")
+                for line in plan:
+                    print(f"      {line}")
+
+    print()
+    if flagged:
+        print(f"Найдено полных сканирований: {flagged}. Выполните: python3 add_hot_path_indexes.py")
+    else:
+        print("Все горячие запросы используют индексы")
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,9 +5,13 @@ Telegram Bot для клиентов StealthNET VPN
 """
 
 import os
+import time
+import random
 import logging
 import requests
+import httpx
 import asyncio
+from io import BytesIO
 from datetime import datetime
 from typing import Optional
 from dotenv import load_dotenv
@@ -23,7 +27,9 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
-from telegram.error import Conflict
+from telegram.error import Conflict, BadRequest
+
+from modules import telegram_media_cache
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -56,22 +62,53 @@ _bot_config_cache = {
     'cache_ttl': 5  # 5 секунд — для быстрого обновления при изменении в админке
 }
 
+def _schedule_cache_refresh(cache: dict, loader) -> bool:
+    """
+    Запустить фоновое обновление кеша в event loop бота
+    
+    Синхронные хелперы (get_text, is_button_visible, ...) вызываются из async обработчиков,
+    поэтому ходить в API из них нельзя - отдаем текущий кеш, а свежие данные грузим задачей.
+    Возвращает False, если event loop не запущен.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    if cache.get('refreshing'):
+        return True
+    cache['refreshing'] = True
+    
+    async def _refresh():
+        try:
+            data = await loader()
+            if data:
+                cache['data'] = data
+                cache['last_update'] = time.time()
+        finally:
+            cache['refreshing'] = False
+    
+    loop.create_task(_refresh())
+    return True
+
 def clear_bot_config_cache():
-    """Очистить кеш конфигурации бота"""
-    _bot_config_cache['data'] = None
+    """Сбросить кеш конфигурации бота (следующее обращение запустит обновление)"""
     _bot_config_cache['last_update'] = 0
 
 def get_bot_config() -> dict:
     """Получить конфигурацию бота из API с кешированием"""
-    import time
-    
     current_time = time.time()
     
-    # Возвращаем из кеша если не истёк
-    if _bot_config_cache['data'] and (current_time - _bot_config_cache['last_update']) < _bot_config_cache['cache_ttl']:
+    # Возвращаем из кеша; если истёк - обновляем в фоне (stale-while-revalidate)
+    if _bot_config_cache['data']:
+        if (current_time - _bot_config_cache['last_update']) >= _bot_config_cache['cache_ttl']:
+            _schedule_cache_refresh(_bot_config_cache, api.get_bot_config)
         return _bot_config_cache['data']
     
-    # Загружаем из API
+    # Кеш пуст: внутри event loop не блокируемся, а отдаем дефолты до завершения загрузки
+    if _schedule_cache_refresh(_bot_config_cache, api.get_bot_config):
+        return _default_bot_config()
+    
+    # Загружаем из API (синхронно, только вне event loop - например при старте)
     try:
         response = requests.get(f"{FLASK_API_URL}/api/public/bot-config", timeout=5)
         if response.status_code == 200:
@@ -83,11 +120,10 @@ def get_bot_config() -> dict:
     except Exception as e:
         logger.warning(f"Failed to load bot config from API: {e}")
     
-    # Возвращаем кеш даже если истёк (лучше старые данные чем никаких)
-    if _bot_config_cache['data']:
-        return _bot_config_cache['data']
-    
-    # Дефолтная конфигурация
+    return _default_bot_config()
+
+def _default_bot_config() -> dict:
+    """Дефолтная конфигурация бота"""
     return {
         'service_name': SERVICE_NAME,
         'show_webapp_button': True,
@@ -158,21 +194,23 @@ _trial_settings_cache = {
 }
 
 def clear_trial_settings_cache():
-    """Очистить кеш настроек триала"""
-    _trial_settings_cache['data'] = None
+    """Сбросить кеш настроек триала (следующее обращение запустит обновление)"""
     _trial_settings_cache['last_update'] = 0
 
 def get_trial_settings() -> dict:
     """Получить настройки триала из API с кешированием"""
-    import time
-    
     current_time = time.time()
     
-    # Возвращаем из кеша если не истёк
-    if _trial_settings_cache['data'] and (current_time - _trial_settings_cache['last_update']) < _trial_settings_cache['cache_ttl']:
+    # Возвращаем из кеша; если истёк - обновляем в фоне
+    if _trial_settings_cache['data']:
+        if (current_time - _trial_settings_cache['last_update']) >= _trial_settings_cache['cache_ttl']:
+            _schedule_cache_refresh(_trial_settings_cache, api.get_trial_settings)
         return _trial_settings_cache['data']
     
-    # Загружаем из API
+    if _schedule_cache_refresh(_trial_settings_cache, api.get_trial_settings):
+        return _default_trial_settings()
+    
+    # Загружаем из API (синхронно, только вне event loop)
     try:
         response = requests.get(f"{FLASK_API_URL}/api/public/trial-settings", timeout=5)
         if response.status_code == 200:
@@ -183,11 +221,10 @@ def get_trial_settings() -> dict:
     except Exception as e:
         logger.warning(f"Failed to load trial settings from API: {e}")
     
-    # Возвращаем кеш даже если истёк
-    if _trial_settings_cache['data']:
-        return _trial_settings_cache['data']
-    
-    # Дефолтные настройки
+    return _default_trial_settings()
+
+def _default_trial_settings() -> dict:
+    """Дефолтные настройки триала"""
     return {
         'days': 3,
         'devices': 3,
@@ -265,7 +302,7 @@ def get_buttons_order() -> list:
     return config.get('buttons_order', default_order) or default_order
 
 
-def build_main_menu_keyboard(user_lang: str, is_active: bool, subscription_url: str, expire_at) -> list:
+async def build_main_menu_keyboard(user_lang: str, is_active: bool, subscription_url: str, expire_at) -> list:
     """Построить клавиатуру главного меню на основе настроек из админки"""
     from telegram import InlineKeyboardButton, WebAppInfo
     
@@ -386,8 +423,7 @@ def build_main_menu_keyboard(user_lang: str, is_active: bool, subscription_url:
     
     # Получаем брендинг для проверки ссылок на документы
     try:
-        api = ClientBotAPI()
-        branding = api.get_branding()
+        branding = await api.get_branding()
         agreement_url = branding.get('user_agreement_url', '')
         offer_url = branding.get('offer_url', '')
     except:
@@ -537,6 +573,40 @@ def format_info_line(label: str, value: str, icon: str = "") -> str:
     return f"{label}: {value}\n"
 
 
+async def send_cached_photo(send, path=None, content=None, filename="photo.png", **kwargs):
+    """
+    Отправить фото, загружая файл в Telegram только один раз.
+
+    send - метод отправки (context.bot.send_photo, message.reply_photo), kwargs передаются в него.
+    Фото берется из файла path или из bytes content. После первой загрузки file_id
+    запоминается в telegram_media_cache и дальше отправляется только он; если Telegram
+    отклонил сохраненный file_id, файл загружается заново.
+    """
+    key = telegram_media_cache.media_key(path=path, content=content)
+    file_id = telegram_media_cache.get_file_id(CLIENT_BOT_TOKEN, key)
+    if file_id:
+        try:
+            return await send(photo=file_id, **kwargs)
+        except BadRequest as e:
+            if not telegram_media_cache.is_invalid_file_id_error(e):
+                raise
+            logger.warning(f"Cached file_id rejected by Telegram, re-uploading: {e}")
+            telegram_media_cache.forget_file_id(CLIENT_BOT_TOKEN, key)
+    
+    if path is not None:
+        with open(path, 'rb') as photo_file:
+            sent = await send(photo=photo_file, **kwargs)
+    else:
+        photo_file = BytesIO(content)
+        photo_file.name = filename
+        sent = await send(photo=photo_file, **kwargs)
+    
+    if sent and sent.photo:
+        # Самый большой размер - последний
+        telegram_media_cache.set_file_id(CLIENT_BOT_TOKEN, key, sent.photo[-1].file_id)
+    return sent
+
+
 async def reply_with_logo(update: Update, text: str, reply_markup=None, parse_mode=None):
     """
     Отправляет сообщение с логотипом сверху.
@@ -564,13 +634,13 @@ async def reply_with_logo(update: Update, text: str, reply_markup=None, parse_mo
             return
         
         # Всегда отправляем фото с caption в одном сообщении
-        with open(LOGO_PATH, 'rb') as logo_file:
-            await message.reply_photo(
-                photo=logo_file,
-                caption=text,
-                reply_markup=reply_markup,
-                parse_mode=parse_mode
-            )
+        await send_cached_photo(
+            message.reply_photo,
+            LOGO_PATH,
+            caption=text,
+            reply_markup=reply_markup,
+            parse_mode=parse_mode
+        )
     except Exception as e:
         logger.error(f"Ошибка при отправке сообщения с логотипом: {e}")
         # В случае ошибки отправляем обычное сообщение
@@ -641,25 +711,25 @@ async def safe_edit_or_send_with_logo(update: Update, context: ContextTypes.DEFA
         
         # Отправляем новое сообщение с логотипом
         try:
-            with open(LOGO_PATH, 'rb') as logo_file:
-                return await context.bot.send_photo(
-                    chat_id=message.chat.id,
-                    photo=logo_file,
-                    caption=display_text,
-                    reply_markup=reply_markup,
-                    parse_mode=parse_mode
-                )
+            return await send_cached_photo(
+                context.bot.send_photo,
+                LOGO_PATH,
+                chat_id=message.chat.id,
+                caption=display_text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
         except Exception as e2:
             logger.warning(f"Error sending photo with logo: {e2}")
             # Fallback: отправляем без форматирования
             try:
-                with open(LOGO_PATH, 'rb') as logo_file:
-                    return await context.bot.send_photo(
-                        chat_id=message.chat.id,
-                        photo=logo_file,
-                        caption=clean_markdown_for_cards(display_text),
-                        reply_markup=reply_markup
-                    )
+                return await send_cached_photo(
+                    context.bot.send_photo,
+                    LOGO_PATH,
+                    chat_id=message.chat.id,
+                    caption=clean_markdown_for_cards(display_text),
+                    reply_markup=reply_markup
+                )
             except Exception as e3:
                 logger.error(f"Failed to send photo: {e3}")
     
@@ -702,25 +772,25 @@ async def safe_edit_or_send_with_logo(update: Update, context: ContextTypes.DEFA
             
             # Отправляем новое сообщение с логотипом
             try:
-                with open(LOGO_PATH, 'rb') as logo_file:
-                    return await context.bot.send_photo(
-                        chat_id=message.chat.id,
-                        photo=logo_file,
-                        caption=display_text,
-                        reply_markup=reply_markup,
-                        parse_mode=parse_mode
-                    )
+                return await send_cached_photo(
+                    context.bot.send_photo,
+                    LOGO_PATH,
+                    chat_id=message.chat.id,
+                    caption=display_text,
+                    reply_markup=reply_markup,
+                    parse_mode=parse_mode
+                )
             except Exception as e2:
                 logger.warning(f"Error sending photo with logo: {e2}")
                 # Fallback: отправляем без форматирования
                 try:
-                    with open(LOGO_PATH, 'rb') as logo_file:
-                        return await context.bot.send_photo(
-                            chat_id=message.chat.id,
-                            photo=logo_file,
-                            caption=clean_markdown_for_cards(display_text),
-                            reply_markup=reply_markup
-                        )
+                    return await send_cached_photo(
+                        context.bot.send_photo,
+                        LOGO_PATH,
+                        chat_id=message.chat.id,
+                        caption=clean_markdown_for_cards(display_text),
+                        reply_markup=reply_markup
+                    )
                 except Exception as e3:
                     logger.error(f"Failed to send photo: {e3}")
         
@@ -759,14 +829,14 @@ async def safe_edit_or_send_with_logo(update: Update, context: ContextTypes.DEFA
     # Отправляем новое сообщение с логотипом
     try:
         if os.path.exists(LOGO_PATH):
-            with open(LOGO_PATH, 'rb') as logo_file:
-                await context.bot.send_photo(
-                    chat_id=message.chat.id,
-                    photo=logo_file,
-                    caption=display_text,
-                    reply_markup=reply_markup,
-                    parse_mode=parse_mode
-                )
+            await send_cached_photo(
+                context.bot.send_photo,
+                LOGO_PATH,
+                chat_id=message.chat.id,
+                caption=display_text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
         else:
             await context.bot.send_message(
                 chat_id=message.chat.id,
@@ -779,13 +849,13 @@ async def safe_edit_or_send_with_logo(update: Update, context: ContextTypes.DEFA
         logger.warning(f"Error sending message with logo: {e2}")
         try:
             if os.path.exists(LOGO_PATH):
-                with open(LOGO_PATH, 'rb') as logo_file:
-                    await context.bot.send_photo(
-                        chat_id=message.chat.id,
-                        photo=logo_file,
-                        caption=clean_markdown_for_cards(display_text),
-                        reply_markup=reply_markup
-                    )
+                await send_cached_photo(
+                    context.bot.send_photo,
+                    LOGO_PATH,
+                    chat_id=message.chat.id,
+                    caption=clean_markdown_for_cards(display_text),
+                    reply_markup=reply_markup
+                )
             else:
                 await context.bot.send_message(
                     chat_id=message.chat.id,
@@ -805,56 +875,74 @@ if MINIAPP_URL and not MINIAPP_URL.startswith("https://"):
 
 
 class ClientBotAPI:
-    """Класс для взаимодействия с Flask API"""
+    """Асинхронный клиент Flask API (пул соединений httpx, не блокирует event loop)"""
     
-    def __init__(self, api_url: str):
+    # Статусы, при которых запрос повторяется (как в прежней urllib3 Retry стратегии)
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    
+    def __init__(self, api_url: str, max_retries: int = 3, backoff_factor: float = 0.5):
         self.api_url = api_url.rstrip('/')
-        self.session = requests.Session()
-        
-        # Настройка connection pooling для переиспользования соединений
-        from requests.adapters import HTTPAdapter
-        from urllib3.util.retry import Retry
-        
-        # Настройка retry стратегии
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
-            raise_on_status=False
-        )
-        
-        # Настройка HTTP adapter с connection pooling
-        adapter = HTTPAdapter(
-            pool_connections=10,
-            pool_maxsize=20,
-            max_retries=retry_strategy,
-            pool_block=False
-        )
-        
-        # Применяем adapter для HTTP и HTTPS
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._client: Optional[httpx.AsyncClient] = None
+        self._system_settings_cache = None
+        self._system_settings_cache_time = 0
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Общий httpx клиент (создается лениво внутри event loop бота)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("BOT_API_MAX_CONNECTIONS", "100")),
+                    max_keepalive_connections=int(os.getenv("BOT_API_MAX_KEEPALIVE", "20")),
+                    keepalive_expiry=60
+                )
+            )
+        return self._client
+    
+    async def close(self):
+        """Закрыть пул соединений (при остановке бота)"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+    
+    async def _request(self, method: str, path: str, token: Optional[str] = None, timeout: float = 10,
+                       retry_statuses=RETRY_STATUSES, **kwargs) -> httpx.Response:
+        """
+        Запрос к Flask API с повторами
         
-        # Настройка keep-alive заголовков
-        self.session.headers.update({
-            'Connection': 'keep-alive',
-            'Keep-Alive': 'timeout=60, max=100'
-        })
-    
-    def get_user_by_telegram_id(self, telegram_id: int) -> Optional[dict]:
-        """Получить пользователя по Telegram ID через API бота или создать JWT"""
-        # Сначала пытаемся получить JWT токен через telegram-login эндпоинт
-        # Но для бота нам нужен другой подход - создадим специальный эндпоинт
-        # Пока используем прямой запрос к БД через Flask API
+        Повторяет сетевые ошибки и ответы из retry_statuses с экспоненциальной
+        задержкой через asyncio.sleep (event loop продолжает обслуживать других пользователей).
+        """
+        url = f"{self.api_url}{path}"
+        headers = kwargs.pop('headers', {}) or {}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
         
-        # Временное решение: используем внутренний эндпоинт для ботов
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return response
+                logger.warning(f"HTTP {response.status_code} от {path} (попытка {attempt + 1}/{self.max_retries + 1})")
+                delay = self.backoff_factor * (2 ** attempt)
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"{type(e).__name__} при запросе {path} (попытка {attempt + 1}/{self.max_retries + 1})")
+                delay = self.backoff_factor * (2 ** attempt)
+            # Джиттер, чтобы повторы разных пользователей не приходили одной пачкой
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+    
+    async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[dict]:
+        """Получить JWT пользователя по Telegram ID через внутренний эндпоинт для ботов"""
         try:
-            response = self.session.post(
-                f"{self.api_url}/api/bot/get-token",
-                json={"telegram_id": telegram_id},
-                timeout=10
-            )
+            response = await self._request("POST", "/api/bot/get-token", json={"telegram_id": telegram_id})
             if response.status_code == 200:
                 data = response.json()
                 return data.get("token")
@@ -869,7 +957,7 @@ class ClientBotAPI:
         
         return None
     
-    def register_user(self, telegram_id: int, telegram_username: str = "", ref_code: str = None, preferred_lang: str = None, preferred_currency: str = None) -> Optional[dict]:
+    async def register_user(self, telegram_id: int, telegram_username: str = "", ref_code: str = None, preferred_lang: str = None, preferred_currency: str = None) -> Optional[dict]:
         """Зарегистрировать пользователя через бота"""
         try:
             payload = {
@@ -882,11 +970,8 @@ class ClientBotAPI:
             if preferred_currency:
                 payload["preferred_currency"] = preferred_currency
             
-            response = self.session.post(
-                f"{self.api_url}/api/bot/register",
-                json=payload,
-                timeout=30
-            )
+            # Регистрация не идемпотентна - 5xx не повторяем
+            response = await self._request("POST", "/api/bot/register", json=payload, timeout=30, retry_statuses=(429,))
             if response.status_code == 201:
                 return response.json()
             elif response.status_code == 400:
@@ -896,125 +981,64 @@ class ClientBotAPI:
             logger.error(f"Ошибка регистрации: {e}")
         return None
     
-    def get_credentials(self, telegram_id: int) -> Optional[dict]:
+    async def get_credentials(self, telegram_id: int) -> Optional[dict]:
         """Получить логин (email) и пароль пользователя для входа на сайте"""
         try:
-            response = self.session.post(
-                f"{self.api_url}/api/bot/get-credentials",
-                json={"telegram_id": telegram_id},
-                timeout=10
-            )
+            response = await self._request("POST", "/api/bot/get-credentials", json={"telegram_id": telegram_id})
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка получения credentials: {e}")
         return None
     
-    def get_user_data(self, token: str, force_refresh: bool = False) -> Optional[dict]:
+    async def get_user_data(self, token: str, force_refresh: bool = False) -> Optional[dict]:
         """Получить данные пользователя с retry логикой"""
         headers = {
-            "Authorization": f"Bearer {token}",
             "Cache-Control": "no-cache, no-store, must-revalidate",
             "Pragma": "no-cache",
             "Expires": "0"
         }
         # Добавляем timestamp для предотвращения кэширования
-        url = f"{self.api_url}/api/client/me"
+        path = "/api/client/me"
         if force_refresh:
-            url += f"?_t={int(datetime.now().timestamp() * 1000)}"
+            path += f"?_t={int(datetime.now().timestamp() * 1000)}"
         
-        # Retry логика с экспоненциальной задержкой
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(
-                    url,
-                    headers=headers,
-                    timeout=15  # Увеличено до 15 секунд
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    user_data = data.get("response") or data
-                    # Логируем для отладки
-                    if user_data:
-                        logger.debug(f"User data keys: {list(user_data.keys())[:15]}")
-                        logger.debug(f"User preferred_lang: {user_data.get('preferred_lang')}, preferred_currency: {user_data.get('preferred_currency')}")
-                    return user_data
-                elif response.status_code == 401:
-                    # Не валидный токен, не повторяем
-                    logger.warning(f"Unauthorized access attempt (401) for get_user_data")
-                    return None
-                else:
-                    logger.warning(f"HTTP {response.status_code} при получении данных пользователя (попытка {attempt + 1}/{max_retries})")
-            except requests.exceptions.Timeout:
-                logger.warning(f"Timeout при получении данных пользователя (попытка {attempt + 1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2 ** attempt)  # Экспоненциальная задержка: 1s, 2s, 4s
-                else:
-                    logger.error(f"Превышено максимальное количество попыток при получении данных пользователя")
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"Ошибка соединения при получении данных пользователя (попытка {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2 ** attempt)
-                    # Пытаемся пересоздать соединение
-                    try:
-                        self.session.close()
-                        self.session = requests.Session()
-                        # Повторно применяем adapter
-                        from requests.adapters import HTTPAdapter
-                        from urllib3.util.retry import Retry
-                        retry_strategy = Retry(
-                            total=3,
-                            backoff_factor=1,
-                            status_forcelist=[429, 500, 502, 503, 504],
-                            allowed_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
-                            raise_on_status=False
-                        )
-                        adapter = HTTPAdapter(
-                            pool_connections=10,
-                            pool_maxsize=20,
-                            max_retries=retry_strategy,
-                            pool_block=False
-                        )
-                        self.session.mount("http://", adapter)
-                        self.session.mount("https://", adapter)
-                        self.session.headers.update({
-                            'Connection': 'keep-alive',
-                            'Keep-Alive': 'timeout=60, max=100'
-                        })
-                    except Exception as reset_error:
-                        logger.error(f"Ошибка при пересоздании сессии: {reset_error}")
-                else:
-                    logger.error(f"Превышено максимальное количество попыток при ошибке соединения")
-            except Exception as e:
-                logger.error(f"Неожиданная ошибка при получении данных пользователя: {e}")
-                if attempt == max_retries - 1:
-                    return None
+        try:
+            response = await self._request("GET", path, token=token, headers=headers, timeout=15)
+            if response.status_code == 200:
+                data = response.json()
+                user_data = data.get("response") or data
+                # Логируем для отладки
+                if user_data:
+                    logger.debug(f"User data keys: {list(user_data.keys())[:15]}")
+                    logger.debug(f"User preferred_lang: {user_data.get('preferred_lang')}, preferred_currency: {user_data.get('preferred_currency')}")
+                return user_data
+            elif response.status_code == 401:
+                # Не валидный токен, не повторяем
+                logger.warning(f"Unauthorized access attempt (401) for get_user_data")
+            else:
+                logger.warning(f"HTTP {response.status_code} при получении данных пользователя")
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            logger.error(f"Превышено максимальное количество попыток при получении данных пользователя: {e}")
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при получении данных пользователя: {e}")
         
         return None
     
-    def get_tariffs(self) -> list:
+    async def get_tariffs(self) -> list:
         """Получить список тарифов"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/public/tariffs",
-                timeout=10
-            )
+            response = await self._request("GET", "/api/public/tariffs")
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка получения тарифов: {e}")
         return []
     
-    def get_tariff_features(self) -> dict:
+    async def get_tariff_features(self) -> dict:
         """Получить функции тарифов по tier"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/public/tariff-features",
-                timeout=10
-            )
+            response = await self._request("GET", "/api/public/tariff-features")
             if response.status_code == 200:
                 features_list = response.json()
                 # Преобразуем список в словарь по tier
@@ -1034,36 +1058,45 @@ class ClientBotAPI:
             logger.error(f"Ошибка получения функций тарифов: {e}")
         return {}
     
-    def get_branding(self) -> dict:
+    async def get_branding(self) -> dict:
         """Получить настройки брендинга (для названий функций)"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/public/branding",
-                timeout=10
-            )
+            response = await self._request("GET", "/api/public/branding")
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка получения брендинга: {e}")
         return {}
     
-    def get_system_settings(self) -> dict:
+    async def get_bot_config(self) -> Optional[dict]:
+        """Получить конфигурацию бота из админки"""
+        try:
+            response = await self._request("GET", "/api/public/bot-config", timeout=5)
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.warning(f"Failed to load bot config from API: {e}")
+        return None
+    
+    async def get_trial_settings(self) -> Optional[dict]:
+        """Получить настройки триала из админки"""
+        try:
+            response = await self._request("GET", "/api/public/trial-settings", timeout=5)
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.warning(f"Failed to load trial settings from API: {e}")
+        return None
+    
+    async def get_system_settings(self) -> dict:
         """Получить системные настройки (активные языки и валюты) с кэшированием на 1 минуту"""
-        # Используем простой кэш в памяти
-        if not hasattr(self, '_system_settings_cache') or not hasattr(self, '_system_settings_cache_time'):
-            self._system_settings_cache = None
-            self._system_settings_cache_time = 0
-        
         # Проверяем кэш (1 минута = 60 секунд)
         current_time = datetime.now().timestamp()
         if self._system_settings_cache and (current_time - self._system_settings_cache_time) < 60:
             return self._system_settings_cache
         
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/public/system-settings",
-                timeout=10
-            )
+            response = await self._request("GET", "/api/public/system-settings")
             if response.status_code == 200:
                 data = response.json()
                 # Сохраняем в кэш
@@ -1080,13 +1113,10 @@ class ClientBotAPI:
         }
         return default_settings
     
-    def get_available_payment_methods(self) -> list:
+    async def get_available_payment_methods(self) -> list:
         """Получить список доступных способов оплаты"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/public/available-payment-methods",
-                timeout=10
-            )
+            response = await self._request("GET", "/api/public/available-payment-methods")
             if response.status_code == 200:
                 data = response.json()
                 return data.get("available_methods", [])
@@ -1094,14 +1124,10 @@ class ClientBotAPI:
             logger.error(f"Ошибка получения способов оплаты: {e}")
         return []
     
-    def get_nodes(self, token: str) -> list:
+    async def get_nodes(self, token: str) -> list:
         """Получить список серверов"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/client/nodes",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10
-            )
+            response = await self._request("GET", "/api/client/nodes", token=token)
             if response.status_code == 200:
                 data = response.json()
                 return data.get("response", {}).get("activeNodes", [])
@@ -1109,21 +1135,17 @@ class ClientBotAPI:
             logger.error(f"Ошибка получения серверов: {e}")
         return []
     
-    def activate_trial(self, token: str) -> dict:
+    async def activate_trial(self, token: str) -> dict:
         """Активировать триал"""
         try:
-            response = self.session.post(
-                f"{self.api_url}/api/client/activate-trial",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10
-            )
+            response = await self._request("POST", "/api/client/activate-trial", token=token, retry_statuses=(429,))
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка активации триала: {e}")
         return {"success": False, "message": "Ошибка активации триала"}
     
-    def create_payment(self, token: str, tariff_id: int, payment_provider: str, promo_code: Optional[str] = None) -> dict:
+    async def create_payment(self, token: str, tariff_id: int, payment_provider: str, promo_code: Optional[str] = None) -> dict:
         """Создать платеж"""
         try:
             payload = {
@@ -1131,41 +1153,45 @@ class ClientBotAPI:
                 "payment_provider": payment_provider,
                 "promo_code": promo_code
             }
-            response = self.session.post(
-                f"{self.api_url}/api/client/create-payment",
-                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-                json=payload,
-                timeout=10
-            )
+            # Повтор 5xx мог бы создать второй счет у провайдера - повторяем только 429
+            response = await self._request("POST", "/api/client/create-payment", token=token, json=payload, retry_statuses=(429,))
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка создания платежа: {e}")
         return {"success": False, "message": "Ошибка создания платежа"}
     
-    def get_support_tickets(self, token: str) -> list:
+    async def wait_payment(self, order_id: str, timeout: int = 20) -> Optional[dict]:
+        """
+        Дождаться выдачи заказа (long-poll /miniapp/payments/<order_id>/events)
+        
+        Возвращает статус платежа, как только заказ выдан, или текущий статус через timeout секунд.
+        """
+        try:
+            response = await self._request("GET", f"/miniapp/payments/{order_id}/events",
+                                           params={"timeout": timeout}, timeout=timeout + 10,
+                                           retry_statuses=(429,))
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.error(f"Ошибка ожидания платежа {order_id}: {e}")
+        return None
+    
+    async def get_support_tickets(self, token: str) -> list:
         """Получить список тикетов поддержки"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/client/support-tickets",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10
-            )
+            response = await self._request("GET", "/api/client/support-tickets", token=token)
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка получения тикетов: {e}")
         return []
     
-    def create_support_ticket(self, token: str, subject: str, message: str) -> dict:
+    async def create_support_ticket(self, token: str, subject: str, message: str) -> dict:
         """Создать тикет поддержки"""
         try:
-            response = self.session.post(
-                f"{self.api_url}/api/client/support-tickets",
-                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-                json={"subject": subject, "message": message},
-                timeout=10
-            )
+            response = await self._request("POST", "/api/client/support-tickets", token=token,
+                                           json={"subject": subject, "message": message}, retry_statuses=(429,))
             # API возвращает 201 при создании
             if response.status_code in [200, 201]:
                 return response.json()
@@ -1173,21 +1199,17 @@ class ClientBotAPI:
             logger.error(f"Ошибка создания тикета: {e}")
         return {"success": False, "message": "Ошибка создания тикета"}
     
-    def get_ticket_messages(self, token: str, ticket_id: int) -> dict:
+    async def get_ticket_messages(self, token: str, ticket_id: int) -> dict:
         """Получить сообщения тикета"""
         try:
-            response = self.session.get(
-                f"{self.api_url}/api/support-tickets/{ticket_id}",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10
-            )
+            response = await self._request("GET", f"/api/support-tickets/{ticket_id}", token=token)
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             logger.error(f"Ошибка получения сообщений тикета: {e}")
         return {}
     
-    def save_settings(self, token: str, lang: Optional[str] = None, currency: Optional[str] = None) -> dict:
+    async def save_settings(self, token: str, lang: Optional[str] = None, currency: Optional[str] = None) -> dict:
         """Сохранить настройки пользователя (язык, валюта)"""
         try:
             payload = {}
@@ -1200,12 +1222,7 @@ class ClientBotAPI:
                 return {"success": False, "message": "Нет данных для сохранения"}
             
             logger.info(f"Saving settings: {payload}")
-            response = self.session.post(
-                f"{self.api_url}/api/client/settings",
-                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-                json=payload,
-                timeout=10
-            )
+            response = await self._request("POST", "/api/client/settings", token=token, json=payload)
             logger.info(f"Settings save response: {response.status_code}, {response.text}")
             if response.status_code == 200:
                 return {"success": True, "message": "Настройки сохранены"}
@@ -1215,15 +1232,11 @@ class ClientBotAPI:
             logger.error(f"Ошибка сохранения настроек: {e}")
         return {"success": False, "message": "Ошибка сохранения настроек"}
     
-    def reply_to_ticket(self, token: str, ticket_id: int, message: str) -> dict:
+    async def reply_to_ticket(self, token: str, ticket_id: int, message: str) -> dict:
         """Ответить на тикет"""
         try:
-            response = self.session.post(
-                f"{self.api_url}/api/support-tickets/{ticket_id}/reply",
-                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-                json={"message": message},
-                timeout=10
-            )
+            response = await self._request("POST", f"/api/support-tickets/{ticket_id}/reply", token=token,
+                                           json={"message": message}, retry_statuses=(429,))
             if response.status_code in [200, 201]:
                 return response.json()
         except Exception as e:
@@ -2121,7 +2134,7 @@ def get_text(key: str, lang: str = 'ru') -> str:
         text = text.replace('{SERVICE_NAME}', get_service_name())
     return text
 
-def get_user_lang(user_data: dict = None, context: ContextTypes.DEFAULT_TYPE = None, token: str = None) -> str:
+async def get_user_lang(user_data: dict = None, context: ContextTypes.DEFAULT_TYPE = None, token: str = None) -> str:
     """Получить язык пользователя из данных, context или по токену"""
     # Сначала проверяем context.user_data (самый быстрый способ, если язык был недавно изменен)
     if context and hasattr(context, 'user_data') and 'user_lang' in context.user_data:
@@ -2140,7 +2153,7 @@ def get_user_lang(user_data: dict = None, context: ContextTypes.DEFAULT_TYPE = N
     
     # Если есть token, получаем данные из API
     if token:
-        user_data = api.get_user_data(token)
+        user_data = await api.get_user_data(token)
         if user_data:
             lang = user_data.get('preferred_lang') or user_data.get('preferredLang') or 'ru'
             if lang in ['ru', 'ua', 'en', 'cn']:
@@ -2153,13 +2166,13 @@ def get_user_lang(user_data: dict = None, context: ContextTypes.DEFAULT_TYPE = N
     return 'ru'
 
 
-def get_user_token(telegram_id: int) -> Optional[str]:
+async def get_user_token(telegram_id: int) -> Optional[str]:
     """Получить или создать JWT токен для пользователя"""
     if telegram_id in user_tokens:
         return user_tokens[telegram_id]
     
     # Получаем токен через API
-    token = api.get_user_by_telegram_id(telegram_id)
+    token = await api.get_user_by_telegram_id(telegram_id)
     if token:
         user_tokens[telegram_id] = token
         return token
@@ -2173,7 +2186,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = user.id
     
     # Получаем токен для пользователя
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     
     # Проверяем блокировку аккаунта
     if isinstance(token, dict) and token.get('blocked'):
@@ -2236,15 +2249,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Получаем данные пользователя
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     
     if not user_data:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await reply_with_logo(update, f"❌ {get_text('failed_to_load_user', lang)}")
         return
     
     # Получаем язык пользователя
-    user_lang = get_user_lang(user_data, context, token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     # Получаем данные для клавиатуры
     is_active = user_data.get("activeInternalSquads", [])
@@ -2354,7 +2367,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Кнопки главного меню - строим динамически из конфига
     # Используем has_active_subscription для правильного отображения кнопок
-    keyboard = build_main_menu_keyboard(user_lang, has_active_subscription, subscription_url, expire_at)
+    keyboard = await build_main_menu_keyboard(user_lang, has_active_subscription, subscription_url, expire_at)
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -2394,20 +2407,20 @@ async def show_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await update.callback_query.answer(f"❌ {get_text('auth_error', lang)}")
         return
     
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     if not user_data:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await update.callback_query.answer(f"❌ {get_text('failed_to_load', lang)}")
         return
     
     # Получаем язык пользователя
-    user_lang = get_user_lang(user_data, context, token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     # Формируем сообщение со статусом
     is_active = user_data.get("activeInternalSquads", [])
@@ -2475,7 +2488,7 @@ async def show_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_text += "━━━━━━━━━━━━━━━\n"
     status_text += f"🔐 **{get_text('login_data_title', user_lang)}**\n"
     
-    credentials = api.get_credentials(telegram_id)
+    credentials = await api.get_credentials(telegram_id)
     if credentials and credentials.get("email"):
         status_text += f"📧 `{credentials['email']}`\n"
         if credentials.get("password"):
@@ -2526,19 +2539,19 @@ async def show_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await update.callback_query.answer("❌ Ошибка авторизации")
         return
     
-    tariffs = api.get_tariffs()
+    tariffs = await api.get_tariffs()
     
     if not tariffs:
         await update.callback_query.answer("❌ Тарифы не найдены")
         return
     
     # Получаем валюту пользователя
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     currency = user_data.get("preferred_currency", "uah") if user_data else "uah"
     
     currency_map = {
@@ -2578,7 +2591,7 @@ async def show_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE):
             basic_tariffs.append(tariff)
     
     # Получаем названия тарифов из брендинга
-    branding = api.get_branding()
+    branding = await api.get_branding()
     basic_name = branding.get("tariff_tier_basic_name", "Базовый") or "Базовый"
     pro_name = branding.get("tariff_tier_pro_name", "Премиум") or "Премиум"
     elite_name = branding.get("tariff_tier_elite_name", "Элитный") or "Элитный"
@@ -2640,19 +2653,19 @@ async def show_tier_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE,
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await query.answer("❌ Ошибка авторизации")
         return
     
-    tariffs = api.get_tariffs()
+    tariffs = await api.get_tariffs()
     
     if not tariffs:
         await query.answer("❌ Тарифы не найдены")
         return
     
     # Получаем валюту пользователя
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     currency = user_data.get("preferred_currency", "uah") if user_data else "uah"
     
     currency_map = {
@@ -2666,7 +2679,7 @@ async def show_tier_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE,
     symbol = currency_config["symbol"]
     
     # Получаем названия тарифов из брендинга
-    branding = api.get_branding()
+    branding = await api.get_branding()
     basic_name = branding.get("tariff_tier_basic_name", "Базовый") or "Базовый"
     pro_name = branding.get("tariff_tier_pro_name", "Премиум") or "Премиум"
     elite_name = branding.get("tariff_tier_elite_name", "Элитный") or "Элитный"
@@ -2703,11 +2716,11 @@ async def show_tier_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE,
     tier_tariffs.sort(key=lambda x: x.get("duration_days", 0))
     
     # Получаем функции тарифа для этого tier
-    tariff_features = api.get_tariff_features()
+    tariff_features = await api.get_tariff_features()
     features_list = tariff_features.get(tier, [])
     
     # Получаем названия функций из брендинга
-    branding = api.get_branding()
+    branding = await api.get_branding()
     features_names = branding.get("tariff_features_names", {})
     
     # Подготавливаем функции для генерации изображения
@@ -2745,8 +2758,7 @@ async def show_tier_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE,
     
     # Генерируем изображение
     try:
-        from modules.image_generator import generate_tariff_image
-        from io import BytesIO
+        from modules.image_generator import get_tariff_image, TARIFF_IMAGE_EXTENSION
         
         # Получаем цвет из брендинга (если есть)
         primary_color_hex = branding.get("primary_color", "#3f69ff")
@@ -2759,7 +2771,9 @@ async def show_tier_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE,
         except:
             primary_color = (63, 105, 255)  # Синий по умолчанию
         
-        image_bytes = generate_tariff_image(
+        # Картинка берется из кеша по содержимому; генерация (CPU) - вне event loop
+        image_bytes = await asyncio.to_thread(
+            get_tariff_image,
             tier_name=tier_info["name"],
             tier_icon=tier_info["icon"],
             features=processed_features,
@@ -2795,20 +2809,18 @@ async def show_tier_tariffs(update: Update, context: ContextTypes.DEFAULT_TYPE,
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        # Отправляем изображение
-        photo_file = BytesIO(image_bytes)
-        photo_file.name = f"tariff_{tier}.png"
-        
         # Пытаемся удалить старое сообщение
         try:
             await query.message.delete()
         except:
             pass
         
-        # Отправляем новое сообщение с изображением
-        await context.bot.send_photo(
+        # Отправляем новое сообщение с изображением (повторно - по file_id, без байтов)
+        await send_cached_photo(
+            context.bot.send_photo,
+            content=image_bytes,
+            filename=f"tariff_{tier}.{TARIFF_IMAGE_EXTENSION}",
             chat_id=query.message.chat_id,
-            photo=photo_file,
             caption="Выберите длительность:",
             reply_markup=reply_markup
         )
@@ -2924,13 +2936,13 @@ async def show_servers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await update.callback_query.answer("❌ Ошибка авторизации")
         return
     
     # Проверяем активность подписки
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     if not user_data:
         await update.callback_query.answer("❌ Не удалось загрузить данные")
         return
@@ -2942,7 +2954,7 @@ async def show_servers(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.callback_query.answer("❌ Подписка не активна. Активируйте триал или выберите тариф")
         return
     
-    nodes = api.get_nodes(token)
+    nodes = await api.get_nodes(token)
     
     if not nodes:
         text = "🌐 **Серверы**\n\n❌ Серверы не найдены"
@@ -3005,18 +3017,18 @@ async def show_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await update.callback_query.answer("❌ Ошибка авторизации")
         return
     
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     if not user_data:
         await update.callback_query.answer("❌ Не удалось загрузить данные")
         return
     
     # Получаем язык пользователя
-    user_lang = get_user_lang(user_data, context, token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     # Получаем информацию о реферальной программе из API
     try:
@@ -3149,16 +3161,16 @@ async def show_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await update.callback_query.answer(f"❌ {get_text('auth_error', lang)}")
         return
     
-    tickets = api.get_support_tickets(token)
+    tickets = await api.get_support_tickets(token)
     
-    user_data = api.get_user_data(token)
-    user_lang = get_user_lang(user_data, context, token)
+    user_data = await api.get_user_data(token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     text = f"💬 **{get_text('support_title', user_lang)}**\n"
     text += "━━━━━━━━━━━━━━━\n\n"
@@ -3214,8 +3226,8 @@ async def show_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_user_agreement(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать пользовательское соглашение"""
     telegram_id = update.effective_user.id
-    token = get_user_token(telegram_id)
-    user_lang = get_user_lang(None, context, token)
+    token = await get_user_token(telegram_id)
+    user_lang = await get_user_lang(None, context, token)
     
     # Текст пользовательского соглашения
     agreement_text = get_user_agreement_text(user_lang)
@@ -3236,8 +3248,8 @@ async def show_user_agreement(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def show_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать публичную оферту"""
     telegram_id = update.effective_user.id
-    token = get_user_token(telegram_id)
-    user_lang = get_user_lang(None, context, token)
+    token = await get_user_token(telegram_id)
+    user_lang = await get_user_lang(None, context, token)
     
     # Текст публичной оферты
     offer_text = get_offer_text(user_lang)
@@ -3786,8 +3798,8 @@ def get_refund_policy_text(lang: str = 'ru') -> str:
 async def show_refund_policy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать политику возврата"""
     telegram_id = update.effective_user.id
-    token = get_user_token(telegram_id)
-    user_lang = get_user_lang(None, context, token)
+    token = await get_user_token(telegram_id)
+    user_lang = await get_user_lang(None, context, token)
     
     # Текст политики возврата
     policy_text = get_refund_policy_text(user_lang)
@@ -3839,13 +3851,13 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         telegram_id = user.id
         
-        token = get_user_token(telegram_id)
+        token = await get_user_token(telegram_id)
         if token:
-            user_data = api.get_user_data(token)
+            user_data = await api.get_user_data(token)
             
             if user_data:
                 # Получаем язык пользователя
-                user_lang = get_user_lang(user_data, context, token)
+                user_lang = await get_user_lang(user_data, context, token)
                 
                 welcome_text = f"🛡 **{get_text('stealthnet_bot', user_lang)}**\n"
                 welcome_text += f"👋 {get_text('main_menu_button', user_lang)}\n"
@@ -3940,7 +3952,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 # Используем build_main_menu_keyboard для правильного порядка кнопок из админки
                 # Используем has_active_subscription для правильного отображения кнопок
-                keyboard = build_main_menu_keyboard(user_lang, has_active_subscription, subscription_url, expire_at)
+                keyboard = await build_main_menu_keyboard(user_lang, has_active_subscription, subscription_url, expire_at)
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 # Используем безопасную функцию для редактирования/отправки
@@ -3958,7 +3970,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
         
         # Fallback если не удалось загрузить данные
-        lang = get_user_lang(None, context, token) if token else 'ru'
+        lang = await get_user_lang(None, context, token) if token else 'ru'
         welcome_text = f"👋 {get_text('main_menu_button', lang)}\n\n"
         welcome_text += f"{get_text('select_action', lang)}:"
         
@@ -4026,19 +4038,19 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         telegram_id = user.id
         
-        token = get_user_token(telegram_id)
+        token = await get_user_token(telegram_id)
         if not token:
-            lang = get_user_lang(None, context, token)
+            lang = await get_user_lang(None, context, token)
             await query.answer(f"❌ {get_text('auth_error', lang)}")
             return
         
-        user_data_api = api.get_user_data(token)
+        user_data_api = await api.get_user_data(token)
         if not user_data_api:
-            lang = get_user_lang(None, context, token)
+            lang = await get_user_lang(None, context, token)
             await query.answer(f"❌ {get_text('failed_to_load', lang)}")
             return
         
-        user_lang = get_user_lang(user_data_api, context, token)
+        user_lang = await get_user_lang(user_data_api, context, token)
         preferred_currency = user_data_api.get("preferred_currency", "uah")
         currency_symbol = {"uah": "₴", "rub": "₽", "usd": "$"}.get(preferred_currency, "₴")
         
@@ -4081,9 +4093,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         user = update.effective_user
         telegram_id = user.id
-        token = get_user_token(telegram_id)
-        user_data = api.get_user_data(token) if token else None
-        user_lang = get_user_lang(user_data, context, token)
+        token = await get_user_token(telegram_id)
+        user_data = await api.get_user_data(token) if token else None
+        user_lang = await get_user_lang(user_data, context, token)
         
         # Получаем домен сервера из API
         try:
@@ -4126,9 +4138,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "create_ticket":
         user = update.effective_user
         telegram_id = user.id
-        token = get_user_token(telegram_id)
-        user_data = api.get_user_data(token) if token else None
-        user_lang = get_user_lang(user_data, context, token)
+        token = await get_user_token(telegram_id)
+        user_data = await api.get_user_data(token) if token else None
+        user_lang = await get_user_lang(user_data, context, token)
         
         temp_update = Update(update_id=0, callback_query=query)
         await safe_edit_or_send_with_logo(
@@ -4152,9 +4164,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ticket_id = int(data.replace("reply_ticket_", ""))
             user = update.effective_user
             telegram_id = user.id
-            token = get_user_token(telegram_id)
-            user_data = api.get_user_data(token) if token else None
-            user_lang = get_user_lang(user_data, context, token)
+            token = await get_user_token(telegram_id)
+            user_data = await api.get_user_data(token) if token else None
+            user_lang = await get_user_lang(user_data, context, token)
             
             temp_update = Update(update_id=0, callback_query=query)
             await safe_edit_or_send_with_logo(
@@ -4170,9 +4182,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except (ValueError, IndexError):
             user = update.effective_user
             telegram_id = user.id
-            token = get_user_token(telegram_id)
-            user_data = api.get_user_data(token) if token else None
-            user_lang = get_user_lang(user_data, context, token)
+            token = await get_user_token(telegram_id)
+            user_data = await api.get_user_data(token) if token else None
+            user_lang = await get_user_lang(user_data, context, token)
             await query.answer(f"❌ {get_text('invalid_ticket_id', user_lang)}")
     
     elif data == "register_user":
@@ -4220,18 +4232,18 @@ async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await query.answer("❌ Ошибка авторизации")
         return
     
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     if not user_data:
         await query.answer("❌ Не удалось загрузить данные")
         return
     
     # Получаем язык и валюту с правильными ключами
-    user_lang = get_user_lang(user_data, context, token)
+    user_lang = await get_user_lang(user_data, context, token)
     current_currency = user_data.get("preferred_currency") or user_data.get("preferredCurrency") or "uah"
     
     logger.debug(f"Settings: lang={user_lang}, currency={current_currency}")
@@ -4252,7 +4264,7 @@ async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += f"📝 {get_text('select_currency', user_lang)}\n"
     
     # Получаем активные валюты из настроек
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_currencies = system_settings.get("active_currencies", ["uah", "rub", "usd"])
     
     # Генерируем кнопки валют динамически
@@ -4304,13 +4316,13 @@ async def set_currency(update: Update, context: ContextTypes.DEFAULT_TYPE, curre
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await query.answer("❌ Ошибка авторизации")
         return
     
     # Проверяем, что валюта активна
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_currencies = system_settings.get("active_currencies", ["uah", "rub", "usd"])
     
     if currency not in active_currencies:
@@ -4318,7 +4330,7 @@ async def set_currency(update: Update, context: ContextTypes.DEFAULT_TYPE, curre
         return
     
     # Проверяем текущую валюту
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     current_currency = user_data.get("preferred_currency", "uah") if user_data else "uah"
     
     if current_currency == currency:
@@ -4326,7 +4338,7 @@ async def set_currency(update: Update, context: ContextTypes.DEFAULT_TYPE, curre
         return
     
     # Сохраняем валюту
-    result = api.save_settings(token, currency=currency)
+    result = await api.save_settings(token, currency=currency)
     
     logger.info(f"Currency save result: {result}")
     
@@ -4355,24 +4367,24 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE, lang:
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await query.answer("❌ Ошибка авторизации")
         return
     
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     if not user_data:
         await query.answer("❌ Не удалось загрузить данные")
         return
     
-    current_lang = get_user_lang(user_data, context, token)
+    current_lang = await get_user_lang(user_data, context, token)
     
     # Если язык не указан, показываем меню выбора
     if not lang:
         text = f"🌐 **{get_text('select_language', current_lang)}**\n\n"
         
         # Получаем активные языки из настроек
-        system_settings = api.get_system_settings()
+        system_settings = await api.get_system_settings()
         active_languages = system_settings.get("active_languages", ["ru", "ua", "en", "cn"])
         
         # Генерируем кнопки языков динамически
@@ -4411,7 +4423,7 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE, lang:
         return
     
     # Проверяем, что язык активен
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_languages = system_settings.get("active_languages", ["ru", "ua", "en", "cn"])
     
     if lang not in active_languages:
@@ -4424,7 +4436,7 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE, lang:
         return
     
     # Сохраняем язык
-    result = api.save_settings(token, lang=lang)
+    result = await api.save_settings(token, lang=lang)
     
     logger.info(f"Language save result: {result}")
     
@@ -4458,18 +4470,18 @@ async def view_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE, ticket
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await query.answer(f"❌ {get_text('auth_error', lang)}")
         return
     
-    user_data = api.get_user_data(token)
-    user_lang = get_user_lang(user_data, context, token)
+    user_data = await api.get_user_data(token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     await query.answer(f"⏳ {get_text('loading_ticket', user_lang)}...")
     
-    ticket_data = api.get_ticket_messages(token, ticket_id)
+    ticket_data = await api.get_ticket_messages(token, ticket_id)
     
     if not ticket_data or not ticket_data.get("messages"):
         temp_update = Update(update_id=0, callback_query=query)
@@ -4586,9 +4598,9 @@ async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = user.id
     
     # Проверяем, не зарегистрирован ли уже
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if token:
-        lang = get_user_lang(None, context, token) if token else 'ru'
+        lang = await get_user_lang(None, context, token) if token else 'ru'
         await query.answer(f"✅ {get_text('already_registered', lang)}", show_alert=True)
         await show_status(update, context)
         return
@@ -4609,7 +4621,7 @@ async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = 'ru'
     
     # Получаем активные языки из настроек
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_languages = system_settings.get("active_languages", ["ru", "ua", "en", "cn"])
     
     text = f"🛡️ **{SERVICE_NAME} VPN**\n"
@@ -4666,7 +4678,7 @@ async def register_select_language(update: Update, context: ContextTypes.DEFAULT
         return
     
     # Проверяем, что язык активен
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_languages = system_settings.get("active_languages", ["ru", "ua", "en", "cn"])
     
     if lang not in active_languages:
@@ -4690,7 +4702,7 @@ async def register_select_language(update: Update, context: ContextTypes.DEFAULT
     text += "💡 Вы сможете изменить её позже в настройках."
     
     # Получаем активные валюты из настроек
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_currencies = system_settings.get("active_currencies", ["uah", "rub", "usd"])
     
     # Генерируем кнопки валют динамически на основе активных валют
@@ -4735,7 +4747,7 @@ async def register_select_currency(update: Update, context: ContextTypes.DEFAULT
         return
     
     # Проверяем, что валюта активна
-    system_settings = api.get_system_settings()
+    system_settings = await api.get_system_settings()
     active_currencies = system_settings.get("active_currencies", ["uah", "rub", "usd"])
     
     if currency not in active_currencies:
@@ -4786,7 +4798,7 @@ async def register_select_currency(update: Update, context: ContextTypes.DEFAULT
     ref_code = context.user_data.get("ref_code")
     
     # Регистрируем пользователя с выбранными языком и валютой
-    result = api.register_user(telegram_id, telegram_username, ref_code, preferred_lang=lang, preferred_currency=currency)
+    result = await api.register_user(telegram_id, telegram_username, ref_code, preferred_lang=lang, preferred_currency=currency)
     
     if not result:
         text = "❌ **Ошибка регистрации**\n\n"
@@ -4802,7 +4814,7 @@ async def register_select_currency(update: Update, context: ContextTypes.DEFAULT
     
     if result.get("message") == "User already registered":
         await query.answer("✅ Вы уже зарегистрированы!", show_alert=True)
-        token = get_user_token(telegram_id)
+        token = await get_user_token(telegram_id)
         if token:
             await show_status(update, context)
         return
@@ -4873,18 +4885,18 @@ async def activate_trial(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await query.answer(f"❌ {get_text('auth_error', lang)}", show_alert=True)
         return
     
-    user_data = api.get_user_data(token)
-    user_lang = get_user_lang(user_data, context, token)
+    user_data = await api.get_user_data(token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     await query.answer(f"⏳ {get_text('activating_trial', user_lang)}...")
     
-    result = api.activate_trial(token)
+    result = await api.activate_trial(token)
     
     keyboard = [[InlineKeyboardButton(f"🔙 {get_text('main_menu_button', user_lang)}", callback_data="main_menu")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -4990,22 +5002,22 @@ async def select_tariff(update: Update, context: ContextTypes.DEFAULT_TYPE, tari
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
         await query.answer("❌ Ошибка авторизации", show_alert=True)
         return
     
     # Получаем информацию о тарифе
-    tariffs = api.get_tariffs()
+    tariffs = await api.get_tariffs()
     tariff = next((t for t in tariffs if t.get("id") == tariff_id), None)
     
     if not tariff:
         await query.answer("❌ Тариф не найден", show_alert=True)
         return
     
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     currency = user_data.get("preferred_currency", "uah") if user_data else "uah"
-    user_lang = get_user_lang(user_data, context, token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     currency_map = {
         "uah": {"field": "price_uah", "symbol": "₴"},
@@ -5016,7 +5028,7 @@ async def select_tariff(update: Update, context: ContextTypes.DEFAULT_TYPE, tari
     price = tariff.get(currency_config["field"], 0)
     
     # Получаем баланс пользователя
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     balance = user_data.get("balance", 0) if user_data else 0
     preferred_currency = user_data.get("preferred_currency", currency) if user_data else currency
     balance_currency_config = currency_map.get(preferred_currency, currency_map["uah"])
@@ -5034,11 +5046,11 @@ async def select_tariff(update: Update, context: ContextTypes.DEFAULT_TYPE, tari
             tariff_tier = "basic"
     
     # Получаем функции тарифа
-    tariff_features = api.get_tariff_features()
+    tariff_features = await api.get_tariff_features()
     features_list = tariff_features.get(tariff_tier, [])
     
     # Получаем названия функций из брендинга
-    branding = api.get_branding()
+    branding = await api.get_branding()
     features_names = branding.get("tariff_features_names", {})
     
     text = f"💎 **{get_text('tariff_selected', user_lang)}:** {tariff.get('name', get_text('unknown', user_lang))}\n"
@@ -5093,7 +5105,7 @@ async def select_tariff(update: Update, context: ContextTypes.DEFAULT_TYPE, tari
     text += f"**{get_text('payment_methods', user_lang)}**:"
     
     # Получаем доступные способы оплаты из API
-    available_methods = api.get_available_payment_methods()
+    available_methods = await api.get_available_payment_methods()
     
     # Маппинг названий способов оплаты
     payment_names = {
@@ -5179,14 +5191,14 @@ async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, tar
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await query.answer(f"❌ {get_text('auth_error', lang)}")
         return
     
-    user_data = api.get_user_data(token)
-    user_lang = get_user_lang(user_data, context, token)
+    user_data = await api.get_user_data(token)
+    user_lang = await get_user_lang(user_data, context, token)
     
     # Если оплата с баланса, используем специальный endpoint
     if provider == 'balance':
@@ -5246,7 +5258,7 @@ async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, tar
     
     await query.answer(f"⏳ {get_text('creating_payment', user_lang)}...")
     
-    result = api.create_payment(token, tariff_id, provider)
+    result = await api.create_payment(token, tariff_id, provider)
     
     if result.get("payment_url"):
         payment_url = result["payment_url"]
@@ -5316,19 +5328,19 @@ async def show_topup_balance(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await query.answer(f"❌ {get_text('auth_error', lang)}")
         return
     
-    user_data = api.get_user_data(token)
+    user_data = await api.get_user_data(token)
     if not user_data:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await query.answer(f"❌ {get_text('failed_to_load', lang)}")
         return
     
-    user_lang = get_user_lang(user_data, context, token)
+    user_lang = await get_user_lang(user_data, context, token)
     balance = user_data.get("balance", 0)
     preferred_currency = user_data.get("preferred_currency", "uah")
     currency_symbol = {"uah": "₴", "rub": "₽", "usd": "$"}.get(preferred_currency, "₴")
@@ -5386,9 +5398,9 @@ async def select_topup_method(update: Update, context: ContextTypes.DEFAULT_TYPE
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         if query:
             await query.answer(f"❌ {get_text('auth_error', lang)}")
         elif message:
@@ -5396,8 +5408,8 @@ async def select_topup_method(update: Update, context: ContextTypes.DEFAULT_TYPE
             await reply_with_logo(temp_update, f"❌ {get_text('auth_error', lang)}")
         return
     
-    user_data = api.get_user_data(token)
-    user_lang = get_user_lang(user_data, context, token)
+    user_data = await api.get_user_data(token)
+    user_lang = await get_user_lang(user_data, context, token)
     preferred_currency = user_data.get("preferred_currency", "uah") if user_data else "uah"
     currency_symbol = {"uah": "₴", "rub": "₽", "usd": "$"}.get(preferred_currency, "₴")
     
@@ -5407,7 +5419,7 @@ async def select_topup_method(update: Update, context: ContextTypes.DEFAULT_TYPE
     text += f"**{get_text('select_topup_method', user_lang)}**:"
     
     # Получаем доступные способы оплаты
-    available_methods = api.get_available_payment_methods()
+    available_methods = await api.get_available_payment_methods()
     
     payment_names = {
         'crystalpay': '💳 CrystalPay',
@@ -5483,14 +5495,14 @@ async def handle_topup_payment(update: Update, context: ContextTypes.DEFAULT_TYP
     user = update.effective_user
     telegram_id = user.id
     
-    token = get_user_token(telegram_id)
+    token = await get_user_token(telegram_id)
     if not token:
-        lang = get_user_lang(None, context, token)
+        lang = await get_user_lang(None, context, token)
         await query.answer(f"❌ {get_text('auth_error', lang)}")
         return
     
-    user_data = api.get_user_data(token)
-    user_lang = get_user_lang(user_data, context, token)
+    user_data = await api.get_user_data(token)
+    user_lang = await get_user_lang(user_data, context, token)
     preferred_currency = user_data.get("preferred_currency", "uah") if user_data else "uah"
     currency_symbol = {"uah": "₴", "rub": "₽", "usd": "$"}.get(preferred_currency, "₴")
     
@@ -5561,8 +5573,31 @@ async def handle_topup_payment(update: Update, context: ContextTypes.DEFAULT_TYP
 
 def main():
     """Главная функция запуска бота"""
+    async def post_init(application: Application):
+        """Прогрев кешей конфигурации до приема первых апдейтов"""
+        config, trial = await asyncio.gather(api.get_bot_config(), api.get_trial_settings())
+        if config:
+            _bot_config_cache['data'] = config
+            _bot_config_cache['last_update'] = time.time()
+            logger.info("Bot config loaded from API")
+        if trial:
+            _trial_settings_cache['data'] = trial
+            _trial_settings_cache['last_update'] = time.time()
+    
+    async def post_shutdown(application: Application):
+        await api.close()
+    
     # Создаем приложение
-    application = Application.builder().token(CLIENT_BOT_TOKEN).build()
+    # Апдейты обрабатываются конкурентно: обработчики не блокируют друг друга на запросах к API
+    concurrent_updates = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
+    application = (
+        Application.builder()
+        .token(CLIENT_BOT_TOKEN)
+        .concurrent_updates(concurrent_updates)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -5616,14 +5651,14 @@ def main():
                 message = update.message.text
                 
                 telegram_id = update.effective_user.id
-                token = get_user_token(telegram_id)
+                token = await get_user_token(telegram_id)
                 
                 if token:
-                    result = api.create_support_ticket(token, subject, message)
+                    result = await api.create_support_ticket(token, subject, message)
                     
                     # Получаем язык пользователя для кнопки
-                    user_data_api = api.get_user_data(token) if token else None
-                    user_lang = get_user_lang(user_data_api, context, token)
+                    user_data_api = await api.get_user_data(token) if token else None
+                    user_lang = await get_user_lang(user_data_api, context, token)
                     
                     # API возвращает {"message": "Created", "ticket_id": nt.id} со статусом 201
                     # Проверяем оба варианта
@@ -5670,14 +5705,14 @@ def main():
                 message = update.message.text
                 
                 telegram_id = update.effective_user.id
-                token = get_user_token(telegram_id)
+                token = await get_user_token(telegram_id)
                 
                 if token and ticket_id:
                     # Получаем язык пользователя для кнопок
-                    user_data_api = api.get_user_data(token)
-                    user_lang = get_user_lang(user_data_api, context, token)
+                    user_data_api = await api.get_user_data(token)
+                    user_lang = await get_user_lang(user_data_api, context, token)
                     
-                    result = api.reply_to_ticket(token, ticket_id, message)
+                    result = await api.reply_to_ticket(token, ticket_id, message)
                     
                     if result.get("id") or result.get("success"):
                         # Создаем клавиатуру с кнопками "Просмотреть тикет" и "Назад"
@@ -5717,9 +5752,9 @@ def main():
                 user = update.effective_user
                 telegram_id = user.id
                 
-                token = get_user_token(telegram_id)
-                user_data_api = api.get_user_data(token) if token else None
-                user_lang = get_user_lang(user_data_api, context, token)
+                token = await get_user_token(telegram_id)
+                user_data_api = await api.get_user_data(token) if token else None
+                user_lang = await get_user_lang(user_data_api, context, token)
                 
                 try:
                     amount_text = update.message.text.strip()
@@ -5786,13 +5821,13 @@ def main():
         user = update.effective_user
         telegram_id = user.id
         
-        token = get_user_token(telegram_id)
+        token = await get_user_token(telegram_id)
         if not token:
             await message.reply_text("❌ Ошибка авторизации")
             return
         
-        user_data = api.get_user_data(token)
-        user_lang = get_user_lang(user_data, context, token)
+        user_data = await api.get_user_data(token)
+        user_lang = await get_user_lang(user_data, context, token)
         
         # Платеж обрабатывается через вебхук, просто уведомляем пользователя
         text = f"✅ **{get_text('payment_successful', user_lang)}**\n\n"
@@ -5801,12 +5836,12 @@ def main():
         
         await reply_with_logo(update, text, parse_mode="Markdown")
         
-        # Даем время вебхуку обработать платеж, затем обновляем статус
-        import asyncio
-        await asyncio.sleep(2)
+        # Ждем выдачи заказа (API отвечает, как только подписка обновлена)
+        status = await api.wait_payment(order_id)
+        if not status or not status.get('paid'):
+            logger.warning(f"Payment {order_id} is not fulfilled yet: {status}")
         
         # Обновляем данные пользователя - создаем временный callback для показа главного меню
-        # Вебхук уже обработал платеж, подписка обновлена
         from telegram import CallbackQuery
         # Создаем временный callback query для показа главного меню
         temp_query = CallbackQuery(
@@ -1,48 +1,131 @@
-"""Gunicorn конфигурация для инициализации базы данных в worker процессах"""
+"""
+Конфигурация gunicorn для StealthNET API
+
+    gunicorn -c gunicorn_config.py wsgi:application
+
+- preload_app: приложение загружается в master процессе, воркеры делят его память (copy-on-write);
+- init_database() (создание таблиц, миграции схемы) выполняется один раз в master процессе
+  до форка воркеров, а не в каждом воркере; там же строится манифест статики;
+- планировщик (APScheduler: синхронизация RemnaWave, авторассылка, очередь рассылок) работает
+  ровно в одном воркере. Если этот воркер перезапускается, планировщик получает воркер,
+  который его заменяет.
+- ожидание оплаты (/miniapp/payments/<order_id>/events, SSE/long-poll) держит запрос до 25с:
+  с gthread - поток воркера, поэтому таких запросов на воркер не больше половины потоков
+  (PAYMENT_EVENTS_MAX_WAITERS), остальные получают 503. Если ожидающих много, используйте
+  GUNICORN_WORKER_CLASS=gevent - там ожидание стоит гринлета и лимита нет.
+
+Параметры задаются переменными окружения GUNICORN_* (см. env.example).
+"""
+import os
+import multiprocessing
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# sync, gthread или gevent (для gevent: pip install gevent)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread").lower()
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))  # потоков на воркер (gthread)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))  # соединений на воркер (gevent)
+
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Keep-alive должен быть дольше, чем keepalive_timeout у nginx для upstream, иначе
+# gunicorn закрывает соединение, которое nginx считает живым (502 на следующем запросе).
+# Для sync воркеров keep-alive не используется.
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+# Плановый перезапуск воркеров (0 - выключен); jitter - чтобы не перезапускались одновременно
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Heartbeat воркеров - в памяти, а не на overlay-диске контейнера
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# Планировщик можно отключить (например, на дополнительных репликах API)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+
+if worker_class == "gevent":
+    # С preload_app приложение импортируется до форка - патчим стандартную библиотеку заранее
+    from gevent import monkey
+    monkey.patch_all()
+
 
 def on_starting(server):
-    """Вызывается при старте master процесса"""
-    print("🚀 [gunicorn] Master процесс запущен")
+    """Вызывается при старте master процесса - подготовка БД один раз до форка воркеров"""
+    print(f"🚀 [gunicorn] Master процесс запущен: {worker_class}, воркеров: {workers}")
+    try:
+        from app import app, db, init_database
+        init_database()
+
+        # Соединения, открытые master процессом, не должны достаться воркерам
+        with app.app_context():
+            db.engine.dispose()
+        print("✅ [gunicorn] База данных инициализирована")
+
+        # Манифест статики строится один раз, воркеры получают его после форка
+        from modules.static_assets import load_static_manifests
+        load_static_manifests()
+    except Exception as e:
+        print(f"❌ [gunicorn] Ошибка инициализации БД: {e}")
+        import traceback
+        traceback.print_exc()
+
 
 def when_ready(server):
     """Вызывается когда master процесс готов к работе"""
     print("✅ [gunicorn] Master процесс готов")
 
+
+def on_reload(server):
+    """Вызывается при перезагрузке (SIGHUP) - новые воркеры стартуют до остановки старых"""
+    # Планировщик переходит к новому поколению воркеров
+    server.scheduler_generation = getattr(server, 'scheduler_generation', 0) + 1
+
+
 def pre_fork(server, worker):
-    """Вызывается перед форком worker процесса"""
-    print(f"🔧 [gunicorn] Подготовка worker процесса {worker.age}")
+    """Вызывается в master процессе перед форком worker процесса"""
+    # Планировщик - только в одном воркере текущего поколения. Воркер, который завершился,
+    # уже удален из server.WORKERS, поэтому его замена получает планировщик.
+    if not SCHEDULER_ENABLED:
+        return
+    generation = getattr(server, 'scheduler_generation', 0)
+    if not any(getattr(w, 'scheduler_generation', None) == generation for w in server.WORKERS.values()):
+        worker.runs_scheduler = True
+        worker.scheduler_generation = generation
+
 
 def post_fork(server, worker):
-    """Вызывается после форка worker процесса - здесь инициализируем БД"""
-    import os
-    print(f"🚀 [gunicorn] Worker процесс {worker.age} запущен, инициализация БД...")
-    print(f"🔍 [gunicorn] Worker {worker.age}: Текущая директория: {os.getcwd()}")
+    """Вызывается после форка worker процесса"""
+    role = " (планировщик)" if getattr(worker, 'runs_scheduler', False) else ""
+    print(f"🚀 [gunicorn] Worker процесс {worker.pid} запущен{role}")
+
+
+def post_worker_init(worker):
+    """Вызывается после инициализации worker процесса - запуск планировщика"""
+    if not getattr(worker, 'runs_scheduler', False):
+        return
     try:
-        # Импортируем app и init_database в worker процессе
-        from app import app, init_database
-        print(f"🔍 [gunicorn] Worker {worker.age}: app импортирован")
-        
+        from app import app, start_scheduler
         with app.app_context():
-            print(f"🔍 [gunicorn] Worker {worker.age}: app_context создан, вызываю init_database()")
-            init_database()
-            print(f"✅ [gunicorn] Worker {worker.age}: База данных инициализирована")
-            
-            # Проверяем, что БД создалась
-            db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-            if db_path and os.path.exists(db_path):
-                db_size = os.path.getsize(db_path)
-                print(f"✅ [gunicorn] Worker {worker.age}: БД найдена: {db_path}, размер: {db_size} байт")
-            else:
-                print(f"⚠️ [gunicorn] Worker {worker.age}: БД НЕ найдена: {db_path}")
+            start_scheduler()
     except Exception as e:
-        print(f"❌ [gunicorn] Worker {worker.age}: Ошибка инициализации БД: {e}")
+        print(f"❌ [gunicorn] Worker {worker.pid}: Ошибка запуска планировщика: {e}")
         import traceback
         traceback.print_exc()
 
+
 def worker_int(worker):
     """Вызывается при получении SIGINT/SIGQUIT worker процессом"""
-    print(f"🛑 [gunicorn] Worker {worker.age} получил сигнал остановки")
+    print(f"🛑 [gunicorn] Worker {worker.pid} получил сигнал остановки")
+
 
 def worker_abort(worker):
     """Вызывается при получении SIGABRT worker процессом"""
-    print(f"⚠️ [gunicorn] Worker {worker.age} получил сигнал аварийной остановки")
+    print(f"⚠️ [gunicorn] Worker {worker.pid} получил сигнал аварийной остановки")
@@ -1,8 +1,12 @@
 """
 API эндпоинты администратора
 
-- GET/POST /api/admin/users - Управление пользователями
+- GET/POST /api/admin/users - Управление пользователями (постранично, с фильтрами)
 - GET /api/admin/statistics - Статистика
+- GET /api/admin/statistics/revenue - Выручка за период (по дням и провайдерам)
+- GET/DELETE /api/admin/rate-limit-stats - Срабатывания лимитов запросов
+- GET /api/admin/payment-jobs - Очередь выдачи заказов (зависшие задачи)
+- POST /api/admin/payment-jobs/<job_id>/retry - Повторить выдачу заказа
 - GET/POST /api/admin/system-settings - Системные настройки
 - GET/POST /api/admin/branding - Брендинг
 - GET/POST /api/admin/bot-config - Конфигурация бота
@@ -15,6 +19,7 @@ API эндпоинты администратора
 - GET/POST /api/admin/tariff-features - Функции тарифов
 - GET/POST /api/admin/currency-rates - Курсы валют
 - POST /api/admin/broadcast - Рассылка
+- GET /api/admin/broadcast/<job_id> - Прогресс рассылки
 """
 
 from flask import jsonify, request
@@ -24,9 +29,9 @@ import json
 import os
 
 from modules.core import get_app, get_db, get_cache, get_bcrypt
-from modules.auth import admin_required
+from modules.auth import admin_required, invalidate_user_auth
 from modules.models.user import User
-from modules.models.payment import Payment, PaymentSetting
+from modules.models.payment import Payment, DailyRevenue
 from modules.models.tariff import Tariff
 from modules.models.promo import PromoCode
 from modules.models.ticket import Ticket, TicketMessage
@@ -37,7 +42,13 @@ from modules.models.referral import ReferralSetting
 from modules.models.tariff_feature import TariffFeatureSetting
 from modules.models.currency import CurrencyRate
 from modules.models.auto_broadcast import AutoBroadcastMessage, AutoBroadcastSettings
-from modules.models.trial import TrialSettings
+from modules.models.broadcast import BroadcastJob, BroadcastRecipient
+from modules.remnawave import get_remnawave_client
+from modules.remnawave_mirror import store_patch_result, delete_live_data
+from modules.settings_registry import invalidate_settings
+from modules.api.payments.vault import get_payment_credentials
+from modules.models.remnawave_user import RemnaWaveUserState
+from modules.currency import parse_iso_datetime
 
 app = get_app()
 db = get_db()
@@ -45,97 +56,185 @@ cache = get_cache()
 bcrypt = get_bcrypt()
 
 
-def get_remnawave_headers():
-    """Получить заголовки для RemnaWave API"""
-    headers = {}
-    cookies = {}
-    
-    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
-    if ADMIN_TOKEN:
-        headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
-    
-    REMNAWAVE_COOKIES_STR = os.getenv("REMNAWAVE_COOKIES", "")
-    if REMNAWAVE_COOKIES_STR:
-        try:
-            cookies = json.loads(REMNAWAVE_COOKIES_STR)
-        except json.JSONDecodeError:
-            pass
-    
-    return headers, cookies
-
-
 # ============================================================================
 # USERS
 # ============================================================================
 
+# Без параметров пагинации отдается массив всех пользователей (старая админка не листает страницы);
+# больше 0 - не больше этого числа (когда админка перейдет на пагинацию)
+ADMIN_USERS_LEGACY_LIMIT = int(os.getenv("ADMIN_USERS_LEGACY_LIMIT", "0"))
+ADMIN_USERS_MAX_LIMIT = 500
+
+ADMIN_USERS_SORT_FIELDS = {
+    'id': User.id,
+    'email': User.email,
+    'telegram_username': User.telegram_username,
+    'balance': User.balance,
+    'created_at': User.created_at,
+    'expire_at': RemnaWaveUserState.expire_at
+}
+ADMIN_USERS_PAGE_PARAMS = ('limit', 'offset', 'cursor', 'search', 'email', 'telegram_username',
+                           'blocked', 'has_subscription', 'expire_from', 'expire_to', 'sort', 'order')
+
+
+def _parse_bool_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _match_live_by_email(users):
+    """
+    Поиск снимков RemnaWave по email для пользователей страницы без совпадения по UUID
+
+    Один запрос к зеркалу на страницу (варианты email: как есть, '@' -> '_', логин до '@').
+    """
+    variants = {}
+    for u in users:
+        if not u.email:
+            continue
+        email = u.email.lower()
+        for v in (email, email.replace('@', '_'), email.split('@')[0]):
+            variants.setdefault(v, u)
+    if not variants:
+        return {}
+
+    keys = list(variants)
+    rows = RemnaWaveUserState.query.filter(
+        db.or_(db.func.lower(RemnaWaveUserState.email).in_(keys), db.func.lower(RemnaWaveUserState.username).in_(keys))
+    ).all()
+
+    matched = {}
+    for row in rows:
+        for key in ((row.email or '').lower(), (row.username or '').lower()):
+            u = variants.get(key)
+            if u is not None and u.id not in matched:
+                matched[u.id] = row
+    return matched
+
+
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def get_admin_users(current_admin):
-    """Получение списка пользователей"""
+    """
+    Получение списка пользователей (постранично, с фильтрами)
+
+    Query параметры:
+        limit, offset       - пагинация (limit <= 500)
+        cursor              - id последнего пользователя предыдущей страницы (только sort=id)
+        search              - подстрока email / telegram_username / telegram_id
+        email, telegram_username - подстрока поля
+        blocked             - true/false
+        has_subscription    - true/false (по зеркалу RemnaWave)
+        expire_from, expire_to - диапазон окончания подписки (ISO)
+        sort                - id, email, telegram_username, balance, created_at, expire_at
+        order               - asc/desc
+
+    С любым из параметров возвращается {"users": [...], "total", "limit", "offset", "next_cursor"};
+    без параметров - массив всех пользователей (формат старой админки; ADMIN_USERS_LEGACY_LIMIT
+    ограничивает его) и общее число в заголовке X-Total-Count.
+    """
     try:
-        local_users = User.query.all()
-        live_map = cache.get('all_live_users_map')
-        
-        if not live_map:
-            headers, cookies = get_remnawave_headers()
-            try:
-                resp = requests.get(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies, timeout=10)
-                data = resp.json().get('response', {})
-                users_list = data.get('users', []) if isinstance(data, dict) else (data if isinstance(data, list) else [])
-                # Создаем два индекса: по UUID и по email/username
-                live_map = {u['uuid']: u for u in users_list if isinstance(u, dict) and 'uuid' in u}
-                # Дополнительный индекс по email для поиска, если UUID не совпадает
-                live_map_by_email = {}
-                for u in users_list:
-                    if isinstance(u, dict):
-                        # Пробуем разные поля для email/username
-                        email_key = u.get('email') or u.get('username') or u.get('name')
-                        if email_key:
-                            live_map_by_email[email_key.lower()] = u
-                cache.set('all_live_users_map', live_map, timeout=60)
-                cache.set('all_live_users_map_by_email', live_map_by_email, timeout=60)
-            except Exception as e:
-                print(f"Warning: Could not fetch live users: {e}")
-                live_map = {}
-                live_map_by_email = {}
+        paged = any(name in request.args for name in ADMIN_USERS_PAGE_PARAMS)
+
+        query = db.session.query(User, RemnaWaveUserState).outerjoin(
+            RemnaWaveUserState, RemnaWaveUserState.uuid == User.remnawave_uuid
+        )
+
+        # Фильтры
+        search = (request.args.get('search') or '').strip()
+        if search:
+            pattern = f"%{search}%"
+            query = query.filter(db.or_(
+                User.email.ilike(pattern),
+                User.telegram_username.ilike(pattern),
+                User.telegram_id.ilike(pattern)
+            ))
+        email = (request.args.get('email') or '').strip()
+        if email:
+            query = query.filter(User.email.ilike(f"%{email}%"))
+        telegram_username = (request.args.get('telegram_username') or '').strip().lstrip('@')
+        if telegram_username:
+            query = query.filter(User.telegram_username.ilike(f"%{telegram_username}%"))
+
+        blocked = _parse_bool_arg('blocked')
+        if blocked is True:
+            query = query.filter(User.is_blocked.is_(True))
+        elif blocked is False:
+            query = query.filter(User.is_blocked.is_(False))
+
+        now = datetime.now(timezone.utc)
+        has_subscription = _parse_bool_arg('has_subscription')
+        if has_subscription is True:
+            query = query.filter(RemnaWaveUserState.expire_at > now)
+        elif has_subscription is False:
+            query = query.filter(db.or_(RemnaWaveUserState.expire_at.is_(None), RemnaWaveUserState.expire_at <= now))
+
+        expire_from = parse_iso_datetime(request.args.get('expire_from'))
+        if request.args.get('expire_from') and not expire_from:
+            return jsonify({"message": "Invalid expire_from"}), 400
+        expire_to = parse_iso_datetime(request.args.get('expire_to'))
+        if request.args.get('expire_to') and not expire_to:
+            return jsonify({"message": "Invalid expire_to"}), 400
+        if expire_from:
+            if expire_from.tzinfo is None:
+                expire_from = expire_from.replace(tzinfo=timezone.utc)
+            query = query.filter(RemnaWaveUserState.expire_at >= expire_from)
+        if expire_to:
+            if expire_to.tzinfo is None:
+                expire_to = expire_to.replace(tzinfo=timezone.utc)
+            query = query.filter(RemnaWaveUserState.expire_at <= expire_to)
+
+        # Сортировка
+        sort = request.args.get('sort', 'id')
+        if sort not in ADMIN_USERS_SORT_FIELDS:
+            return jsonify({"message": f"Invalid sort. Valid: {', '.join(ADMIN_USERS_SORT_FIELDS)}"}), 400
+        descending = request.args.get('order', 'asc').lower() == 'desc'
+        sort_column = ADMIN_USERS_SORT_FIELDS[sort]
+
+        # Пагинация
+        if paged:
+            limit = min(max(request.args.get('limit', type=int) or 50, 1), ADMIN_USERS_MAX_LIMIT)
         else:
-            live_map_by_email = cache.get('all_live_users_map_by_email') or {}
-        
-        from modules.currency import convert_from_usd
-        
+            limit = ADMIN_USERS_LEGACY_LIMIT or None
+        offset = max(request.args.get('offset', type=int) or 0, 0)
+
+        total = query.order_by(None).count()
+
+        cursor = request.args.get('cursor', type=int)
+        if cursor is not None:
+            if sort != 'id':
+                return jsonify({"message": "cursor is supported only with sort=id"}), 400
+            query = query.filter(User.id < cursor if descending else User.id > cursor)
+            offset = 0
+
+        order_by = [sort_column.desc() if descending else sort_column.asc()]
+        if sort != 'id':
+            order_by.append(User.id.desc() if descending else User.id.asc())
+        rows = query.order_by(*order_by).limit(limit).offset(offset).all()
+
+        # Пользователи страницы без снимка по UUID - ищем в зеркале по email
+        by_email = _match_live_by_email([u for u, state in rows if state is None])
+
+        from modules.currency import convert_many
+
+        balances_usd = [float(u.balance) if u.balance else 0.0 for u, state in rows]
+        balances_converted = convert_many(balances_usd, [u.preferred_currency or 'uah' for u, state in rows])
+
         combined = []
-        for u in local_users:
-            balance_usd = float(u.balance) if u.balance else 0.0
-            balance_converted = convert_from_usd(balance_usd, u.preferred_currency or 'uah')
-            
-            # Пытаемся найти пользователя в RemnaWave
-            live_data = None
-            fetch_error = None
-            
-            # Сначала ищем по UUID
-            if u.remnawave_uuid:
-                live_data = live_map.get(u.remnawave_uuid)
-            
-            # Если не нашли по UUID, пробуем найти по email
-            if not live_data and u.email:
-                # Пробуем разные варианты email для поиска
-                email_variants = [
-                    u.email.lower(),
-                    u.email.replace('@', '_').lower(),  # admin@stealthnet.app -> admin_stealthnet_app
-                    u.email.split('@')[0].lower()  # admin@stealthnet.app -> admin
-                ]
-                for email_var in email_variants:
-                    if email_var in live_map_by_email:
-                        live_data = live_map_by_email[email_var]
-                        # Если нашли по email, обновляем UUID в БД (но не коммитим сразу, чтобы не делать много коммитов)
-                        if live_data and live_data.get('uuid') and live_data.get('uuid') != u.remnawave_uuid:
-                            print(f"Updating UUID for user {u.email}: {u.remnawave_uuid} -> {live_data.get('uuid')}")
-                            u.remnawave_uuid = live_data.get('uuid')
-                        break
-            
-            if u.remnawave_uuid and not live_data:
-                fetch_error = "User not found in RemnaWave"
-            
+        for (u, state), balance_usd, balance_converted in zip(rows, balances_usd, balances_converted):
+
+            if state is None and u.id in by_email:
+                state = by_email[u.id]
+                # Если нашли по email, обновляем UUID в БД (коммит один раз на страницу)
+                if state.uuid != u.remnawave_uuid:
+                    print(f"Updating UUID for user {u.email}: {u.remnawave_uuid} -> {state.uuid}")
+                    u.remnawave_uuid = state.uuid
+
+            live_data = state.get_data() if state is not None else None
+            fetch_error = "User not found in RemnaWave" if u.remnawave_uuid and not live_data else None
+
             combined.append({
                 "id": u.id, 
                 "email": u.email, 
@@ -155,18 +254,36 @@ def get_admin_users(current_admin):
                 "live_data": {"response": live_data},
                 "fetch_error": fetch_error
             })
-        
+
         # Коммитим все обновления UUID одним разом
-        try:
-            db.session.commit()
-        except Exception as e:
-            print(f"Error committing UUID updates: {e}")
-            db.session.rollback()
-        
-        return jsonify(combined), 200
+        if by_email:
+            try:
+                db.session.commit()
+            except Exception as e:
+                print(f"Error committing UUID updates: {e}")
+                db.session.rollback()
+
+        if not paged:
+            response = jsonify(combined)
+            response.headers['X-Total-Count'] = str(total)
+            return response, 200
+
+        next_cursor = None
+        if sort == 'id' and len(rows) == limit:
+            next_cursor = rows[-1][0].id
+
+        return jsonify({
+            "users": combined,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_cursor": next_cursor
+        }), 200
         
     except Exception as e:
         print(f"Error in get_admin_users: {e}")
+        import traceback
+        traceback.print_exc()
         return jsonify({"message": "Internal Server Error"}), 500
 
 
@@ -185,8 +302,17 @@ def delete_user(current_admin, user_id):
         ticket_messages_count = TicketMessage.query.filter_by(sender_id=user_id).count()
         referrals_count = User.query.filter_by(referrer_id=user_id).count()
         
+        # Реферальная статистика и журнал начислений ссылаются на пользователя и его платежи
+        from modules.referral_ledger import forget_referral_user
+        forget_referral_user(user_id)
+        
         # Если есть связанные данные, удаляем их каскадно
         if payments_count > 0:
+            # Задачи выдачи ссылаются на платежи
+            from modules.models.payment_job import PaymentFulfilmentJob
+            PaymentFulfilmentJob.query.filter(
+                PaymentFulfilmentJob.payment_id.in_(db.select(Payment.id).where(Payment.user_id == user_id))
+            ).delete(synchronize_session=False)
             Payment.query.filter_by(user_id=user_id).delete()
         
         if tickets_count > 0:
@@ -210,13 +336,7 @@ def delete_user(current_admin, user_id):
         # Удаляем пользователя из RemnaWave перед удалением из локальной БД
         if remnawave_uuid:
             try:
-                headers, cookies = get_remnawave_headers()
-                delete_response = requests.delete(
-                    f"{os.getenv('API_URL')}/api/users/{remnawave_uuid}",
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=10
-                )
+                delete_response = get_remnawave_client().delete_user(remnawave_uuid)
                 if delete_response.status_code in [200, 204]:
                     print(f"✓ User {user_id} deleted from RemnaWave (UUID: {remnawave_uuid})")
                 else:
@@ -227,12 +347,14 @@ def delete_user(current_admin, user_id):
         
         # Очищаем кэш
         if remnawave_uuid:
-            cache.delete(f'live_data_{remnawave_uuid}')
+            delete_live_data(remnawave_uuid)
         cache.delete('all_live_users_map')
         
         # Удаляем пользователя из локальной БД
         db.session.delete(user)
         db.session.commit()
+        # Токены удаленного пользователя перестают работать сразу, а не по истечении TTL кеша
+        invalidate_user_auth(user_id)
         
         return jsonify({
             "message": "User deleted successfully",
@@ -299,7 +421,6 @@ def update_user_balance(current_admin, user_id):
         db.session.commit()
         
         # Очищаем кэш пользователя
-        cache.delete(f'live_data_{u.remnawave_uuid}')
         cache.delete('all_live_users_map')
         
         # Конвертируем баланс обратно в валюту пользователя для отображения
@@ -399,6 +520,7 @@ def block_user(current_admin, user_id):
         user.blocked_at = datetime.now(timezone.utc)
         
         db.session.commit()
+        invalidate_user_auth(user_id)
         
         return jsonify({
             "message": "User blocked successfully",
@@ -428,10 +550,9 @@ def unblock_user(current_admin, user_id):
         user.blocked_at = None
         
         db.session.commit()
+        invalidate_user_auth(user_id)
         
         # Очищаем кэш пользователя, чтобы данные обновились
-        if user.remnawave_uuid:
-            cache.delete(f'live_data_{user.remnawave_uuid}')
         cache.delete('all_live_users_map')
         
         return jsonify({
@@ -471,14 +592,8 @@ def update_user_telegram_id(current_admin, user_id):
         # Обновляем telegramId в RemnaWave, если есть UUID
         if user.remnawave_uuid:
             try:
-                headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-                requests.patch(
-                    f"{os.getenv('API_URL')}/api/users",
-                    headers=headers,
-                    json={"uuid": user.remnawave_uuid, "telegramId": telegram_id},
-                    timeout=10
-                )
-                cache.delete(f'live_data_{user.remnawave_uuid}')
+                patch_resp = get_remnawave_client().patch_user(user.remnawave_uuid, telegramId=telegram_id)
+                store_patch_result(patch_resp, user.remnawave_uuid, {'telegramId': telegram_id})
             except Exception as e:
                 print(f"Warning: Failed to update telegramId in RemnaWave: {e}")
                 # Не возвращаем ошибку, т.к. локальное обновление уже выполнено
@@ -512,7 +627,7 @@ def admin_update_user(current_admin, user_id):
         if not action:
             return jsonify({"message": "Action is required. Valid actions: grant_tariff, grant_trial, set_device_limit"}), 400
             
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
+        rw = get_remnawave_client()
 
         if action == 'grant_tariff':
             tariff_id = data.get('tariff_id')
@@ -523,34 +638,30 @@ def admin_update_user(current_admin, user_id):
             if not tariff:
                 return jsonify({"message": "Tariff not found"}), 404
 
-            resp = requests.get(f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}", headers=headers)
-            if resp.status_code == 200:
-                user_data = resp.json().get('response', {})
+            user_data = rw.get_user(user.remnawave_uuid)
+            if user_data is not None:
                 current_expire = user_data.get('expireAt')
                 if current_expire:
                     new_expire_dt = datetime.fromisoformat(current_expire) + timedelta(days=days)
                 else:
                     new_expire_dt = datetime.now(timezone.utc) + timedelta(days=days)
                 
-                requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
-                             json={"uuid": user.remnawave_uuid, "expireAt": new_expire_dt.isoformat()})
-                cache.delete(f'live_data_{user.remnawave_uuid}')
+                patch_resp = rw.patch_user(user.remnawave_uuid, expireAt=new_expire_dt.isoformat())
+                store_patch_result(patch_resp, user.remnawave_uuid, {'expireAt': new_expire_dt.isoformat()})
                 return jsonify({"message": "Tariff granted successfully"}), 200
             return jsonify({"message": "Failed to get user data"}), 500
 
         elif action == 'grant_trial':
             days = data.get('days', 3)
             new_expire = (datetime.now(timezone.utc) + timedelta(days=days)).isoformat()
-            requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
-                         json={"uuid": user.remnawave_uuid, "expireAt": new_expire})
-            cache.delete(f'live_data_{user.remnawave_uuid}')
+            patch_resp = rw.patch_user(user.remnawave_uuid, expireAt=new_expire)
+            store_patch_result(patch_resp, user.remnawave_uuid, {'expireAt': new_expire})
             return jsonify({"message": "Trial granted successfully"}), 200
 
         elif action == 'set_device_limit':
             device_limit = data.get('device_limit', 0)
-            requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
-                         json={"uuid": user.remnawave_uuid, "hwidDeviceLimit": device_limit})
-            cache.delete(f'live_data_{user.remnawave_uuid}')
+            patch_resp = rw.patch_user(user.remnawave_uuid, hwidDeviceLimit=device_limit)
+            store_patch_result(patch_resp, user.remnawave_uuid, {'hwidDeviceLimit': device_limit})
             return jsonify({"message": "Device limit updated successfully"}), 200
 
         return jsonify({"message": "Invalid action"}), 400
@@ -575,6 +686,18 @@ def get_users_emails(current_admin):
 # STATISTICS
 # ============================================================================
 
+def _revenue_by_currency(*filters):
+    """Сумма выручки по валютам из сводки"""
+    revenue = {'USD': 0.0, 'UAH': 0.0, 'RUB': 0.0}
+    rows = db.session.query(
+        DailyRevenue.currency, db.func.sum(DailyRevenue.total_amount)
+    ).filter(*filters).group_by(DailyRevenue.currency).all()
+    for currency, amount in rows:
+        if currency in revenue:
+            revenue[currency] += float(amount or 0.0)
+    return revenue
+
+
 @app.route('/api/admin/statistics', methods=['GET'])
 @admin_required
 def get_statistics(current_admin):
@@ -589,40 +712,12 @@ def get_statistics(current_admin):
         # Подсчет продаж (только успешные платежи)
         total_sales_count = successful_payments
         
-        # Подсчет общей прибыли по валютам
-        paid_payments = Payment.query.filter(Payment.status == 'PAID').all()
-        total_revenue = {'USD': 0.0, 'UAH': 0.0, 'RUB': 0.0}
-        
-        for payment in paid_payments:
-            currency = payment.currency or 'USD'
-            amount = float(payment.amount) if payment.amount else 0.0
-            
-            # Конвертируем в USD для общего подсчета, если нужно
-            if currency == 'USD':
-                total_revenue['USD'] += amount
-            elif currency == 'UAH':
-                total_revenue['UAH'] += amount
-            elif currency == 'RUB':
-                total_revenue['RUB'] += amount
-        
+        # Прибыль по валютам - из дневной сводки (GROUP BY в БД)
+        total_revenue = _revenue_by_currency()
+
         # Подсчет прибыли за сегодня
-        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        today_payments = Payment.query.filter(
-            Payment.status == 'PAID',
-            Payment.created_at >= today_start
-        ).all()
-        
-        today_revenue = {'USD': 0.0, 'UAH': 0.0, 'RUB': 0.0}
-        for payment in today_payments:
-            currency = payment.currency or 'USD'
-            amount = float(payment.amount) if payment.amount else 0.0
-            
-            if currency == 'USD':
-                today_revenue['USD'] += amount
-            elif currency == 'UAH':
-                today_revenue['UAH'] += amount
-            elif currency == 'RUB':
-                today_revenue['RUB'] += amount
+        today = datetime.now(timezone.utc).date()
+        today_revenue = _revenue_by_currency(DailyRevenue.date == today)
 
         return jsonify({
             'total_users': total_users,
@@ -643,6 +738,102 @@ def get_statistics(current_admin):
         return jsonify({"message": "Internal Server Error"}), 500
 
 
+@app.route('/api/admin/rate-limit-stats', methods=['GET', 'DELETE'])
+@admin_required
+def rate_limit_stats(current_admin):
+    """Срабатывания лимитов запросов по эндпоинтам (DELETE - сбросить счетчики)"""
+    try:
+        from modules.rate_limit import get_rate_limit_stats, reset_rate_limit_stats
+        if request.method == 'DELETE':
+            reset_rate_limit_stats()
+        return jsonify(get_rate_limit_stats()), 200
+    except Exception as e:
+        print(f"Error in rate_limit_stats: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": "Internal Server Error"}), 500
+
+
+@app.route('/api/admin/payment-jobs', methods=['GET'])
+@admin_required
+def payment_jobs(current_admin):
+    """Очередь выдачи заказов: задачи по статусам и зависшие задачи"""
+    try:
+        from modules.payment_fulfilment import get_fulfilment_stats
+        limit = min(request.args.get('limit', 100, type=int) or 100, 500)
+        return jsonify(get_fulfilment_stats(limit=limit)), 200
+    except Exception as e:
+        print(f"Error in payment_jobs: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": "Internal Server Error"}), 500
+
+
+@app.route('/api/admin/payment-jobs/<int:job_id>/retry', methods=['POST'])
+@admin_required
+def retry_payment_job(current_admin, job_id):
+    """Повторить выдачу заказа (попытки считаются заново)"""
+    try:
+        from modules.payment_fulfilment import retry_fulfilment_job
+        job = retry_fulfilment_job(job_id)
+        if not job:
+            return jsonify({"message": "Payment job not found"}), 404
+        return jsonify(job.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in retry_payment_job: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": "Internal Server Error"}), 500
+
+
+@app.route('/api/admin/statistics/revenue', methods=['GET'])
+@admin_required
+def get_revenue_statistics(current_admin):
+    """
+    Выручка за период из дневной сводки
+
+    Query параметры:
+        days - длина периода (по умолчанию 30, максимум 366)
+        provider, currency - фильтры
+    """
+    try:
+        days = min(max(request.args.get('days', type=int) or 30, 1), 366)
+        start_date = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+        filters = [DailyRevenue.date >= start_date]
+        if request.args.get('provider'):
+            filters.append(DailyRevenue.provider == request.args.get('provider'))
+        if request.args.get('currency'):
+            filters.append(DailyRevenue.currency == request.args.get('currency').upper())
+
+        daily = DailyRevenue.query.filter(*filters).order_by(DailyRevenue.date.asc()).all()
+
+        by_provider = db.session.query(
+            DailyRevenue.provider,
+            DailyRevenue.currency,
+            db.func.sum(DailyRevenue.payments_count),
+            db.func.sum(DailyRevenue.total_amount)
+        ).filter(*filters).group_by(DailyRevenue.provider, DailyRevenue.currency).all()
+
+        return jsonify({
+            'days': days,
+            'from': start_date.isoformat(),
+            'daily': [row.to_dict() for row in daily],
+            'by_provider': [
+                {'provider': provider, 'currency': currency, 'count': int(count or 0), 'amount': round(float(amount or 0.0), 2)}
+                for provider, currency, count, amount in by_provider
+            ],
+            'total': _revenue_by_currency(*filters)
+        }), 200
+
+    except Exception as e:
+        print(f"Error in get_revenue_statistics: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": "Internal Server Error"}), 500
+
+
 @app.route('/api/admin/sales', methods=['GET'])
 @admin_required
 def get_sales(current_admin):
@@ -736,21 +927,7 @@ def get_sales(current_admin):
 def get_squads(current_admin):
     """Получить список сквадов"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.get(f"{os.getenv('API_URL')}/api/internal-squads", headers=headers, timeout=10)
-        resp.raise_for_status()
-        
-        data = resp.json()
-        if isinstance(data, dict) and 'response' in data:
-            response_data = data['response']
-            if isinstance(response_data, dict) and 'internalSquads' in response_data:
-                squads_list = response_data['internalSquads']
-            else:
-                squads_list = response_data if isinstance(response_data, list) else []
-        elif isinstance(data, list):
-            squads_list = data
-        else:
-            squads_list = []
+        squads_list = get_remnawave_client().internal_squads()
         
         cache.set('squads_list', squads_list, timeout=300)
         return jsonify(squads_list), 200
@@ -774,14 +951,7 @@ def get_internal_squads(current_admin):
 def get_nodes(current_admin):
     """Получить список нод"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.get(f"{os.getenv('API_URL')}/api/nodes", headers=headers, timeout=10)
-        resp.raise_for_status()
-        
-        data = resp.json()
-        nodes_list = data.get('response', data) if isinstance(data, dict) else data
-        if not isinstance(nodes_list, list):
-            nodes_list = []
+        nodes_list = get_remnawave_client().nodes()
         
         cache.set('nodes_list', nodes_list, timeout=300)
         return jsonify(nodes_list), 200
@@ -798,8 +968,7 @@ def get_nodes(current_admin):
 def restart_node(current_admin, uuid):
     """Перезапустить ноду"""
     try:
-        headers, cookies = get_remnawave_headers()
-        requests.post(f"{os.getenv('API_URL')}/api/nodes/{uuid}/restart", headers=headers, cookies=cookies)
+        get_remnawave_client().node_action(uuid, 'restart')
         return jsonify({"message": "Node restart initiated"}), 200
     except Exception:
         return jsonify({"message": "Failed to restart node"}), 500
@@ -810,8 +979,7 @@ def restart_node(current_admin, uuid):
 def restart_all_nodes(current_admin):
     """Перезапустить все ноды"""
     try:
-        headers, cookies = get_remnawave_headers()
-        requests.post(f"{os.getenv('API_URL')}/api/nodes/restart-all", headers=headers, cookies=cookies)
+        get_remnawave_client().restart_all_nodes()
         return jsonify({"message": "All nodes restart initiated"}), 200
     except Exception:
         return jsonify({"message": "Failed to restart all nodes"}), 500
@@ -822,12 +990,7 @@ def restart_all_nodes(current_admin):
 def enable_node(current_admin, uuid):
     """Включить конкретную ноду"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.post(
-            f"{os.getenv('API_URL')}/api/nodes/{uuid}/actions/enable",
-            headers=headers,
-            timeout=30
-        )
+        resp = get_remnawave_client().node_action(uuid, 'enable', timeout=30)
         resp.raise_for_status()
         
         # Очищаем кэш нод после изменения
@@ -846,12 +1009,7 @@ def enable_node(current_admin, uuid):
 def disable_node(current_admin, uuid):
     """Отключить конкретную ноду"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.post(
-            f"{os.getenv('API_URL')}/api/nodes/{uuid}/actions/disable",
-            headers=headers,
-            timeout=30
-        )
+        resp = get_remnawave_client().node_action(uuid, 'disable', timeout=30)
         resp.raise_for_status()
         
         # Очищаем кэш нод после изменения
@@ -887,6 +1045,7 @@ def system_settings(current_admin):
         if not s.active_currencies or s.active_currencies.strip() == '':
             s.active_currencies = '["uah","rub","usd"]'
         db.session.commit()
+        invalidate_settings('system')
     
     if request.method == 'GET':
         # Парсим JSON массивы
@@ -911,6 +1070,7 @@ def system_settings(current_admin):
         if needs_save:
             try:
                 db.session.commit()
+                invalidate_settings('system')
             except:
                 pass
         
@@ -997,6 +1157,7 @@ def system_settings(current_admin):
             s.theme_text_secondary_dark = data['theme_text_secondary_dark']
         
         db.session.commit()
+        invalidate_settings('system')
         return jsonify({"message": "System settings updated successfully"}), 200
 
     except Exception as e:
@@ -1019,6 +1180,7 @@ def admin_branding_settings(current_admin):
         b = BrandingSetting(id=1)
         db.session.add(b)
         db.session.commit()
+        invalidate_settings('branding')
     
     if request.method == 'GET':
         # Парсим JSON для названий функций тарифов
@@ -1145,6 +1307,7 @@ def admin_branding_settings(current_admin):
         # Используем merge для гарантии, что объект в сессии
         db.session.merge(b)
         db.session.commit()
+        invalidate_settings('branding')
         app.logger.info(f"✅ Branding settings saved successfully (ID: {b.id})")
         return jsonify({"message": "Branding settings updated successfully"}), 200
     except Exception as e:
@@ -1168,6 +1331,7 @@ def admin_bot_config_endpoint(current_admin):
         config = BotConfig(id=1)
         db.session.add(config)
         db.session.commit()
+        invalidate_settings('bot_config')
     
     if request.method == 'GET':
         return jsonify({
@@ -1269,6 +1433,7 @@ def admin_bot_config_endpoint(current_admin):
                 setattr(config, field, json.dumps(data[field], ensure_ascii=False) if data[field] else None)
         
         db.session.commit()
+        invalidate_settings('bot_config')
         
         # Очищаем кеш конфигурации бота в старом боте
         try:
@@ -1533,6 +1698,7 @@ def ref_settings(current_admin):
             s.default_referral_percent = float(data.get('default_referral_percent', 10.0))
         db.session.add(s)
         db.session.commit()
+        invalidate_settings('referral')
         return jsonify({"message": "Referral settings updated"}), 200
     except Exception as e:
         print(f"Error updating referral settings: {e}")
@@ -1804,6 +1970,7 @@ def currency_rates(current_admin):
                 db.session.add(rate_obj)
         
         db.session.commit()
+        invalidate_settings('currency_rates')
         return jsonify({"message": "Currency rates updated"}), 200
     except Exception as e:
         db.session.rollback()
@@ -1949,143 +2116,93 @@ def send_broadcast(current_admin):
         if broadcast_type in ['telegram', 'both'] and not bot_token:
             return jsonify({"message": f"Bot token for {bot_type} bot is not configured"}), 400
         
-        # Определяем получателей
-        recipients = []
+        # Определяем получателей (запрос, без загрузки всех пользователей)
         if recipient_type == 'all':
-            recipients = User.query.filter_by(role='CLIENT').all()
+            recipients_query = User.query.filter_by(role='CLIENT')
         elif recipient_type == 'active':
             from sqlalchemy import and_
-            recipients = User.query.filter(and_(User.role == 'CLIENT', User.remnawave_uuid != None)).all()
+            recipients_query = User.query.filter(and_(User.role == 'CLIENT', User.remnawave_uuid != None))
         elif recipient_type == 'inactive':
-            recipients = User.query.filter_by(role='CLIENT').filter(User.remnawave_uuid == None).all()
+            recipients_query = User.query.filter_by(role='CLIENT').filter(User.remnawave_uuid == None)
         elif recipient_type == 'custom':
             if not custom_emails or not isinstance(custom_emails, list):
                 return jsonify({"message": "Custom emails list is required"}), 400
             emails = [email.strip() for email in custom_emails if email.strip()]
-            recipients = User.query.filter(User.email.in_(emails)).all()
+            recipients_query = User.query.filter(User.email.in_(emails))
+        else:
+            return jsonify({"message": "Invalid recipient_type"}), 400
         
-        if not recipients:
+        total_recipients = recipients_query.count()
+        if not total_recipients:
             return jsonify({"message": "No recipients found"}), 400
         
-        # Статистика
-        email_sent = 0
-        email_failed = 0
-        telegram_sent = 0
-        telegram_failed = 0
-        failed_emails = []
-        failed_telegram = []
-        
-        import threading
-        from flask_mail import Message
-        from modules.core import get_mail
-        
-        def send_email_background(email, subj, msg):
-            """Отправить email в фоновом режиме"""
-            with app.app_context():
-                try:
-                    mail_obj = get_mail()
-                    m = Message(subj, recipients=[email])
-                    m.html = msg
-                    mail_obj.send(m)
-                    return True
-                except Exception as e:
-                    print(f"Failed to send email to {email}: {e}")
-                    return False
-        
-        # Формируем текст для Telegram
-        telegram_text = f"<b>{subject}</b>\n\n{message}" if subject else message
-        
-        # Отправляем сообщения
-        for user in recipients:
-            # Email рассылка
-            if broadcast_type in ['email', 'both']:
-                if user.email and not user.email.endswith('@telegram.local'):
-                    def send_email_wrapper(u, subj, msg):
-                        nonlocal email_sent, email_failed, failed_emails
-                        if send_email_background(u.email, subj, msg):
-                            email_sent += 1
-                        else:
-                            email_failed += 1
-                            failed_emails.append(u.email)
-                    
-                    threading.Thread(
-                        target=send_email_wrapper,
-                        args=(user, subject, message)
-                    ).start()
-            
-            # Telegram рассылка
-            if broadcast_type in ['telegram', 'both']:
-                if user.telegram_id:
-                    def send_telegram_wrapper(u, token, text, photo, pin):
-                        nonlocal telegram_sent, telegram_failed, failed_telegram
-                        # Отправляем сообщение
-                        success, result = send_telegram_message(token, u.telegram_id, text, photo_file=photo)
-                        if success:
-                            telegram_sent += 1
-                            message_id = result
-                            
-                            # Закрепляем сообщение если нужно
-                            if pin and message_id:
-                                pin_success, pin_error = pin_telegram_message(token, u.telegram_id, message_id)
-                                if not pin_success:
-                                    # Логируем ошибку закрепления, но не считаем это критичной ошибкой
-                                    print(f"Failed to pin message for user {u.telegram_id}: {pin_error}")
-                        else:
-                            telegram_failed += 1
-                            failed_telegram.append({
-                                'telegram_id': u.telegram_id,
-                                'email': u.email,
-                                'error': result
-                            })
-                    
-                    # Если есть фото, нужно переоткрыть файл для каждого потока
-                    photo_for_thread = None
-                    if photo_file:
-                        # Сохраняем файл во временное место или используем BytesIO
-                        from io import BytesIO
-                        photo_file.seek(0)  # Возвращаемся в начало файла
-                        photo_data = photo_file.read()
-                        photo_for_thread = BytesIO(photo_data)
-                        photo_file.seek(0)  # Возвращаемся для следующего использования
-                    
-                    threading.Thread(
-                        target=send_telegram_wrapper,
-                        args=(user, bot_token, telegram_text, photo_for_thread, pin_message)
-                    ).start()
-        
-        # Ждем немного, чтобы потоки начали работу
-        import time
-        time.sleep(0.5)
+        photo_bytes = None
+        photo_filename = None
+        if photo_file and broadcast_type in ['telegram', 'both']:
+            photo_bytes = photo_file.read()
+            photo_filename = photo_file.filename
+        
+        # Задача сохраняется в БД и обрабатывается в фоне пулом воркеров
+        from modules.broadcast_queue import create_broadcast_job, start_broadcast_job
+        job = create_broadcast_job(
+            created_by=current_admin.id,
+            users_query=recipients_query,
+            broadcast_type=broadcast_type,
+            bot_type=bot_type,
+            recipient_type=recipient_type,
+            subject=subject,
+            message=message,
+            pin_message=pin_message,
+            photo=photo_bytes,
+            photo_filename=photo_filename
+        )
+        start_broadcast_job(job.id)
         
         result = {
             "message": "Broadcast initiated",
-            "total_recipients": len(recipients),
+            "job_id": job.id,
+            "status_url": f"/api/admin/broadcast/{job.id}",
+            "total_recipients": total_recipients,
+            "total_messages": job.total,
             "broadcast_type": broadcast_type,
             "bot_type": bot_type
         }
         
         if broadcast_type in ['email', 'both']:
-            result["email"] = {
-                "sent": email_sent,
-                "failed": email_failed,
-                "failed_emails": failed_emails[:10]
-            }
+            result["email"] = {"sent": 0, "failed": 0, "failed_emails": []}
         
         if broadcast_type in ['telegram', 'both']:
-            result["telegram"] = {
-                "sent": telegram_sent,
-                "failed": telegram_failed,
-                "failed_users": failed_telegram[:10]
-            }
+            result["telegram"] = {"sent": 0, "failed": 0, "failed_users": []}
         
         return jsonify(result), 200
         
     except Exception as e:
+        db.session.rollback()
         import traceback
         traceback.print_exc()
         return jsonify({"message": f"Failed to send broadcast: {str(e)}"}), 500
 
 
+@app.route('/api/admin/broadcast/<int:job_id>', methods=['GET'])
+@admin_required
+def get_broadcast_job(current_admin, job_id):
+    """Прогресс задачи рассылки"""
+    try:
+        job = db.session.get(BroadcastJob, job_id)
+        if not job:
+            return jsonify({"message": "Broadcast job not found"}), 404
+        
+        result = job.to_dict()
+        failed = BroadcastRecipient.query.filter_by(job_id=job.id, status='FAILED').order_by(BroadcastRecipient.id.asc()).limit(10).all()
+        result["failed_recipients"] = [r.to_dict() for r in failed]
+        return jsonify(result), 200
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": "Internal Server Error"}), 500
+
+
 # ============================================================================
 # SYNC BOT USERS
 # ============================================================================
@@ -2600,8 +2717,7 @@ def decrypt_key(key):
 def telegram_webhook_status(current_admin):
     """Проверка статуса webhook для Telegram бота"""
     try:
-        s = PaymentSetting.query.first()
-        bot_token = decrypt_key(s.telegram_bot_token) if s else None
+        bot_token = get_payment_credentials('telegram_stars').bot_token
         
         if not bot_token or bot_token == "DECRYPTION_ERROR":
             return jsonify({"error": "Bot token not configured"}), 400
@@ -2635,8 +2751,7 @@ def telegram_webhook_status(current_admin):
 def telegram_set_webhook(current_admin):
     """Настройка webhook для Telegram бота"""
     try:
-        s = PaymentSetting.query.first()
-        bot_token = decrypt_key(s.telegram_bot_token) if s else None
+        bot_token = get_payment_credentials('telegram_stars').bot_token
         
         if not bot_token or bot_token == "DECRYPTION_ERROR":
             return jsonify({"error": "Bot token not configured"}), 400
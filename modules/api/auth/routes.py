@@ -15,16 +15,15 @@ import random
 import string
 import threading
 import requests
-import json
 import os
 
 from modules.core import get_app, get_db, get_bcrypt, get_fernet, get_mail, get_cache, get_limiter
 from modules.auth import create_local_jwt
 from modules.models.user import User
 from modules.models.system import SystemSetting
-from modules.models.referral import ReferralSetting
-from modules.models.branding import BrandingSetting
-from modules.models.bot_config import BotConfig
+from modules.remnawave import get_remnawave_client
+from modules.remnawave_mirror import store_patch_result
+from modules.settings_registry import get_settings, invalidate_settings
 
 app = get_app()
 db = get_db()
@@ -41,29 +40,6 @@ def generate_referral_code(user_id):
     return f"REF-{user_id}-{random_part}"
 
 
-def get_remnawave_headers(additional_headers=None):
-    """Получение заголовков для RemnaWave API"""
-    headers = {}
-    cookies = {}
-    
-    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
-    REMNAWAVE_COOKIES_STR = os.getenv("REMNAWAVE_COOKIES", "")
-    
-    if ADMIN_TOKEN:
-        headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
-    
-    if REMNAWAVE_COOKIES_STR:
-        try:
-            cookies = json.loads(REMNAWAVE_COOKIES_STR)
-        except json.JSONDecodeError:
-            pass
-    
-    if additional_headers:
-        headers.update(additional_headers)
-    
-    return headers, cookies
-
-
 def send_email_in_background(app_context, recipient, subject, html_body):
     """Отправка email в фоновом режиме"""
     with app_context:
@@ -90,7 +66,7 @@ def send_email_in_background(app_context, recipient, subject, html_body):
 
 def get_system_settings():
     """Получить системные настройки"""
-    return SystemSetting.query.first()
+    return get_settings('system')
 
 
 def create_system_settings():
@@ -98,12 +74,13 @@ def create_system_settings():
     settings = SystemSetting(default_language='ru', default_currency='uah')
     db.session.add(settings)
     db.session.commit()
+    invalidate_settings('system')
     return settings
 
 
 def get_referral_settings():
     """Получить настройки рефералов"""
-    return ReferralSetting.query.first()
+    return get_settings('referral')
 
 
 # ============================================================================
@@ -150,28 +127,15 @@ def public_register():
     expire_date = (datetime.now(timezone.utc) + timedelta(days=bonus_days_new)).isoformat()
 
     try:
-        headers, cookies = get_remnawave_headers()
-        API_URL = os.getenv('API_URL')
+        rw = get_remnawave_client()
         
         # Сначала проверяем, существует ли пользователь в RemnaWave по email
         existing_remnawave_user = None
         try:
-            # URL-encode email для безопасной передачи
-            import urllib.parse
-            encoded_email = urllib.parse.quote(email, safe='')
-            check_resp = requests.get(
-                f"{API_URL}/api/users/by-email/{encoded_email}",
-                headers=headers,
-                cookies=cookies,
-                timeout=15
-            )
-            if check_resp.status_code == 200:
-                check_data = check_resp.json()
-                # API может вернуть response с пользователем или массив пользователей
-                if check_data.get('response'):
-                    existing_remnawave_user = check_data['response']
-                    if isinstance(existing_remnawave_user, list) and len(existing_remnawave_user) > 0:
-                        existing_remnawave_user = existing_remnawave_user[0]
+            # API может вернуть пользователя или массив пользователей - берем первого
+            found = rw.get_users_by_email(email, timeout=15)
+            if found:
+                existing_remnawave_user = found[0]
                 print(f"Found existing user in RemnaWave by email: {existing_remnawave_user.get('uuid') if existing_remnawave_user else 'None'}")
         except Exception as e:
             print(f"Error checking existing user by email: {e}")
@@ -188,7 +152,7 @@ def public_register():
                 "activeInternalSquads": [os.getenv("DEFAULT_SQUAD_ID")] if referrer else []
             }
 
-            resp = requests.post(f"{API_URL}/api/users", headers=headers, cookies=cookies, json=payload_create)
+            resp = rw.create_user(payload_create)
             resp.raise_for_status()
             remnawave_uuid = resp.json().get('response', {}).get('uuid')
 
@@ -234,8 +198,8 @@ def public_register():
 
             url = f"{your_server_ip}/verify?token={verif_token}"
             # Получаем branding и service_name для шаблона
-            branding = BrandingSetting.query.first()
-            bot_config = BotConfig.query.first()
+            branding = get_settings('branding')
+            bot_config = get_settings('bot_config')
             service_name = bot_config.service_name if bot_config else (branding.site_name if branding else "StealthNET")
             html = render_template('email_verification.html', 
                                  verification_url=url,
@@ -250,16 +214,12 @@ def public_register():
         if referrer:
             s = get_referral_settings()
             days = s.referrer_bonus_days if s else 7
-            headers, cookies = get_remnawave_headers()
-            resp = requests.get(f"{os.getenv('API_URL')}/api/users/{referrer.remnawave_uuid}", headers=headers, cookies=cookies)
-            if resp.ok:
-                live_data = resp.json().get('response', {})
+            live_data = rw.get_user(referrer.remnawave_uuid)
+            if live_data is not None:
                 curr = datetime.fromisoformat(live_data.get('expireAt'))
                 new_exp = max(datetime.now(timezone.utc), curr) + timedelta(days=days)
-                requests.patch(f"{os.getenv('API_URL')}/api/users",
-                            headers={"Content-Type": "application/json", **headers},
-                            json={"uuid": referrer.remnawave_uuid, "expireAt": new_exp.isoformat()})
-                cache.delete(f'live_data_{referrer.remnawave_uuid}')
+                patch_resp = rw.patch_user(referrer.remnawave_uuid, expireAt=new_exp.isoformat())
+                store_patch_result(patch_resp, referrer.remnawave_uuid, {'expireAt': new_exp.isoformat()})
 
         return jsonify({"message": "Регистрация прошла успешно. Проверьте email."}), 201
 
@@ -448,8 +408,8 @@ def resend_verification():
 
             url = f"{your_server_ip}/verify?token={user.verification_token}"
             # Получаем branding и service_name для шаблона
-            branding = BrandingSetting.query.first()
-            bot_config = BotConfig.query.first()
+            branding = get_settings('branding')
+            bot_config = get_settings('bot_config')
             service_name = bot_config.service_name if bot_config else (branding.site_name if branding else "StealthNET")
             html = render_template('email_verification.html', 
                                  verification_url=url,
@@ -552,7 +512,6 @@ def telegram_login():
             user.telegram_username = username
             db.session.commit()
 
-        cache.delete(f'live_data_{user.remnawave_uuid}')
         return jsonify({"token": create_local_jwt(user.id), "role": user.role}), 200
 
     except Exception as e:
@@ -15,8 +15,7 @@ from modules.core import get_app, get_db
 from modules.auth import create_local_jwt
 from modules.models.user import User
 from modules.models.system import SystemSetting
-from modules.models.bot_config import BotConfig
-from modules.models.referral import ReferralSetting
+from modules.settings_registry import get_settings
 
 app = get_app()
 db = get_db()
@@ -111,7 +110,7 @@ def bot_register():
             }), 200
 
         # Получаем системные настройки
-        sys_settings = SystemSetting.query.first()
+        sys_settings = get_settings('system')
         if not sys_settings:
             sys_settings = SystemSetting(default_language='ru', default_currency='uah')
             db.session.add(sys_settings)
@@ -132,15 +131,15 @@ def bot_register():
 
         # Создаем пользователя в RemnaWave API (как в старом app.py)
         remnawave_uuid = None
-        from modules.api.webhooks.routes import get_remnawave_headers
+        from modules.remnawave import get_remnawave_client
         from datetime import datetime, timedelta, timezone
         import requests
         
         API_URL = os.getenv('API_URL')
-        ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
         DEFAULT_SQUAD_ID = os.getenv('DEFAULT_SQUAD_ID')
+        rw = get_remnawave_client()
         
-        if not API_URL or not ADMIN_TOKEN:
+        if not rw.configured:
             return jsonify({"message": "RemnaWave API not configured (API_URL or ADMIN_TOKEN missing)"}), 500
         
         try:
@@ -149,11 +148,7 @@ def bot_register():
             if telegram_id:
                 try:
                     telegram_id_int = int(telegram_id) if isinstance(telegram_id, (str, int)) else telegram_id
-                    check_resp = requests.get(
-                        f"{API_URL}/api/users/by-telegram-id/{telegram_id_int}",
-                        headers={"Authorization": f"Bearer {ADMIN_TOKEN}"},
-                        timeout=15
-                    )
+                    check_resp = rw.get(f"/api/users/by-telegram-id/{telegram_id_int}", timeout=15)
                     if check_resp.status_code == 200:
                         check_data = check_resp.json()
                         # API может вернуть response с пользователем или массив пользователей
@@ -174,7 +169,7 @@ def bot_register():
                 # Бонусные дни для реферала
                 bonus_days = 0
                 if referrer:
-                    ref_settings = ReferralSetting.query.first()
+                    ref_settings = get_settings('referral')
                     bonus_days = ref_settings.invitee_bonus_days if ref_settings else 7
                 
                 expire_date = (datetime.now(timezone.utc) + timedelta(days=bonus_days)).isoformat()
@@ -203,12 +198,7 @@ def bot_register():
                 
                 print(f"Creating user in RemnaWave with payload: {payload_create}")
                 
-                resp = requests.post(
-                    f"{API_URL}/api/users",
-                    headers={"Authorization": f"Bearer {ADMIN_TOKEN}"},
-                    json=payload_create,
-                    timeout=30
-                )
+                resp = rw.create_user(payload_create, timeout=30)
                 
                 if resp.status_code != 200 and resp.status_code != 201:
                     error_text = resp.text[:500] if hasattr(resp, 'text') else 'No error details'
@@ -389,7 +379,7 @@ def bot_get_credentials():
         
         # Добавляем данные для подключения (для совместимости)
         if user.remnawave_uuid:
-            bot_config = BotConfig.query.first()
+            bot_config = get_settings('bot_config')
             response["remnawave_uuid"] = user.remnawave_uuid
             response["server_domain"] = os.getenv("YOUR_SERVER_IP") or os.getenv("YOUR_SERVER_IP_OR_DOMAIN", "testpanel.stealthnet.app")
             response["bot_config"] = {
@@ -6,25 +6,34 @@ API эндпоинты Telegram Mini App
 - POST /miniapp/subscription/trial - Активация триала
 - POST /miniapp/payments/methods - Методы оплаты
 - POST /miniapp/payments/create - Создание платежа
+- POST /miniapp/payments/status - Статус платежа
+- GET /miniapp/payments/<order_id>/events - Ожидание оплаты (SSE / long-poll)
+- POST /miniapp/referrals/stats - Статистика рефералов
+- POST /miniapp/referrals/list - Список рефералов (постранично)
 - GET /miniapp/app-config.json - Конфигурация приложения
+
+Эндпоинты пользователя авторизуются декоратором miniapp_user_required
+(проверка подписи initData, см. modules/auth.py).
 """
 
-from flask import request, jsonify
+from flask import request, jsonify, g
 from datetime import datetime, timezone, timedelta
-import requests
 import json
 import os
-import urllib.parse
 import re
-import uuid
 
 from modules.core import get_app, get_db, get_cache, get_limiter, get_fernet
-from modules.models.user import User
 from modules.models.tariff import Tariff
 from modules.models.promo import PromoCode
-from modules.models.payment import Payment, PaymentSetting
-from modules.models.referral import ReferralSetting
-from modules.models.branding import BrandingSetting
+from modules.models.payment import Payment
+from modules.remnawave import get_remnawave_client
+from modules.remnawave_mirror import get_live_data, store_patch_result
+from modules.auth import miniapp_user_required
+from modules.settings_registry import get_settings
+from modules.api.payments.vault import get_payment_vault
+from modules.api.payments import get_payment_provider
+from modules.payment_reconciler import get_payment_status
+from modules.referral_ledger import get_referral_stats, list_referrals
 
 app = get_app()
 db = get_db()
@@ -42,57 +51,12 @@ def decrypt_key(key):
         return ""
 
 
-def parse_telegram_init_data(init_data):
-    """Парсит initData из Telegram"""
-    if not init_data:
-        return None, None
-    
-    try:
-        if isinstance(init_data, dict):
-            parsed_data = init_data
-        else:
-            parsed_data = urllib.parse.parse_qs(init_data)
-        
-        user_str = parsed_data.get('user', [''])[0] if isinstance(parsed_data.get('user'), list) else parsed_data.get('user')
-        
-        if not user_str:
-            return None, None
-        
-        if isinstance(user_str, str):
-            user_data = json.loads(urllib.parse.unquote(user_str))
-        else:
-            user_data = user_str
-        
-        return user_data.get('id'), user_data
-    except:
-        return None, None
-
-
 def get_referral_settings():
-    return ReferralSetting.query.first()
+    return get_settings('referral')
 
 
 def get_branding_settings():
-    return BrandingSetting.query.first()
-
-
-def get_remnawave_headers():
-    """Получить заголовки для RemnaWave API"""
-    headers = {}
-    cookies = {}
-    
-    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
-    if ADMIN_TOKEN:
-        headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
-    
-    REMNAWAVE_COOKIES_STR = os.getenv("REMNAWAVE_COOKIES", "")
-    if REMNAWAVE_COOKIES_STR:
-        try:
-            cookies = json.loads(REMNAWAVE_COOKIES_STR)
-        except json.JSONDecodeError:
-            pass
-    
-    return headers, cookies
+    return get_settings('branding')
 
 
 # ============================================================================
@@ -101,7 +65,8 @@ def get_remnawave_headers():
 
 @app.route('/miniapp/subscription', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_subscription():
+@miniapp_user_required
+def miniapp_subscription(user):
     """Данные подписки пользователя"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -111,42 +76,8 @@ def miniapp_subscription():
         return response
 
     try:
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
-
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-
-        if not telegram_id:
-            print(f"[MINIAPP] Missing or invalid initData: {init_data[:100] if init_data else 'None'}")
-            return jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing or invalid initData"}
-            }), 401
-
-        # Ищем пользователя по telegram_id (как строка)
-        telegram_id_str = str(telegram_id)
-        user = User.query.filter_by(telegram_id=telegram_id_str).first()
-        if not user:
-            print(f"[MINIAPP] User not found for telegram_id: {telegram_id_str}")
-            # Возвращаем 404, чтобы старый мини-апп показал сообщение о регистрации
-            return jsonify({
-                "detail": {"title": "User Not Found", "message": "Please register in the bot first"}
-            }), 404
-        
         print(f"[MINIAPP] User found: id={user.id}, telegram_id={user.telegram_id}, email={user.email}")
 
-        # Получаем данные из кэша
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
-
         def adapt_data(data_dict, user_obj):
             expire_at = data_dict.get('expireAt')
             has_active = False
@@ -196,27 +127,15 @@ def miniapp_subscription():
                 'activeInternalSquads': active_squads  # Для совместимости
             }
 
-        if cached:
-            response = jsonify(adapt_data(cached.copy(), user))
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 200
-
-        # Запрос к RemnaWave
+        # Данные из зеркала RemnaWave (при отсутствии снимка - один запрос к API)
         try:
-            resp = requests.get(
-                f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}",
-                headers={"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"},
-                timeout=10
-            )
+            data = get_live_data(user.remnawave_uuid)
 
-            if resp.status_code != 200:
+            if data is None:
                 return jsonify({
-                    "detail": {"title": "Error", "message": f"Failed to fetch data: {resp.status_code}"}
+                    "detail": {"title": "Error", "message": "Failed to fetch data: user not found"}
                 }), 500
 
-            data = resp.json().get('response', {})
-            cache.set(cache_key, data, timeout=300)
-
             response = jsonify(adapt_data(data, user))
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 200
@@ -246,22 +165,12 @@ def miniapp_maintenance_status():
 
 @app.route('/miniapp/subscription/trial', methods=['POST'])
 @limiter.limit("10 per minute")
-def miniapp_activate_trial():
+@miniapp_user_required
+def miniapp_activate_trial(user):
     """Активация триала"""
     from modules.models.trial import get_trial_settings
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData', '')
-        telegram_id, _ = parse_telegram_init_data(init_data)
-
-        if not telegram_id:
-            return jsonify({"success": False, "message": "Missing initData"}), 401
-
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            return jsonify({"success": False, "message": "User not registered"}), 404
-
         # Получаем настройки триала из БД
         trial_settings = get_trial_settings()
         
@@ -291,17 +200,12 @@ def miniapp_activate_trial():
         if trial_settings.traffic_limit_bytes > 0:
             patch_payload["trafficLimitBytes"] = trial_settings.traffic_limit_bytes
 
-        resp = requests.patch(
-            f"{os.getenv('API_URL')}/api/users",
-            headers={"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"},
-            json=patch_payload,
-            timeout=10
-        )
+        resp = get_remnawave_client().patch("/api/users", json=patch_payload)
 
         if resp.status_code != 200:
             return jsonify({"success": False, "message": "Failed to activate trial"}), 500
 
-        cache.delete(f'live_data_{user.remnawave_uuid}')
+        store_patch_result(resp, user.remnawave_uuid, patch_payload)
         
         # Форматируем сообщение об успешной активации
         lang = user.preferred_lang or 'ru'
@@ -324,6 +228,23 @@ def miniapp_activate_trial():
 # PAYMENTS
 # ============================================================================
 
+# Порядок и подписи методов оплаты в mini app
+MINIAPP_PAYMENT_METHODS = [
+    {"id": "crystalpay", "name": "CrystalPay", "type": "redirect"},
+    {"id": "heleket", "name": "Heleket (Крипто)", "type": "crypto"},
+    {"id": "yookassa", "name": "YooKassa", "type": "redirect"},
+    {"id": "telegram_stars", "name": "Telegram Stars", "type": "telegram"},
+    {"id": "platega", "name": "Platega", "type": "redirect"},
+    {"id": "monobank", "name": "Monobank", "type": "card"},
+    {"id": "freekassa", "name": "Freekassa", "type": "redirect"},
+    {"id": "robokassa", "name": "Robokassa", "type": "redirect"},
+    {"id": "mulenpay", "name": "MulenPay", "type": "redirect"},
+    {"id": "urlpay", "name": "UrlPay", "type": "redirect"},
+    {"id": "tribute", "name": "Tribute", "type": "redirect"},
+    {"id": "btcpayserver", "name": "BTCPay (Bitcoin)", "type": "crypto"},
+]
+
+
 @app.route('/miniapp/payments/methods', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
 def miniapp_payment_methods():
@@ -334,36 +255,8 @@ def miniapp_payment_methods():
         return response
 
     try:
-        s = PaymentSetting.query.first()
-        if not s:
-            return jsonify({"methods": []}), 200
-
-        available = []
-
-        if s.crystalpay_api_key and decrypt_key(s.crystalpay_api_key):
-            available.append({"id": "crystalpay", "name": "CrystalPay", "type": "redirect"})
-        if s.heleket_api_key and decrypt_key(s.heleket_api_key):
-            available.append({"id": "heleket", "name": "Heleket (Крипто)", "type": "crypto"})
-        if s.yookassa_shop_id and decrypt_key(s.yookassa_shop_id):
-            available.append({"id": "yookassa", "name": "YooKassa", "type": "redirect"})
-        if s.telegram_bot_token and decrypt_key(s.telegram_bot_token):
-            available.append({"id": "telegram_stars", "name": "Telegram Stars", "type": "telegram"})
-        if getattr(s, 'platega_api_key', None) and decrypt_key(s.platega_api_key):
-            available.append({"id": "platega", "name": "Platega", "type": "redirect"})
-        if getattr(s, 'monobank_token', None) and decrypt_key(s.monobank_token):
-            available.append({"id": "monobank", "name": "Monobank", "type": "card"})
-        if getattr(s, 'freekassa_shop_id', None) and decrypt_key(s.freekassa_shop_id):
-            available.append({"id": "freekassa", "name": "Freekassa", "type": "redirect"})
-        if getattr(s, 'robokassa_merchant_login', None) and decrypt_key(s.robokassa_merchant_login):
-            available.append({"id": "robokassa", "name": "Robokassa", "type": "redirect"})
-        if getattr(s, 'mulenpay_api_key', None) and decrypt_key(s.mulenpay_api_key):
-            available.append({"id": "mulenpay", "name": "MulenPay", "type": "redirect"})
-        if getattr(s, 'urlpay_api_key', None) and decrypt_key(s.urlpay_api_key):
-            available.append({"id": "urlpay", "name": "UrlPay", "type": "redirect"})
-        if getattr(s, 'tribute_api_key', None) and decrypt_key(s.tribute_api_key):
-            available.append({"id": "tribute", "name": "Tribute", "type": "redirect"})
-        if getattr(s, 'btcpayserver_api_key', None) and decrypt_key(s.btcpayserver_api_key):
-            available.append({"id": "btcpayserver", "name": "BTCPay (Bitcoin)", "type": "crypto"})
+        vault = get_payment_vault()
+        available = [method for method in MINIAPP_PAYMENT_METHODS if vault.is_available(method["id"])]
 
         response = jsonify({"methods": available})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -374,7 +267,8 @@ def miniapp_payment_methods():
 
 @app.route('/miniapp/payments/create', methods=['POST', 'OPTIONS'])
 @limiter.limit("10 per minute")
-def miniapp_create_payment():
+@miniapp_user_required
+def miniapp_create_payment(user):
     """Создание платежа"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -383,26 +277,6 @@ def miniapp_create_payment():
 
     try:
         data = request.json or {}
-        init_data = data.get('initData') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-
-        if not telegram_id:
-            # Попробуем initDataUnsafe
-            unsafe = data.get('initDataUnsafe', {})
-            if isinstance(unsafe, dict) and unsafe.get('user'):
-                telegram_id = unsafe['user'].get('id')
-
-        if not telegram_id:
-            return jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            }), 401
-
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            return jsonify({
-                "detail": {"title": "User Not Found", "message": "Please register first"}
-            }), 404
-
         tariff_id = data.get('tariff_id') or data.get('tariffId')
         amount = data.get('amount')  # Для пополнения баланса
         payment_provider = data.get('payment_provider') or data.get('paymentProvider', 'crystalpay')
@@ -413,6 +287,12 @@ def miniapp_create_payment():
         
         currency = data.get('currency') or user.preferred_currency or 'rub'
 
+        provider = get_payment_provider(payment_provider)
+        if not provider:
+            return jsonify({
+                "detail": {"title": "Invalid Request", "message": f"Unsupported payment provider: {payment_provider}"}
+            }), 400
+
         # Проверяем, это пополнение баланса или покупка тарифа
         is_balance_topup = not tariff_id and amount
         
@@ -437,6 +317,10 @@ def miniapp_create_payment():
             # Определяем валюту
             currency_map = {"uah": "UAH", "rub": "RUB", "usd": "USD"}
             currency_code = currency_map.get(currency, currency_map.get(user.preferred_currency, "RUB"))
+            if not provider.supports_currency(currency_code):
+                return jsonify({
+                    "detail": {"title": "Invalid Currency", "message": f"{provider.title} supports only {', '.join(provider.currencies)}"}
+                }), 400
             
             # Создаем запись о платеже на пополнение баланса
             import uuid
@@ -466,6 +350,10 @@ def miniapp_create_payment():
             # Определяем цену (используем валюту из запроса или preferred_currency пользователя)
             price_map = {"uah": {"a": tariff.price_uah, "c": "UAH"}, "rub": {"a": tariff.price_rub, "c": "RUB"}, "usd": {"a": tariff.price_usd, "c": "USD"}}
             info = price_map.get(currency, price_map.get(user.preferred_currency, price_map['rub']))
+            if not provider.supports_currency(info['c']):
+                return jsonify({
+                    "detail": {"title": "Invalid Currency", "message": f"{provider.title} supports only {', '.join(provider.currencies)}"}
+                }), 400
 
             final_amount = info['a']
             promo_code_obj = None
@@ -524,14 +412,11 @@ def miniapp_create_payment():
             db.session.commit()
             currency_code = info['c']
 
-        # Создаем платеж через провайдера
-        from modules.api.payments import create_payment as create_payment_provider
-        
-        payment_url, payment_system_id = create_payment_provider(
-            provider=payment_provider,
-            amount=final_amount,
-            currency=currency_code if is_balance_topup else info['c'],
-            order_id=order_id,
+        # Создаем платеж через адаптер платёжной системы
+        payment_url, payment_system_id = provider.create_payment(
+            final_amount,
+            currency_code,
+            order_id,
             user_email=user.email,
             source='miniapp',
             miniapp_type='v1'  # Старый мини-апп использует /miniapp/
@@ -578,12 +463,11 @@ def miniapp_create_payment():
 def miniapp_app_config():
     """Конфигурация приложения"""
     import json
-    from modules.models.system import SystemSetting
     
     # Получаем активные языки из настроек
     active_languages = ["ru", "ua", "en", "cn"]
     try:
-        settings = SystemSetting.query.first()
+        settings = get_settings('system')
         if settings and hasattr(settings, 'active_languages') and settings.active_languages:
             try:
                 active_languages = json.loads(settings.active_languages) if isinstance(settings.active_languages, str) else settings.active_languages
@@ -670,12 +554,11 @@ def miniapp_payment_status():
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
-        # Находим платеж
-        p = Payment.query.filter_by(order_id=payment_id).first()
-        if not p:
-            p = Payment.query.filter_by(payment_system_id=payment_id).first()
+        # Только локальное состояние (кеш статуса, иначе БД): статус у платёжной
+        # системы проверяет сверка в планировщике (modules/payment_reconciler.py)
+        status = get_payment_status(str(payment_id))
         
-        if not p:
+        if not status:
             response = jsonify({
                 "status": "not_found",
                 "paid": False
@@ -683,72 +566,7 @@ def miniapp_payment_status():
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 200
         
-        # Если платеж Platega со статусом PENDING, проверяем статус через API
-        if p.payment_provider == 'platega' and p.status == 'PENDING' and p.payment_system_id:
-            try:
-                from modules.models.payment import PaymentSetting, decrypt_key
-                import requests
-                import re
-                
-                settings = PaymentSetting.query.first()
-                if settings:
-                    platega_key = decrypt_key(settings.platega_api_key) if settings.platega_api_key else None
-                    platega_merchant_raw = decrypt_key(settings.platega_merchant_id) if settings.platega_merchant_id else None
-                    
-                    if platega_key and platega_merchant_raw:
-                        # Обработка Merchant ID
-                        platega_merchant = platega_merchant_raw.strip()
-                        if platega_merchant.startswith('live_'):
-                            platega_merchant = platega_merchant[5:]
-                        uuid_pattern = r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
-                        uuid_match = re.search(uuid_pattern, platega_merchant)
-                        if uuid_match:
-                            platega_merchant = uuid_match.group(0)
-                        
-                        # Проверяем статус через API Platega
-                        api_url = f"https://app.platega.io/transaction/{p.payment_system_id}"
-                        headers = {
-                            "X-MerchantId": platega_merchant,
-                            "X-Secret": platega_key,
-                            "Content-Type": "application/json"
-                        }
-                        
-                        resp = requests.get(api_url, headers=headers, timeout=10)
-                        if resp.status_code == 200:
-                            api_data = resp.json()
-                            api_status = api_data.get('status', '').upper()
-                            
-                            # Если статус CONFIRMED, обрабатываем платеж
-                            if api_status == 'CONFIRMED' and p.status != 'PAID':
-                                from modules.models.user import User
-                                from modules.models.tariff import Tariff
-                                
-                                user = db.session.get(User, p.user_id)
-                                tariff = db.session.get(Tariff, p.tariff_id) if p.tariff_id else None
-                                
-                                if user:
-                                    p.status = 'PAID'
-                                    # Если это пополнение баланса
-                                    if not tariff:
-                                        user.balance = (user.balance or 0) + float(p.amount)
-                                        print(f"[PLATEGA] Auto-processed balance topup {p.order_id}, new balance: {user.balance}")
-                                    else:
-                                        # Обрабатываем покупку тарифа
-                                        from modules.api.webhooks.routes import process_successful_payment
-                                        process_successful_payment(p, user, tariff)
-                                        print(f"[PLATEGA] Auto-processed tariff purchase {p.order_id}")
-                                    
-                                    db.session.commit()
-            except Exception as e:
-                print(f"[PLATEGA] Error checking status via API: {e}")
-        
-        response = jsonify({
-            "status": p.status.lower(),
-            "paid": p.status == 'PAID',
-            "order_id": p.order_id,
-            "amount": p.amount,
-            "currency": p.currency
-        })
+        response = jsonify(status)
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
@@ -765,13 +583,92 @@ def miniapp_payment_status():
         return response, 200
 
 
+@app.route('/miniapp/payments/<order_id>/events', methods=['GET', 'OPTIONS'])
+@limiter.limit("30 per minute")
+def miniapp_payment_events(order_id):
+    """
+    Ожидание оплаты: один запрос вместо опросов /miniapp/payments/status
+
+    - Accept: text/event-stream (EventSource) - SSE: событие payment с текущим
+      статусом, затем, если платеж ожидает оплаты, событие payment после выдачи
+      заказа. Поток закрывается через PAYMENT_EVENTS_TIMEOUT, EventSource
+      переподключается сам.
+    - Иначе long-poll: ответ JSON со статусом, как только заказ выдан, или через
+      ?timeout= секунд (не больше PAYMENT_EVENTS_TIMEOUT) с текущим статусом.
+    - Если воркер уже держит PAYMENT_EVENTS_MAX_WAITERS ожидающих запросов - 503 с
+      Retry-After: клиент повторяет позже или опрашивает /miniapp/payments/status.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Accept')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response
+
+    from flask import Response, stream_with_context
+    from modules.payment_events import (
+        PAYMENT_EVENTS_TIMEOUT, PAYMENT_EVENTS_RETRY_AFTER,
+        acquire_wait_slot, release_wait_slot, wait_payment_status
+    )
+
+    try:
+        timeout = min(max(int(request.args.get('timeout', PAYMENT_EVENTS_TIMEOUT)), 0), PAYMENT_EVENTS_TIMEOUT)
+    except (TypeError, ValueError):
+        timeout = PAYMENT_EVENTS_TIMEOUT
+
+    status = get_payment_status(order_id)
+    # Место ожидания нужно, только если платеж еще ожидает оплаты
+    waiting = bool(status) and status.get('status') == 'pending' and timeout > 0
+    if waiting and not acquire_wait_slot():
+        response = jsonify({
+            "detail": {
+                "title": "Service Unavailable",
+                "message": "Too many waiting requests, retry later"
+            }
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers['Retry-After'] = str(PAYMENT_EVENTS_RETRY_AFTER)
+        response.headers['Cache-Control'] = 'no-store'
+        return response, 503
+
+    if 'text/event-stream' not in request.headers.get('Accept', ''):
+        if waiting:
+            try:
+                status, _ = wait_payment_status(order_id, timeout)
+            finally:
+                release_wait_slot()
+        response = jsonify(status or {"status": "not_found", "paid": False})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers['Cache-Control'] = 'no-store'
+        return response, 200
+
+    def stream():
+        yield "retry: 3000\n\n"
+        yield f"event: payment\ndata: {json.dumps(status or {'status': 'not_found', 'paid': False})}\n\n"
+        if not waiting:
+            return
+        new_status, _ = wait_payment_status(order_id, timeout)
+        if new_status and new_status != status:
+            yield f"event: payment\ndata: {json.dumps(new_status)}\n\n"
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx отдает события сразу, без буфера
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    if waiting:
+        # Место освобождается, когда сервер закрывает поток (в том числе если клиент ушел)
+        response.call_on_close(release_wait_slot)
+    return response
+
+
 # ============================================================================
 # PROMO CODES
 # ============================================================================
 
 @app.route('/miniapp/promo-codes/activate', methods=['POST', 'OPTIONS'])
 @limiter.limit("10 per minute")
-def miniapp_activate_promocode():
+@miniapp_user_required
+def miniapp_activate_promocode(user):
     """Активировать промокод через miniapp"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -781,7 +678,6 @@ def miniapp_activate_promocode():
         return response
     
     try:
-        # Парсим initData
         data = {}
         if request.is_json:
             data = request.json or {}
@@ -793,47 +689,6 @@ def miniapp_activate_promocode():
             except:
                 pass
         
-        init_data = data.get('initData') or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data') or request.args.get('initData')
-        
-        if not init_data:
-            init_data_unsafe = data.get('initDataUnsafe', {})
-            if isinstance(init_data_unsafe, dict) and init_data_unsafe.get('user'):
-                user_data = init_data_unsafe['user']
-                telegram_id = user_data.get('id')
-            else:
-                response = jsonify({
-                    "detail": {
-                        "title": "Authorization Error",
-                        "message": "Missing initData. Please open the mini app from Telegram."
-                    }
-                })
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response, 401
-        else:
-            telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authorization Error",
-                    "message": "Telegram ID not found in initData."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        # Находим пользователя
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered. Please register in the bot first."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Получаем промокод
         promo_code_str = data.get('promo_code') or data.get('promoCode', '').strip().upper()
         if not promo_code_str:
@@ -870,11 +725,10 @@ def miniapp_activate_promocode():
         
         # Применяем промокод (упрощенная версия - только для DAYS)
         if promo.promo_type == 'DAYS':
-            API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
+            rw = get_remnawave_client()
             
             try:
-                live = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=headers, cookies=cookies, timeout=10).json().get('response', {})
+                live = rw.get_user(user.remnawave_uuid) or {}
                 curr_exp_str = live.get('expireAt')
                 if curr_exp_str:
                     try:
@@ -901,12 +755,7 @@ def miniapp_activate_promocode():
                     patch_payload["activeInternalSquads"] = [promo.squad_id]
                 # Если у пользователя уже есть сквад - просто добавляем дни (не меняем сквад)
                 
-                patch_resp = requests.patch(
-                    f"{API_URL}/api/users",
-                    headers={"Content-Type": "application/json", **headers},
-                    json=patch_payload,
-                    timeout=10
-                )
+                patch_resp = rw.patch("/api/users", json=patch_payload)
                 
                 if not patch_resp.ok:
                     response = jsonify({
@@ -922,7 +771,7 @@ def miniapp_activate_promocode():
                 promo.uses_left -= 1
                 db.session.commit()
                 
-                cache.delete(f'live_data_{user.remnawave_uuid}')
+                store_patch_result(patch_resp, user.remnawave_uuid, patch_payload)
                 cache.delete('all_live_users_map')
                 
                 response = jsonify({
@@ -971,7 +820,8 @@ def miniapp_activate_promocode():
 
 @app.route('/miniapp/nodes', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_nodes():
+@miniapp_user_required
+def miniapp_nodes(user):
     """Получить список серверов для miniapp"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -981,47 +831,8 @@ def miniapp_nodes():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or data.get('data') or ''
-        
-        if not init_data:
-            response = jsonify({
-                "detail": {
-                    "title": "Authorization Error",
-                    "message": "Missing initData"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authorization Error",
-                    "message": "Invalid initData format"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        # Находим пользователя
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Получаем серверы
-        API_URL = os.getenv('API_URL')
-        headers, cookies = get_remnawave_headers()
-        resp = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}/accessible-nodes", headers=headers, cookies=cookies, timeout=10)
+        resp = get_remnawave_client().get(f"/api/users/{user.remnawave_uuid}/accessible-nodes")
         
         if resp.status_code == 200:
             nodes_data = resp.json()
@@ -1104,7 +915,8 @@ def miniapp_tariffs():
 
 @app.route('/miniapp/subscription/renewal/options', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_subscription_renewal_options():
+@miniapp_user_required
+def miniapp_subscription_renewal_options(user):
     """Получить опции продления подписки для miniapp"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1114,58 +926,6 @@ def miniapp_subscription_renewal_options():
         return response
     
     try:
-        # Парсим initData для получения пользователя
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
-        
-        init_data = data.get('initData') or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data') or request.args.get('initData')
-        
-        if not init_data:
-            init_data_unsafe = data.get('initDataUnsafe', {})
-            if isinstance(init_data_unsafe, dict) and init_data_unsafe.get('user'):
-                user_data = init_data_unsafe['user']
-                telegram_id = user_data.get('id')
-            else:
-                response = jsonify({
-                    "detail": {
-                        "title": "Authorization Error",
-                        "message": "Missing initData. Please open the mini app from Telegram."
-                    }
-                })
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response, 401
-        else:
-            telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authorization Error",
-                    "message": "Telegram ID not found in initData."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Получаем тарифы
         tariffs = Tariff.query.all()
         options = [{
@@ -1197,7 +957,8 @@ def miniapp_subscription_renewal_options():
 
 @app.route('/miniapp/subscription/settings', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_subscription_settings():
+@miniapp_user_required
+def miniapp_subscription_settings(user):
     """Получить настройки подписки для miniapp"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1207,58 +968,6 @@ def miniapp_subscription_settings():
         return response
     
     try:
-        # Парсим initData
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
-        
-        init_data = data.get('initData') or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data') or request.args.get('initData')
-        
-        if not init_data:
-            init_data_unsafe = data.get('initDataUnsafe', {})
-            if isinstance(init_data_unsafe, dict) and init_data_unsafe.get('user'):
-                user_data = init_data_unsafe['user']
-                telegram_id = user_data.get('id')
-            else:
-                response = jsonify({
-                    "detail": {
-                        "title": "Authorization Error",
-                        "message": "Missing initData. Please open the mini app from Telegram."
-                    }
-                })
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response, 401
-        else:
-            telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authorization Error",
-                    "message": "Telegram ID not found in initData."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Возвращаем настройки подписки (упрощенная версия)
         response = jsonify({
             "auto_renewal": False,
@@ -1335,7 +1044,8 @@ def miniapp_claim_promo_offer(offer_id):
 
 @app.route('/miniapp/configs', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_configs():
+@miniapp_user_required
+def miniapp_configs(user):
     """
     Получить список конфигов пользователя.
     
@@ -1350,25 +1060,6 @@ def miniapp_configs():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {"title": "User Not Found", "message": "User not registered"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Проверяем, что remnawave_uuid валидный (должен быть UUID, а не email)
         if not user.remnawave_uuid:
             response = jsonify({
@@ -1387,24 +1078,10 @@ def miniapp_configs():
             return response, 500
         
         # Получаем данные подписки (subscription URL содержит конфиги)
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
-        
-        if not cached:
-            API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
-            try:
-                resp = requests.get(
-                    f"{API_URL}/api/users/{user.remnawave_uuid}",
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=10
-                )
-                if resp.status_code == 200:
-                    cached = resp.json().get('response', {})
-                    cache.set(cache_key, cached, timeout=300)
-            except:
-                pass
+        try:
+            cached = get_live_data(user.remnawave_uuid)
+        except:
+            cached = None
         
         subscription_url = cached.get('subscriptionUrl') if cached else None
         expire_at = cached.get('expireAt') if cached else None
@@ -1426,8 +1103,7 @@ def miniapp_configs():
             ).order_by(Payment.created_at.desc()).first()
             
             # Получаем названия тарифов из брендинга
-            from modules.models.branding import BrandingSetting
-            branding = BrandingSetting.query.first()
+            branding = get_settings('branding')
             basic_name = getattr(branding, 'tariff_tier_basic_name', None) or 'Базовый'
             pro_name = getattr(branding, 'tariff_tier_pro_name', None) or 'Премиум'
             elite_name = getattr(branding, 'tariff_tier_elite_name', None) or 'Элитный'
@@ -1513,7 +1189,8 @@ def miniapp_configs():
 
 @app.route('/miniapp/referrals/info', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_referrals_info():
+@miniapp_user_required
+def miniapp_referrals_info(user):
     """Получить информацию о реферальной программе"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1521,25 +1198,6 @@ def miniapp_referrals_info():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {"title": "User Not Found", "message": "User not registered"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Генерируем реферальную ссылку
         YOUR_SERVER_IP_OR_DOMAIN = os.getenv("YOUR_SERVER_IP_OR_DOMAIN", os.getenv("YOUR_SERVER_IP", ""))
         referral_code = user.referral_code or f"REF{user.id}"
@@ -1598,7 +1256,7 @@ def miniapp_referrals_info():
             "referral_link_direct": referral_link_direct,
             "referral_link_telegram": referral_link_telegram,
             "referral_info": referral_info,
-            "referrals_count": User.query.filter_by(referrer_id=user.id).count()
+            "referrals_count": get_referral_stats(user.id)["referrals_count"]
         }
         
         response = jsonify(response_data)
@@ -1617,7 +1275,8 @@ def miniapp_referrals_info():
 
 @app.route('/miniapp/referrals/stats', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_referrals_stats():
+@miniapp_user_required
+def miniapp_referrals_stats(user):
     """Получить статистику рефералов пользователя"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1625,36 +1284,14 @@ def miniapp_referrals_stats():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {"title": "User Not Found", "message": "User not registered"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
-        # Подсчитываем рефералов
-        referrals_count = User.query.filter_by(referrer_id=user.id).count()
-        
-        # Подсчитываем баланс рефералов (можно расширить через Payment модель)
-        total_earnings = 0.0  # TODO: Реализовать подсчет через платежи рефералов
+        stats = get_referral_stats(user.id)
+        page = list_referrals(user.id)
         
         response_data = {
-            "referrals_count": referrals_count,
-            "total_earnings": total_earnings,
-            "available_for_withdrawal": total_earnings,
-            "referrals": []  # Список рефералов (можно расширить)
+            **stats,
+            "total_earnings": stats["total_earned"],
+            "available_for_withdrawal": stats["total_earned"],
+            "referrals": page["referrals"]
         }
         
         response = jsonify(response_data)
@@ -1671,13 +1308,53 @@ def miniapp_referrals_stats():
         return response, 500
 
 
+@app.route('/miniapp/referrals/list', methods=['POST', 'OPTIONS'])
+@limiter.limit("30 per minute")
+@miniapp_user_required
+def miniapp_referrals_list(user):
+    """
+    Список приглашенных пользователем (новые первыми)
+    
+    Параметры (body или query): limit (<= 200), offset
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        limit = data.get('limit') or request.args.get('limit', type=int)
+        offset = data.get('offset') or request.args.get('offset', type=int)
+        try:
+            page = list_referrals(user.id, limit=limit, offset=offset)
+        except (TypeError, ValueError):
+            response = jsonify({"detail": {"title": "Error", "message": "Invalid limit or offset"}})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 400
+        
+        response = jsonify(page)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        response = jsonify({
+            "detail": {"title": "Error", "message": str(e)}
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 500
+
+
 # ============================================================================
 # PROFILE (расширенные данные профиля)
 # ============================================================================
 
 @app.route('/miniapp/profile', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_profile():
+@miniapp_user_required
+def miniapp_profile(user):
     """Получить данные профиля пользователя для отображения"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1685,44 +1362,11 @@ def miniapp_profile():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, user_data_parsed = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {"title": "User Not Found", "message": "User not registered"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Получаем данные подписки
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
-        
-        if not cached:
-            API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
-            try:
-                resp = requests.get(
-                    f"{API_URL}/api/users/{user.remnawave_uuid}",
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=10
-                )
-                if resp.status_code == 200:
-                    cached = resp.json().get('response', {})
-                    cache.set(cache_key, cached, timeout=300)
-            except:
-                cached = {}
+        try:
+            cached = get_live_data(user.remnawave_uuid) or {}
+        except:
+            cached = {}
         
         expire_at = cached.get('expireAt') if cached else None
         has_active = False
@@ -1740,7 +1384,7 @@ def miniapp_profile():
         
         profile_data = {
             "telegram_id": str(user.telegram_id),
-            "username": user.telegram_username or (user_data_parsed.get('username') if user_data_parsed else None) or f"user_{user.telegram_id}",
+            "username": user.telegram_username or (g.telegram_user.get('username') if g.telegram_user else None) or f"user_{user.telegram_id}",
             "email": user.email,
             "referral_code": user.referral_code,
             "has_active_subscription": has_active,
@@ -1769,7 +1413,8 @@ def miniapp_profile():
 
 @app.route('/miniapp/settings', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_settings():
+@miniapp_user_required
+def miniapp_settings(user):
     """Обновить настройки пользователя (валюта, язык)"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1778,24 +1423,6 @@ def miniapp_settings():
     
     try:
         data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {"title": "User Not Found", "message": "User not registered"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Установка пароля (для пользователей из бота)
         if data.get('action') == 'set_password' and 'new_password' in data:
             new_password = data['new_password']
@@ -1828,9 +1455,8 @@ def miniapp_settings():
         if 'preferred_currency' in data:
             currency = data['preferred_currency']
             # Проверяем, что валюта активна
-            from modules.models.system import SystemSetting
             import json
-            settings = SystemSetting.query.first()
+            settings = get_settings('system')
             active_currencies = ['uah', 'rub', 'usd']
             if settings and hasattr(settings, 'active_currencies') and settings.active_currencies:
                 try:
@@ -1845,16 +1471,14 @@ def miniapp_settings():
                 db.session.commit()
                 # Очищаем кэш при изменении валюты, чтобы баланс пересчитался
                 if currency_changed:
-                    cache.delete(f'live_data_{user.remnawave_uuid}')
                     cache.delete('all_live_users_map')
         
         # Обновляем язык
         if 'preferred_lang' in data:
             lang = data['preferred_lang']
             # Проверяем, что язык активен
-            from modules.models.system import SystemSetting
             import json
-            settings = SystemSetting.query.first()
+            settings = get_settings('system')
             active_languages = ['ru', 'ua', 'en', 'cn']
             if settings and hasattr(settings, 'active_languages') and settings.active_languages:
                 try:
@@ -1886,7 +1510,8 @@ def miniapp_settings():
 
 @app.route('/miniapp/options', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_options():
+@miniapp_user_required(optional=True)
+def miniapp_options(user):
     """Получить список платных опций"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1894,10 +1519,6 @@ def miniapp_options():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
         # Получаем опции (пока статичный список, можно расширить через БД)
         options = [
             {
@@ -1911,12 +1532,10 @@ def miniapp_options():
             }
         ]
         
-        # Если есть telegram_id, проверяем статус опций пользователя
-        if telegram_id:
-            user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-            if user:
-                # TODO: Реализовать проверку активных опций через RemnaWave API
-                pass
+        # Если пользователь авторизован, проверяем статус его опций
+        if user:
+            # TODO: Реализовать проверку активных опций через RemnaWave API
+            pass
         
         response = jsonify({"options": options})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -1936,7 +1555,8 @@ def miniapp_options():
 
 @app.route('/miniapp/support/tickets', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_support_tickets():
+@miniapp_user_required
+def miniapp_support_tickets(user):
     """Получить список тикетов или создать новый тикет"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1945,31 +1565,6 @@ def miniapp_support_tickets():
     
     try:
         data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authentication Error",
-                    "message": "Invalid or missing Telegram initData"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        # Получаем пользователя (преобразуем telegram_id в строку, т.к. в БД это VARCHAR)
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered. Please register first."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         from modules.models.ticket import Ticket, TicketMessage
         
         # GET - список тикетов
@@ -2051,7 +1646,8 @@ def miniapp_support_tickets():
 
 @app.route('/miniapp/support/tickets/<int:ticket_id>', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_support_ticket_detail(ticket_id):
+@miniapp_user_required
+def miniapp_support_ticket_detail(ticket_id, user):
     """Получить детали тикета"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -2059,32 +1655,6 @@ def miniapp_support_ticket_detail(ticket_id):
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authentication Error",
-                    "message": "Invalid or missing Telegram initData"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        # Получаем пользователя (преобразуем telegram_id в строку, т.к. в БД это VARCHAR)
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered. Please register first."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         from modules.models.ticket import Ticket, TicketMessage
         
         # Получаем тикет
@@ -2135,7 +1705,8 @@ def miniapp_support_ticket_detail(ticket_id):
 
 @app.route('/miniapp/support/tickets/<int:ticket_id>/reply', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_support_ticket_reply(ticket_id):
+@miniapp_user_required
+def miniapp_support_ticket_reply(ticket_id, user):
     """Ответить на тикет"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -2144,31 +1715,6 @@ def miniapp_support_ticket_reply(ticket_id):
     
     try:
         data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {
-                    "title": "Authentication Error",
-                    "message": "Invalid or missing Telegram initData"
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        # Получаем пользователя (преобразуем telegram_id в строку, т.к. в БД это VARCHAR)
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {
-                    "title": "User Not Found",
-                    "message": "User not registered. Please register first."
-                }
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         from modules.models.ticket import Ticket, TicketMessage
         
         # Проверяем, что тикет принадлежит пользователю
@@ -2285,7 +1831,8 @@ def miniapp_support_ticket_reply(ticket_id):
 
 @app.route('/miniapp/payments/history', methods=['POST', 'OPTIONS'])
 @limiter.limit("30 per minute")
-def miniapp_payments_history():
+@miniapp_user_required
+def miniapp_payments_history(user):
     """Получить историю платежей пользователя"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -2293,28 +1840,8 @@ def miniapp_payments_history():
         return response
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or data.get('init_data') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({
-                "detail": {"title": "Authorization Error", "message": "Missing initData"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({
-                "detail": {"title": "User Not Found", "message": "User not registered"}
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
         # Получаем названия тарифов из брендинга
-        from modules.models.branding import BrandingSetting
-        branding = BrandingSetting.query.first()
+        branding = get_settings('branding')
         basic_name = getattr(branding, 'tariff_tier_basic_name', None) or 'Базовый'
         pro_name = getattr(branding, 'tariff_tier_pro_name', None) or 'Премиум'
         elite_name = getattr(branding, 'tariff_tier_elite_name', None) or 'Элитный'
@@ -2423,17 +1950,9 @@ def get_user_days_remaining(user):
         return 0
     
     try:
-        api_url = os.environ.get('API_URL', '')
-        admin_token = os.environ.get('ADMIN_TOKEN', '')
-        
-        response = requests.get(
-            f"{api_url}/api/users/{user.remnawave_uuid}",
-            headers={"Authorization": f"Bearer {admin_token}"},
-            timeout=10
-        )
+        data = get_live_data(user.remnawave_uuid)
         
-        if response.status_code == 200:
-            data = response.json().get('response', {})
+        if data is not None:
             expire_at = data.get('expireAt')
             if expire_at:
                 expire_date = datetime.fromisoformat(expire_at.replace('Z', '+00:00'))
@@ -2452,20 +1971,14 @@ def update_user_subscription(user, days_delta):
         return False
     
     try:
-        api_url = os.environ.get('API_URL', '')
-        admin_token = os.environ.get('ADMIN_TOKEN', '')
-        
-        # Получаем текущую дату окончания
-        response = requests.get(
-            f"{api_url}/api/users/{user.remnawave_uuid}",
-            headers={"Authorization": f"Bearer {admin_token}"},
-            timeout=10
-        )
+        rw = get_remnawave_client()
+        
+        # Получаем текущую дату окончания (свежую - ставка меняет срок подписки)
+        data = get_live_data(user.remnawave_uuid, force_refresh=True)
         
-        if response.status_code != 200:
+        if data is None:
             return False
         
-        data = response.json().get('response', {})
         current_expire = data.get('expireAt')
         
         if current_expire:
@@ -2477,18 +1990,12 @@ def update_user_subscription(user, days_delta):
         new_expire = expire_date + timedelta(days=days_delta)
         
         # Обновляем через API (правильный формат - uuid в теле запроса)
-        update_response = requests.patch(
-            f"{api_url}/api/users",
-            headers={
-                "Authorization": f"Bearer {admin_token}",
-                "Content-Type": "application/json"
-            },
-            json={"uuid": user.remnawave_uuid, "expireAt": new_expire.isoformat()},
-            timeout=10
-        )
+        update_response = rw.patch_user(user.remnawave_uuid, expireAt=new_expire.isoformat())
         
         if update_response.status_code != 200:
             print(f"Error updating subscription: Status {update_response.status_code}, Response: {update_response.text[:200]}")
+        else:
+            store_patch_result(update_response, user.remnawave_uuid, {'expireAt': new_expire.isoformat()})
         
         return update_response.status_code == 200
     except Exception as e:
@@ -2531,7 +2038,8 @@ def casino_config():
 
 
 @app.route('/miniapp/casino/play', methods=['POST', 'OPTIONS'])
-def casino_play():
+@miniapp_user_required
+def casino_play(user):
     """Играть в казино"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -2549,24 +2057,8 @@ def casino_play():
     
     try:
         data = request.json or {}
-        init_data = data.get('initData', '')
         bet_days = int(data.get('bet', 1))
-        
-        # Парсим данные пользователя
-        telegram_id, user_data = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({'error': 'Не авторизован'})
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 401
-        
-        # Находим пользователя
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            response = jsonify({'error': 'Пользователь не найден'})
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 404
-        
+
         # Проверяем ставку
         if bet_days < config['min_bet'] or bet_days > config['max_bet']:
             response = jsonify({'error': f'Ставка должна быть от {config["min_bet"]} до {config["max_bet"]} дней'})
@@ -2715,7 +2207,8 @@ def casino_play():
 
 
 @app.route('/miniapp/casino/history', methods=['GET', 'POST', 'OPTIONS'])
-def casino_history():
+@miniapp_user_required(optional=True)
+def casino_history(user):
     """Получить историю игр пользователя"""
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -2725,17 +2218,6 @@ def casino_history():
         return response, 200
     
     try:
-        data = request.json or {}
-        init_data = data.get('initData', '')
-        
-        telegram_id, _ = parse_telegram_init_data(init_data)
-        
-        if not telegram_id:
-            response = jsonify({'games': []})
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 200
-        
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
         if not user:
             response = jsonify({'games': []})
             response.headers.add('Access-Control-Allow-Origin', '*')
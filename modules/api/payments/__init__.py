@@ -1,7 +1,7 @@
 """
 Платёжные системы StealthNET
 
-Каждая платёжная система в отдельном файле:
+Каждая платёжная система - адаптер (adapter.py) в отдельном файле:
 - crystalpay.py   - CrystalPay
 - heleket.py      - Heleket
 - yookassa.py     - YooKassa
@@ -12,32 +12,31 @@
 - monobank.py     - Monobank
 - btcpayserver.py - BTCPayServer
 - platega.py      - Platega
+- mulenpay.py     - MulenPay
+- urlpay.py       - UrlPay
+- tribute.py      - Tribute
+
+Ключи провайдеров - vault.py (расшифровываются один раз на версию настроек)
 """
 
-from modules.api.payments.crystalpay import create_crystalpay_payment
-from modules.api.payments.heleket import create_heleket_payment
-from modules.api.payments.yookassa import create_yookassa_payment
-from modules.api.payments.telegram_stars import create_telegram_stars_payment
-from modules.api.payments.freekassa import create_freekassa_payment
-from modules.api.payments.robokassa import create_robokassa_payment
-from modules.api.payments.cryptobot import create_cryptobot_payment
-from modules.api.payments.monobank import create_monobank_payment
-from modules.api.payments.btcpayserver import create_btcpayserver_payment
-from modules.api.payments.platega import create_platega_payment
+from modules.api.payments.adapter import PAYMENT_PROVIDERS, PaymentProvider, get_payment_provider
 
-# Маппинг провайдеров к функциям создания платежа
-PAYMENT_PROVIDERS = {
-    'crystalpay': create_crystalpay_payment,
-    'heleket': create_heleket_payment,
-    'yookassa': create_yookassa_payment,
-    'telegram_stars': create_telegram_stars_payment,
-    'freekassa': create_freekassa_payment,
-    'robokassa': create_robokassa_payment,
-    'cryptobot': create_cryptobot_payment,
-    'monobank': create_monobank_payment,
-    'btcpayserver': create_btcpayserver_payment,
-    'platega': create_platega_payment,
-}
+# Импорт модулей регистрирует адаптеры в PAYMENT_PROVIDERS
+from modules.api.payments import (  # noqa: F401
+    crystalpay,
+    heleket,
+    yookassa,
+    telegram_stars,
+    freekassa,
+    robokassa,
+    cryptobot,
+    monobank,
+    btcpayserver,
+    platega,
+    mulenpay,
+    urlpay,
+    tribute,
+)
 
 
 def create_payment(provider: str, amount: float, currency: str, order_id: str, **kwargs):
@@ -54,9 +53,8 @@ def create_payment(provider: str, amount: float, currency: str, order_id: str, *
     Returns:
         tuple: (url, payment_id) или (None, error_message)
     """
-    if provider not in PAYMENT_PROVIDERS:
+    adapter = get_payment_provider(provider)
+    if adapter is None:
         return None, f"Unknown payment provider: {provider}"
     
-    return PAYMENT_PROVIDERS[provider](amount, currency, order_id, **kwargs)
-
-
+    return adapter.create_payment(amount, currency, order_id, **kwargs)
@@ -0,0 +1,258 @@
+"""
+Адаптер платёжной системы и реестр адаптеров
+
+Адаптер отвечает за одну платёжную систему:
+  - ключи берет из vault.py (расшифрованы один раз на версию настроек), а
+    производные от них значения (заголовки авторизации, нормализованные id)
+    собирает в prepare() и держит до смены ключей;
+  - держит свою HTTP сессию с пулом соединений: счет создается одним запросом
+    по уже открытому keep-alive соединению, без TLS рукопожатия на каждый платеж.
+    Сессия своя у каждого процесса (после fork gunicorn создается заново).
+
+Сайт (/api/client/create-payment) и мини-апп (/miniapp/payments/create) создают
+счета только через реестр:
+
+    provider = get_payment_provider('yookassa')
+    payment_url, payment_system_id = provider.create_payment(amount, currency, order_id, **kwargs)
+
+Адаптеры с supports_status_check умеют запрашивать статус счетов - ими пользуется
+сверка ожидающих платежей (modules/payment_reconciler.py):
+
+    provider.fetch_statuses([payment_system_id, ...])  # -> {payment_system_id: PAYMENT_PAID, ...}
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.api.payments.base import get_callback_url, get_return_url
+from modules.api.payments.vault import get_payment_credentials
+
+PAYMENT_HTTP_POOL_SIZE = int(os.getenv("PAYMENT_HTTP_POOL_SIZE", "10"))
+PAYMENT_HTTP_TIMEOUT = int(os.getenv("PAYMENT_HTTP_TIMEOUT", "30"))
+
+# provider -> адаптер (порядок регистрации - порядок импорта в __init__)
+PAYMENT_PROVIDERS = {}
+
+# Статусы счета у платёжной системы (fetch_statuses)
+PAYMENT_PAID = 'PAID'
+PAYMENT_PENDING = 'PENDING'
+PAYMENT_CANCELED = 'CANCELED'
+
+
+class PaymentError(Exception):
+    """Платёжная система отказала в создании счета (сообщение уходит клиенту)"""
+
+
+class PaymentProvider:
+    """Базовый адаптер: сессия, ключи и общий разбор ошибок"""
+
+    name = None
+    title = None
+    currencies = None  # валюты, которые принимает система; None - любые
+    session_headers = {}
+    supports_status_check = False
+    status_batch_size = 1  # счетов в одном запросе статуса
+
+    def __init__(self):
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._prepared = None
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PAYMENT_HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.session_headers)
+        return session
+
+    @property
+    def session(self):
+        """HTTP сессия процесса (пул соединений к API платёжной системы)"""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    self._session = self._create_session()
+                    self._session_pid = pid
+        return self._session
+
+    def reset_session(self):
+        """Закрыть сессию; следующий запрос откроет новую"""
+        with self._session_lock:
+            if self._session is not None and self._session_pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._session_pid = None
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', PAYMENT_HTTP_TIMEOUT)
+        return self.session.post(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', PAYMENT_HTTP_TIMEOUT)
+        return self.session.get(url, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Ключи
+    # ------------------------------------------------------------------
+
+    def credentials(self):
+        """Ключи из vault или None, если заданы не все обязательные"""
+        creds = get_payment_credentials(self.name)
+        if not creds or not creds.configured:
+            return None
+        return creds
+
+    def prepared(self, creds):
+        """Результат prepare() для этих ключей (пересчитывается при смене ключей)"""
+        cached = self._prepared
+        if cached is not None and cached[0] is creds:
+            return cached[1]
+        value = self.prepare(creds)
+        self._prepared = (creds, value)
+        return value
+
+    def prepare(self, creds):
+        """Производные от ключей значения, общие для всех счетов"""
+        return None
+
+    # ------------------------------------------------------------------
+    # Счет
+    # ------------------------------------------------------------------
+
+    def supports_currency(self, currency):
+        return not self.currencies or (currency or '').upper() in self.currencies
+
+    def create_payment(self, amount, currency, order_id, **kwargs):
+        """
+        Создать счет
+
+        Args:
+            amount: Сумма платежа
+            currency: Валюта (UAH, RUB, USD)
+            order_id: ID заказа
+            **kwargs: source, miniapp_type, user_email, title, description
+
+        Returns:
+            tuple: (payment_url, payment_system_id) или (None, error_message)
+        """
+        creds = self.credentials()
+        if creds is None:
+            return None, f"{self.title} не настроен"
+
+        currency = (currency or '').upper()
+        if not self.supports_currency(currency):
+            return None, f"{self.title} поддерживает только {', '.join(self.currencies)}"
+
+        try:
+            return self.create(creds, float(amount), currency, order_id, **kwargs)
+        except PaymentError as e:
+            print(f"[{self.name.upper()}] Счет {order_id} не создан: {e}")
+            return None, str(e)
+        except requests.HTTPError as e:
+            message = _response_error(e.response) or str(e)
+            print(f"[{self.name.upper()}] HTTP ошибка для {order_id}: {message}")
+            return None, f"{self.title} API Error: {message}"
+        except requests.RequestException as e:
+            print(f"[{self.name.upper()}] Ошибка соединения для {order_id}: {e}")
+            return None, f"{self.title} connection error: {e}"
+        except Exception as e:
+            print(f"[{self.name.upper()}] Ошибка создания счета {order_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None, f"{self.title} error: {e}"
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
+        """Запрос к API платёжной системы -> (payment_url, payment_system_id)"""
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------
+    # Статус счетов
+    # ------------------------------------------------------------------
+
+    def fetch_statuses(self, payment_system_ids):
+        """
+        Статусы счетов у платёжной системы
+
+        Returns:
+            dict: payment_system_id -> PAYMENT_PAID / PAYMENT_PENDING / PAYMENT_CANCELED;
+                  счета, статус которых узнать не удалось, в словарь не попадают
+        """
+        creds = self.credentials()
+        if creds is None or not self.supports_status_check:
+            return {}
+
+        ids = [str(i) for i in payment_system_ids if i]
+        result = {}
+        for start in range(0, len(ids), self.status_batch_size):
+            batch = ids[start:start + self.status_batch_size]
+            try:
+                result.update(self.statuses(creds, batch))
+            except requests.RequestException as e:
+                print(f"[{self.name.upper()}] Ошибка запроса статуса ({len(batch)} счетов): {e}")
+            except Exception as e:
+                print(f"[{self.name.upper()}] Ошибка разбора статуса ({len(batch)} счетов): {e}")
+        return result
+
+    def statuses(self, creds, payment_system_ids):
+        """Запрос статуса не более status_batch_size счетов -> {payment_system_id: статус}"""
+        raise NotImplementedError
+
+    def callback_url(self):
+        """URL webhook; без публичного адреса панели счет не создается - оплату некому подтвердить"""
+        url = get_callback_url(self.name)
+        if url is None:
+            raise PaymentError(f"{self.title}: не задан YOUR_SERVER_IP - платёжная система не сможет отправить уведомление об оплате")
+        return url
+
+    @staticmethod
+    def return_url(kwargs):
+        return get_return_url(kwargs.get('source', 'miniapp'), kwargs.get('miniapp_type', 'v2'))
+
+    @staticmethod
+    def description(order_id, kwargs):
+        return kwargs.get('description') or f"Подписка StealthNET #{order_id}"
+
+
+def _response_error(response):
+    """Сообщение об ошибке из ответа API"""
+    if response is None:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return response.text[:200] if response.text else None
+    if isinstance(data, dict):
+        return data.get('message') or data.get('error') or data.get('detail') or data.get('description')
+    return None
+
+
+def register_provider(provider_cls):
+    """Декоратор класса адаптера: добавляет экземпляр в реестр"""
+    PAYMENT_PROVIDERS[provider_cls.name] = provider_cls()
+    return provider_cls
+
+
+def get_payment_provider(name):
+    """Адаптер платёжной системы или None"""
+    return PAYMENT_PROVIDERS.get(name)
+
+
+__all__ = [
+    'PAYMENT_PROVIDERS',
+    'PAYMENT_PAID',
+    'PAYMENT_PENDING',
+    'PAYMENT_CANCELED',
+    'PaymentError',
+    'PaymentProvider',
+    'register_provider',
+    'get_payment_provider'
+]
@@ -3,15 +3,14 @@
 """
 import os
 from modules.core import get_fernet
-from modules.models.payment import PaymentSetting
-from modules.models.bot_config import BotConfig
+from modules.settings_registry import get_settings
 
 fernet = get_fernet()
 
 
 def get_payment_settings():
     """Получить настройки платёжных систем"""
-    return PaymentSetting.query.first()
+    return get_settings('payment')
 
 
 def decrypt_key(encrypted_key):
@@ -50,12 +49,20 @@ def decrypt_key(encrypted_key):
         return ""
 
 
-def get_callback_url(provider: str) -> str:
-    """Получить URL для webhook"""
-    base_url = os.getenv('YOUR_SERVER_IP') or os.getenv('YOUR_SERVER_IP_OR_DOMAIN', '')
+def get_callback_url(provider: str):
+    """
+    Получить URL для webhook
+
+    Returns:
+        str: абсолютный URL или None, если публичный адрес панели (YOUR_SERVER_IP) не задан -
+             относительный адрес платёжная система вызвать не сможет
+    """
+    base_url = (os.getenv('YOUR_SERVER_IP') or os.getenv('YOUR_SERVER_IP_OR_DOMAIN', '')).strip().rstrip('/')
+    if not base_url:
+        return None
     if not base_url.startswith(('http://', 'https://')):
-        base_url = f"https://{base_url}" if base_url else ""
-    return f"{base_url}/api/webhook/{provider}" if base_url else f"/api/webhook/{provider}"
+        base_url = f"https://{base_url}"
+    return f"{base_url}/api/webhook/{provider}"
 
 
 def get_bot_username() -> str:
@@ -70,7 +77,7 @@ def get_bot_username() -> str:
     
     # Если нет в переменных окружения, пробуем получить из BotConfig
     try:
-        bot_config = BotConfig.query.first()
+        bot_config = get_settings('bot_config')
         if bot_config and bot_config.bot_username:
             username = bot_config.bot_username
             # Убираем @ если есть
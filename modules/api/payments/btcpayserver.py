@@ -2,79 +2,51 @@
 BTCPay Server - self-hosted платёжная система для криптовалют
 https://btcpayserver.org/
 """
-import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.adapter import PaymentError, PaymentProvider, register_provider
 
 
-def create_btcpayserver_payment(amount: float, currency: str, order_id: str, **kwargs):
-    """
-    Создать платёж через BTCPay Server
-    
-    Args:
-        amount: Сумма платежа
-        currency: Валюта
-        order_id: ID заказа
-        user_email: Email пользователя (опционально)
-    
-    Returns:
-        tuple: (payment_url, invoice_id) или (None, error_message)
-    """
-    settings = get_payment_settings()
-    if not settings:
-        return None, "Payment settings not configured"
-    
-    server_url = settings.btcpayserver_url
-    api_key = decrypt_key(settings.btcpayserver_api_key)
-    store_id = settings.btcpayserver_store_id
-    
-    if not server_url or not api_key or not store_id:
-        return None, "BTCPay Server not configured"
-    
-    try:
-        # Убираем trailing slash
-        server_url = server_url.rstrip('/')
-        
+@register_provider
+class BTCPayServerProvider(PaymentProvider):
+    """BTCPay Server: счет в магазине store_id"""
+
+    name = 'btcpayserver'
+    title = 'BTCPay Server'
+
+    def prepare(self, creds):
+        return (
+            f"{creds.url.rstrip('/')}/api/v1/stores/{creds.store_id}/invoices",
+            {
+                "Authorization": f"token {creds.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
+        invoice_url, headers = self.prepared(creds)
+        user_email = kwargs.get('user_email')
+
         payload = {
-            "amount": str(amount),
-            "currency": currency.upper(),
+            "amount": f"{amount:.2f}",
+            "currency": currency,
             "metadata": {
-                "orderId": order_id
+                "orderId": order_id,
+                "itemDesc": self.description(order_id, kwargs)
             },
             "checkout": {
-                "redirectURL": get_return_url(kwargs.get('source', 'miniapp'), kwargs.get('miniapp_type', 'v2')),
+                "redirectURL": self.return_url(kwargs),
                 "redirectAutomatically": True
             },
             "receipt": {
                 "enabled": True
             }
         }
-        
-        user_email = kwargs.get('user_email')
         if user_email:
-            payload["buyer"] = {"email": user_email}
-        
-        headers = {
-            "Authorization": f"token {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            f"{server_url}/api/v1/stores/{store_id}/invoices",
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        
+            payload["metadata"]["buyerEmail"] = user_email
+
+        response = self.post(invoice_url, json=payload, headers=headers)
         data = response.json()
-        
-        if response.status_code not in [200, 201]:
-            return None, data.get('message', 'BTCPay Server API Error')
-        
-        return data.get('checkoutLink'), data.get('id')
-        
-    except requests.RequestException as e:
-        return None, f"BTCPay Server connection error: {str(e)}"
-    except Exception as e:
-        return None, f"BTCPay Server error: {str(e)}"
 
+        if response.status_code not in [200, 201]:
+            raise PaymentError(data.get('message', 'BTCPay Server API Error'))
 
+        return data.get('checkoutLink'), data.get('id')
@@ -2,70 +2,69 @@
 CryptoBot - платёжная система Telegram
 https://t.me/CryptoBot
 """
-import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url
+from modules.api.payments.adapter import (
+    PAYMENT_CANCELED, PAYMENT_PAID, PAYMENT_PENDING, PaymentError, PaymentProvider, register_provider
+)
+from modules.api.payments.vault import get_payment_vault
 
+CRYPTOBOT_STATUSES = {
+    'paid': PAYMENT_PAID,
+    'expired': PAYMENT_CANCELED,
+}
 
-def create_cryptobot_payment(amount: float, currency: str, order_id: str, **kwargs):
-    """
-    Создать платёж через CryptoBot
-    
-    Args:
-        amount: Сумма платежа
-        currency: Валюта
-        order_id: ID заказа
-    
-    Returns:
-        tuple: (payment_url, invoice_id) или (None, error_message)
-    """
-    settings = get_payment_settings()
-    if not settings:
-        return None, "Payment settings not configured"
-    
-    api_key = decrypt_key(settings.cryptobot_api_key)
-    if not api_key:
-        return None, "CryptoBot API key not configured"
-    
-    try:
-        # CryptoBot работает с криптовалютами
-        # Используем USDT как основную валюту
-        crypto_currency = "USDT"
-        
+
+@register_provider
+class CryptoBotProvider(PaymentProvider):
+    """CryptoBot: счет в фиатной валюте, оплата любой криптовалютой бота"""
+
+    name = 'cryptobot'
+    title = 'CryptoBot'
+    supports_status_check = True
+    status_batch_size = 100  # getInvoices принимает список invoice_ids
+
+    def prepare(self, creds):
+        return {
+            "Crypto-Pay-API-Token": creds.api_key,
+            "Content-Type": "application/json"
+        }
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
         payload = {
-            "asset": crypto_currency,
-            "amount": str(amount),
-            "description": f"Подписка StealthNET #{order_id}",
-            "hidden_message": order_id,
+            "currency_type": "fiat",
+            "fiat": currency,
+            "amount": f"{amount:.2f}",
+            "description": self.description(order_id, kwargs),
             "payload": order_id,
+            "paid_btn_name": "callback",
+            "paid_btn_url": self.return_url(kwargs),
             "allow_comments": False,
             "allow_anonymous": True
         }
-        
-        headers = {
-            "Crypto-Pay-API-Token": api_key,
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            "https://pay.crypt.bot/api/createInvoice",
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        
-        data = response.json()
-        
+
+        data = self.post("https://pay.crypt.bot/api/createInvoice", json=payload, headers=self.prepared(creds)).json()
+
         if not data.get('ok'):
             error = data.get('error', {})
-            return None, error.get('name', 'CryptoBot API Error')
-        
+            raise PaymentError(error.get('name', 'CryptoBot API Error'))
+
         result = data.get('result', {})
         return result.get('pay_url'), str(result.get('invoice_id'))
-        
-    except requests.RequestException as e:
-        return None, f"CryptoBot connection error: {str(e)}"
-    except Exception as e:
-        return None, f"CryptoBot error: {str(e)}"
+
+    def statuses(self, creds, payment_system_ids):
+        response = self.get(
+            "https://pay.crypt.bot/api/getInvoices",
+            params={"invoice_ids": ",".join(payment_system_ids), "count": len(payment_system_ids)},
+            headers=self.prepared(creds),
+            timeout=10
+        )
+        data = response.json()
+        if not data.get('ok'):
+            print(f"[CRYPTOBOT] getInvoices: {data.get('error')}")
+            return {}
+        return {
+            str(invoice.get('invoice_id')): CRYPTOBOT_STATUSES.get(invoice.get('status'), PAYMENT_PENDING)
+            for invoice in data.get('result', {}).get('items', [])
+        }
 
 
 def verify_cryptobot_signature(data: dict, signature: str) -> bool:
@@ -73,11 +72,12 @@ def verify_cryptobot_signature(data: dict, signature: str) -> bool:
     import hashlib
     import hmac
     
-    settings = get_payment_settings()
-    if not settings:
+    vault = get_payment_vault()
+    if not vault.settings:
         return False
+    creds = vault.credentials('cryptobot')
     
-    api_key = decrypt_key(settings.cryptobot_api_key)
+    api_key = creds.api_key
     if not api_key:
         return False
     
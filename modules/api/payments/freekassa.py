@@ -3,62 +3,42 @@ FreeKassa - платёжная система
 https://freekassa.ru/
 """
 import hashlib
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url
+from urllib.parse import urlencode
+from modules.api.payments.adapter import PaymentProvider, register_provider
+from modules.api.payments.vault import get_payment_vault
 
 
-def create_freekassa_payment(amount: float, currency: str, order_id: str, **kwargs):
-    """
-    Создать платёж через FreeKassa
-    
-    Args:
-        amount: Сумма платежа
-        currency: Валюта
-        order_id: ID заказа
-    
-    Returns:
-        tuple: (payment_url, order_id) или (None, error_message)
-    """
-    settings = get_payment_settings()
-    if not settings:
-        return None, "Payment settings not configured"
-    
-    shop_id = settings.freekassa_shop_id
-    secret = decrypt_key(settings.freekassa_secret)
-    
-    if not shop_id or not secret:
-        return None, "FreeKassa credentials not configured"
-    
-    try:
-        # FreeKassa работает с RUB
-        fk_currency = 'RUB'
-        
-        # Формируем подпись
-        sign_string = f"{shop_id}:{amount:.2f}:{secret}:{fk_currency}:{order_id}"
+@register_provider
+class FreeKassaProvider(PaymentProvider):
+    """FreeKassa: ссылка на форму оплаты с подписью, без запроса к API"""
+
+    name = 'freekassa'
+    title = 'FreeKassa'
+    currencies = ('RUB', 'USD', 'EUR', 'UAH', 'KZT')
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
+        out_sum = f"{amount:.2f}"
+        sign_string = f"{creds.shop_id}:{out_sum}:{creds.secret}:{currency}:{order_id}"
         signature = hashlib.md5(sign_string.encode()).hexdigest()
-        
-        # Формируем URL
-        payment_url = (
-            f"https://pay.freekassa.ru/"
-            f"?m={shop_id}"
-            f"&oa={amount:.2f}"
-            f"&currency={fk_currency}"
-            f"&o={order_id}"
-            f"&s={signature}"
-        )
-        
-        return payment_url, order_id
-        
-    except Exception as e:
-        return None, f"FreeKassa error: {str(e)}"
+
+        query = urlencode({
+            "m": creds.shop_id,
+            "oa": out_sum,
+            "currency": currency,
+            "o": order_id,
+            "s": signature
+        })
+        return f"https://pay.freekassa.ru/?{query}", order_id
 
 
 def verify_freekassa_signature(data: dict) -> bool:
     """Проверить подпись webhook от FreeKassa"""
-    settings = get_payment_settings()
-    if not settings:
+    vault = get_payment_vault()
+    if not vault.settings:
         return False
+    creds = vault.credentials('freekassa')
     
-    secret2 = decrypt_key(settings.freekassa_secret2)
+    secret2 = creds.secret2
     if not secret2:
         return False
     
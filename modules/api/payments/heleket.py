@@ -2,76 +2,63 @@
 Heleket - платёжная система для криптовалют
 https://heleket.com/
 """
-import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+import base64
+import hashlib
+import hmac
+import json
+from modules.api.payments.adapter import PaymentError, PaymentProvider, register_provider
+from modules.api.payments.vault import get_payment_vault
 
 
-def create_heleket_payment(amount: float, currency: str, order_id: str, **kwargs):
-    """
-    Создать платёж через Heleket
-    
-    Args:
-        amount: Сумма платежа
-        currency: Валюта
-        order_id: ID заказа
-    
-    Returns:
-        tuple: (payment_url, payment_id) или (None, error_message)
-    """
-    settings = get_payment_settings()
-    if not settings:
-        return None, "Payment settings not configured"
-    
-    api_key = decrypt_key(settings.heleket_api_key)
-    if not api_key:
-        return None, "Heleket API key not configured"
-    
-    try:
-        # Конвертируем в USD для Heleket
-        heleket_currency = "USD"
-        to_currency = "USDT" if currency != 'USD' else None
-        
+@register_provider
+class HeleketProvider(PaymentProvider):
+    """Heleket: счет в USD, оплата в USDT"""
+
+    name = 'heleket'
+    title = 'Heleket'
+
+    def prepare(self, creds):
+        return {
+            "Authorization": f"Bearer {creds.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
         payload = {
             "amount": f"{amount:.2f}",
-            "currency": heleket_currency,
+            "currency": "USD",
             "order_id": order_id,
-            "url_return": get_return_url(kwargs.get('source', 'miniapp'), kwargs.get('miniapp_type', 'v2')),
-            "url_callback": get_callback_url('heleket')
-        }
-        
-        if to_currency:
-            payload["to_currency"] = to_currency
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
+            "url_return": self.return_url(kwargs),
+            "url_callback": self.callback_url()
         }
-        
-        response = requests.post(
-            "https://api.heleket.com/v1/payment",
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        
-        data = response.json()
-        
+        if currency != 'USD':
+            payload["to_currency"] = "USDT"
+
+        data = self.post("https://api.heleket.com/v1/payment", json=payload, headers=self.prepared(creds)).json()
+
         if data.get('state') != 0 or not data.get('result'):
-            return None, data.get('message', 'Heleket API Error')
-        
+            raise PaymentError(data.get('message', 'Heleket API Error'))
+
         result = data.get('result', {})
         return result.get('url'), result.get('uuid')
-        
-    except requests.RequestException as e:
-        return None, f"Heleket connection error: {str(e)}"
-    except Exception as e:
-        return None, f"Heleket error: {str(e)}"
 
 
 def verify_heleket_signature(data: dict, signature: str) -> bool:
-    """Проверить подпись webhook от Heleket"""
-    # Heleket использует другой метод верификации
-    # TODO: Реализовать проверку подписи
-    return True
+    """
+    Проверить подпись webhook от Heleket
+
+    sign = md5(base64(JSON тела без поля sign) + API ключ); JSON - как json_encode
+    в PHP с JSON_UNESCAPED_UNICODE: без пробелов, "/" экранируется.
+    """
+    if not signature or not isinstance(data, dict):
+        return False
+    api_key = get_payment_vault().credentials('heleket').api_key
+    if not api_key:
+        return False
+
+    payload = {key: value for key, value in data.items() if key != 'sign'}
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).replace('/', '\\/')
+    calculated_signature = hashlib.md5(base64.b64encode(body.encode('utf-8')) + api_key.encode('utf-8')).hexdigest()
+    return hmac.compare_digest(calculated_signature, str(signature))
 
 
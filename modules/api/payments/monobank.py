@@ -2,68 +2,73 @@
 Monobank - платёжная система (Украина)
 https://api.monobank.ua/
 """
-import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.adapter import (
+    PAYMENT_CANCELED, PAYMENT_PAID, PAYMENT_PENDING, PaymentError, PaymentProvider, register_provider
+)
 
+# ISO 4217
+MONOBANK_CCY = {'UAH': 980, 'RUB': 643, 'USD': 840}
 
-def create_monobank_payment(amount: float, currency: str, order_id: str, **kwargs):
-    """
-    Создать платёж через Monobank Acquiring
-    
-    Args:
-        amount: Сумма платежа
-        currency: Валюта (UAH)
-        order_id: ID заказа
-    
-    Returns:
-        tuple: (payment_url, invoice_id) или (None, error_message)
-    """
-    settings = get_payment_settings()
-    if not settings:
-        return None, "Payment settings not configured"
-    
-    token = decrypt_key(settings.monobank_token)
-    if not token:
-        return None, "Monobank token not configured"
-    
-    try:
-        # Monobank работает с UAH, сумма в копейках
-        amount_kopecks = int(amount * 100)
-        
-        payload = {
-            "amount": amount_kopecks,
-            "ccy": 980,  # UAH ISO код
-            "merchantPaymInfo": {
-                "reference": order_id,
-                "destination": f"Подписка StealthNET #{order_id}"
-            },
-            "redirectUrl": get_return_url(kwargs.get('source', 'miniapp'), kwargs.get('miniapp_type', 'v2')),
-            "webHookUrl": get_callback_url('monobank'),
-            "validity": 3600  # 1 час
-        }
-        
-        headers = {
-            "X-Token": token,
+MONOBANK_STATUSES = {
+    'success': PAYMENT_PAID,
+    'failure': PAYMENT_CANCELED,
+    'expired': PAYMENT_CANCELED,
+    'reversed': PAYMENT_CANCELED,
+}
+
+
+@register_provider
+class MonobankProvider(PaymentProvider):
+    """Monobank Acquiring, сумма в копейках"""
+
+    name = 'monobank'
+    title = 'Monobank'
+    currencies = tuple(MONOBANK_CCY)
+    supports_status_check = True
+
+    def prepare(self, creds):
+        return {
+            "X-Token": creds.token,
             "Content-Type": "application/json"
         }
-        
-        response = requests.post(
-            "https://api.monobank.ua/api/merchant/invoice/create",
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
+        merchant_info = {
+            "reference": order_id,
+            "destination": self.description(order_id, kwargs)
+        }
+        if kwargs.get('title'):
+            merchant_info["comment"] = kwargs['title']
+
+        payload = {
+            "amount": int(round(amount * 100)),
+            "ccy": MONOBANK_CCY[currency],
+            "merchantPaymInfo": merchant_info,
+            "redirectUrl": self.return_url(kwargs),
+            "webHookUrl": self.callback_url(),
+            "validity": 3600,  # 1 час
+            "paymentType": "debit"
+        }
+
+        response = self.post("https://api.monobank.ua/api/merchant/invoice/create", json=payload, headers=self.prepared(creds))
         data = response.json()
-        
+
         if response.status_code != 200:
-            return None, data.get('errText', 'Monobank API Error')
-        
-        return data.get('pageUrl'), data.get('invoiceId')
-        
-    except requests.RequestException as e:
-        return None, f"Monobank connection error: {str(e)}"
-    except Exception as e:
-        return None, f"Monobank error: {str(e)}"
+            raise PaymentError(data.get('errText', 'Monobank API Error'))
 
+        return data.get('pageUrl'), data.get('invoiceId')
 
+    def statuses(self, creds, payment_system_ids):
+        result = {}
+        for invoice_id in payment_system_ids:
+            response = self.get(
+                "https://api.monobank.ua/api/merchant/invoice/status",
+                params={"invoiceId": invoice_id},
+                headers=self.prepared(creds),
+                timeout=10
+            )
+            if response.status_code != 200:
+                print(f"[MONOBANK] Статус {invoice_id}: HTTP {response.status_code} - {response.text[:200]}")
+                continue
+            result[invoice_id] = MONOBANK_STATUSES.get(response.json().get('status'), PAYMENT_PENDING)
+        return result
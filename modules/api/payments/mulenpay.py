@@ -0,0 +1,51 @@
+"""
+MulenPay - платёжная система
+https://mulenpay.ru/
+
+UrlPay (urlpay.py) работает на том же API v2.
+"""
+import base64
+from modules.api.payments.adapter import PaymentError, PaymentProvider, register_provider
+
+
+@register_provider
+class MulenPayProvider(PaymentProvider):
+    """MulenPay, API v2 (Basic auth: api_key:secret_key)"""
+
+    name = 'mulenpay'
+    title = 'MulenPay'
+    api_url = "https://api.mulenpay.ru/v2/payments"
+
+    def prepare(self, creds):
+        auth = base64.b64encode(f"{creds.api_key}:{creds.secret_key}".encode('ascii')).decode('ascii')
+        try:
+            shop_id = int(creds.shop_id)
+        except (ValueError, TypeError):
+            shop_id = creds.shop_id
+        return shop_id, {
+            "Authorization": f"Basic {auth}",
+            "Content-Type": "application/json"
+        }
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
+        shop_id, headers = self.prepared(creds)
+
+        payload = {
+            "currency": currency.lower(),
+            "amount": f"{amount:.2f}",
+            "uuid": order_id,
+            "shopId": shop_id,
+            "description": self.description(order_id, kwargs),
+            "subscribe": None,
+            "holdTime": None
+        }
+
+        response = self.post(self.api_url, json=payload, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+
+        payment_url = data.get('url') or data.get('payment_url') or data.get('redirect')
+        if not payment_url:
+            raise PaymentError(data.get('message') or data.get('error') or f"Failed to get payment URL from {self.title}")
+
+        return payment_url, data.get('id') or data.get('payment_id') or order_id
@@ -3,66 +3,43 @@ Robokassa - платёжная система
 https://robokassa.com/
 """
 import hashlib
-from modules.api.payments.base import get_payment_settings, decrypt_key
+from urllib.parse import urlencode
+from modules.api.payments.adapter import PaymentProvider, register_provider
+from modules.api.payments.vault import get_payment_vault
 
 
-def create_robokassa_payment(amount: float, currency: str, order_id: str, **kwargs):
-    """
-    Создать платёж через Robokassa
-    
-    Args:
-        amount: Сумма платежа
-        currency: Валюта
-        order_id: ID заказа
-        description: Описание платежа
-    
-    Returns:
-        tuple: (payment_url, order_id) или (None, error_message)
-    """
-    settings = get_payment_settings()
-    if not settings:
-        return None, "Payment settings not configured"
-    
-    merchant_login = settings.robokassa_merchant_login
-    password1 = decrypt_key(settings.robokassa_password1)
-    
-    if not merchant_login or not password1:
-        return None, "Robokassa credentials not configured"
-    
-    try:
-        description = kwargs.get('description', f'Подписка StealthNET #{order_id}')
-        
-        # Robokassa работает с RUB
+@register_provider
+class RobokassaProvider(PaymentProvider):
+    """Robokassa: ссылка на форму оплаты с подписью, без запроса к API"""
+
+    name = 'robokassa'
+    title = 'Robokassa'
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
         out_sum = f"{amount:.2f}"
-        
-        # Формируем подпись
-        sign_string = f"{merchant_login}:{out_sum}:{order_id}:{password1}"
+        sign_string = f"{creds.merchant_login}:{out_sum}:{order_id}:{creds.password1}"
         signature = hashlib.md5(sign_string.encode()).hexdigest()
-        
-        # Формируем URL
-        payment_url = (
-            f"https://auth.robokassa.ru/Merchant/Index.aspx"
-            f"?MerchantLogin={merchant_login}"
-            f"&OutSum={out_sum}"
-            f"&InvId={order_id}"
-            f"&Description={description}"
-            f"&SignatureValue={signature}"
-            f"&IsTest=0"
-        )
-        
-        return payment_url, order_id
-        
-    except Exception as e:
-        return None, f"Robokassa error: {str(e)}"
+
+        query = urlencode({
+            "MerchantLogin": creds.merchant_login,
+            "OutSum": out_sum,
+            "InvId": order_id,
+            "Description": self.description(order_id, kwargs),
+            "SignatureValue": signature,
+            "Culture": "ru",
+            "IsTest": 0
+        })
+        return f"https://auth.robokassa.ru/Merchant/Index.aspx?{query}", order_id
 
 
 def verify_robokassa_signature(data: dict) -> bool:
     """Проверить подпись webhook от Robokassa"""
-    settings = get_payment_settings()
-    if not settings:
+    vault = get_payment_vault()
+    if not vault.settings:
         return False
+    creds = vault.credentials('robokassa')
     
-    password2 = decrypt_key(settings.robokassa_password2)
+    password2 = creds.password2
     if not password2:
         return False
     
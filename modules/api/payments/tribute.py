@@ -0,0 +1,44 @@
+"""
+Tribute - оплата через Telegram
+https://tribute.tg/
+"""
+from modules.api.payments.adapter import PaymentError, PaymentProvider, register_provider
+
+# Tribute принимает rub и eur
+TRIBUTE_CURRENCY = {'RUB': 'rub', 'UAH': 'rub', 'USD': 'eur'}
+
+
+@register_provider
+class TributeProvider(PaymentProvider):
+    """Tribute: заказ магазина, сумма в копейках/центах"""
+
+    name = 'tribute'
+    title = 'Tribute'
+
+    def prepare(self, creds):
+        return {
+            "Content-Type": "application/json",
+            "Api-Key": creds.api_key
+        }
+
+    def create(self, creds, amount, currency, order_id, **kwargs):
+        return_url = self.return_url(kwargs)
+        payload = {
+            "amount": int(round(amount * 100)),
+            "currency": TRIBUTE_CURRENCY.get(currency, 'rub'),
+            "title": (kwargs.get('title') or "Подписка StealthNET")[:100],
+            "description": self.description(order_id, kwargs)[:300],
+            "successUrl": return_url,
+            "failUrl": return_url
+        }
+        if kwargs.get('user_email'):
+            payload["email"] = kwargs['user_email']
+
+        response = self.post("https://tribute.tg/api/v1/shop/orders", json=payload, headers=self.prepared(creds))
+        response.raise_for_status()
+        data = response.json()
+
+        if not data.get('paymentUrl'):
+            raise PaymentError("Tribute did not return payment URL")
+
+        return data.get('paymentUrl'), data.get('uuid')
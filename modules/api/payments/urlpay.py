@@ -0,0 +1,15 @@
+"""
+UrlPay - платёжная система
+https://urlpay.io/
+"""
+from modules.api.payments.adapter import register_provider
+from modules.api.payments.mulenpay import MulenPayProvider
+
+
+@register_provider
+class UrlPayProvider(MulenPayProvider):
+    """UrlPay: тот же API v2, что у MulenPay"""
+
+    name = 'urlpay'
+    title = 'UrlPay'
+    api_url = "https://api.urlpay.io/v2/payments"
@@ -0,0 +1,185 @@
+"""
+Расшифрованные ключи платёжных систем
+
+Ключи в PaymentSetting хранятся зашифрованными (Fernet). Раньше каждый запрос
+(список методов оплаты, создание платежа, проверка подписи webhook) расшифровывал
+их заново. Хранилище расшифровывает все ключи один раз на версию настроек
+(снимок из modules.settings_registry) и держит в памяти воркера:
+
+  - credentials(provider) - ключи провайдера (namedtuple, поле configured);
+  - available_methods - провайдеры, у которых заданы все обязательные ключи;
+  - get(column) - расшифрованное значение по имени колонки PaymentSetting.
+
+Сохранение /api/admin/payment-settings сбрасывает снимок настроек, и при
+следующем обращении хранилище собирается заново.
+"""
+import threading
+from collections import namedtuple
+
+from modules.api.payments.base import decrypt_key
+from modules.settings_registry import get_settings
+
+# provider -> [(поле, колонка PaymentSetting, обязательное)]
+# Порядок провайдеров - порядок в списке доступных методов
+PROVIDER_CREDENTIALS = {
+    'crystalpay': [
+        ('api_key', 'crystalpay_api_key', True),
+        ('api_secret', 'crystalpay_api_secret', True),
+    ],
+    'heleket': [
+        ('api_key', 'heleket_api_key', True),
+    ],
+    'yookassa': [
+        ('shop_id', 'yookassa_shop_id', True),
+        ('secret_key', 'yookassa_secret_key', True),
+        ('api_key', 'yookassa_api_key', False),
+        ('receipt_required', 'yookassa_receipt_required', False),
+    ],
+    'platega': [
+        ('api_key', 'platega_api_key', True),
+        ('merchant_id', 'platega_merchant_id', True),
+    ],
+    'mulenpay': [
+        ('api_key', 'mulenpay_api_key', True),
+        ('secret_key', 'mulenpay_secret_key', True),
+        ('shop_id', 'mulenpay_shop_id', True),
+    ],
+    'urlpay': [
+        ('api_key', 'urlpay_api_key', True),
+        ('secret_key', 'urlpay_secret_key', True),
+        ('shop_id', 'urlpay_shop_id', True),
+    ],
+    'telegram_stars': [
+        ('bot_token', 'telegram_bot_token', True),
+    ],
+    'monobank': [
+        ('token', 'monobank_token', True),
+    ],
+    'btcpayserver': [
+        ('url', 'btcpayserver_url', True),
+        ('api_key', 'btcpayserver_api_key', True),
+        ('store_id', 'btcpayserver_store_id', True),
+    ],
+    'tribute': [
+        ('api_key', 'tribute_api_key', True),
+    ],
+    'robokassa': [
+        ('merchant_login', 'robokassa_merchant_login', True),
+        ('password1', 'robokassa_password1', True),
+        ('password2', 'robokassa_password2', False),
+    ],
+    'freekassa': [
+        ('shop_id', 'freekassa_shop_id', True),
+        ('secret', 'freekassa_secret', True),
+        ('secret2', 'freekassa_secret2', False),
+    ],
+    'cryptobot': [
+        ('api_key', 'cryptobot_api_key', True),
+    ],
+}
+
+# Колонки, которые хранятся открыто
+PLAIN_COLUMNS = {'yookassa_receipt_required'}
+
+CREDENTIAL_TYPES = {
+    provider: namedtuple(
+        ''.join(part.capitalize() for part in provider.split('_')) + 'Credentials',
+        [field for field, _, _ in fields] + ['configured']
+    )
+    for provider, fields in PROVIDER_CREDENTIALS.items()
+}
+
+_lock = threading.Lock()
+_vault = None
+
+
+class PaymentVault:
+    """Расшифрованные ключи для одного снимка PaymentSetting"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._values = settings.to_dict() if settings else {}
+        self._secrets = {}
+        self.providers = {}
+
+        for provider, fields in PROVIDER_CREDENTIALS.items():
+            values = []
+            configured = settings is not None
+            for field, column, required in fields:
+                value = self._values.get(column)
+                if column not in PLAIN_COLUMNS:
+                    value = self._decrypt(value)
+                    self._secrets[column] = value
+                values.append(value)
+                if required and not value:
+                    configured = False
+            self.providers[provider] = CREDENTIAL_TYPES[provider](*values, configured=configured)
+
+        self.available_methods = tuple(p for p, creds in self.providers.items() if creds.configured)
+
+    @staticmethod
+    def _decrypt(value):
+        if not value:
+            return ""
+        value = decrypt_key(value)
+        # Старый формат ошибки расшифровки
+        if value == "DECRYPTION_ERROR":
+            return ""
+        return value
+
+    def matches(self, settings):
+        """Собрано ли хранилище из тех же значений настроек"""
+        if settings is self.settings:
+            return True
+        if (settings.to_dict() if settings else {}) != self._values:
+            return False
+        # Снимок перечитан без изменений - запоминаем его, чтобы дальше сравнивать по ссылке
+        self.settings = settings
+        return True
+
+    def credentials(self, provider):
+        """Ключи провайдера; неизвестный провайдер - None"""
+        return self.providers.get(provider)
+
+    def is_available(self, provider):
+        creds = self.providers.get(provider)
+        return bool(creds and creds.configured)
+
+    def get(self, column):
+        """Расшифрованное значение колонки PaymentSetting ('' если не задано)"""
+        if column in self._secrets:
+            return self._secrets[column]
+        value = self._values.get(column)
+        return value if column in PLAIN_COLUMNS else self._decrypt(value)
+
+
+def get_payment_vault():
+    """Хранилище ключей для текущей версии настроек платежей"""
+    global _vault
+    settings = get_settings('payment')
+    vault = _vault
+    if vault is not None and vault.matches(settings):
+        return vault
+    with _lock:
+        if _vault is None or not _vault.matches(settings):
+            _vault = PaymentVault(settings)
+        return _vault
+
+
+def get_payment_credentials(provider):
+    """Ключи провайдера (namedtuple с полем configured) или None"""
+    return get_payment_vault().credentials(provider)
+
+
+def get_available_methods():
+    """Провайдеры, у которых заданы все обязательные ключи"""
+    return list(get_payment_vault().available_methods)
+
+
+__all__ = [
+    'PROVIDER_CREDENTIALS',
+    'PaymentVault',
+    'get_payment_vault',
+    'get_payment_credentials',
+    'get_available_methods'
+]
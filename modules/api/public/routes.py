@@ -22,10 +22,7 @@ import os
 from modules.core import get_app, get_db, get_cache
 from modules.models.tariff import Tariff
 from modules.models.tariff_feature import TariffFeatureSetting
-from modules.models.system import SystemSetting
-from modules.models.branding import BrandingSetting
-from modules.models.bot_config import BotConfig
-from modules.models.currency import CurrencyRate
+from modules.settings_registry import get_settings
 
 app = get_app()
 db = get_db()
@@ -101,7 +98,7 @@ def public_system_settings():
     """Публичные системные настройки"""
     try:
         import json
-        settings = SystemSetting.query.first()
+        settings = get_settings('system')
         if not settings:
             return jsonify({
                 "default_language": "ru",
@@ -146,7 +143,7 @@ def public_branding():
     """Публичный брендинг"""
     try:
         import json
-        branding = BrandingSetting.query.first()
+        branding = get_settings('branding')
         if not branding:
             return jsonify({
                 "site_name": "",
@@ -275,13 +272,8 @@ def public_currency_rates():
 def get_public_nodes():
     """Публичные ноды для лендинга"""
     try:
-        import requests
-        headers, cookies = {}, {}
-        ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
-        if ADMIN_TOKEN:
-            headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
-        
-        resp = requests.get(f"{os.getenv('API_URL')}/api/nodes/public", headers=headers, timeout=10)
+        from modules.remnawave import get_remnawave_client
+        resp = get_remnawave_client().get("/api/nodes/public")
         resp.raise_for_status()
         return jsonify(resp.json()), 200
     except Exception as e:
@@ -292,9 +284,9 @@ def get_public_nodes():
 def get_system_info():
     """Публичная информация о системе"""
     try:
-        system_settings = SystemSetting.query.first()
-        branding = BrandingSetting.query.first()
-        bot_config = BotConfig.query.first()
+        system_settings = get_settings('system')
+        branding = get_settings('branding')
+        bot_config = get_settings('bot_config')
 
         return jsonify({
             "system": {
@@ -338,7 +330,7 @@ def telegram_auth_enabled():
             }), 200
         
         # Fallback: проверяем BotConfig из БД
-        bot_config = BotConfig.query.first()
+        bot_config = get_settings('bot_config')
         if bot_config and bot_config.bot_username:
             return jsonify({
                 "enabled": True,
@@ -373,12 +365,10 @@ def server_domain():
 @app.route('/api/public/bot-config', methods=['GET'])
 def public_bot_config():
     """Публичный эндпоинт для получения конфигурации бота"""
-    from modules.models.bot_config import BotConfig
-    
     import json
     import os
     
-    config = BotConfig.query.first()
+    config = get_settings('bot_config')
     
     # Получаем bot_username: сначала из BotConfig, потом из .env
     bot_username = ""
@@ -7,6 +7,9 @@ API вебхуков платежных систем
 - POST /api/webhook/telegram-stars - Telegram Stars webhook (alt)
 - POST /api/webhook/freekassa - FreeKassa webhook
 - POST /api/webhook/robokassa - Robokassa webhook
+
+Вебхуки только проверяют уведомление и записывают задачу выдачи заказа
+(modules/payment_fulfilment.py) - тариф и баланс выдает пул воркеров.
 """
 
 from flask import request, jsonify
@@ -17,12 +20,21 @@ import os
 import threading
 
 from modules.core import get_app, get_db, get_cache, get_fernet
-from modules.models.payment import Payment, PaymentSetting
+from modules.models.payment import Payment
 from modules.models.user import User
 from modules.models.tariff import Tariff
 from modules.models.promo import PromoCode
-from modules.models.referral import ReferralSetting
 from modules.currency import convert_to_usd
+from modules.remnawave import get_remnawave_client
+from modules.remnawave_mirror import store_patch_result
+from modules.api.payments.vault import get_payment_credentials
+from modules.api.payments import get_payment_provider
+from modules.api.payments.adapter import PAYMENT_PAID
+from modules.api.payments.heleket import verify_heleket_signature
+from modules.api.payments.freekassa import verify_freekassa_signature
+from modules.api.payments.robokassa import verify_robokassa_signature
+from modules.payment_fulfilment import enqueue_fulfilment, run_fulfilment_job, pin_target_expire
+from modules.referral_ledger import add_referral_commission
 
 app = get_app()
 db = get_db()
@@ -32,69 +44,6 @@ BOT_API_URL = os.getenv("BOT_API_URL", "")
 BOT_API_TOKEN = os.getenv("BOT_API_TOKEN", "")
 
 
-def add_referral_commission(user, amount_usd, is_tariff_purchase=True):
-    """
-    Начисляет реферальную комиссию рефереру пользователя
-    
-    Args:
-        user: Пользователь, который совершил покупку/пополнение
-        amount_usd: Сумма в USD
-        is_tariff_purchase: True если покупка тарифа, False если пополнение баланса
-    """
-    try:
-        # Проверяем тип реферальной системы
-        referral_settings = ReferralSetting.query.first()
-        if not referral_settings:
-            return
-        
-        # Если система на днях, не начисляем проценты
-        if referral_settings.referral_type != 'PERCENT':
-            return
-        
-        # Проверяем наличие реферера
-        if not user.referrer_id:
-            return
-        
-        referrer = db.session.get(User, user.referrer_id)
-        if not referrer:
-            return
-        
-        # Получаем процент реферала (индивидуальный или дефолтный)
-        # Если у реферера установлен индивидуальный процент - используем его, иначе глобальный
-        referral_percent = referrer.referral_percent if referrer.referral_percent is not None else referral_settings.default_referral_percent
-        
-        # Вычисляем комиссию
-        commission_usd = (amount_usd * referral_percent) / 100.0
-        
-        # Начисляем на баланс реферера
-        current_balance = float(referrer.balance) if referrer.balance else 0.0
-        referrer.balance = current_balance + commission_usd
-        
-        print(f"[REFERRAL] Начислено {commission_usd:.2f} USD ({referral_percent}%) рефереру {referrer.id} за покупку пользователя {user.id}")
-        
-    except Exception as e:
-        print(f"[REFERRAL] Ошибка начисления комиссии: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-def get_remnawave_headers(additional_headers=None):
-    headers = {}
-    cookies = {}
-    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
-    if ADMIN_TOKEN:
-        headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
-    REMNAWAVE_COOKIES_STR = os.getenv("REMNAWAVE_COOKIES", "")
-    if REMNAWAVE_COOKIES_STR:
-        try:
-            cookies = json.loads(REMNAWAVE_COOKIES_STR)
-        except:
-            pass
-    if additional_headers:
-        headers.update(additional_headers)
-    return headers, cookies
-
-
 def decrypt_key(key):
     fernet = get_fernet()
     if not key or not fernet:
@@ -122,34 +71,44 @@ def sync_subscription_to_bot(app_context, remnawave_uuid):
             print(f"Background sync error: {e}")
 
 
-def process_successful_payment(payment, user, tariff):
-    """Обработка успешного платежа"""
-    API_URL = os.getenv("API_URL")
-    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+def process_successful_payment(payment, user, tariff, job=None):
+    """
+    Обработка успешного платежа
+
+    job - задача выдачи (PaymentFulfilmentJob): новый срок подписки записывается в нее
+    до PATCH, и повтор задачи отправляет в RemnaWave тот же срок, а не продлевает еще раз.
+    """
     DEFAULT_SQUAD_ID = os.getenv("DEFAULT_SQUAD_ID")
-    
-    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    rw = get_remnawave_client()
     
     try:
-        resp = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=headers)
-        if resp.status_code != 200:
-            print(f"Failed to get user data: {resp.status_code}")
-            return False
-            
-        user_data = resp.json().get('response', {})
-        current_expire = user_data.get('expireAt')
-        current_squads = user_data.get('activeInternalSquads', [])
-        
-        if current_expire:
-            # Обработка формата с 'Z'
-            if isinstance(current_expire, str) and current_expire.endswith('Z'):
-                current_expire = current_expire[:-1] + '+00:00'
-            current_expire_dt = datetime.fromisoformat(current_expire)
-            if current_expire_dt.tzinfo is None:
-                current_expire_dt = current_expire_dt.replace(tzinfo=timezone.utc)
-            new_expire_dt = max(datetime.now(timezone.utc), current_expire_dt) + timedelta(days=tariff.duration_days)
+        new_expire_dt = job.target_expire_at if job is not None else None
+        if new_expire_dt is not None:
+            # Повтор задачи: срок уже посчитан предыдущей попыткой
+            if new_expire_dt.tzinfo is None:
+                new_expire_dt = new_expire_dt.replace(tzinfo=timezone.utc)
         else:
-            new_expire_dt = datetime.now(timezone.utc) + timedelta(days=tariff.duration_days)
+            resp = rw.get(f"/api/users/{user.remnawave_uuid}")
+            if resp.status_code != 200:
+                print(f"Failed to get user data: {resp.status_code}")
+                return False
+                
+            user_data = resp.json().get('response', {})
+            current_expire = user_data.get('expireAt')
+            
+            if current_expire:
+                # Обработка формата с 'Z'
+                if isinstance(current_expire, str) and current_expire.endswith('Z'):
+                    current_expire = current_expire[:-1] + '+00:00'
+                current_expire_dt = datetime.fromisoformat(current_expire)
+                if current_expire_dt.tzinfo is None:
+                    current_expire_dt = current_expire_dt.replace(tzinfo=timezone.utc)
+                new_expire_dt = max(datetime.now(timezone.utc), current_expire_dt) + timedelta(days=tariff.duration_days)
+            else:
+                new_expire_dt = datetime.now(timezone.utc) + timedelta(days=tariff.duration_days)
+            
+            if job is not None:
+                new_expire_dt = pin_target_expire(job, new_expire_dt)
         
         # Получаем список сквадов из тарифа
         squad_ids = []
@@ -183,8 +142,7 @@ def process_successful_payment(payment, user, tariff):
         if hasattr(tariff, 'hwid_device_limit') and tariff.hwid_device_limit is not None and tariff.hwid_device_limit > 0:
             patch_payload["hwidDeviceLimit"] = tariff.hwid_device_limit
         
-        h, c = get_remnawave_headers({"Content-Type": "application/json"})
-        patch_resp = requests.patch(f"{API_URL}/api/users", headers=h, cookies=c, json=patch_payload)
+        patch_resp = rw.patch("/api/users", json=patch_payload)
         
         if not patch_resp.ok:
             print(f"Failed to update user: {patch_resp.status_code}")
@@ -197,14 +155,13 @@ def process_successful_payment(payment, user, tariff):
                 promo.uses_left -= 1
         
         payment.status = 'PAID'
-        db.session.commit()
         
-        # Начисляем реферальную комиссию
+        # Начисляем реферальную комиссию (в той же транзакции, что и оплата)
         amount_usd = convert_to_usd(payment.amount, payment.currency)
-        add_referral_commission(user, amount_usd, is_tariff_purchase=True)
+        add_referral_commission(user, amount_usd, is_tariff_purchase=True, payment=payment)
         db.session.commit()
         
-        cache.delete(f'live_data_{user.remnawave_uuid}')
+        store_patch_result(patch_resp, user.remnawave_uuid, patch_payload)
         cache.delete(f'nodes_{user.remnawave_uuid}')
         cache.delete('all_live_users_map')
         
@@ -237,6 +194,37 @@ def process_successful_payment(payment, user, tariff):
         return False
 
 
+def process_balance_topup(payment, user, notify_user=True):
+    """Пополнение баланса оплаченным платежом (баланс хранится в USD)"""
+    current_balance_usd = float(user.balance) if user.balance else 0.0
+    amount_usd = convert_to_usd(payment.amount, payment.currency)
+    user.balance = current_balance_usd + amount_usd
+    payment.status = 'PAID'
+    
+    # Начисляем реферальную комиссию (в той же транзакции, что и пополнение)
+    add_referral_commission(user, amount_usd, is_tariff_purchase=False, payment=payment)
+    db.session.commit()
+    
+    cache.delete('all_live_users_map')
+    
+    # Отправляем уведомление админам
+    try:
+        from modules.notifications import notify_payment
+        notify_payment(payment, user, is_balance_topup=True)
+    except Exception as e:
+        print(f"Error sending payment notification: {e}")
+    
+    # Отправляем уведомление пользователю в бот
+    if notify_user:
+        try:
+            from modules.notifications import send_user_payment_notification_async
+            send_user_payment_notification_async(user, is_successful=True, is_balance_topup=True, payment=payment)
+        except Exception as e:
+            print(f"Error sending user payment notification: {e}")
+    
+    print(f"[PAYMENT] ✅ Balance top-up: user_id={user.id}, amount={amount_usd} USD, new_balance={user.balance} USD")
+
+
 # ============================================================================
 # WEBHOOKS
 # ============================================================================
@@ -245,9 +233,13 @@ def process_successful_payment(payment, user, tariff):
 def heleket_webhook():
     """Heleket webhook"""
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         print(f"[HELEKET] Received: {json.dumps(data, indent=2)}")
         
+        if not verify_heleket_signature(data, data.get('sign')):
+            print("[HELEKET] ❌ Invalid signature")
+            return jsonify({"status": "error", "message": "Invalid signature"}), 400
+        
         order_id = data.get('order_id')
         status = data.get('status')
         
@@ -258,16 +250,14 @@ def heleket_webhook():
         if not payment:
             return jsonify({"status": "error", "message": "Payment not found"}), 404
         
-        payment.status = status.upper()
         payment.payment_system_id = data.get('payment_id')
-        db.session.commit()
-        
         if status.upper() == 'PAID':
-            user = User.query.get(payment.user_id)
-            tariff = Tariff.query.get(payment.tariff_id)
-            
-            if user and tariff:
-                process_successful_payment(payment, user, tariff)
+            # Статус PAID запишет выдача заказа
+            if payment.status != 'PAID':
+                enqueue_fulfilment(payment, 'heleket')
+        else:
+            payment.status = status.upper()
+        db.session.commit()
         
         return jsonify({"status": "success"}), 200
         
@@ -335,7 +325,6 @@ def yookassa_webhook():
                 payment.status = 'REFUNDED'
                 db.session.commit()
                 
-                cache.delete(f'live_data_{user.remnawave_uuid}')
                 cache.delete('all_live_users_map')
                 
                 print(f"[YOOKASSA] ✅ Balance refund processed: user_id={user.id}, refund={refund_amount_usd} USD, new_balance={new_balance} USD")
@@ -407,56 +396,8 @@ def yookassa_webhook():
         # YooKassa отправляет статус 'succeeded' для успешных платежей
         # Также обрабатываем статус 'succeeded' из события 'payment.succeeded'
         if status == 'succeeded':
-            user = User.query.get(payment.user_id)
-            if not user:
-                print(f"[YOOKASSA] User not found for payment {order_id}")
-                return jsonify({"status": "error", "message": "User not found"}), 404
-            
-            print(f"[YOOKASSA] Processing payment: order_id={order_id}, user_id={user.id}, tariff_id={payment.tariff_id}, amount={payment.amount} {payment.currency}")
-            
-            # Если это пополнение баланса (tariff_id == None)
-            if payment.tariff_id is None:
-                current_balance_usd = float(user.balance) if user.balance else 0.0
-                amount_usd = convert_to_usd(payment.amount, payment.currency)
-                new_balance = current_balance_usd + amount_usd
-                user.balance = new_balance
-                payment.status = 'PAID'
-                db.session.commit()
-                
-                # Начисляем реферальную комиссию
-                add_referral_commission(user, amount_usd, is_tariff_purchase=False)
-                db.session.commit()
-                
-                cache.delete(f'live_data_{user.remnawave_uuid}')
-                cache.delete('all_live_users_map')
-                
-                # Отправляем уведомление админам
-                try:
-                    from modules.notifications import notify_payment
-                    notify_payment(payment, user, is_balance_topup=True)
-                except Exception as e:
-                    print(f"Error sending payment notification: {e}")
-                
-                # Отправляем уведомление пользователю в бот
-                try:
-                    from modules.notifications import send_user_payment_notification_async
-                    send_user_payment_notification_async(user, is_successful=True, is_balance_topup=True, payment=payment)
-                except Exception as e:
-                    print(f"Error sending user payment notification: {e}")
-                
-                print(f"[YOOKASSA] ✅ Balance top-up successful: user_id={user.id}, amount={amount_usd} USD, new_balance={new_balance} USD")
-            else:
-                # Покупка тарифа
-                tariff = Tariff.query.get(payment.tariff_id)
-                if tariff:
-                    # process_successful_payment уже отправляет уведомления админам и пользователю
-                    success = process_successful_payment(payment, user, tariff)
-                    if success:
-                        print(f"[YOOKASSA] ✅ Tariff purchase successful: user_id={user.id}, tariff_id={tariff.id}, tariff_name={tariff.name}")
-                    else:
-                        print(f"[YOOKASSA] ❌ Failed to process tariff purchase: user_id={user.id}, tariff_id={tariff.id}")
-                else:
-                    print(f"[YOOKASSA] ❌ Warning: Tariff not found for payment {payment.order_id}, tariff_id={payment.tariff_id}")
+            job, created = enqueue_fulfilment(payment, 'yookassa')
+            print(f"[YOOKASSA] ✅ Fulfilment job #{job.id} for order_id={payment.order_id} ({'created' if created else 'already queued'})")
         else:
             # Логируем другие статусы для отладки
             print(f"[YOOKASSA] Payment status: {status} (not processing, waiting for 'succeeded')")
@@ -483,8 +424,7 @@ def telegram_webhook():
             order_id = pre_checkout.get('invoice_payload')
             query_id = pre_checkout.get('id')
             
-            s = PaymentSetting.query.first()
-            bot_token = decrypt_key(s.telegram_bot_token) if s else None
+            bot_token = get_payment_credentials('telegram_stars').bot_token
             
             if not bot_token:
                 return jsonify({"ok": True}), 200
@@ -514,49 +454,8 @@ def telegram_webhook():
             if not p:
                 p = Payment.query.filter_by(payment_system_id=order_id).first()
             
-            if not p or p.status == 'PAID':
-                return jsonify({"ok": True}), 200
-            
-            u = db.session.get(User, p.user_id)
-            if not u:
-                return jsonify({"ok": True}), 200
-            
-        # Пополнение баланса
-        if p.tariff_id is None:
-            current_balance = float(u.balance) if u.balance else 0.0
-            amount_usd = convert_to_usd(p.amount, p.currency)
-            u.balance = current_balance + amount_usd
-            p.status = 'PAID'
-            db.session.commit()
-            
-            # Начисляем реферальную комиссию
-            add_referral_commission(u, amount_usd, is_tariff_purchase=False)
-            db.session.commit()
-            
-            # Отправляем уведомление админам
-            try:
-                from modules.notifications import notify_payment
-                notify_payment(p, u, is_balance_topup=True)
-            except Exception as e:
-                print(f"Error sending payment notification: {e}")
-            
-            # Отправляем уведомление пользователю в бот
-            try:
-                from modules.notifications import send_user_payment_notification_async
-                send_user_payment_notification_async(u, is_successful=True, is_balance_topup=True, payment=p)
-            except Exception as e:
-                print(f"Error sending user payment notification: {e}")
-            
-            cache.delete(f'live_data_{u.remnawave_uuid}')
-            return jsonify({"ok": True}), 200
-        
-        # Покупка тарифа
-        t = db.session.get(Tariff, p.tariff_id)
-        if not t:
-            return jsonify({"ok": True}), 200
-        
-        # process_successful_payment уже отправляет уведомление пользователю
-        process_successful_payment(p, u, t)
+            if p and p.status != 'PAID':
+                enqueue_fulfilment(p, 'telegram_stars')
         
         return jsonify({"ok": True}), 200
         
@@ -599,51 +498,36 @@ def process_telegram_payment_internal():
         if not u:
             return jsonify({"success": False, "message": "User not found"}), 404
         
-        # Пополнение баланса
-        if p.tariff_id is None:
-            current_balance = float(u.balance) if u.balance else 0.0
-            amount_usd = convert_to_usd(p.amount, p.currency)
-            u.balance = current_balance + amount_usd
-            p.status = 'PAID'
-            db.session.commit()
-            
-            # Начисляем реферальную комиссию
-            try:
-                add_referral_commission(u, amount_usd, is_tariff_purchase=False)
-                db.session.commit()
-            except Exception as e:
-                print(f"[TELEGRAM-INTERNAL] Referral commission error: {e}")
-            
-            # Отправляем уведомление админам
-            try:
-                from modules.notifications import notify_payment
-                notify_payment(p, u, is_balance_topup=True)
-            except Exception as e:
-                print(f"[TELEGRAM-INTERNAL] Notification error: {e}")
-            
-            cache.delete(f'live_data_{u.remnawave_uuid}')
-            print(f"[TELEGRAM-INTERNAL] Balance topped up: user={u.id}, amount={amount_usd} USD")
-            return jsonify({
-                "success": True, 
-                "message": f"Баланс пополнен на {p.amount} {p.currency}"
-            }), 200
-        
-        # Покупка тарифа
-        t = db.session.get(Tariff, p.tariff_id)
-        if not t:
+        t = db.session.get(Tariff, p.tariff_id) if p.tariff_id else None
+        if p.tariff_id and not t:
             return jsonify({"success": False, "message": "Tariff not found"}), 404
         
-        # process_successful_payment обработает платеж
-        try:
-            process_successful_payment(p, u, t)
-            print(f"[TELEGRAM-INTERNAL] Tariff activated: user={u.id}, tariff={t.name}")
+        # Бот ждет результат - выполняем задачу сразу в этом запросе.
+        # Пользователю о пополнении баланса бот сообщает сам.
+        order_id, amount, currency = p.order_id, p.amount, p.currency
+        tariff_name = t.name if t else None
+        job, created = enqueue_fulfilment(p, 'telegram_internal', notify_user=False, run=False)
+        status = run_fulfilment_job(job.id)
+        
+        if status == 'DONE':
+            if tariff_name:
+                print(f"[TELEGRAM-INTERNAL] Tariff activated: user={u.id}, tariff={tariff_name}")
+                return jsonify({
+                    "success": True, 
+                    "message": f"Подписка '{tariff_name}' активирована!"
+                }), 200
+            print(f"[TELEGRAM-INTERNAL] Balance topped up: user={u.id}, order_id={order_id}")
             return jsonify({
                 "success": True, 
-                "message": f"Подписка '{t.name}' активирована!"
+                "message": f"Баланс пополнен на {amount} {currency}"
             }), 200
-        except Exception as e:
-            print(f"[TELEGRAM-INTERNAL] Tariff activation error: {e}")
-            return jsonify({"success": False, "message": str(e)}), 500
+        
+        if status in ('PENDING', 'RUNNING'):
+            # Выполняется другим воркером или будет повторена
+            return jsonify({"success": True, "message": "Платеж обрабатывается"}), 202
+        
+        print(f"[TELEGRAM-INTERNAL] Fulfilment failed: order_id={order_id}, error={job.error}")
+        return jsonify({"success": False, "message": job.error or "Payment processing failed"}), 500
         
     except Exception as e:
         print(f"[TELEGRAM-INTERNAL] Error: {e}")
@@ -659,6 +543,11 @@ def freekassa_webhook():
         data = request.values.to_dict()
         print(f"[FREEKASSA] Received: {data}")
         
+        # FreeKassa присылает уведомление только об успешной оплате - подпись подтверждает оплату
+        if not verify_freekassa_signature(data):
+            print("[FREEKASSA] ❌ Invalid signature")
+            return "NO", 400
+        
         order_id = data.get('MERCHANT_ORDER_ID')
         if not order_id:
             return "NO", 400
@@ -668,15 +557,8 @@ def freekassa_webhook():
             return "NO", 404
         
         if payment.status != 'PAID':
-            payment.status = 'PAID'
             payment.payment_system_id = data.get('intid')
-            db.session.commit()
-            
-            user = User.query.get(payment.user_id)
-            tariff = Tariff.query.get(payment.tariff_id)
-            
-            if user and tariff:
-                process_successful_payment(payment, user, tariff)
+            enqueue_fulfilment(payment, 'freekassa')
         
         return "YES", 200
         
@@ -692,6 +574,11 @@ def robokassa_webhook():
         data = request.values.to_dict()
         print(f"[ROBOKASSA] Received: {data}")
         
+        # Robokassa присылает уведомление только об успешной оплате - подпись подтверждает оплату
+        if not verify_robokassa_signature(data):
+            print("[ROBOKASSA] ❌ Invalid signature")
+            return "NO", 400
+        
         order_id = data.get('InvId') or data.get('inv_id')
         if not order_id:
             return "NO", 400
@@ -701,14 +588,7 @@ def robokassa_webhook():
             return "NO", 404
         
         if payment.status != 'PAID':
-            payment.status = 'PAID'
-            db.session.commit()
-            
-            user = User.query.get(payment.user_id)
-            tariff = Tariff.query.get(payment.tariff_id)
-            
-            if user and tariff:
-                process_successful_payment(payment, user, tariff)
+            enqueue_fulfilment(payment, 'robokassa')
         
         return f"OK{order_id}", 200
         
@@ -745,48 +625,7 @@ def crystalpay_webhook():
         if not p or p.status == 'PAID':
             return jsonify({"error": False}), 200
         
-        u = db.session.get(User, p.user_id)
-        if not u:
-            return jsonify({"error": False}), 200
-        
-        # Если это пополнение баланса (tariff_id == None)
-        if p.tariff_id is None:
-            current_balance_usd = float(u.balance) if u.balance else 0.0
-            amount_usd = convert_to_usd(p.amount, p.currency)
-            u.balance = current_balance_usd + amount_usd
-            p.status = 'PAID'
-            db.session.commit()
-            
-            # Начисляем реферальную комиссию
-            add_referral_commission(u, amount_usd, is_tariff_purchase=False)
-            db.session.commit()
-            
-            # Отправляем уведомление админам
-            try:
-                from modules.notifications import notify_payment
-                notify_payment(p, u, is_balance_topup=True)
-            except Exception as e:
-                print(f"Error sending payment notification: {e}")
-            
-            # Отправляем уведомление пользователю в бот
-            try:
-                from modules.notifications import send_user_payment_notification_async
-                send_user_payment_notification_async(u, is_successful=True, is_balance_topup=True, payment=p)
-            except Exception as e:
-                print(f"Error sending user payment notification: {e}")
-            
-            cache.delete(f'live_data_{u.remnawave_uuid}')
-            cache.delete('all_live_users_map')
-            
-            return jsonify({"error": False}), 200
-        
-        # Обычная покупка тарифа
-        t = db.session.get(Tariff, p.tariff_id)
-        if not t:
-            return jsonify({"error": False}), 200
-        
-        # process_successful_payment уже отправляет уведомление пользователю
-        process_successful_payment(p, u, t)
+        enqueue_fulfilment(p, 'crystalpay')
         
         return jsonify({"error": False}), 200
         
@@ -873,54 +712,14 @@ def platega_webhook():
         # GET /transaction/{id} - проверка статуса оплаты платежа
         verified_status = None
         if transaction_id:
-            try:
-                from modules.models.payment import PaymentSetting, decrypt_key
-                import requests
-                
-                settings = PaymentSetting.query.first()
-                if settings:
-                    platega_key = decrypt_key(getattr(settings, 'platega_api_key', None)) if settings else None
-                    platega_merchant_raw = decrypt_key(getattr(settings, 'platega_merchant_id', None)) if settings else None
-                    
-                    if platega_key and platega_merchant_raw:
-                        # Обработка Merchant ID (убираем префикс 'live_' если есть)
-                        import re
-                        import uuid as uuid_lib
-                        platega_merchant = platega_merchant_raw.strip()
-                        if platega_merchant.startswith('live_'):
-                            platega_merchant = platega_merchant[5:]
-                        uuid_pattern = r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
-                        uuid_match = re.search(uuid_pattern, platega_merchant)
-                        if uuid_match:
-                            platega_merchant = uuid_match.group(0)
-                        
-                        # Проверяем статус через API Platega
-                        api_url = f"https://app.platega.io/transaction/{transaction_id}"
-                        headers = {
-                            "X-MerchantId": platega_merchant,
-                            "X-Secret": platega_key,
-                            "Content-Type": "application/json"
-                        }
-                        
-                        resp = requests.get(api_url, headers=headers, timeout=10)
-                        if resp.status_code == 200:
-                            api_data = resp.json()
-                            verified_status = api_data.get('status', '').upper()
-                            print(f"[PLATEGA] Verified status from API: {verified_status}, full response: {json.dumps(api_data, indent=2)}")
-                        elif resp.status_code == 404:
-                            print(f"[PLATEGA] Transaction {transaction_id} not found in Platega API (404)")
-                        else:
-                            print(f"[PLATEGA] Failed to verify status via API: {resp.status_code} - {resp.text[:200]}")
-            except Exception as api_error:
-                print(f"[PLATEGA] Error verifying status via API: {api_error}")
+            statuses = get_payment_provider('platega').fetch_statuses([transaction_id])
+            verified_status = statuses.get(str(transaction_id))
+            print(f"[PLATEGA] Verified status from API: {verified_status}")
         
         # Используем проверенный статус из API, если доступен, иначе из webhook
-        if verified_status:
-            status_upper = verified_status
-            print(f"[PLATEGA] Using verified status from API: {status_upper}")
-        else:
-            status_upper = status.upper() if status else ''
-            print(f"[PLATEGA] Using status from webhook: {status_upper}")
+        if verified_status and verified_status != PAYMENT_PAID:
+            print(f"[PLATEGA] Payment is not confirmed by API: {verified_status}")
+            return jsonify({"status": "ok"}), 200
         
         # Ищем платеж по transaction_id (это payment_system_id в нашей БД)
         p = None
@@ -943,31 +742,9 @@ def platega_webhook():
             print(f"[PLATEGA] Payment {p.order_id} already processed")
             return jsonify({"status": "ok"}), 200
         
-        # Получаем пользователя и тариф
-        u = db.session.get(User, p.user_id)
-        t = db.session.get(Tariff, p.tariff_id) if p.tariff_id else None
-        
-        if not u:
-            print(f"[PLATEGA] User not found for payment {p.order_id}")
-            return jsonify({"status": "ok"}), 200
-        
-        # Если это пополнение баланса (нет тарифа), обрабатываем отдельно
-        if not t:
-            # Для пополнения баланса обновляем статус и пополняем баланс
-            p.status = 'PAID'
-            # Пополняем баланс пользователя
-            u.balance = (u.balance or 0) + float(p.amount)
-            db.session.commit()
-            print(f"[PLATEGA] Balance topup payment {p.order_id} marked as PAID, balance updated: {u.balance}")
-            return jsonify({"status": "ok"}), 200
-        
-        # Обрабатываем успешный платеж за тариф
-        if process_successful_payment(p, u, t):
-            print(f"[PLATEGA] Successfully processed payment {p.order_id}")
-            return jsonify({"status": "ok"}), 200
-        else:
-            print(f"[PLATEGA] Failed to process payment {p.order_id}")
-            return jsonify({"status": "ok"}), 200
+        job, created = enqueue_fulfilment(p, 'platega')
+        print(f"[PLATEGA] Fulfilment job #{job.id} for payment {p.order_id} ({'created' if created else 'already queued'})")
+        return jsonify({"status": "ok"}), 200
         
     except Exception as e:
         print(f"[PLATEGA] Error: {e}")
@@ -1001,16 +778,8 @@ def mulenpay_webhook():
         if not p or p.status == 'PAID':
             return jsonify({}), 200
         
-        u = db.session.get(User, p.user_id)
-        t = db.session.get(Tariff, p.tariff_id)
-        
-        if not u or not t:
-            return jsonify({}), 200
-        
-        if process_successful_payment(p, u, t):
-            return jsonify({}), 200
-        else:
-            return jsonify({}), 200
+        enqueue_fulfilment(p, 'mulenpay')
+        return jsonify({}), 200
         
     except Exception as e:
         print(f"[MULENPAY] Error: {e}")
@@ -1042,16 +811,8 @@ def urlpay_webhook():
         if not p or p.status == 'PAID':
             return jsonify({}), 200
         
-        u = db.session.get(User, p.user_id)
-        t = db.session.get(Tariff, p.tariff_id)
-        
-        if not u or not t:
-            return jsonify({}), 200
-        
-        if process_successful_payment(p, u, t):
-            return jsonify({}), 200
-        else:
-            return jsonify({}), 200
+        enqueue_fulfilment(p, 'urlpay')
+        return jsonify({}), 200
         
     except Exception as e:
         print(f"[URLPAY] Error: {e}")
@@ -1087,16 +848,8 @@ def btcpayserver_webhook():
         if not p or p.status == 'PAID':
             return jsonify({}), 200
         
-        u = db.session.get(User, p.user_id)
-        t = db.session.get(Tariff, p.tariff_id)
-        
-        if not u or not t:
-            return jsonify({}), 200
-        
-        if process_successful_payment(p, u, t):
-            return jsonify({}), 200
-        else:
-            return jsonify({}), 200
+        enqueue_fulfilment(p, 'btcpayserver')
+        return jsonify({}), 200
         
     except Exception as e:
         print(f"[BTCPAYSERVER] Error: {e}")
@@ -1128,16 +881,8 @@ def tribute_webhook():
         if not p or p.status == 'PAID':
             return jsonify({}), 200
         
-        u = db.session.get(User, p.user_id)
-        t = db.session.get(Tariff, p.tariff_id)
-        
-        if not u or not t:
-            return jsonify({}), 200
-        
-        if process_successful_payment(p, u, t):
-            return jsonify({}), 200
-        else:
-            return jsonify({}), 200
+        enqueue_fulfilment(p, 'tribute')
+        return jsonify({}), 200
         
     except Exception as e:
         print(f"[TRIBUTE] Error: {e}")
@@ -1166,16 +911,8 @@ def monobank_webhook():
         if not p or p.status == 'PAID':
             return jsonify({}), 200
         
-        u = db.session.get(User, p.user_id)
-        t = db.session.get(Tariff, p.tariff_id)
-        
-        if not u or not t:
-            return jsonify({}), 200
-        
-        if process_successful_payment(p, u, t):
-            return jsonify({}), 200
-        else:
-            return jsonify({}), 200
+        enqueue_fulfilment(p, 'monobank')
+        return jsonify({}), 200
         
     except Exception as e:
         print(f"[MONOBANK] Error: {e}")
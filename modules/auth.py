@@ -1,7 +1,15 @@
-from flask import request, jsonify
+from flask import request, jsonify, g
 from functools import wraps
 import jwt
+import hmac
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 import os
@@ -21,6 +29,152 @@ bcrypt = get_bcrypt()
 # Импорт модели User из modules.user
 from modules.user import User
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# КЕШ ИДЕНТИФИКАЦИИ
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Проверка токена не ходит в БД: поля, нужные для авторизации, берутся из кеша
+# (LRU + TTL в памяти воркера; при CACHE_TYPE=redis - еще и общий Redis).
+# Кеш сбрасывается при изменении этих полей через ORM и явно в админских
+# эндпоинтах блокировки и удаления; в остальных случаях устаревание ограничено TTL.
+
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+# При общем Redis локальная копия живет недолго, чтобы сброс из другого воркера доходил быстро
+AUTH_CACHE_LOCAL_TTL_SHARED = 3
+
+AUTH_FIELDS = ('id', 'role', 'is_blocked', 'remnawave_uuid', 'preferred_currency', 'preferred_lang')
+
+_auth_cache = OrderedDict()  # user_id -> (expires_at, projection)
+_auth_cache_lock = threading.Lock()
+
+
+def _shared_cache():
+    """Redis-кеш приложения или None"""
+    if app.config.get('CACHE_TYPE') != 'RedisCache':
+        return None
+    from modules.core import get_cache
+    return get_cache()
+
+
+def _load_auth_projection(user_id):
+    """Проекция пользователя для авторизации: кеш -> Redis -> БД"""
+    now = time.monotonic()
+    with _auth_cache_lock:
+        entry = _auth_cache.get(user_id)
+        if entry and entry[0] > now:
+            _auth_cache.move_to_end(user_id)
+            return entry[1]
+
+    shared = _shared_cache()
+    projection = None
+    if shared is not None:
+        try:
+            projection = shared.get(f'auth_user_{user_id}')
+        except Exception as e:
+            print(f"[AUTH] Redis недоступен для кеша авторизации: {e}")
+            shared = None
+
+    if projection is None:
+        row = db.session.query(*[getattr(User, f) for f in AUTH_FIELDS]).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        projection = dict(zip(AUTH_FIELDS, row))
+        if shared is not None:
+            try:
+                shared.set(f'auth_user_{user_id}', projection, timeout=AUTH_CACHE_TTL)
+            except Exception:
+                pass
+
+    local_ttl = min(AUTH_CACHE_TTL, AUTH_CACHE_LOCAL_TTL_SHARED) if shared is not None else AUTH_CACHE_TTL
+    with _auth_cache_lock:
+        _auth_cache[user_id] = (now + local_ttl, projection)
+        _auth_cache.move_to_end(user_id)
+        while len(_auth_cache) > AUTH_CACHE_SIZE:
+            _auth_cache.popitem(last=False)
+    return projection
+
+
+def invalidate_user_auth(user_id):
+    """Сбросить кеш авторизации пользователя (блокировка, смена роли, удаление)"""
+    with _auth_cache_lock:
+        _auth_cache.pop(user_id, None)
+    try:
+        shared = _shared_cache()
+        if shared is not None:
+            shared.delete(f'auth_user_{user_id}')
+    except Exception as e:
+        print(f"[AUTH] Не удалось сбросить кеш авторизации в Redis: {e}")
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_auth_on_update(mapper, connection, target):
+    """Сбросить кеш, если через ORM изменилось одно из полей авторизации"""
+    state = db.inspect(target)
+    if any(state.attrs[f].history.has_changes() for f in AUTH_FIELDS):
+        invalidate_user_auth(target.id)
+    if state.attrs.telegram_id.history.has_changes():
+        invalidate_miniapp_sessions(target.id)
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_auth_on_delete(mapper, connection, target):
+    invalidate_user_auth(target.id)
+    invalidate_miniapp_sessions(target.id)
+
+
+class AuthUser:
+    """
+    Пользователь, найденный по токену
+
+    Поля AUTH_FIELDS отдаются из кеша без запроса к БД. Обращение к любому другому
+    атрибуту или запись атрибута один раз загружает модель User в текущую сессию,
+    дальше все операции идут через нее (изменения сохраняются обычным db.session.commit()).
+    """
+    __slots__ = ('_projection', '_user')
+
+    def __init__(self, projection):
+        object.__setattr__(self, '_projection', projection)
+        object.__setattr__(self, '_user', None)
+
+    def _load(self):
+        user = object.__getattribute__(self, '_user')
+        if user is None:
+            user = db.session.get(User, object.__getattribute__(self, '_projection')['id'])
+            if user is None:
+                raise LookupError("User no longer exists")
+            object.__setattr__(self, '_user', user)
+        return user
+
+    def __getattr__(self, name):
+        projection = object.__getattribute__(self, '_projection')
+        if name in projection and object.__getattribute__(self, '_user') is None:
+            return projection[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<AuthUser {self.id}>"
+
+
+def _user_from_auth_header():
+    """AuthUser по заголовку Authorization (Bearer JWT) или None"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    local_token = auth_header.split(" ")[1]
+    payload = jwt.decode(local_token, app.config['JWT_SECRET_KEY'], algorithms=["HS256"])
+    projection = _load_auth_projection(int(payload['sub']))
+    return AuthUser(projection) if projection else None
+
 # Функции аутентификации
 def create_local_jwt(user_id):
     payload = {'iat': datetime.now(timezone.utc), 'exp': datetime.now(timezone.utc) + timedelta(days=1), 'sub': str(user_id)}
@@ -34,9 +188,7 @@ def admin_required(f):
         if not auth_header or not auth_header.startswith("Bearer "):
             return jsonify({"message": "Auth required"}), 401
         try:
-            local_token = auth_header.split(" ")[1]
-            payload = jwt.decode(local_token, app.config['JWT_SECRET_KEY'], algorithms=["HS256"])
-            user = db.session.get(User, int(payload['sub']))
+            user = _user_from_auth_header()
             if not user or user.role != 'ADMIN':
                 return jsonify({"message": "Forbidden"}), 403
             kwargs['current_admin'] = user
@@ -46,13 +198,227 @@ def admin_required(f):
     return decorated_function
 
 def get_user_from_token():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return None
     try:
-        local_token = auth_header.split(" ")[1]
-        payload = jwt.decode(local_token, app.config['JWT_SECRET_KEY'], algorithms=["HS256"])
-        user = db.session.get(User, int(payload['sub']))
-        return user
+        return _user_from_auth_header()
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TELEGRAM MINI APP (initData)
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# initData проверяется по подписи (HMAC-SHA256, ключ выводится из токена бота) и по
+# свежести auth_date. Результат кешируется по хешу строки initData до конца срока ее
+# действия и сразу указывает на id пользователя - повторные запросы экрана mini app
+# не проверяют подпись и не ищут пользователя по telegram_id. Без токена бота подпись
+# проверить нельзя, и все запросы mini app отклоняются (401).
+
+MINIAPP_INIT_DATA_MAX_AGE = int(os.getenv("MINIAPP_INIT_DATA_MAX_AGE", "86400"))
+MINIAPP_SESSION_CACHE_SIZE = 10000
+
+_miniapp_sessions = OrderedDict()  # sha256(initData) -> (expires_at, user_id, telegram_user)
+_miniapp_sessions_lock = threading.Lock()
+
+
+def _miniapp_bot_tokens():
+    """Токены ботов, из которых открывается mini app"""
+    tokens = [os.getenv("CLIENT_BOT_TOKEN"), os.getenv("CLIENT_BOT_V2_TOKEN")]
+    tokens += os.getenv("MINIAPP_BOT_TOKENS", "").split(",")
+    result = []
+    for token in tokens:
+        token = (token or "").strip()
+        if token and token not in result:
+            result.append(token)
+    return result
+
+
+def verify_telegram_init_data(init_data, bot_tokens=None, max_age=MINIAPP_INIT_DATA_MAX_AGE):
+    """
+    Проверить initData Telegram WebApp
+
+    Args:
+        init_data: строка initData (query string)
+        bot_tokens: токены ботов, подписью любого из которых initData может быть подписана
+        max_age: максимальный возраст auth_date в секундах
+
+    Returns:
+        tuple: (telegram_user dict, auth_date) или None, если подпись неверна или данные устарели
+    """
+    if not init_data or not isinstance(init_data, str):
+        return None
+    try:
+        fields = dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True))
+        received_hash = fields.pop('hash', '')
+        if not received_hash:
+            return None
+
+        data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+        for token in (bot_tokens if bot_tokens is not None else _miniapp_bot_tokens()):
+            secret_key = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+            calculated = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+            if hmac.compare_digest(calculated, received_hash):
+                break
+        else:
+            return None
+
+        auth_date = int(fields.get('auth_date') or 0)
+        if time.time() - auth_date > max_age:
+            return None
+
+        telegram_user = json.loads(fields.get('user') or '{}')
+        if not telegram_user.get('id'):
+            return None
+        return telegram_user, auth_date
+    except (ValueError, TypeError):
+        return None
+
+
+def invalidate_miniapp_sessions(user_id):
+    """Удалить кешированные сессии mini app пользователя (смена telegram_id, удаление)"""
+    with _miniapp_sessions_lock:
+        for key in [k for k, v in _miniapp_sessions.items() if v[1] == user_id]:
+            del _miniapp_sessions[key]
+
+
+def _request_init_data():
+    """initData из тела запроса (JSON / form), заголовков или query string"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    if not data and request.form:
+        data = dict(request.form)
+    if not data and request.data:
+        try:
+            data = json.loads(request.data.decode('utf-8'))
+        except Exception:
+            data = {}
+    init_data = (
+        data.get('initData') or data.get('init_data')
+        or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data')
+        or request.args.get('initData')
+    )
+    return init_data if isinstance(init_data, str) else None
+
+
+def get_miniapp_telegram_id():
+    """
+    Telegram id из initData запроса или None (ключ лимитов запросов)
+
+    Сначала - кеш сессий по хешу initData, затем проверка подписи. Если токен бота
+    не настроен, подпись проверить нельзя - тогда None.
+    """
+    init_data = _request_init_data()
+    if not init_data:
+        return None
+    key = hashlib.sha256(init_data.encode('utf-8')).hexdigest()
+    with _miniapp_sessions_lock:
+        session = _miniapp_sessions.get(key)
+    if session and session[0] > time.time():
+        return session[2].get('id')
+
+    bot_tokens = _miniapp_bot_tokens()
+    if not bot_tokens:
+        return None
+    verified = verify_telegram_init_data(init_data, bot_tokens)
+    return verified[0]['id'] if verified else None
+
+
+def _resolve_miniapp_user(init_data):
+    """
+    Пользователь mini app по initData
+
+    Returns:
+        tuple: (AuthUser или None, telegram_user или None, код ошибки или None)
+    """
+    key = hashlib.sha256(init_data.encode('utf-8')).hexdigest()
+    now = time.time()
+
+    with _miniapp_sessions_lock:
+        session = _miniapp_sessions.get(key)
+        if session and session[0] > now:
+            _miniapp_sessions.move_to_end(key)
+        else:
+            session = None
+
+    if session is None:
+        bot_tokens = _miniapp_bot_tokens()
+        if not bot_tokens:
+            # Неподписанной initData верить нельзя: любой мог бы войти под чужим telegram_id
+            print("[MINIAPP] ❌ Ошибка конфигурации: не задан токен бота (CLIENT_BOT_TOKEN, CLIENT_BOT_V2_TOKEN "
+                  "или MINIAPP_BOT_TOKENS) - подпись initData не проверить, запрос отклонен")
+            return None, None, 'invalid'
+        verified = verify_telegram_init_data(init_data, bot_tokens)
+        if verified is None:
+            return None, None, 'invalid'
+
+        telegram_user, auth_date = verified
+        user_id = db.session.query(User.id).filter(User.telegram_id == str(telegram_user['id'])).scalar()
+        if user_id is None:
+            # Не кешируем: пользователь может зарегистрироваться в боте прямо сейчас
+            return None, telegram_user, 'not_found'
+
+        session = (auth_date + MINIAPP_INIT_DATA_MAX_AGE, user_id, telegram_user)
+        with _miniapp_sessions_lock:
+            _miniapp_sessions[key] = session
+            while len(_miniapp_sessions) > MINIAPP_SESSION_CACHE_SIZE:
+                _miniapp_sessions.popitem(last=False)
+
+    projection = _load_auth_projection(session[1])
+    if projection is None:
+        invalidate_miniapp_sessions(session[1])
+        return None, session[2], 'not_found'
+    return AuthUser(projection), session[2], None
+
+
+def _miniapp_error(title, message, status):
+    response = jsonify({
+        "success": False,
+        "error": message,
+        "message": message,
+        "detail": {"title": title, "message": message}
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response, status
+
+
+def miniapp_user_required(f=None, optional=False):
+    """
+    Авторизация эндпоинтов mini app по initData
+
+    Передает в функцию kwargs['user'] (AuthUser), данные пользователя Telegram
+    доступны в g.telegram_user. Запросы OPTIONS проходят без проверки (user=None).
+    С optional=True вместо ответа 401/404 в функцию передается user=None.
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            g.telegram_user = None
+            if request.method == 'OPTIONS':
+                kwargs['user'] = None
+                return func(*args, **kwargs)
+
+            init_data = _request_init_data()
+            if not init_data:
+                user, error = None, 'missing'
+            else:
+                try:
+                    user, g.telegram_user, error = _resolve_miniapp_user(init_data)
+                except Exception as e:
+                    print(f"[MINIAPP] Ошибка проверки initData: {e}")
+                    user, error = None, 'invalid'
+
+            if error and not optional:
+                if error == 'missing':
+                    return _miniapp_error("Authorization Error", "Missing initData", 401)
+                if error == 'invalid':
+                    return _miniapp_error("Authorization Error", "Invalid or expired initData", 401)
+                return _miniapp_error("User Not Found", "User not registered. Please register in the bot first.", 404)
+
+            kwargs['user'] = user
+            return func(*args, **kwargs)
+        return decorated_function
+
+    if f is not None:
+        return decorator(f)
+    return decorator
@@ -0,0 +1,589 @@
+"""
+Очередь ручных рассылок (админка)
+
+Вместо отдельного потока на каждого получателя:
+  - задача и получатели сохраняются в БД (broadcast_job / broadcast_recipient);
+  - один поток-диспетчер на задачу читает неотправленных получателей пачками
+    и раздает их ограниченному пулу воркеров (BROADCAST_WORKERS);
+  - все отправки в Telegram проходят через общий ограничитель скорости
+    (BROADCAST_TELEGRAM_RATE сообщений/сек): с Redis слоты выдает Redis, и лимит
+    бота общий для всех процессов, без Redis - на процесс. Ответ 429 с retry_after
+    приостанавливает всю отправку на указанное время;
+  - задачу рассылает только процесс, взявший ее в аренду: UPDATE с условием
+    "аренды нет или она истекла", аренда продлевается после каждой пачки. Задачу
+    процесса, который остановился, планировщик продолжает после истечения аренды
+    (BROADCAST_LEASE_SECONDS);
+  - фото загружается в Telegram один раз, дальше отправляется по file_id
+    (file_id запоминается в telegram_media_cache и переиспользуется между рассылками).
+"""
+import os
+import json
+import time
+import socket
+import threading
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import bindparam
+
+from modules.core import get_app, get_db
+from modules import telegram_media_cache
+from modules.models.user import User
+from modules.models.broadcast import BroadcastJob, BroadcastRecipient
+
+db = get_db()
+
+TELEGRAM_RATE = float(os.getenv("BROADCAST_TELEGRAM_RATE", "30"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_BATCH_SIZE = 200
+MAX_ATTEMPTS = 3
+# Аренда задачи; продлевается после каждой пачки - должна быть больше времени отправки пачки
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "120"))
+TELEGRAM_RATE_KEY = 'stealthnet:telegram_rate'
+
+
+# ============================================================================
+# ОГРАНИЧИТЕЛЬ СКОРОСТИ TELEGRAM
+# ============================================================================
+
+class TelegramRateLimiter:
+    """Ограничитель частоты запросов к Telegram Bot API в пределах процесса"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Дождаться своего слота отправки"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Приостановить все отправки (ответ 429 с retry_after)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._next_slot = max(self._next_slot, self._paused_until)
+
+
+# Слот отправки выдает Redis по своему времени (TIME): часы процессов и хостов не важны.
+# KEYS[1] - время следующего свободного слота, KEYS[2] - пауза после 429 до
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local slot = math.max(now, tonumber(redis.call('GET', KEYS[1]) or '0'), tonumber(redis.call('GET', KEYS[2]) or '0'))
+redis.call('SET', KEYS[1], tostring(slot + tonumber(ARGV[1])), 'EX', 3600)
+return tostring(slot - now)
+"""
+
+_PAUSE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local paused_until = math.max(now + tonumber(ARGV[1]), tonumber(redis.call('GET', KEYS[2]) or '0'))
+redis.call('SET', KEYS[2], tostring(paused_until), 'EX', 3600)
+local next_slot = math.max(tonumber(redis.call('GET', KEYS[1]) or '0'), paused_until)
+redis.call('SET', KEYS[1], tostring(next_slot), 'EX', 3600)
+return tostring(paused_until - now)
+"""
+
+
+class RedisTelegramRateLimiter:
+    """Ограничитель, общий для всех процессов: слоты отправки выдает Redis"""
+
+    def __init__(self, client, rate, key=TELEGRAM_RATE_KEY):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._keys = [f"{key}:next", f"{key}:paused"]
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._pause = client.register_script(_PAUSE_SCRIPT)
+        # Redis недоступен - лимит процесса, а не остановка рассылки
+        self._fallback = TelegramRateLimiter(rate)
+        self._redis_failed = False
+
+    def _redis_error(self, e):
+        if not self._redis_failed:
+            print(f"[BROADCAST] Redis ограничителя недоступен ({e}), лимит Telegram считается в процессе")
+        self._redis_failed = True
+
+    def acquire(self):
+        """Дождаться своего слота отправки"""
+        try:
+            wait = float(self._acquire(keys=self._keys, args=[self.interval]))
+            self._redis_failed = False
+        except Exception as e:
+            self._redis_error(e)
+            self._fallback.acquire()
+            return
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Приостановить все отправки всех процессов (ответ 429 с retry_after)"""
+        self._fallback.pause(seconds)
+        try:
+            self._pause(keys=self._keys, args=[seconds])
+        except Exception as e:
+            self._redis_error(e)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def _rate_limiter_redis():
+    """Redis лимитов запросов (как у Flask-Limiter, modules/rate_limit.py) или None"""
+    try:
+        from modules.rate_limit import get_storage_uri
+        url = get_storage_uri(get_app())
+        if not url.startswith(('redis://', 'rediss://')):
+            return None
+        import redis
+        return redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=1)
+    except Exception as e:
+        print(f"[BROADCAST] Redis для лимита Telegram не используется: {e}")
+        return None
+
+
+def get_telegram_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                client = _rate_limiter_redis()
+                if client is not None:
+                    _rate_limiter = RedisTelegramRateLimiter(client, TELEGRAM_RATE)
+                else:
+                    _rate_limiter = TelegramRateLimiter(TELEGRAM_RATE)
+    return _rate_limiter
+
+
+_session = None
+
+
+def _get_session():
+    """Общая сессия с пулом keep-alive соединений к api.telegram.org"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(BROADCAST_WORKERS, 10))
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+# ============================================================================
+# ОТПРАВКА
+# ============================================================================
+
+def send_telegram(bot_token, chat_id, text, photo=None, photo_filename=None, photo_file_id=None, reply_markup=None):
+    """
+    Отправить сообщение (или фото с caption) через Bot API
+
+    Фото (bytes), которое этот бот уже загружал, отправляется по file_id из
+    telegram_media_cache. Если Telegram отклонил file_id, а bytes переданы, фото
+    загружается заново.
+
+    Returns:
+        dict: ok, message_id, file_id (для загруженного фото), error, retry_after
+    """
+    key = None
+    if photo is not None and not photo_file_id:
+        key = telegram_media_cache.media_key(content=photo)
+        photo_file_id = telegram_media_cache.get_file_id(bot_token, key)
+
+    result = _send_telegram(bot_token, chat_id, text, photo, photo_filename, photo_file_id, reply_markup)
+    uploaded = photo is not None and not photo_file_id
+
+    if (not result['ok'] and photo_file_id and photo is not None
+            and telegram_media_cache.is_invalid_file_id_error(result['error'])):
+        print(f"[BROADCAST] Telegram отклонил file_id фото, загружаем заново: {result['error']}")
+        key = key or telegram_media_cache.media_key(content=photo)
+        telegram_media_cache.forget_file_id(bot_token, key)
+        result = _send_telegram(bot_token, chat_id, text, photo, photo_filename, None, reply_markup)
+        uploaded = True
+
+    if uploaded and result['file_id']:
+        telegram_media_cache.set_file_id(bot_token, key or telegram_media_cache.media_key(content=photo), result['file_id'])
+    return result
+
+
+def _send_telegram(bot_token, chat_id, text, photo, photo_filename, photo_file_id, reply_markup):
+    """Один запрос sendMessage / sendPhoto (file_id имеет приоритет над bytes)"""
+    result = {'ok': False, 'message_id': None, 'file_id': None, 'error': None, 'retry_after': None}
+    session = _get_session()
+    try:
+        if photo is not None or photo_file_id:
+            url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
+            # Обрезаем caption до 1024 символов (лимит Telegram)
+            data = {"chat_id": chat_id, "caption": text[:1024], "parse_mode": "HTML"}
+            if photo_file_id:
+                data["photo"] = photo_file_id
+                if reply_markup:
+                    data["reply_markup"] = reply_markup
+                response = session.post(url, json=data, timeout=30)
+            else:
+                # multipart: reply_markup передается строкой JSON
+                if reply_markup:
+                    data["reply_markup"] = json.dumps(reply_markup)
+                files = {'photo': (photo_filename or 'photo.jpg', photo)}
+                response = session.post(url, data=data, files=files, timeout=60)
+        else:
+            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+            payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+            if reply_markup:
+                payload["reply_markup"] = reply_markup
+            response = session.post(url, json=payload, timeout=10)
+
+        body = response.json() if response.content else {}
+        if response.status_code == 200 and body.get('ok', True):
+            message = body.get('result', {}) or {}
+            result['ok'] = True
+            result['message_id'] = message.get('message_id')
+            photos = message.get('photo') or []
+            if photos:
+                # Самый большой размер - последний
+                result['file_id'] = photos[-1].get('file_id')
+            return result
+
+        result['error'] = body.get('description', f'HTTP {response.status_code}')
+        if response.status_code == 429:
+            result['retry_after'] = (body.get('parameters') or {}).get('retry_after') or 1
+        return result
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+
+def pin_telegram(bot_token, chat_id, message_id):
+    """Закрепить сообщение"""
+    try:
+        response = _get_session().post(
+            f"https://api.telegram.org/bot{bot_token}/pinChatMessage",
+            json={"chat_id": chat_id, "message_id": message_id, "disable_notification": False},
+            timeout=10
+        )
+        return response.status_code == 200
+    except Exception:
+        return False
+
+
+def send_telegram_limited(bot_token, chat_id, text, **kwargs):
+    """send_telegram через глобальный ограничитель, с повтором после 429"""
+    limiter = get_telegram_rate_limiter()
+    result = None
+    for _ in range(MAX_ATTEMPTS):
+        limiter.acquire()
+        result = send_telegram(bot_token, chat_id, text, **kwargs)
+        if not result['retry_after']:
+            return result
+        print(f"[BROADCAST] 429 от Telegram, пауза {result['retry_after']}с")
+        limiter.pause(result['retry_after'])
+    return result
+
+
+def _bot_token(bot_type):
+    old_bot_token = os.getenv("CLIENT_BOT_TOKEN")
+    new_bot_token = os.getenv("CLIENT_BOT_V2_TOKEN") or os.getenv("CLIENT_BOT_TOKEN")
+    return new_bot_token if bot_type == 'new' else old_bot_token
+
+
+# ============================================================================
+# ЗАДАЧИ
+# ============================================================================
+
+def create_broadcast_job(created_by, users_query, broadcast_type, bot_type, recipient_type,
+                         subject, message, pin_message=False, photo=None, photo_filename=None):
+    """
+    Создать задачу и строки получателей (вставка пачками, без загрузки моделей User)
+
+    Returns:
+        BroadcastJob
+    """
+    job = BroadcastJob(
+        created_by=created_by,
+        status='PENDING',
+        broadcast_type=broadcast_type,
+        bot_type=bot_type,
+        recipient_type=recipient_type,
+        subject=subject,
+        message=message,
+        pin_message=bool(pin_message),
+        photo=photo,
+        photo_filename=photo_filename
+    )
+    db.session.add(job)
+    db.session.flush()
+
+    table = BroadcastRecipient.__table__
+    total = 0
+    rows = []
+
+    def flush_rows():
+        nonlocal total, rows
+        if rows:
+            db.session.execute(table.insert(), rows)
+            total += len(rows)
+            rows = []
+
+    for user_id, email, telegram_id in users_query.with_entities(User.id, User.email, User.telegram_id).yield_per(1000):
+        if broadcast_type in ['email', 'both'] and email and not email.endswith('@telegram.local'):
+            rows.append({'job_id': job.id, 'user_id': user_id, 'channel': 'email', 'target': email, 'status': 'PENDING', 'attempts': 0})
+        if broadcast_type in ['telegram', 'both'] and telegram_id:
+            rows.append({'job_id': job.id, 'user_id': user_id, 'channel': 'telegram', 'target': str(telegram_id), 'status': 'PENDING', 'attempts': 0})
+        if len(rows) >= 1000:
+            flush_rows()
+    flush_rows()
+
+    job.total = total
+    db.session.commit()
+    return job
+
+
+_running_jobs = set()
+_running_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def _lease_free(table, now):
+    return db.or_(table.c.lease_expires_at.is_(None), table.c.lease_expires_at < now)
+
+
+def _claim_job(job_id):
+    """Взять задачу в аренду: PENDING или RUNNING без действующей аренды (ее процесс остановлен)"""
+    now = _now()
+    table = BroadcastJob.__table__
+    result = db.session.execute(
+        table.update().where(
+            table.c.id == job_id,
+            table.c.status.in_(['PENDING', 'RUNNING']),
+            _lease_free(table, now)
+        ).values(
+            status='RUNNING',
+            lease_owner=_worker_id(),
+            lease_expires_at=now + timedelta(seconds=BROADCAST_LEASE_SECONDS),
+            started_at=db.func.coalesce(table.c.started_at, now)
+        )
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _renew_lease(job_id):
+    """Продлить аренду (после каждой пачки); False - задачу забрал другой процесс"""
+    table = BroadcastJob.__table__
+    result = db.session.execute(
+        table.update().where(
+            table.c.id == job_id,
+            table.c.status == 'RUNNING',
+            table.c.lease_owner == _worker_id()
+        ).values(lease_expires_at=_now() + timedelta(seconds=BROADCAST_LEASE_SECONDS))
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _finish_job(job_id, status, error=None):
+    """Завершить задачу, если аренда все еще у этого процесса"""
+    table = BroadcastJob.__table__
+    values = {'status': status, 'finished_at': _now(), 'lease_owner': None, 'lease_expires_at': None}
+    if error is not None:
+        values['error'] = error
+    result = db.session.execute(
+        table.update().where(table.c.id == job_id, table.c.lease_owner == _worker_id()).values(**values)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def start_broadcast_job(job_id):
+    """Запустить обработку задачи в фоновом потоке (не более одного потока на задачу в процессе)"""
+    with _running_lock:
+        if job_id in _running_jobs:
+            return False
+        _running_jobs.add(job_id)
+    threading.Thread(target=_run_job, args=(get_app(), job_id), daemon=True, name=f"broadcast-{job_id}").start()
+    return True
+
+
+def resume_broadcast_jobs():
+    """
+    Продолжить незавершенные задачи без действующей аренды (задача планировщика)
+
+    Задача, которую рассылает другой процесс, не трогается; задача остановленного
+    процесса продолжается после истечения его аренды.
+    """
+    app = get_app()
+    with app.app_context():
+        table = BroadcastJob.__table__
+        job_ids = [row.id for row in db.session.query(BroadcastJob.id).filter(
+            BroadcastJob.status.in_(['PENDING', 'RUNNING']),
+            _lease_free(table, _now())
+        ).all()]
+    with _running_lock:
+        job_ids = [job_id for job_id in job_ids if job_id not in _running_jobs]
+    for job_id in job_ids:
+        print(f"[BROADCAST] Продолжаем задачу рассылки #{job_id}")
+        start_broadcast_job(job_id)
+    return job_ids
+
+
+def _deliver(app, job_info, recipient):
+    """Отправка одному получателю (выполняется в воркере пула, без доступа к db.session)"""
+    recipient_id, channel, target = recipient
+    if channel == 'email':
+        try:
+            from flask_mail import Message
+            from modules.core import get_mail
+            with app.app_context():
+                m = Message(job_info['subject'], recipients=[target])
+                m.html = job_info['message']
+                get_mail().send(m)
+            return recipient_id, channel, True, None, None
+        except Exception as e:
+            print(f"Failed to send email to {target}: {e}")
+            return recipient_id, channel, False, str(e), None
+
+    if not job_info['bot_token']:
+        return recipient_id, channel, False, 'Bot token is not configured', None
+
+    kwargs = {}
+    if job_info['photo'] is not None:
+        # bytes передаются и при известном file_id - для повторной загрузки, если он устарел
+        kwargs['photo'] = job_info['photo']
+        kwargs['photo_filename'] = job_info['photo_filename']
+    if job_info['photo_file_id']:
+        kwargs['photo_file_id'] = job_info['photo_file_id']
+
+    result = send_telegram_limited(job_info['bot_token'], target, job_info['telegram_text'], **kwargs)
+    if result['ok'] and job_info['pin_message'] and result['message_id']:
+        get_telegram_rate_limiter().acquire()
+        if not pin_telegram(job_info['bot_token'], target, result['message_id']):
+            # Логируем ошибку закрепления, но не считаем это критичной ошибкой
+            print(f"Failed to pin message for user {target}")
+    return recipient_id, channel, result['ok'], result['error'], result['file_id']
+
+
+def _apply_results(job, results):
+    """Записать статусы получателей и счетчики задачи"""
+    if not results:
+        return
+    now = datetime.now(timezone.utc)
+    table = BroadcastRecipient.__table__
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('r_id')).values(
+            status=bindparam('status'), error=bindparam('error'), attempts=table.c.attempts + 1, updated_at=now
+        ),
+        [{'r_id': r_id, 'status': 'SENT' if ok else 'FAILED', 'error': (error or None) and str(error)[:500]}
+         for r_id, channel, ok, error, file_id in results]
+    )
+    for r_id, channel, ok, error, file_id in results:
+        if channel == 'email':
+            if ok:
+                job.email_sent = (job.email_sent or 0) + 1
+            else:
+                job.email_failed = (job.email_failed or 0) + 1
+        else:
+            if ok:
+                job.telegram_sent = (job.telegram_sent or 0) + 1
+            else:
+                job.telegram_failed = (job.telegram_failed or 0) + 1
+    db.session.commit()
+
+
+def _run_job(app, job_id):
+    """Диспетчер задачи: пачки получателей -> пул воркеров -> статусы в БД"""
+    try:
+        with app.app_context():
+            if not _claim_job(job_id):
+                # Завершена или ее рассылает другой процесс
+                return
+            job = db.session.get(BroadcastJob, job_id)
+            print(f"[BROADCAST] Задача #{job.id}: {job.total} получателей, воркеров {BROADCAST_WORKERS}")
+
+            job_info = {
+                'subject': job.subject or '',
+                'message': job.message,
+                # Формируем текст для Telegram
+                'telegram_text': f"<b>{job.subject}</b>\n\n{job.message}" if job.subject else job.message,
+                'bot_token': _bot_token(job.bot_type),
+                'pin_message': job.pin_message,
+                'photo': job.photo,
+                'photo_filename': job.photo_filename,
+                'photo_file_id': job.photo_file_id
+            }
+
+            last_id = 0
+            with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS, thread_name_prefix=f"broadcast-{job.id}") as pool:
+                while True:
+                    batch = BroadcastRecipient.query.filter(
+                        BroadcastRecipient.job_id == job.id,
+                        BroadcastRecipient.status == 'PENDING',
+                        BroadcastRecipient.id > last_id
+                    ).order_by(BroadcastRecipient.id.asc()).limit(BROADCAST_BATCH_SIZE).all()
+                    if not batch:
+                        break
+                    last_id = batch[-1].id
+                    items = [(r.id, r.channel, r.target) for r in batch]
+
+                    # Первое фото загружаем синхронно, чтобы остальные ушли по file_id
+                    if job_info['photo'] is not None and not job_info['photo_file_id']:
+                        first = next((item for item in items if item[1] == 'telegram'), None)
+                        if first:
+                            items.remove(first)
+                            result = _deliver(app, job_info, first)
+                            if result[4]:
+                                job_info['photo_file_id'] = result[4]
+                                job.photo_file_id = result[4]
+                            _apply_results(job, [result])
+
+                    _apply_results(job, list(pool.map(lambda item: _deliver(app, job_info, item), items)))
+
+                    if not _renew_lease(job.id):
+                        print(f"[BROADCAST] Задача #{job.id}: аренда потеряна, рассылку продолжит другой процесс")
+                        return
+
+            if not _finish_job(job.id, 'DONE'):
+                return
+            db.session.refresh(job)
+            print(f"[BROADCAST] Задача #{job.id} завершена: email {job.email_sent}/{job.email_failed}, "
+                  f"telegram {job.telegram_sent}/{job.telegram_failed} (отправлено/ошибок)")
+    except Exception as e:
+        print(f"[BROADCAST] Ошибка задачи #{job_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        try:
+            with app.app_context():
+                db.session.rollback()
+                _finish_job(job_id, 'FAILED', str(e)[:1000])
+        except Exception:
+            pass
+    finally:
+        with _running_lock:
+            _running_jobs.discard(job_id)
+
+
+__all__ = [
+    'TelegramRateLimiter',
+    'RedisTelegramRateLimiter',
+    'get_telegram_rate_limiter',
+    'send_telegram',
+    'send_telegram_limited',
+    'pin_telegram',
+    'create_broadcast_job',
+    'start_broadcast_job',
+    'resume_broadcast_jobs'
+]
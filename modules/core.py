@@ -5,7 +5,7 @@
 
 from flask import Flask
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
@@ -181,7 +181,30 @@ def init_app(flask_app):
         print("⚠️  Кэширование: отключено (null cache)")
     
     cache = Cache(app)
-    limiter = Limiter(get_remote_address, app=app, default_limits=["2000 per day", "500 per hour"], storage_uri="memory://")
+
+    # За nginx: IP клиента и схема - из X-Forwarded-* (число доверенных прокси). По умолчанию 0:
+    # без прокси клиент подставлял бы X-Forwarded-For сам и обходил лимиты по IP
+    proxy_count = int(os.getenv("PROXY_FIX_X_FOR", "0"))
+    if proxy_count > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count)
+
+    # Лимиты запросов: общий Redis, moving-window, ключ - пользователь (см. modules/rate_limit.py)
+    from modules.rate_limit import get_storage_uri, rate_limit_key, on_rate_limit_breach
+    storage_uri = get_storage_uri(app)
+    app.config.setdefault('RATELIMIT_STRATEGY', os.getenv("RATELIMIT_STRATEGY", "moving-window"))
+    limiter = Limiter(
+        rate_limit_key,
+        app=app,
+        default_limits=["2000 per day", "500 per hour"],
+        storage_uri=storage_uri,
+        strategy=app.config['RATELIMIT_STRATEGY'],
+        key_prefix="stealthnet",
+        on_breach=on_rate_limit_breach,
+        # Redis недоступен - лимиты в памяти воркера, а не ошибка 500
+        swallow_errors=True,
+        in_memory_fallback_enabled=storage_uri != "memory://"
+    )
+    print(f"✅ Лимиты запросов: {storage_uri.split('://')[0]} ({app.config['RATELIMIT_STRATEGY']})")
 
     # CORS
     # Временно отключаем CORS для отладки
@@ -1,11 +1,19 @@
 """
-Модуль валют - реэкспорт из modules.models.currency
+Модуль валют: курсы и конвертация
 
-DEPRECATED: Используйте modules.models.currency напрямую
+Таблица курсов загружается из CurrencyRate один раз и хранится в памяти воркера
+(через modules.settings_registry); /api/admin/currency-rates сбрасывает ее после
+сохранения. Конвертации не обращаются к БД.
 """
-from modules.models.currency import CurrencyRate
+from types import MappingProxyType
 from datetime import datetime
 
+from modules.core import get_db
+from modules.models.currency import CurrencyRate
+from modules.settings_registry import get_settings, register_settings
+
+db = get_db()
+
 
 # Курсы валют по умолчанию (к USD) - сколько единиц валюты за 1 USD
 DEFAULT_RATES = {
@@ -17,12 +25,25 @@ DEFAULT_RATES = {
 }
 
 
+def _load_rate_table():
+    """Курсы по умолчанию, перекрытые курсами из БД"""
+    rates = dict(DEFAULT_RATES)
+    for currency, rate_to_usd in db.session.query(CurrencyRate.currency, CurrencyRate.rate_to_usd):
+        rates[currency.upper()] = rate_to_usd
+    return MappingProxyType(rates)
+
+
+register_settings('currency_rates', _load_rate_table)
+
+
+def get_rate_table():
+    """Таблица курсов {валюта: единиц за 1 USD} (только чтение)"""
+    return get_settings('currency_rates')
+
+
 def get_currency_rate(currency):
     """Получить курс валюты к USD (сколько единиц валюты за 1 USD)"""
-    rate = CurrencyRate.query.filter_by(currency=currency.upper()).first()
-    if rate:
-        return rate.rate_to_usd
-    return DEFAULT_RATES.get(currency.upper(), 1.0)
+    return get_rate_table().get(currency.upper(), 1.0)
 
 
 def convert_to_usd(amount, from_currency):
@@ -41,6 +62,39 @@ def convert_from_usd(amount_usd, to_currency):
     return amount_usd
 
 
+def convert_many(amounts, currencies, to_usd=False):
+    """
+    Конвертировать список сумм за один проход по таблице курсов
+
+    Args:
+        amounts: суммы
+        currencies: валюта для каждой суммы или одна валюта для всех
+        to_usd: True - суммы в currencies переводятся в USD,
+                False - суммы в USD переводятся в currencies
+
+    Returns:
+        list: суммы в том же порядке
+    """
+    table = get_rate_table()
+    rates = {}
+
+    def rate_for(currency):
+        rate = rates.get(currency)
+        if rate is None:
+            rate = rates[currency] = table.get(currency.upper(), 1.0) or 1.0
+        return rate
+
+    if isinstance(currencies, str):
+        rate = rate_for(currencies)
+        if to_usd:
+            return [amount / rate for amount in amounts]
+        return [amount * rate for amount in amounts]
+
+    if to_usd:
+        return [amount / rate_for(currency) for amount, currency in zip(amounts, currencies)]
+    return [amount * rate_for(currency) for amount, currency in zip(amounts, currencies)]
+
+
 def parse_iso_datetime(date_str):
     """Парсит ISO datetime строку"""
     if not date_str:
@@ -53,8 +107,10 @@ def parse_iso_datetime(date_str):
 
 __all__ = [
     'CurrencyRate',
+    'get_rate_table',
     'get_currency_rate',
     'convert_to_usd',
     'convert_from_usd',
+    'convert_many',
     'parse_iso_datetime'
 ]
@@ -2,5 +2,15 @@
 Модуль для генерации изображений для бота
 """
 from .tariff_image import generate_tariff_image
+from .cache import (
+    get_tariff_image,
+    clear_tariff_image_cache,
+    TARIFF_IMAGE_EXTENSION
+)
 
-__all__ = ['generate_tariff_image']
+__all__ = [
+    'generate_tariff_image',
+    'get_tariff_image',
+    'clear_tariff_image_cache',
+    'TARIFF_IMAGE_EXTENSION'
+]
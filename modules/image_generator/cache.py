@@ -0,0 +1,146 @@
+"""
+Кеш готовых изображений тарифов
+
+Картинка адресуется по содержимому: ключ - sha256 от всего, что на ней нарисовано
+(tier, валюта, функции, цены, цвет). Поэтому при изменении тарифов или брендинга
+меняется ключ и старая картинка просто перестает использоваться - явный сброс не нужен.
+
+Уровни кеша:
+- в памяти (LRU) - bytes изображения;
+- на диске (TARIFF_IMAGE_CACHE_DIR) - переживает перезапуск бота.
+
+file_id Telegram для отправленной картинки хранит modules.telegram_media_cache
+(ключ - хеш содержимого), поэтому повторный показ не передает байты.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .tariff_image import generate_tariff_image, IMAGE_FORMATS
+
+# Версия отрисовки: увеличить при изменении внешнего вида, чтобы не отдавать старые картинки
+RENDER_VERSION = 2
+
+TARIFF_IMAGE_CACHE_DIR = os.getenv(
+    "TARIFF_IMAGE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "stealthnet_tariff_images")
+)
+# PNG, JPEG или WEBP
+TARIFF_IMAGE_FORMAT = os.getenv("TARIFF_IMAGE_FORMAT", "PNG").upper()
+if TARIFF_IMAGE_FORMAT not in IMAGE_FORMATS:
+    TARIFF_IMAGE_FORMAT = "PNG"
+TARIFF_IMAGE_EXTENSION = IMAGE_FORMATS[TARIFF_IMAGE_FORMAT]
+MEMORY_CACHE_SIZE = 32
+DISK_CACHE_SIZE = 200
+
+PRICE_FIELDS = {
+    "uah": "price_uah",
+    "rub": "price_rub",
+    "usd": "price_usd"
+}
+
+_lock = threading.Lock()
+_memory_cache = OrderedDict()  # key -> bytes
+
+
+def tariff_image_cache_key(tier_name, tier_icon, features, tariffs, currency, currency_symbol, primary_color):
+    """Ключ кеша: хеш от нормализованных данных, которые попадают на картинку"""
+    price_field = PRICE_FIELDS.get(currency, "price_uah")
+    payload = {
+        "v": RENDER_VERSION,
+        "format": TARIFF_IMAGE_FORMAT,
+        "tier": [tier_name, tier_icon],
+        "features": [[f.get("icon"), f.get("name")] for f in features or []],
+        "tariffs": [
+            [t.get("name"), t.get("duration_days", 0), t.get(price_field, 0)]
+            for t in tariffs or []
+        ],
+        "currency": [currency, currency_symbol],
+        "color": list(primary_color)
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _disk_path(key):
+    return os.path.join(TARIFF_IMAGE_CACHE_DIR, f"{key}.{TARIFF_IMAGE_EXTENSION}")
+
+
+def _remember(key, image_bytes):
+    with _lock:
+        _memory_cache[key] = image_bytes
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def _write_disk(key, image_bytes):
+    """Атомарная запись на диск + удаление самых старых файлов сверх лимита"""
+    try:
+        os.makedirs(TARIFF_IMAGE_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=TARIFF_IMAGE_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, _disk_path(key))
+
+        files = [
+            os.path.join(TARIFF_IMAGE_CACHE_DIR, name)
+            for name in os.listdir(TARIFF_IMAGE_CACHE_DIR)
+            if name.endswith(f".{TARIFF_IMAGE_EXTENSION}")
+        ]
+        if len(files) > DISK_CACHE_SIZE:
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - DISK_CACHE_SIZE]:
+                os.remove(path)
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить изображение тарифа в кеш: {e}")
+
+
+def get_tariff_image(tier_name, tier_icon, features, tariffs, currency, currency_symbol,
+                     primary_color=(63, 105, 255)):
+    """
+    Получить изображение тарифа из кеша или сгенерировать
+
+    Принимает те же аргументы, что generate_tariff_image; формат задается TARIFF_IMAGE_FORMAT.
+
+    Returns:
+        bytes: изображение
+    """
+    key = tariff_image_cache_key(tier_name, tier_icon, features, tariffs, currency, currency_symbol, primary_color)
+
+    with _lock:
+        image_bytes = _memory_cache.get(key)
+        if image_bytes is not None:
+            _memory_cache.move_to_end(key)
+            return image_bytes
+
+    try:
+        with open(_disk_path(key), "rb") as f:
+            image_bytes = f.read()
+    except OSError:
+        image_bytes = None
+
+    if image_bytes is None:
+        image_bytes = generate_tariff_image(
+            tier_name=tier_name,
+            tier_icon=tier_icon,
+            features=features,
+            tariffs=tariffs,
+            currency=currency,
+            currency_symbol=currency_symbol,
+            primary_color=primary_color,
+            image_format=TARIFF_IMAGE_FORMAT
+        )
+        _write_disk(key, image_bytes)
+
+    _remember(key, image_bytes)
+    return image_bytes
+
+
+def clear_tariff_image_cache():
+    """Сбросить кеш в памяти (файлы на диске перезапишутся по новым ключам)"""
+    with _lock:
+        _memory_cache.clear()
@@ -1,10 +1,17 @@
 """
 Модуль для генерации изображений тарифов
 """
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from io import BytesIO
 import re
 
+# Поддерживаемые форматы вывода -> расширение файла
+IMAGE_FORMATS = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "WEBP": "webp"
+}
+
 
 def remove_emoji(text):
     """Удаляет emoji из текста, так как PIL их не поддерживает"""
@@ -103,45 +110,79 @@ def draw_rounded_rectangle(draw, xy, radius, fill=None, outline=None, width=1):
 
 
 def draw_shadow(img, draw, xy, radius, shadow_color=(0, 0, 0), shadow_opacity=20, blur_size=8):
-    """Рисует тень для скругленного прямоугольника"""
+    """
+    Рисует мягкую тень для скругленного прямоугольника
+
+    Маска тени размывается один раз (GaussianBlur) и только в пределах карточки
+    с запасом на размытие, а не слоями во весь размер изображения.
+    """
     x1, y1, x2, y2 = xy
-    
-    # Создаем временное изображение для тени
-    shadow_img = Image.new('RGBA', (img.width, img.height), (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow_img)
-    
-    # Рисуем тень большего размера
     offset = blur_size // 2
-    shadow_x1 = x1 + offset
-    shadow_y1 = y1 + offset
-    shadow_x2 = x2 + offset
-    shadow_y2 = y2 + offset
-    
-    # Рисуем скругленный прямоугольник для тени
-    shadow_fill = (*shadow_color, shadow_opacity)
-    draw_rounded_rectangle(shadow_draw, (shadow_x1, shadow_y1, shadow_x2, shadow_y2), 
-                          radius, fill=shadow_fill, outline=None)
-    
-    # Применяем размытие (простая имитация через несколько слоев)
-    for i in range(blur_size):
-        alpha = shadow_opacity // (blur_size + 1) * (blur_size - i)
-        if alpha > 0:
-            temp_img = Image.new('RGBA', (img.width, img.height), (0, 0, 0, 0))
-            temp_draw = ImageDraw.Draw(temp_img)
-            offset2 = i
-            draw_rounded_rectangle(temp_draw, 
-                                  (shadow_x1 + offset2, shadow_y1 + offset2, 
-                                   shadow_x2 + offset2, shadow_y2 + offset2),
-                                  radius, fill=(*shadow_color, alpha), outline=None)
-            shadow_img = Image.alpha_composite(shadow_img, temp_img)
-    
-    # Накладываем тень на основное изображение
-    img.paste(shadow_img, (0, 0), shadow_img)
-    # Восстанавливаем draw после изменения изображения
-    draw = ImageDraw.Draw(img)
+    margin = blur_size * 2
+
+    # Маска размером с карточку + поля под размытие
+    mask_w = x2 - x1 + margin * 2
+    mask_h = y2 - y1 + margin * 2
+    mask = Image.new('L', (mask_w, mask_h), 0)
+    draw_rounded_rectangle(
+        ImageDraw.Draw(mask),
+        (margin, margin, margin + x2 - x1, margin + y2 - y1),
+        radius,
+        fill=shadow_opacity,
+        outline=None
+    )
+    mask = mask.filter(ImageFilter.GaussianBlur(blur_size / 2))
+
+    # Накладываем цвет тени через маску со смещением
+    left = x1 + offset - margin
+    top = y1 + offset - margin
+    img.paste(shadow_color, (left, top, left + mask_w, top + mask_h), mask)
     return draw
 
 
+def _gradient_background(width, height, bg_color, primary_color):
+    """
+    Градиентный фон: одна колонка высотой с изображение растягивается по ширине
+
+    Цвет строки i тот же, что при построчной отрисовке, но без width*height операций в Python.
+    """
+    column = []
+    for i in range(height):
+        # Двойной градиент для более красивого эффекта
+        progress = i / height
+        # Первый градиент (сверху)
+        alpha1 = min(0.12, progress * 0.12)
+        # Второй градиент (снизу, обратный)
+        alpha2 = min(0.08, (1 - progress) * 0.08)
+        alpha = alpha1 + alpha2
+        column.append(tuple(
+            int(bg_color[j] * (1 - alpha) + primary_color[j] * alpha)
+            for j in range(3)
+        ))
+
+    strip = Image.new('RGB', (1, height))
+    strip.putdata(column)
+    return strip.resize((width, height), Image.NEAREST)
+
+
+def encode_image(img, image_format="PNG"):
+    """
+    Кодирует изображение в bytes
+
+    PNG сохраняется с compress_level=6 без optimize: optimize перебирает
+    параметры сжатия и в разы медленнее при выигрыше в единицы процентов.
+    """
+    image_format = image_format.upper()
+    output = BytesIO()
+    if image_format == "JPEG":
+        img.save(output, format="JPEG", quality=90, subsampling=0)
+    elif image_format == "WEBP":
+        img.save(output, format="WEBP", quality=90, method=4)
+    else:
+        img.save(output, format="PNG", compress_level=6)
+    return output.getvalue()
+
+
 def generate_tariff_image(
     tier_name: str,
     tier_icon: str,
@@ -149,7 +190,8 @@ def generate_tariff_image(
     tariffs: list,
     currency: str,
     currency_symbol: str,
-    primary_color: tuple = (63, 105, 255)  # Синий цвет по умолчанию #3f69ff
+    primary_color: tuple = (63, 105, 255),  # Синий цвет по умолчанию #3f69ff
+    image_format: str = "PNG"
 ) -> bytes:
     """
     Генерирует красивое изображение тарифа
@@ -162,9 +204,10 @@ def generate_tariff_image(
         currency: Код валюты (uah, rub, usd)
         currency_symbol: Символ валюты (₴, ₽, $)
         primary_color: Основной цвет (RGB tuple)
+        image_format: Формат вывода (PNG, JPEG, WEBP)
     
     Returns:
-        bytes: PNG изображение в виде bytes
+        bytes: изображение в виде bytes
     """
     # Размеры изображения
     width = 1400
@@ -192,25 +235,9 @@ def generate_tariff_image(
     total_height = header_height + features_section_height + tariffs_table_height + padding * 2 + card_spacing * 3
     
     # Создаем изображение с градиентным фоном
-    img = Image.new('RGB', (width, total_height), color=bg_color)
+    img = _gradient_background(width, total_height, bg_color, primary_color)
     draw = ImageDraw.Draw(img)
     
-    # Рисуем улучшенный градиентный фон (более плавный и выразительный)
-    for i in range(total_height):
-        # Двойной градиент для более красивого эффекта
-        progress = i / total_height
-        # Первый градиент (сверху)
-        alpha1 = min(0.12, progress * 0.12)
-        # Второй градиент (снизу, обратный)
-        alpha2 = min(0.08, (1 - progress) * 0.08)
-        alpha = alpha1 + alpha2
-        
-        color = tuple(
-            int(bg_color[j] * (1 - alpha) + primary_color[j] * alpha)
-            for j in range(3)
-        )
-        draw.line([(0, i), (width, i)], fill=color)
-    
     y = padding
     
     # ========== ЗАГОЛОВОК ==========
@@ -218,22 +245,14 @@ def generate_tariff_image(
     header_y = y
     
     # Рисуем тень для заголовка (улучшенная)
-    shadow_offset = 6
-    shadow_blur = 12
-    for i in range(shadow_blur):
-        alpha = 8 * (1 - i / shadow_blur)
-        shadow_r = int(shadow_color[0] * alpha / 255)
-        shadow_g = int(shadow_color[1] * alpha / 255)
-        shadow_b = int(shadow_color[2] * alpha / 255)
-        shadow_fill = (shadow_r, shadow_g, shadow_b)
-        draw_rounded_rectangle(
-            draw,
-            (padding + shadow_offset + i, header_y + shadow_offset + i,
-             width - padding + shadow_offset + i, header_y + header_card_height + shadow_offset + i),
-            radius=corner_radius,
-            fill=shadow_fill,
-            outline=None
-        )
+    draw_shadow(
+        img, draw,
+        (padding, header_y, width - padding, header_y + header_card_height),
+        radius=corner_radius,
+        shadow_color=shadow_color,
+        shadow_opacity=40,
+        blur_size=12
+    )
     
     # Рисуем карточку заголовка с градиентом
     draw_rounded_rectangle(
@@ -269,22 +288,14 @@ def generate_tariff_image(
         features_y = y
         
         # Тень для карточки функций
-        shadow_offset = 4
-        shadow_blur = 10
-        for i in range(shadow_blur):
-            alpha = 6 * (1 - i / shadow_blur)
-            shadow_r = int(shadow_color[0] * alpha / 255)
-            shadow_g = int(shadow_color[1] * alpha / 255)
-            shadow_b = int(shadow_color[2] * alpha / 255)
-            shadow_fill = (shadow_r, shadow_g, shadow_b)
-            draw_rounded_rectangle(
-                draw,
-                (padding + shadow_offset + i, features_y + shadow_offset + i,
-                 width - padding + shadow_offset + i, features_y + features_card_height + shadow_offset + i),
-                radius=corner_radius,
-                fill=shadow_fill,
-                outline=None
-            )
+        draw_shadow(
+            img, draw,
+            (padding, features_y, width - padding, features_y + features_card_height),
+            radius=corner_radius,
+            shadow_color=shadow_color,
+            shadow_opacity=30,
+            blur_size=10
+        )
         
         draw_rounded_rectangle(
             draw,
@@ -555,7 +566,4 @@ def generate_tariff_image(
         y += row_height
     
     # Сохраняем в bytes
-    output = BytesIO()
-    img.save(output, format='PNG', optimize=True, quality=95)
-    output.seek(0)
-    return output.getvalue()
+    return encode_image(img, image_format)
@@ -6,29 +6,37 @@ SQLAlchemy модели для StealthNET
 """
 
 from modules.models.user import User
-from modules.models.payment import Payment, PaymentSetting
+from modules.models.payment import Payment, PaymentSetting, DailyRevenue
 from modules.models.tariff import Tariff
 from modules.models.promo import PromoCode
 from modules.models.ticket import Ticket, TicketMessage
 from modules.models.system import SystemSetting
 from modules.models.branding import BrandingSetting
 from modules.models.bot_config import BotConfig
-from modules.models.referral import ReferralSetting
+from modules.models.referral import ReferralSetting, ReferralCommission, ReferralStats, ReferralEarning
 from modules.models.currency import CurrencyRate
 from modules.models.tariff_feature import TariffFeatureSetting
 from modules.models.trial import TrialSettings
+from modules.models.remnawave_user import RemnaWaveUserState
+from modules.models.broadcast import BroadcastJob, BroadcastRecipient
+from modules.models.schema_version import SchemaVersion
+from modules.models.payment_job import PaymentFulfilmentJob
 
 __all__ = [
     'User',
-    'Payment', 'PaymentSetting',
+    'Payment', 'PaymentSetting', 'DailyRevenue',
     'Tariff',
     'PromoCode',
     'Ticket', 'TicketMessage',
     'SystemSetting',
     'BrandingSetting',
     'BotConfig',
-    'ReferralSetting',
+    'ReferralSetting', 'ReferralCommission', 'ReferralStats', 'ReferralEarning',
     'CurrencyRate',
     'TariffFeatureSetting',
-    'TrialSettings'
+    'TrialSettings',
+    'RemnaWaveUserState',
+    'BroadcastJob', 'BroadcastRecipient',
+    'SchemaVersion',
+    'PaymentFulfilmentJob'
 ]
@@ -0,0 +1,98 @@
+"""
+Модели задач ручной рассылки (админка)
+
+Задача рассылки хранится в БД вместе со статусом каждого получателя,
+поэтому прогресс доступен через API, а прерванная рассылка продолжается
+с неотправленных получателей. Одновременно задачу рассылает один процесс -
+тот, что взял ее в аренду (lease_owner, lease_expires_at).
+"""
+from datetime import datetime, timezone
+from modules.core import get_db
+
+db = get_db()
+
+
+class BroadcastJob(db.Model):
+    """Задача рассылки"""
+    __tablename__ = 'broadcast_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='PENDING')  # PENDING, RUNNING, DONE, FAILED
+
+    broadcast_type = db.Column(db.String(10), nullable=False, default='email')  # 'email', 'telegram', 'both'
+    bot_type = db.Column(db.String(10), nullable=False, default='old')  # 'old', 'new'
+    recipient_type = db.Column(db.String(20), nullable=True)
+    subject = db.Column(db.Text, nullable=True)
+    message = db.Column(db.Text, nullable=False)
+    pin_message = db.Column(db.Boolean, default=False)
+
+    # Фото загружается в Telegram один раз, дальше отправляется по file_id
+    photo = db.Column(db.LargeBinary, nullable=True)
+    photo_filename = db.Column(db.String(255), nullable=True)
+    photo_file_id = db.Column(db.String(255), nullable=True)
+
+    total = db.Column(db.Integer, default=0)
+    email_sent = db.Column(db.Integer, default=0)
+    email_failed = db.Column(db.Integer, default=0)
+    telegram_sent = db.Column(db.Integer, default=0)
+    telegram_failed = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+    # Аренда задачи: рассылает только процесс lease_owner, пока не истек lease_expires_at
+    lease_owner = db.Column(db.String(64), nullable=True)  # host:pid
+    lease_expires_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        processed = (self.email_sent or 0) + (self.email_failed or 0) + (self.telegram_sent or 0) + (self.telegram_failed or 0)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'broadcast_type': self.broadcast_type,
+            'bot_type': self.bot_type,
+            'recipient_type': self.recipient_type,
+            'subject': self.subject,
+            'has_photo': bool(self.photo or self.photo_file_id),
+            'pin_message': self.pin_message,
+            'total': self.total or 0,
+            'processed': processed,
+            'progress': round(processed / self.total * 100, 1) if self.total else 100.0,
+            'email': {'sent': self.email_sent or 0, 'failed': self.email_failed or 0},
+            'telegram': {'sent': self.telegram_sent or 0, 'failed': self.telegram_failed or 0},
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class BroadcastRecipient(db.Model):
+    """Получатель рассылки (одна строка на пользователя и канал)"""
+    __tablename__ = 'broadcast_recipient'
+    __table_args__ = (
+        db.Index('ix_broadcast_recipient_job_id_status', 'job_id', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('broadcast_job.id'), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    channel = db.Column(db.String(10), nullable=False)  # 'email', 'telegram'
+    target = db.Column(db.String(255), nullable=False)  # email или telegram chat_id
+    status = db.Column(db.String(10), nullable=False, default='PENDING')  # PENDING, SENT, FAILED
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'channel': self.channel,
+            'target': self.target,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error
+        }
@@ -3,6 +3,7 @@
 """
 from datetime import datetime, timezone
 from modules.core import get_db, get_fernet
+from sqlalchemy import event
 
 db = get_db()
 fernet = get_fernet()
@@ -68,6 +69,11 @@ class PaymentSetting(db.Model):
 
 class Payment(db.Model):
     """Платёж"""
+    __table_args__ = (
+        db.Index('ix_payment_user_id_created_at', 'user_id', 'created_at'),  # История платежей пользователя
+        db.Index('ix_payment_status_created_at', 'status', 'created_at'),  # Продажи, статистика
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.String(100), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -75,11 +81,160 @@ class Payment(db.Model):
     status = db.Column(db.String(20), nullable=False, default='PENDING')
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(5), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    payment_system_id = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    payment_system_id = db.Column(db.String(100), nullable=True, index=True)
     payment_provider = db.Column(db.String(20), nullable=True, default='crystalpay')
     promo_code_id = db.Column(db.Integer, db.ForeignKey('promo_code.id'), nullable=True)
     telegram_message_id = db.Column(db.Integer, nullable=True)  # ID сообщения в Telegram боте о создании платежа
+    # Сверка статуса с платёжной системой (modules/payment_reconciler.py): время следующей
+    # проверки (None - через PAYMENT_RECONCILE_FIRST_DELAY после создания) и число проверок
+    reconcile_next_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    reconcile_checks = db.Column(db.Integer, nullable=True, default=0)
+
+
+class DailyRevenue(db.Model):
+    """
+    Дневная сводка выручки (дата, валюта, провайдер)
+
+    Поддерживается инкрементально событиями Payment: переход в PAID добавляет платеж
+    в сводку текущего дня (UTC), выход из PAID (возврат) - вычитает его в день возврата.
+    """
+    __tablename__ = 'daily_revenue'
+    __table_args__ = (
+        db.UniqueConstraint('date', 'currency', 'provider', name='uq_daily_revenue_date_currency_provider'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    currency = db.Column(db.String(5), nullable=False)
+    provider = db.Column(db.String(20), nullable=False, default='unknown')
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            'date': self.date.isoformat() if self.date else None,
+            'currency': self.currency,
+            'provider': self.provider,
+            'count': self.payments_count,
+            'amount': round(self.total_amount or 0.0, 2)
+        }
+
+
+def _bump_daily_revenue(connection, payment, sign):
+    """Добавить (sign=1) или вычесть (sign=-1) платеж в сводке текущего дня"""
+    table = DailyRevenue.__table__
+    now = datetime.now(timezone.utc)
+    values = {
+        'date': now.date(),
+        'currency': payment.currency or 'USD',
+        'provider': payment.payment_provider or 'unknown',
+        'payments_count': sign,
+        'total_amount': sign * (float(payment.amount) if payment.amount else 0.0),
+        'updated_at': now
+    }
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['date', 'currency', 'provider'],
+            set_={
+                'payments_count': table.c.payments_count + stmt.excluded.payments_count,
+                'total_amount': table.c.total_amount + stmt.excluded.total_amount,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        connection.execute(stmt)
+        return
+
+    # Прочие СУБД: UPDATE, при отсутствии строки - INSERT
+    result = connection.execute(
+        table.update().where(
+            (table.c.date == values['date']) &
+            (table.c.currency == values['currency']) &
+            (table.c.provider == values['provider'])
+        ).values(
+            payments_count=table.c.payments_count + values['payments_count'],
+            total_amount=table.c.total_amount + values['total_amount'],
+            updated_at=now
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**values))
+
+
+def _safe_bump_daily_revenue(connection, payment, sign):
+    # Ошибка сводки (например, таблица еще не создана) не должна откатывать сам платеж
+    try:
+        with connection.begin_nested():
+            _bump_daily_revenue(connection, payment, sign)
+    except Exception as e:
+        print(f"Warning: Failed to update daily_revenue for payment {payment.order_id}: {e}")
+
+
+@event.listens_for(Payment, 'after_insert')
+def add_paid_payment_to_daily_revenue(mapper, connection, target):
+    """Платеж создан сразу оплаченным (покупка с баланса, казино)"""
+    if target.status == 'PAID':
+        _safe_bump_daily_revenue(connection, target, 1)
+
+
+@event.listens_for(Payment, 'after_update')
+def update_daily_revenue_on_status_change(mapper, connection, target):
+    """Смена статуса платежа: в PAID - добавить в сводку, из PAID - вычесть"""
+    history = db.inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    old_status = history.deleted[0] if history.deleted else None
+    if old_status != 'PAID' and target.status == 'PAID':
+        _safe_bump_daily_revenue(connection, target, 1)
+    elif old_status == 'PAID' and target.status != 'PAID':
+        _safe_bump_daily_revenue(connection, target, -1)
+
+
+def rebuild_daily_revenue():
+    """
+    Пересобрать сводку из таблицы платежей (GROUP BY в БД)
+
+    Первоначальное заполнение - шаг миграции daily_revenue_backfill (run_schema_migrations.py,
+    до запуска воркеров). У старых платежей нет даты оплаты, поэтому они группируются
+    по дате создания.
+    """
+    day = db.func.date(Payment.created_at)
+    rows = db.session.query(
+        day,
+        Payment.currency,
+        Payment.payment_provider,
+        db.func.count(Payment.id),
+        db.func.coalesce(db.func.sum(Payment.amount), 0.0)
+    ).filter(
+        Payment.status == 'PAID'
+    ).group_by(day, Payment.currency, Payment.payment_provider).all()
+
+    merged = {}
+    for row_date, currency, provider, count, amount in rows:
+        if row_date is None:
+            continue
+        if isinstance(row_date, str):
+            row_date = datetime.strptime(row_date[:10], '%Y-%m-%d').date()
+        key = (row_date, currency or 'USD', provider or 'unknown')
+        prev = merged.get(key, (0, 0.0))
+        merged[key] = (prev[0] + count, prev[1] + float(amount or 0.0))
+
+    DailyRevenue.query.delete()
+    for (row_date, currency, provider), (count, amount) in merged.items():
+        db.session.add(DailyRevenue(
+            date=row_date, currency=currency, provider=provider,
+            payments_count=count, total_amount=amount
+        ))
+    db.session.commit()
+    return len(merged)
 
 
 def decrypt_key(key):
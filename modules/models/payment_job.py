@@ -0,0 +1,57 @@
+"""
+Задачи выдачи оплаченных заказов
+
+Вебхук платежной системы только проверяет уведомление и записывает задачу
+(одна задача на order_id), а тариф или пополнение баланса выдает пул воркеров
+с повторами (modules/payment_fulfilment.py).
+"""
+from datetime import datetime, timezone
+from modules.core import get_db
+
+db = get_db()
+
+
+class PaymentFulfilmentJob(db.Model):
+    """Задача выдачи заказа"""
+    __tablename__ = 'payment_fulfilment_job'
+    __table_args__ = (
+        db.Index('ix_payment_fulfilment_job_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.String(100), unique=True, nullable=False)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'), nullable=False)
+    source = db.Column(db.String(30), nullable=True)  # 'yookassa', 'heleket', ... - кто записал задачу
+    notify_user = db.Column(db.Boolean, default=True)
+    status = db.Column(db.String(10), nullable=False, default='PENDING')  # PENDING, RUNNING, DONE, FAILED
+
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    locked_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)  # host:pid воркера
+    error = db.Column(db.Text, nullable=True)
+    # Срок подписки, который выдача тарифа отправляет в RemnaWave: записывается до PATCH,
+    # повтор задачи отправляет тот же expireAt и не продлевает подписку второй раз
+    target_expire_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'payment_id': self.payment_id,
+            'source': self.source,
+            'status': self.status,
+            'attempts': self.attempts or 0,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'locked_at': self.locked_at.isoformat() if self.locked_at else None,
+            'locked_by': self.locked_by,
+            'error': self.error,
+            'target_expire_at': self.target_expire_at.isoformat() if self.target_expire_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -1,7 +1,10 @@
 """
-Модель реферальных настроек
+Модели реферальной программы: настройки, журнал начислений и статистика
 """
+from datetime import datetime, timezone
+from sqlalchemy import event
 from modules.core import get_db
+from modules.models.user import User
 
 db = get_db()
 
@@ -20,3 +23,154 @@ def get_referral_settings():
     return ReferralSetting.query.first()
 
 
+# ============================================================================
+# НАЧИСЛЕНИЯ И СТАТИСТИКА РЕФЕРЕРОВ
+# ============================================================================
+# Журнал начислений пишется в одной транзакции с пополнением баланса реферера,
+# а статистика (modules/referral_ledger.py) обновляется вместе с ним - страница
+# рефералов читает готовые суммы, не пересчитывая журнал.
+
+class ReferralCommission(db.Model):
+    """Начисление рефереру с покупки или пополнения реферала (журнал, только добавление)"""
+    __tablename__ = 'referral_commission'
+    __table_args__ = (
+        db.Index('ix_referral_commission_referrer_id_created_at', 'referrer_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    referral_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # None - реферал удален
+    payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'), unique=True, nullable=True)  # одно начисление на платеж
+    kind = db.Column(db.String(10), nullable=False, default='TARIFF')  # TARIFF, TOPUP
+    source_amount = db.Column(db.Float, nullable=False)  # сумма покупки, USD
+    percent = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)  # начислено, USD
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'referral_id': self.referral_id,
+            'payment_id': self.payment_id,
+            'kind': self.kind,
+            'source_amount': self.source_amount,
+            'percent': self.percent,
+            'amount': self.amount,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class ReferralStats(db.Model):
+    """Итоги реферера: число приглашенных и заработанное"""
+    __tablename__ = 'referral_stats'
+
+    referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    referrals_count = db.Column(db.Integer, nullable=False, default=0)
+    commissions_count = db.Column(db.Integer, nullable=False, default=0)
+    total_earned = db.Column(db.Float, nullable=False, default=0.0)
+    # Заработано за 30 дней, окно считается днями: earned_30d верно для дня earned_30d_day
+    earned_30d = db.Column(db.Float, nullable=False, default=0.0)
+    earned_30d_day = db.Column(db.Date, nullable=True)
+    last_commission_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+class ReferralEarning(db.Model):
+    """Итоги по одному приглашенному: строка списка рефералов"""
+    __tablename__ = 'referral_earning'
+    __table_args__ = (
+        db.Index('ix_referral_earning_referrer_id_joined_at', 'referrer_id', 'joined_at'),
+    )
+
+    referral_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)  # у реферала один реферер
+    referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    joined_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    commissions_count = db.Column(db.Integer, nullable=False, default=0)
+    total_earned = db.Column(db.Float, nullable=False, default=0.0)
+    last_commission_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+def upsert_counters(connection, table, key, values, increments, updates=None):
+    """
+    Прибавить increments к строке таблицы по ключу key, при отсутствии строки - вставить values
+
+    increments - {колонка: приращение}, updates - колонки, которые перезаписываются у существующей строки.
+    """
+    columns = table.c
+    set_ = {name: columns[name] + delta for name, delta in increments.items()}
+    set_.update(updates or {})
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**values).on_conflict_do_update(index_elements=list(key), set_=set_)
+        connection.execute(stmt)
+        return
+
+    # Прочие СУБД: UPDATE, при отсутствии строки - INSERT
+    condition = db.and_(*[columns[name] == values[name] for name in key])
+    result = connection.execute(table.update().where(condition).values(**set_))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**values))
+
+
+def _move_referral(connection, referral_id, old_referrer_id, new_referrer_id, joined_at):
+    """Перенести приглашенного от старого реферера к новому в статистике"""
+    now = datetime.now(timezone.utc)
+    stats = ReferralStats.__table__
+    if old_referrer_id:
+        connection.execute(
+            ReferralEarning.__table__.delete().where(ReferralEarning.__table__.c.referral_id == referral_id)
+        )
+        connection.execute(
+            stats.update().where(stats.c.referrer_id == old_referrer_id).values(
+                referrals_count=db.case((stats.c.referrals_count > 0, stats.c.referrals_count - 1), else_=0),
+                updated_at=now
+            )
+        )
+    if new_referrer_id:
+        upsert_counters(
+            connection, ReferralEarning.__table__, ('referral_id',),
+            {'referral_id': referral_id, 'referrer_id': new_referrer_id, 'joined_at': joined_at or now,
+             'commissions_count': 0, 'total_earned': 0.0},
+            {},
+            {'referrer_id': new_referrer_id, 'joined_at': joined_at or now,
+             'commissions_count': 0, 'total_earned': 0.0, 'last_commission_at': None}
+        )
+        upsert_counters(
+            connection, stats, ('referrer_id',),
+            {'referrer_id': new_referrer_id, 'referrals_count': 1, 'commissions_count': 0,
+             'total_earned': 0.0, 'earned_30d': 0.0, 'updated_at': now},
+            {'referrals_count': 1},
+            {'updated_at': now}
+        )
+
+
+def _safe_move_referral(connection, target, old_referrer_id):
+    # Ошибка статистики (например, таблица еще не создана) не должна откатывать регистрацию
+    try:
+        with connection.begin_nested():
+            _move_referral(connection, target.id, old_referrer_id, target.referrer_id, target.created_at)
+    except Exception as e:
+        print(f"[REFERRAL] Warning: Failed to update referral stats for user {target.id}: {e}")
+
+
+@event.listens_for(User, 'after_insert')
+def add_referral_to_stats(mapper, connection, target):
+    """Регистрация по реферальной ссылке (сайт)"""
+    if target.referrer_id:
+        _safe_move_referral(connection, target, None)
+
+
+@event.listens_for(User, 'after_update')
+def update_referral_stats_on_referrer_change(mapper, connection, target):
+    """Реферер назначен после создания пользователя (бот) или изменен"""
+    history = db.inspect(target).attrs.referrer_id.history
+    if not history.has_changes():
+        return
+    old_referrer_id = history.deleted[0] if history.deleted else None
+    if old_referrer_id != target.referrer_id:
+        _safe_move_referral(connection, target, old_referrer_id)
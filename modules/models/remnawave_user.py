@@ -0,0 +1,48 @@
+"""
+Локальное зеркало состояния пользователей RemnaWave
+
+Заполняется фоновой синхронизацией (постраничный обход /api/users) и обновляется
+на месте при записи в RemnaWave (покупка, триал, промокод, казино).
+"""
+from modules.core import get_db
+from datetime import datetime, timezone
+import json
+
+db = get_db()
+
+
+class RemnaWaveUserState(db.Model):
+    """Снимок пользователя RemnaWave"""
+    __tablename__ = 'remnawave_user_state'
+
+    uuid = db.Column(db.String(128), primary_key=True)
+    short_uuid = db.Column(db.String(64), nullable=True, index=True)
+    username = db.Column(db.String(255), nullable=True, index=True)
+    email = db.Column(db.String(255), nullable=True, index=True)
+    telegram_id = db.Column(db.String(64), nullable=True, index=True)
+
+    # Подписка
+    status = db.Column(db.String(32), nullable=True)
+    expire_at = db.Column(db.DateTime(timezone=True), nullable=True, index=True)
+    used_traffic_bytes = db.Column(db.BigInteger, nullable=True)
+    traffic_limit_bytes = db.Column(db.BigInteger, nullable=True)
+    hwid_device_limit = db.Column(db.Integer, nullable=True)
+    active_squads = db.Column(db.Text, nullable=True)  # JSON список UUID сквадов
+    subscription_url = db.Column(db.Text, nullable=True)
+
+    # Полный ответ RemnaWave (JSON) - отдается клиентам как раньше live_data
+    data = db.Column(db.Text, nullable=False)
+    synced_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+
+    def get_data(self):
+        """Полный словарь пользователя RemnaWave"""
+        try:
+            return json.loads(self.data) if self.data else {}
+        except (TypeError, ValueError):
+            return {}
+
+    def get_squad_uuids(self):
+        try:
+            return json.loads(self.active_squads) if self.active_squads else []
+        except (TypeError, ValueError):
+            return []
@@ -0,0 +1,23 @@
+"""
+Примененные миграции схемы базы данных
+
+Одна строка на шаг из run_schema_migrations.SCHEMA_MIGRATIONS. При запуске
+читается только MAX(version): если она не меньше последней версии, миграции
+не выполняются.
+"""
+from modules.core import get_db
+from datetime import datetime, timezone
+
+db = get_db()
+
+
+class SchemaVersion(db.Model):
+    """Примененный шаг миграции"""
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(128), nullable=False)
+    applied_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version} {self.name}>'
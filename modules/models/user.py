@@ -4,8 +4,6 @@
 from datetime import datetime, timezone
 from modules.core import get_db
 from sqlalchemy import event
-import os
-import requests
 
 db = get_db()
 
@@ -14,10 +12,10 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=True)
     password_hash = db.Column(db.String(128), nullable=True)
     encrypted_password = db.Column(db.Text, nullable=True)
-    role = db.Column(db.String(20), nullable=False, default='CLIENT')
-    remnawave_uuid = db.Column(db.String(100), nullable=True)
+    role = db.Column(db.String(20), nullable=False, default='CLIENT', index=True)
+    remnawave_uuid = db.Column(db.String(100), nullable=True, index=True)
     referral_code = db.Column(db.String(20), unique=True, nullable=True)
-    referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     is_verified = db.Column(db.Boolean, default=False)
     verification_token = db.Column(db.String(100), nullable=True)
     balance = db.Column(db.Float, default=0.0)
@@ -38,10 +36,6 @@ class User(db.Model):
 
 
 # Автоматическая синхронизация telegramId в RemnaWave при изменении telegram_id
-from sqlalchemy import event
-import os
-import requests
-
 @event.listens_for(User, 'after_update')
 def sync_telegram_id_to_remnawave(mapper, connection, target):
     """Автоматически синхронизирует telegramId в RemnaWave при изменении telegram_id"""
@@ -54,17 +48,11 @@ def sync_telegram_id_to_remnawave(mapper, connection, target):
         # Если значение изменилось, обновляем в RemnaWave
         if old_value != new_value:
             try:
-                API_URL = os.getenv('API_URL')
-                ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+                from modules.remnawave import get_remnawave_client
+                rw = get_remnawave_client()
                 
-                if API_URL and ADMIN_TOKEN:
-                    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
-                    requests.patch(
-                        f"{API_URL}/api/users",
-                        headers=headers,
-                        json={"uuid": target.remnawave_uuid, "telegramId": str(new_value) if new_value else None},
-                        timeout=10
-                    )
+                if rw.configured:
+                    rw.patch_user(target.remnawave_uuid, telegramId=str(new_value) if new_value else None)
                     print(f"✓ Synced telegramId to RemnaWave for user {target.id}: {old_value} -> {new_value}")
             except Exception as e:
                 print(f"Warning: Failed to sync telegramId to RemnaWave for user {target.id}: {e}")
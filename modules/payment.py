@@ -5,6 +5,7 @@ DEPRECATED: Используйте modules.models.payment напрямую
 """
 from modules.models.payment import Payment, PaymentSetting, decrypt_key
 from modules.core import get_db, get_fernet
+from modules.settings_registry import get_settings
 import uuid
 import os
 import requests
@@ -36,7 +37,7 @@ def create_payment(user_id, tariff_id, payment_provider, amount, currency, promo
 def create_heleket_payment(amount, currency, order_id, email):
     """Создать платёж Heleket"""
     try:
-        s = PaymentSetting.query.first()
+        s = get_settings('payment')
         if not s or not s.heleket_api_key:
             return None, "Heleket not configured"
         
@@ -54,7 +55,7 @@ def create_heleket_payment(amount, currency, order_id, email):
 def create_telegram_stars_payment(amount, currency, order_id, email):
     """Создать платёж Telegram Stars"""
     try:
-        s = PaymentSetting.query.first()
+        s = get_settings('payment')
         if not s or not s.telegram_bot_token:
             return None, "Telegram Stars not configured"
         
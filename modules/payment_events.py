@@ -0,0 +1,201 @@
+"""
+Уведомления об оплате для mini app, сайта и бота
+
+Вместо частых опросов /miniapp/payments/status клиент держит один запрос
+/miniapp/payments/<order_id>/events (SSE или long-poll), и тот завершается, как
+только заказ выдан:
+  - выдача заказа (modules/payment_fulfilment.py) вызывает notify_payment_status():
+    статус пишется в кеш и рассылается ожидающим запросам;
+  - с Redis (кеш RedisCache) уведомление идет через pub/sub канал
+    PAYMENT_EVENTS_CHANNEL: каждый воркер gunicorn держит одно подписочное
+    соединение и будит свои ожидающие запросы, так что заказ, выданный в одном
+    процессе, видят запросы во всех;
+  - без Redis - только ожидающие запросы этого процесса (режим одного воркера).
+
+С gthread воркерами каждый ожидающий запрос держит поток, поэтому их число на
+воркер ограничено PAYMENT_EVENTS_MAX_WAITERS (по умолчанию половина потоков):
+сверх лимита запрос получает 503 с Retry-After и не отнимает потоки у API.
+С gevent ожидание стоит одного гринлета, и лимита по умолчанию нет.
+"""
+import json
+import os
+import threading
+
+from modules.payment_reconciler import get_payment_status, publish_payment_status
+
+PAYMENT_EVENTS_CHANNEL = 'stealthnet:payment_events'
+# Дольше запрос не ждет (клиент переподключается); меньше proxy_read_timeout nginx
+PAYMENT_EVENTS_TIMEOUT = int(os.getenv("PAYMENT_EVENTS_TIMEOUT", "25"))
+# Через сколько секунд повторить запрос, если места ожидания заняты (Retry-After)
+PAYMENT_EVENTS_RETRY_AFTER = int(os.getenv("PAYMENT_EVENTS_RETRY_AFTER", "5"))
+
+
+def _default_max_waiters():
+    if os.getenv("GUNICORN_WORKER_CLASS", "gthread").lower() == "gevent":
+        return 0
+    return max(int(os.getenv("GUNICORN_THREADS", "4")) // 2, 1)
+
+
+# Ожидающих запросов на воркер (0 - без лимита)
+PAYMENT_EVENTS_MAX_WAITERS = int(os.getenv("PAYMENT_EVENTS_MAX_WAITERS") or _default_max_waiters())
+
+_waiters = {}  # order_id -> [_Waiter]
+_waiters_lock = threading.Lock()
+_active_waits = 0
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+_redis = None
+_redis_url = None
+
+
+class _Waiter:
+    """Ожидающий запрос: событие и статус, с которым его разбудили"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.status = None
+
+
+def _redis_client():
+    global _redis, _redis_url
+    from modules.core import get_app
+    app = get_app()
+    if app.config.get('CACHE_TYPE') != 'RedisCache' or not app.config.get('CACHE_REDIS_URL'):
+        return None
+    url = app.config['CACHE_REDIS_URL']
+    if _redis is None or _redis_url != url:
+        import redis
+        _redis = redis.Redis.from_url(url, socket_connect_timeout=1)
+        _redis_url = url
+    return _redis
+
+
+def _wake(order_id, status):
+    with _waiters_lock:
+        waiters = _waiters.pop(order_id, [])
+    for waiter in waiters:
+        waiter.status = status
+        waiter.event.set()
+
+
+def _listen(client):
+    """Подписка на канал уведомлений (поток процесса)"""
+    import time
+    while True:
+        pubsub = None
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(PAYMENT_EVENTS_CHANNEL)
+            for message in pubsub.listen():
+                try:
+                    data = json.loads(message['data'])
+                    _wake(data['order_id'], data)
+                except Exception as e:
+                    print(f"[PAYMENT_EVENTS] Некорректное уведомление: {e}")
+        except Exception as e:
+            print(f"[PAYMENT_EVENTS] Подписка прервана: {e}, переподключение через 5с")
+            time.sleep(5)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def _ensure_listener():
+    """Поток подписки этого процесса (после fork - новый)"""
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return True
+    try:
+        client = _redis_client()
+    except Exception as e:
+        print(f"[PAYMENT_EVENTS] Redis недоступен: {e}")
+        return False
+    if client is None:
+        return False
+    with _listener_lock:
+        if _listener is None or _listener_pid != os.getpid():
+            _listener = threading.Thread(target=_listen, args=(client,), name="payment-events", daemon=True)
+            _listener.start()
+            _listener_pid = os.getpid()
+    return True
+
+
+def notify_payment_status(payment):
+    """Записать статус платежа в кеш и разбудить ожидающие его запросы"""
+    status = publish_payment_status(payment)
+    published = False
+    try:
+        client = _redis_client()
+        if client is not None:
+            client.publish(PAYMENT_EVENTS_CHANNEL, json.dumps(status))
+            published = True
+    except Exception as e:
+        print(f"[PAYMENT_EVENTS] Не удалось опубликовать статус {payment.order_id}: {e}")
+    if not published:
+        # Без Redis будим ожидающих этого процесса напрямую
+        _wake(payment.order_id, status)
+    return status
+
+
+def acquire_wait_slot():
+    """
+    Занять место ожидающего запроса
+
+    Returns:
+        bool: False, если воркер уже держит PAYMENT_EVENTS_MAX_WAITERS запросов
+    """
+    global _active_waits
+    with _waiters_lock:
+        if PAYMENT_EVENTS_MAX_WAITERS and _active_waits >= PAYMENT_EVENTS_MAX_WAITERS:
+            return False
+        _active_waits += 1
+        return True
+
+
+def release_wait_slot():
+    """Освободить место, занятое acquire_wait_slot()"""
+    global _active_waits
+    with _waiters_lock:
+        _active_waits = max(_active_waits - 1, 0)
+
+
+def wait_payment_status(order_id, timeout=PAYMENT_EVENTS_TIMEOUT):
+    """
+    Дождаться изменения статуса ожидающего платежа
+
+    Returns:
+        tuple: (статус или None, если платеж не найден; True, если статус изменился)
+    """
+    _ensure_listener()
+    waiter = _Waiter()
+    # Регистрируемся до чтения статуса, чтобы не пропустить уведомление между ними
+    with _waiters_lock:
+        _waiters.setdefault(order_id, []).append(waiter)
+    try:
+        status = get_payment_status(order_id)
+        if status is None or status.get('status') != 'pending':
+            return status, False
+        if waiter.event.wait(timeout):
+            return waiter.status, True
+        return status, False
+    finally:
+        with _waiters_lock:
+            waiters = _waiters.get(order_id)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del _waiters[order_id]
+
+
+__all__ = [
+    'PAYMENT_EVENTS_TIMEOUT',
+    'PAYMENT_EVENTS_RETRY_AFTER',
+    'acquire_wait_slot',
+    'release_wait_slot',
+    'notify_payment_status',
+    'wait_payment_status'
+]
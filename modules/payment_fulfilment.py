@@ -0,0 +1,437 @@
+"""
+Очередь выдачи оплаченных заказов
+
+Вебхук платежной системы не выдает тариф сам (запрос в RemnaWave, коммиты,
+уведомления), а только проверяет уведомление и записывает задачу:
+  - задача одна на order_id (уникальный индекс), поэтому повторные уведомления
+    платежной системы и проверка статуса из mini app не выдают заказ дважды;
+  - задача сразу передается пулу воркеров этого процесса (PAYMENT_FULFILMENT_WORKERS),
+    вебхук отвечает, не дожидаясь RemnaWave;
+  - воркер забирает задачу условным UPDATE (PENDING -> RUNNING), так что между
+    процессами gunicorn задача тоже выполняется один раз; пока задача выполняется,
+    воркер продлевает аренду (locked_at), и задачу не забирает другой воркер;
+  - при ошибке задача повторяется с экспоненциальной задержкой, после
+    PAYMENT_FULFILMENT_MAX_ATTEMPTS попыток - FAILED (видна в админке);
+  - повторы, задачи прерванных воркеров и задачи, не переданные пулу, подбирает
+    process_due_fulfilment_jobs() в планировщике.
+
+Признак выданного заказа - payment.status == 'PAID': он записывается вместе с выдачей,
+и повтор после частичного успеха заказ уже не выдает. Новый срок подписки
+записывается в задачу (target_expire_at) до запроса в RemnaWave: если коммит после
+успешного PATCH не прошел, повтор отправляет тот же абсолютный срок, а не
+продлевает подписку еще раз.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.exc import IntegrityError
+
+from modules.core import get_app, get_db
+from modules.models.payment import Payment
+from modules.models.user import User
+from modules.models.tariff import Tariff
+from modules.models.payment_job import PaymentFulfilmentJob
+
+db = get_db()
+
+FULFILMENT_WORKERS = int(os.getenv("PAYMENT_FULFILMENT_WORKERS", "4"))
+FULFILMENT_MAX_ATTEMPTS = int(os.getenv("PAYMENT_FULFILMENT_MAX_ATTEMPTS", "8"))
+FULFILMENT_RETRY_DELAY = int(os.getenv("PAYMENT_FULFILMENT_RETRY_DELAY", "15"))  # первый повтор, дальше x2
+FULFILMENT_MAX_RETRY_DELAY = 3600
+FULFILMENT_POLL_INTERVAL = int(os.getenv("PAYMENT_FULFILMENT_POLL_INTERVAL", "10"))
+# Аренда RUNNING задачи: воркер продлевает ее каждую треть срока, пока выполняет задачу;
+# не продленная дольше этого - воркер остановлен или перезапущен, задача возвращается в очередь
+FULFILMENT_LOCK_TIMEOUT = int(os.getenv("PAYMENT_FULFILMENT_LOCK_TIMEOUT", "300"))
+FULFILMENT_HEARTBEAT_INTERVAL = max(FULFILMENT_LOCK_TIMEOUT // 3, 1)
+# Незавершенная задача старше этого - "зависшая" в админке
+FULFILMENT_STUCK_AFTER = int(os.getenv("PAYMENT_FULFILMENT_STUCK_AFTER", "600"))
+FULFILMENT_BATCH_SIZE = 50
+
+
+class FulfilmentError(Exception):
+    """Заказ не выдан; retry=False - повтор не поможет (нет пользователя, тарифа)"""
+
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(dt):
+    # SQLite возвращает datetime без tzinfo
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def _retry_delay(attempts):
+    return min(FULFILMENT_RETRY_DELAY * 2 ** max(attempts - 1, 0), FULFILMENT_MAX_RETRY_DELAY)
+
+
+# ============================================================================
+# ПУЛ ВОРКЕРОВ
+# ============================================================================
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_queued = set()  # задачи, уже переданные пулу этого процесса
+_queued_lock = threading.Lock()
+
+
+def _get_executor():
+    """Пул воркеров процесса (после fork - новый, потоки master процесса не наследуются)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FULFILMENT_WORKERS, thread_name_prefix="payment-fulfilment")
+            _executor_pid = os.getpid()
+            with _queued_lock:
+                _queued.clear()
+        return _executor
+
+
+def submit_fulfilment_job(job_id):
+    """Передать задачу пулу воркеров (не более одного раза, пока она в пуле)"""
+    with _queued_lock:
+        if job_id in _queued:
+            return False
+        _queued.add(job_id)
+    try:
+        _get_executor().submit(_run_in_pool, get_app(), job_id)
+    except Exception:
+        with _queued_lock:
+            _queued.discard(job_id)
+        raise
+    return True
+
+
+def _run_in_pool(app, job_id):
+    try:
+        with app.app_context():
+            run_fulfilment_job(job_id)
+    except Exception as e:
+        print(f"[FULFILMENT] Ошибка задачи #{job_id}: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        with _queued_lock:
+            _queued.discard(job_id)
+
+
+# ============================================================================
+# ЗАДАЧИ
+# ============================================================================
+
+def enqueue_fulfilment(payment, source=None, notify_user=True, run=True):
+    """
+    Записать задачу выдачи заказа (идемпотентно по payment.order_id)
+
+    Изменения payment в текущей сессии коммитятся вместе с задачей.
+
+    Args:
+        payment: Payment
+        source: кто записал задачу ('yookassa', 'platega_status', ...)
+        notify_user: отправлять ли пользователю уведомление о пополнении баланса
+        run: сразу передать задачу пулу воркеров
+
+    Returns:
+        tuple: (PaymentFulfilmentJob, True если задача создана этим вызовом)
+    """
+    job = PaymentFulfilmentJob.query.filter_by(order_id=payment.order_id).first()
+    if job is not None:
+        db.session.commit()
+        return job, False
+
+    job = PaymentFulfilmentJob(
+        order_id=payment.order_id,
+        payment_id=payment.id,
+        source=source,
+        notify_user=notify_user,
+        status='PENDING',
+        attempts=0,
+        next_attempt_at=_now()
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Ту же задачу одновременно записал другой запрос
+        db.session.rollback()
+        return PaymentFulfilmentJob.query.filter_by(order_id=payment.order_id).first(), False
+
+    print(f"[FULFILMENT] Задача #{job.id}: заказ {job.order_id} ({source})")
+    if run:
+        try:
+            submit_fulfilment_job(job.id)
+        except Exception as e:
+            # Задача записана - ее подберет планировщик
+            print(f"[FULFILMENT] Не удалось передать задачу #{job.id} пулу: {e}")
+    return job, True
+
+
+def _claim(job_id):
+    """PENDING -> RUNNING, если задачу не забрал другой воркер"""
+    now = _now()
+    table = PaymentFulfilmentJob.__table__
+    result = db.session.execute(
+        table.update().where(
+            table.c.id == job_id,
+            table.c.status == 'PENDING',
+            table.c.next_attempt_at <= now
+        ).values(
+            status='RUNNING',
+            locked_at=now,
+            locked_by=_worker_id(),
+            attempts=table.c.attempts + 1,
+            updated_at=now
+        )
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _renew_lease(job_id, worker_id):
+    """Продлить аренду задачи; False - задача уже не за этим воркером"""
+    now = _now()
+    table = PaymentFulfilmentJob.__table__
+    result = db.session.execute(
+        table.update().where(
+            table.c.id == job_id,
+            table.c.status == 'RUNNING',
+            table.c.locked_by == worker_id
+        ).values(locked_at=now)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _heartbeat(app, job_id, worker_id, stop):
+    """Продлевать аренду, пока задача выполняется (отдельный поток)"""
+    with app.app_context():
+        try:
+            while not stop.wait(FULFILMENT_HEARTBEAT_INTERVAL):
+                if not _renew_lease(job_id, worker_id):
+                    print(f"[FULFILMENT] ⚠️ Задача #{job_id}: аренда потеряна")
+                    return
+        except Exception as e:
+            print(f"[FULFILMENT] Не удалось продлить аренду задачи #{job_id}: {e}")
+        finally:
+            db.session.remove()
+
+
+def pin_target_expire(job, expire_at):
+    """
+    Записать в задачу срок подписки до запроса в RemnaWave (один раз)
+
+    Returns:
+        datetime: срок, записанный в задачу (этот или предыдущей попыткой), UTC
+    """
+    table = PaymentFulfilmentJob.__table__
+    db.session.execute(
+        table.update().where(
+            table.c.id == job.id,
+            table.c.target_expire_at.is_(None)
+        ).values(target_expire_at=expire_at)
+    )
+    db.session.commit()
+    db.session.refresh(job)
+    return _as_utc(job.target_expire_at)
+
+
+def _fulfil(job):
+    """Выдать заказ: тариф или пополнение баланса"""
+    from modules.api.webhooks.routes import process_successful_payment, process_balance_topup
+
+    payment = db.session.get(Payment, job.payment_id)
+    if not payment:
+        raise FulfilmentError("Payment not found", retry=False)
+    if payment.status == 'PAID':
+        # Уже выдан (предыдущей попыткой или до появления очереди)
+        return
+
+    user = db.session.get(User, payment.user_id)
+    if not user:
+        raise FulfilmentError("User not found", retry=False)
+
+    if payment.tariff_id is None:
+        process_balance_topup(payment, user, notify_user=job.notify_user)
+        return
+
+    tariff = db.session.get(Tariff, payment.tariff_id)
+    if not tariff:
+        raise FulfilmentError(f"Tariff {payment.tariff_id} not found", retry=False)
+    if not process_successful_payment(payment, user, tariff, job=job):
+        raise FulfilmentError("Не удалось продлить подписку в RemnaWave")
+
+
+def run_fulfilment_job(job_id):
+    """
+    Выполнить задачу в текущем потоке (нужен app context)
+
+    Returns:
+        str: статус задачи после попытки (None - задачи нет)
+    """
+    if not _claim(job_id):
+        job = db.session.get(PaymentFulfilmentJob, job_id)
+        return job.status if job else None
+
+    job = db.session.get(PaymentFulfilmentJob, job_id)
+    worker_id = _worker_id()
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, args=(get_app(), job_id, worker_id, stop),
+        name=f"payment-fulfilment-lease-{job_id}", daemon=True
+    )
+    heartbeat.start()
+    error = None
+    retry = False
+    try:
+        _fulfil(job)
+    except FulfilmentError as e:
+        error, retry = str(e), e.retry
+    except Exception as e:
+        error, retry = str(e), True
+        import traceback
+        traceback.print_exc()
+    finally:
+        stop.set()
+        heartbeat.join(timeout=5)
+
+    if error:
+        db.session.rollback()
+    job = db.session.get(PaymentFulfilmentJob, job_id)
+    db.session.refresh(job)
+    if job.status != 'RUNNING' or job.locked_by != worker_id:
+        # Аренду забрал другой воркер - итог задачи запишет он
+        print(f"[FULFILMENT] ⚠️ Задача #{job.id}: выполняется другим воркером, результат попытки не записан")
+        return job.status
+
+    now = _now()
+    job.locked_at = None
+    job.locked_by = None
+    job.updated_at = now
+    if not error:
+        job.status = 'DONE'
+        job.error = None
+        job.finished_at = now
+        print(f"[FULFILMENT] ✅ Задача #{job.id}: заказ {job.order_id} выдан (попытка {job.attempts})")
+    elif retry and job.attempts < FULFILMENT_MAX_ATTEMPTS:
+        delay = _retry_delay(job.attempts)
+        job.status = 'PENDING'
+        job.error = error[:1000]
+        job.next_attempt_at = now + timedelta(seconds=delay)
+        print(f"[FULFILMENT] ⚠️ Задача #{job.id}: {error}, повтор через {delay}с "
+              f"(попытка {job.attempts}/{FULFILMENT_MAX_ATTEMPTS})")
+    else:
+        job.status = 'FAILED'
+        job.error = error[:1000]
+        job.finished_at = now
+        print(f"[FULFILMENT] ❌ Задача #{job.id}: заказ {job.order_id} не выдан: {error}")
+    db.session.commit()
+
+    if job.status == 'DONE':
+        # Кеш статуса и ожидающие /miniapp/payments/<order_id>/events узнают об оплате сразу
+        from modules.payment_events import notify_payment_status
+        payment = db.session.get(Payment, job.payment_id)
+        if payment:
+            notify_payment_status(payment)
+    return job.status
+
+
+def process_due_fulfilment_jobs():
+    """
+    Передать пулу задачи, время которых пришло (задача планировщика)
+
+    Задачи RUNNING, аренду которых не продлевали дольше FULFILMENT_LOCK_TIMEOUT,
+    возвращаются в очередь.
+
+    Returns:
+        int: сколько задач передано пулу
+    """
+    now = _now()
+    table = PaymentFulfilmentJob.__table__
+    released = db.session.execute(
+        table.update().where(
+            table.c.status == 'RUNNING',
+            table.c.locked_at < now - timedelta(seconds=FULFILMENT_LOCK_TIMEOUT)
+        ).values(status='PENDING', locked_at=None, locked_by=None, next_attempt_at=now, updated_at=now)
+    ).rowcount
+    db.session.commit()
+    if released:
+        print(f"[FULFILMENT] Возвращено в очередь прерванных задач: {released}")
+
+    job_ids = [row.id for row in db.session.query(PaymentFulfilmentJob.id).filter(
+        PaymentFulfilmentJob.status == 'PENDING',
+        PaymentFulfilmentJob.next_attempt_at <= now
+    ).order_by(PaymentFulfilmentJob.next_attempt_at.asc()).limit(FULFILMENT_BATCH_SIZE).all()]
+    db.session.commit()
+
+    submitted = 0
+    for job_id in job_ids:
+        if submit_fulfilment_job(job_id):
+            submitted += 1
+    return submitted
+
+
+def retry_fulfilment_job(job_id):
+    """Повторить задачу вручную (админка): попытки считаются заново"""
+    job = db.session.get(PaymentFulfilmentJob, job_id)
+    if not job or job.status == 'DONE':
+        return job
+    if job.status == 'RUNNING' and job.locked_at and _as_utc(job.locked_at) > _now() - timedelta(seconds=FULFILMENT_LOCK_TIMEOUT):
+        # Выполняется прямо сейчас
+        return job
+    job.status = 'PENDING'
+    job.attempts = 0
+    job.next_attempt_at = _now()
+    job.locked_at = None
+    job.locked_by = None
+    job.finished_at = None
+    db.session.commit()
+    submit_fulfilment_job(job.id)
+    return job
+
+
+def get_fulfilment_stats(limit=100):
+    """Счетчики задач по статусам и зависшие задачи (FAILED или не выполнены за FULFILMENT_STUCK_AFTER)"""
+    counts = dict(
+        db.session.query(PaymentFulfilmentJob.status, db.func.count(PaymentFulfilmentJob.id))
+        .group_by(PaymentFulfilmentJob.status).all()
+    )
+    stuck_before = _now() - timedelta(seconds=FULFILMENT_STUCK_AFTER)
+    stuck = PaymentFulfilmentJob.query.filter(db.or_(
+        PaymentFulfilmentJob.status == 'FAILED',
+        db.and_(
+            PaymentFulfilmentJob.status.in_(['PENDING', 'RUNNING']),
+            PaymentFulfilmentJob.created_at < stuck_before
+        )
+    )).order_by(PaymentFulfilmentJob.created_at.asc()).limit(limit).all()
+    return {
+        'counts': {status: counts.get(status, 0) for status in ('PENDING', 'RUNNING', 'DONE', 'FAILED')},
+        'stuck_after': FULFILMENT_STUCK_AFTER,
+        'max_attempts': FULFILMENT_MAX_ATTEMPTS,
+        'stuck': [job.to_dict() for job in stuck]
+    }
+
+
+__all__ = [
+    'FulfilmentError',
+    'enqueue_fulfilment',
+    'pin_target_expire',
+    'submit_fulfilment_job',
+    'run_fulfilment_job',
+    'process_due_fulfilment_jobs',
+    'retry_fulfilment_job',
+    'get_fulfilment_stats'
+]
@@ -0,0 +1,205 @@
+"""
+Сверка ожидающих платежей и статус платежа для mini app
+
+Mini app опрашивает /miniapp/payments/status, пока пользователь на экране оплаты.
+Раньше каждый такой опрос для Platega ходил в API платёжной системы, теперь:
+  - эндпоинт читает только локальное состояние: кеш (Redis, общий для воркеров),
+    при промахе - строку Payment в БД;
+  - платежи PENDING у систем, где адаптер умеет запрашивать статус
+    (supports_status_check), сверяет задача планировщика. У каждого платежа свое
+    расписание: первая проверка через PAYMENT_RECONCILE_FIRST_DELAY после создания,
+    дальше интервал удваивается до PAYMENT_RECONCILE_MAX_DELAY; платежи старше
+    PAYMENT_RECONCILE_MAX_AGE не проверяются. Если API позволяет, статусы
+    запрашиваются пачкой (CryptoBot getInvoices);
+  - оплаченный у системы платеж сверка передает в очередь выдачи (как вебхук),
+    а выданный заказ записывается в кеш статуса сразу (publish_payment_status).
+
+Расписание хранится в строке платежа (reconcile_next_at, reconcile_checks), и
+проход выбирает только платежи, время проверки которых пришло, - брошенные
+неоплаченные счета не вытесняют их, сколько бы их ни накопилось за сутки.
+"""
+import os
+from datetime import datetime, timezone, timedelta
+
+from modules.core import get_db, get_cache
+from modules.models.payment import Payment
+
+db = get_db()
+
+RECONCILE_INTERVAL = int(os.getenv("PAYMENT_RECONCILE_INTERVAL", "15"))
+RECONCILE_FIRST_DELAY = int(os.getenv("PAYMENT_RECONCILE_FIRST_DELAY", "20"))  # дальше x2
+RECONCILE_MAX_DELAY = int(os.getenv("PAYMENT_RECONCILE_MAX_DELAY", "900"))
+RECONCILE_MAX_AGE = int(os.getenv("PAYMENT_RECONCILE_MAX_AGE", "86400"))
+RECONCILE_BATCH_SIZE = 500  # платежей за проход; остальные из пришедших - следующим проходом
+# Статус в кеше: ожидающий платеж перечитывается из БД не чаще раза в TTL
+STATUS_CACHE_TTL = int(os.getenv("PAYMENT_STATUS_CACHE_TTL", "10"))
+STATUS_CACHE_FINAL_TTL = 3600
+STATUS_CACHE_PREFIX = 'payment_status:'
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(dt):
+    # SQLite возвращает datetime без tzinfo
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _bind_time(column, dt):
+    """
+    Время для сравнения с колонкой: расчеты - в aware UTC, значение - в типе колонки
+
+    Payment.created_at - DateTime без часового пояса (UTC): aware значение PostgreSQL
+    сравнивал бы, переводя колонку через часовой пояс сессии.
+    """
+    dt = _as_utc(dt)
+    return dt if column.type.timezone else dt.replace(tzinfo=None)
+
+
+def _check_delay(checks):
+    return min(RECONCILE_FIRST_DELAY * 2 ** checks, RECONCILE_MAX_DELAY)
+
+
+# ============================================================================
+# СТАТУС ДЛЯ MINI APP
+# ============================================================================
+
+def _status_payload(payment):
+    return {
+        "status": payment.status.lower(),
+        "paid": payment.status == 'PAID',
+        "order_id": payment.order_id,
+        "amount": payment.amount,
+        "currency": payment.currency
+    }
+
+
+def publish_payment_status(payment):
+    """Записать текущий статус платежа в кеш (по order_id и payment_system_id)"""
+    payload = _status_payload(payment)
+    timeout = STATUS_CACHE_TTL if payment.status == 'PENDING' else STATUS_CACHE_FINAL_TTL
+    try:
+        cache = get_cache()
+        for key in {payment.order_id, payment.payment_system_id}:
+            if key:
+                cache.set(f"{STATUS_CACHE_PREFIX}{key}", payload, timeout=timeout)
+    except Exception as e:
+        print(f"[RECONCILE] Не удалось записать статус {payment.order_id} в кеш: {e}")
+    return payload
+
+
+def get_payment_status(payment_id):
+    """
+    Статус платежа по order_id или payment_system_id - только кеш и БД
+
+    Returns:
+        dict или None, если платеж не найден
+    """
+    key = f"{STATUS_CACHE_PREFIX}{payment_id}"
+    try:
+        cached = get_cache().get(key)
+    except Exception:
+        cached = None
+    if cached:
+        return cached
+
+    payment = Payment.query.filter_by(order_id=payment_id).first()
+    if not payment:
+        payment = Payment.query.filter_by(payment_system_id=payment_id).first()
+    if not payment:
+        return None
+    return publish_payment_status(payment)
+
+
+# ============================================================================
+# СВЕРКА
+# ============================================================================
+
+def reconcile_pending_payments():
+    """
+    Проверить у платёжных систем платежи, время проверки которых пришло (задача планировщика)
+
+    Returns:
+        dict: сколько проверено, оплачено и отменено
+    """
+    from modules.api.payments import PAYMENT_PROVIDERS
+    from modules.api.payments.adapter import PAYMENT_PAID, PAYMENT_CANCELED
+    from modules.api.payments.vault import get_payment_vault
+    from modules.payment_fulfilment import enqueue_fulfilment
+
+    stats = {'checked': 0, 'paid': 0, 'canceled': 0}
+    vault = get_payment_vault()
+    providers = [
+        name for name, provider in PAYMENT_PROVIDERS.items()
+        if provider.supports_status_check and vault.is_available(name)
+    ]
+    if not providers:
+        return stats
+
+    now = _now()
+    created_after = _bind_time(Payment.created_at, now - timedelta(seconds=RECONCILE_MAX_AGE))
+    first_check_before = _bind_time(Payment.created_at, now - timedelta(seconds=RECONCILE_FIRST_DELAY))
+    due = Payment.query.filter(
+        Payment.status == 'PENDING',
+        Payment.payment_provider.in_(providers),
+        Payment.payment_system_id.isnot(None),
+        Payment.created_at >= created_after,
+        db.or_(
+            db.and_(Payment.reconcile_next_at.is_(None), Payment.created_at <= first_check_before),
+            Payment.reconcile_next_at <= _bind_time(Payment.reconcile_next_at, now)
+        )
+    ).order_by(Payment.id.asc()).limit(RECONCILE_BATCH_SIZE).all()
+
+    by_provider = {}  # provider -> [Payment]
+    for p in due:
+        by_provider.setdefault(p.payment_provider, []).append(p)
+
+    for name, payments in by_provider.items():
+        provider = PAYMENT_PROVIDERS[name]
+        statuses = provider.fetch_statuses([p.payment_system_id for p in payments])
+        stats['checked'] += len(payments)
+
+        for p in payments:
+            status = statuses.get(str(p.payment_system_id))
+            checks = (p.reconcile_checks or 0) + 1
+            if status == PAYMENT_PAID:
+                # Ждет выдачи; если выдача затянется, проверим еще раз не раньше чем через MAX_DELAY
+                p.reconcile_checks = checks
+                p.reconcile_next_at = now + timedelta(seconds=RECONCILE_MAX_DELAY)
+                try:
+                    job, created = enqueue_fulfilment(p, f"{name}_reconcile")
+                    if created:
+                        print(f"[RECONCILE] 💰 {p.order_id} оплачен у {provider.title}, задача выдачи #{job.id}")
+                    stats['paid'] += 1
+                    continue
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[RECONCILE] Не удалось записать задачу выдачи {p.order_id}: {e}")
+            elif status == PAYMENT_CANCELED:
+                print(f"[RECONCILE] {p.order_id} отменен у {provider.title}, проверки прекращены")
+                stats['canceled'] += 1
+                p.reconcile_checks = checks
+                # Позже окна PAYMENT_RECONCILE_MAX_AGE - больше не выбирается
+                p.reconcile_next_at = now + timedelta(seconds=RECONCILE_MAX_AGE)
+                continue
+
+            # Все еще ожидает оплаты (или статус не получен) - следующая проверка позже
+            p.reconcile_checks = checks
+            p.reconcile_next_at = now + timedelta(seconds=_check_delay(checks))
+
+        db.session.commit()
+
+    if stats['checked']:
+        print(f"[RECONCILE] Проверено платежей: {stats['checked']}, оплачено: {stats['paid']}, отменено: {stats['canceled']}")
+    return stats
+
+
+__all__ = [
+    'RECONCILE_INTERVAL',
+    'publish_payment_status',
+    'get_payment_status',
+    'reconcile_pending_payments'
+]
@@ -0,0 +1,137 @@
+"""
+Лимиты запросов (Flask-Limiter)
+
+- Хранилище - общий Redis (тот же, что у кеша), стратегия moving-window: счетчики
+  общие для всех воркеров gunicorn, а на стыке окон не получается двойного всплеска.
+  Без Redis - память воркера. RATELIMIT_STORAGE_URI задает хранилище явно.
+- Ключ - пользователь, а не IP: 'user:<id>' по JWT, 'tg:<id>' по initData mini app.
+  Подпись проверяется, иначе лимит обходится подстановкой чужих id. Для остальных
+  запросов - IP клиента; за nginx он берется из X-Forwarded-For (ProxyFix в core).
+- Срабатывания лимитов считаются по эндпоинтам: в Redis (общие для воркеров) и в
+  памяти воркера - GET /api/admin/rate-limit-stats.
+"""
+import os
+import threading
+from collections import Counter
+
+from flask import request
+from flask_limiter.util import get_remote_address
+
+RATE_LIMIT_HITS_KEY = 'stealthnet:rate_limit_hits'
+
+_hits = Counter()  # endpoint -> срабатываний в этом воркере
+_hits_lock = threading.Lock()
+_redis = None
+_redis_url = None
+
+
+def get_storage_uri(app):
+    """Хранилище счетчиков: RATELIMIT_STORAGE_URI, Redis кеша или память воркера"""
+    storage_uri = os.getenv("RATELIMIT_STORAGE_URI")
+    if storage_uri:
+        return storage_uri
+    if app.config.get('CACHE_TYPE') == 'RedisCache' and app.config.get('CACHE_REDIS_URL'):
+        return app.config['CACHE_REDIS_URL']
+    return "memory://"
+
+
+def _identity():
+    """Пользователь запроса (по проверенному JWT или initData) или None"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith("Bearer "):
+        try:
+            import jwt
+            from modules.core import get_app
+            payload = jwt.decode(auth_header.split(" ")[1], get_app().config['JWT_SECRET_KEY'], algorithms=["HS256"])
+            return f"user:{payload['sub']}"
+        except Exception:
+            return None
+
+    from modules.auth import get_miniapp_telegram_id
+    telegram_id = get_miniapp_telegram_id()
+    if telegram_id:
+        return f"tg:{telegram_id}"
+    return None
+
+
+def rate_limit_key():
+    """Ключ лимита: пользователь, иначе IP клиента"""
+    try:
+        identity = _identity()
+    except Exception:
+        identity = None
+    return identity or f"ip:{get_remote_address()}"
+
+
+def _redis_client(app):
+    global _redis, _redis_url
+    url = get_storage_uri(app)
+    if not url.startswith(('redis://', 'rediss://')):
+        return None
+    if _redis is None or _redis_url != url:
+        import redis
+        _redis = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        _redis_url = url
+    return _redis
+
+
+def on_rate_limit_breach(request_limit):
+    """Учет срабатывания лимита (ответ 429 формирует Flask-Limiter)"""
+    endpoint = request.endpoint or request.path
+    with _hits_lock:
+        _hits[endpoint] += 1
+    try:
+        from modules.core import get_app
+        client = _redis_client(get_app())
+        if client is not None:
+            client.hincrby(RATE_LIMIT_HITS_KEY, endpoint, 1)
+    except Exception as e:
+        print(f"[RATELIMIT] Не удалось записать срабатывание лимита: {e}")
+    return None
+
+
+def get_rate_limit_stats():
+    """Срабатывания лимитов по эндпоинтам"""
+    from modules.core import get_app
+    app = get_app()
+    with _hits_lock:
+        worker_hits = dict(_hits)
+
+    shared_hits = None
+    client = _redis_client(app)
+    if client is not None:
+        try:
+            shared_hits = {
+                k.decode() if isinstance(k, bytes) else k: int(v)
+                for k, v in client.hgetall(RATE_LIMIT_HITS_KEY).items()
+            }
+        except Exception as e:
+            print(f"[RATELIMIT] Не удалось прочитать статистику лимитов: {e}")
+
+    hits = shared_hits if shared_hits is not None else worker_hits
+    return {
+        'storage': get_storage_uri(app).split('://')[0],
+        'strategy': app.config.get('RATELIMIT_STRATEGY', 'moving-window'),
+        'shared': shared_hits is not None,
+        'total': sum(hits.values()),
+        'endpoints': dict(sorted(hits.items(), key=lambda item: item[1], reverse=True)),
+        'worker': worker_hits
+    }
+
+
+def reset_rate_limit_stats():
+    with _hits_lock:
+        _hits.clear()
+    from modules.core import get_app
+    client = _redis_client(get_app())
+    if client is not None:
+        client.delete(RATE_LIMIT_HITS_KEY)
+
+
+__all__ = [
+    'get_storage_uri',
+    'rate_limit_key',
+    'on_rate_limit_breach',
+    'get_rate_limit_stats',
+    'reset_rate_limit_stats'
+]
@@ -0,0 +1,368 @@
+"""
+Реферальные начисления и статистика реферера
+
+Начисление процента (реферальная система PERCENT) - одна транзакция:
+  - строка журнала referral_commission (одна на платеж: повтор выдачи заказа
+    второй раз не начисляет);
+  - пополнение баланса реферера одним UPDATE balance = balance + комиссия, без
+    чтения баланса в Python (параллельные начисления не теряются);
+  - итоги реферера (referral_stats) и приглашенного (referral_earning).
+
+Число приглашенных поддерживают события модели User (modules/models/referral.py),
+поэтому /referrals/stats и список рефералов читают готовые строки, а не считают
+пользователей и журнал на каждый запрос.
+
+Заработок за 30 дней считается по дням UTC: в течение дня он растет вместе с
+начислениями, а в первый запрос или начисление нового дня пересчитывается по
+журналу (индекс referrer_id, created_at) - старые начисления выходят из окна.
+"""
+from datetime import datetime, timezone, timedelta
+
+from modules.core import get_db
+from modules.models.user import User
+from modules.models.referral import ReferralCommission, ReferralStats, ReferralEarning, upsert_counters
+
+db = get_db()
+
+EARNINGS_WINDOW_DAYS = 30
+REFERRALS_PAGE_LIMIT = 50
+REFERRALS_MAX_LIMIT = 200
+
+
+def _window_start(today):
+    """Начало окна EARNINGS_WINDOW_DAYS дней, включая сегодняшний"""
+    start = today - timedelta(days=EARNINGS_WINDOW_DAYS - 1)
+    return datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+
+
+def _earned_since(referrer_id, since):
+    total = db.session.query(db.func.coalesce(db.func.sum(ReferralCommission.amount), 0.0)).filter(
+        ReferralCommission.referrer_id == referrer_id,
+        ReferralCommission.created_at >= since
+    ).scalar()
+    return float(total or 0.0)
+
+
+# ============================================================================
+# НАЧИСЛЕНИЕ
+# ============================================================================
+
+def add_referral_commission(user, amount_usd, is_tariff_purchase=True, payment=None):
+    """
+    Начисляет реферальную комиссию рефереру пользователя
+
+    Изменения остаются в текущей сессии - коммитит вызывающий код, вместе с
+    оплатой платежа. Ошибка начисления откатывает только само начисление.
+
+    Args:
+        user: Пользователь, который совершил покупку/пополнение
+        amount_usd: Сумма в USD
+        is_tariff_purchase: True если покупка тарифа, False если пополнение баланса
+        payment: Оплаченный Payment (по нему начисление не повторяется)
+
+    Returns:
+        ReferralCommission или None, если комиссия не начислена
+    """
+    from modules.settings_registry import get_settings
+
+    try:
+        # Проверяем тип реферальной системы
+        referral_settings = get_settings('referral')
+        if not referral_settings:
+            return None
+
+        # Если система на днях, не начисляем проценты
+        if referral_settings.referral_type != 'PERCENT':
+            return None
+
+        # Проверяем наличие реферера
+        if not user.referrer_id:
+            return None
+
+        referrer = db.session.get(User, user.referrer_id)
+        if not referrer:
+            return None
+
+        if payment is not None and payment.id is not None:
+            if db.session.query(ReferralCommission.id).filter_by(payment_id=payment.id).first():
+                print(f"[REFERRAL] Комиссия за платеж {payment.order_id} уже начислена")
+                return None
+
+        # Получаем процент реферала (индивидуальный или дефолтный)
+        # Если у реферера установлен индивидуальный процент - используем его, иначе глобальный
+        referral_percent = referrer.referral_percent if referrer.referral_percent is not None else referral_settings.default_referral_percent
+
+        # Вычисляем комиссию
+        commission_usd = (float(amount_usd) * referral_percent) / 100.0
+        if commission_usd <= 0:
+            return None
+
+        now = datetime.now(timezone.utc)
+        today = now.date()
+
+        with db.session.begin_nested():
+            stats = db.session.get(ReferralStats, referrer.id)
+            earned_30d_stale = stats is None or stats.earned_30d_day != today
+            # Новый день - окно сдвинулось, сумму за 30 дней пересчитываем по журналу
+            earned_30d = _earned_since(referrer.id, _window_start(today)) if earned_30d_stale else None
+
+            commission = ReferralCommission(
+                referrer_id=referrer.id,
+                referral_id=user.id,
+                payment_id=payment.id if payment is not None else None,
+                kind='TARIFF' if is_tariff_purchase else 'TOPUP',
+                source_amount=float(amount_usd),
+                percent=referral_percent,
+                amount=commission_usd,
+                created_at=now
+            )
+            db.session.add(commission)
+
+            # Начисляем на баланс реферера
+            connection = db.session.connection()
+            users = User.__table__
+            connection.execute(
+                users.update().where(users.c.id == referrer.id).values(
+                    balance=db.func.coalesce(users.c.balance, 0.0) + commission_usd
+                )
+            )
+
+            updates = {'last_commission_at': now, 'updated_at': now}
+            increments = {'commissions_count': 1, 'total_earned': commission_usd}
+            if earned_30d_stale:
+                updates.update(earned_30d=earned_30d + commission_usd, earned_30d_day=today)
+            else:
+                increments['earned_30d'] = commission_usd
+            upsert_counters(
+                connection, ReferralStats.__table__, ('referrer_id',),
+                {'referrer_id': referrer.id, 'referrals_count': 1, 'commissions_count': 1,
+                 'total_earned': commission_usd, 'earned_30d': commission_usd, 'earned_30d_day': today,
+                 'last_commission_at': now, 'updated_at': now},
+                increments, updates
+            )
+            upsert_counters(
+                connection, ReferralEarning.__table__, ('referral_id',),
+                {'referral_id': user.id, 'referrer_id': referrer.id, 'joined_at': user.created_at or now,
+                 'commissions_count': 1, 'total_earned': commission_usd, 'last_commission_at': now},
+                {'commissions_count': 1, 'total_earned': commission_usd},
+                {'last_commission_at': now}
+            )
+
+        # Баланс изменен в обход ORM - перечитать при следующем обращении
+        db.session.expire(referrer, ['balance'])
+        if stats is not None:
+            db.session.expire(stats)
+
+        print(f"[REFERRAL] Начислено {commission_usd:.2f} USD ({referral_percent}%) рефереру {referrer.id} за покупку пользователя {user.id}")
+        return commission
+
+    except Exception as e:
+        print(f"[REFERRAL] Ошибка начисления комиссии: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+# ============================================================================
+# СТАТИСТИКА И СПИСОК РЕФЕРАЛОВ
+# ============================================================================
+
+def get_referral_stats(referrer_id):
+    """
+    Итоги реферера (пользователя без приглашенных - нули)
+
+    Returns:
+        dict: referrals_count, commissions_count, total_earned, earned_30d, last_commission_at
+    """
+    stats = db.session.get(ReferralStats, referrer_id)
+    if stats is None:
+        return {
+            "referrals_count": 0,
+            "commissions_count": 0,
+            "total_earned": 0.0,
+            "earned_30d": 0.0,
+            "last_commission_at": None
+        }
+
+    earned_30d = stats.earned_30d
+    today = datetime.now(timezone.utc).date()
+    if stats.earned_30d_day != today:
+        earned_30d = _earned_since(referrer_id, _window_start(today)) if stats.last_commission_at else 0.0
+        try:
+            stats.earned_30d = earned_30d
+            stats.earned_30d_day = today
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[REFERRAL] Не удалось обновить заработок за 30 дней реферера {referrer_id}: {e}")
+
+    return {
+        "referrals_count": stats.referrals_count or 0,
+        "commissions_count": stats.commissions_count or 0,
+        "total_earned": round(stats.total_earned or 0.0, 2),
+        "earned_30d": round(earned_30d or 0.0, 2),
+        "last_commission_at": stats.last_commission_at.isoformat() if stats.last_commission_at else None
+    }
+
+
+def list_referrals(referrer_id, limit=REFERRALS_PAGE_LIMIT, offset=0):
+    """
+    Страница приглашенных (новые первыми) с заработком по каждому
+
+    Returns:
+        dict: {"referrals": [...], "total", "limit", "offset"}
+    """
+    limit = min(max(int(limit or REFERRALS_PAGE_LIMIT), 1), REFERRALS_MAX_LIMIT)
+    offset = max(int(offset or 0), 0)
+
+    stats = db.session.get(ReferralStats, referrer_id)
+    total = stats.referrals_count if stats is not None else 0
+
+    rows = db.session.query(ReferralEarning, User).join(
+        User, User.id == ReferralEarning.referral_id
+    ).filter(
+        ReferralEarning.referrer_id == referrer_id
+    ).order_by(
+        ReferralEarning.joined_at.desc(), ReferralEarning.referral_id.desc()
+    ).limit(limit).offset(offset).all() if total else []
+
+    referrals = []
+    for earning, u in rows:
+        referrals.append({
+            "id": u.id,
+            "telegram_username": u.telegram_username,
+            "email": _mask_email(u.email),
+            "joined_at": earning.joined_at.isoformat() if earning.joined_at else None,
+            "commissions_count": earning.commissions_count or 0,
+            "total_earned": round(earning.total_earned or 0.0, 2),
+            "last_commission_at": earning.last_commission_at.isoformat() if earning.last_commission_at else None
+        })
+
+    return {
+        "referrals": referrals,
+        "total": total,
+        "limit": limit,
+        "offset": offset
+    }
+
+
+def _mask_email(email):
+    # Реферер видит, кого пригласил, но не полный адрес
+    if not email or '@' not in email:
+        return None
+    name, domain = email.split('@', 1)
+    return f"{name[:2]}***@{domain}"
+
+
+# ============================================================================
+# ОБСЛУЖИВАНИЕ
+# ============================================================================
+
+def forget_referral_user(user_id):
+    """
+    Убрать пользователя из реферальной статистики перед его удалением
+
+    Начисления, полученные его реферером, остаются в журнале (без ссылки на
+    пользователя и его платежи), начисления самого пользователя удаляются.
+    Не коммитит.
+    """
+    from modules.models.payment import Payment
+
+    connection = db.session.connection()
+    commissions = ReferralCommission.__table__
+    connection.execute(
+        commissions.update().where(
+            commissions.c.payment_id.in_(db.select(Payment.id).where(Payment.user_id == user_id))
+        ).values(payment_id=None)
+    )
+    connection.execute(commissions.update().where(commissions.c.referral_id == user_id).values(referral_id=None))
+    connection.execute(commissions.delete().where(commissions.c.referrer_id == user_id))
+
+    earnings = ReferralEarning.__table__
+    user = db.session.get(User, user_id)
+    if user is not None and user.referrer_id:
+        stats = ReferralStats.__table__
+        connection.execute(
+            stats.update().where(stats.c.referrer_id == user.referrer_id).values(
+                referrals_count=db.case((stats.c.referrals_count > 0, stats.c.referrals_count - 1), else_=0)
+            )
+        )
+    connection.execute(earnings.delete().where(db.or_(
+        earnings.c.referral_id == user_id, earnings.c.referrer_id == user_id
+    )))
+    connection.execute(ReferralStats.__table__.delete().where(ReferralStats.__table__.c.referrer_id == user_id))
+
+
+def rebuild_referral_stats():
+    """
+    Пересобрать статистику по пользователям и журналу начислений
+
+    Используется для первоначального заполнения: начисления до появления журнала
+    не записывались, поэтому у старых рефереров заработок считается с нуля.
+    """
+    today = datetime.now(timezone.utc).date()
+    since = _window_start(today)
+
+    counts = dict(db.session.query(User.referrer_id, db.func.count(User.id)).filter(
+        User.referrer_id.isnot(None)
+    ).group_by(User.referrer_id).all())
+
+    earned = {}
+    for referrer_id, count, total, last_at in db.session.query(
+        ReferralCommission.referrer_id,
+        db.func.count(ReferralCommission.id),
+        db.func.coalesce(db.func.sum(ReferralCommission.amount), 0.0),
+        db.func.max(ReferralCommission.created_at)
+    ).group_by(ReferralCommission.referrer_id).all():
+        earned[referrer_id] = (count, float(total or 0.0), last_at)
+    recent = dict(db.session.query(
+        ReferralCommission.referrer_id, db.func.sum(ReferralCommission.amount)
+    ).filter(ReferralCommission.created_at >= since).group_by(ReferralCommission.referrer_id).all())
+
+    by_referral = {}
+    for referral_id, count, total, last_at in db.session.query(
+        ReferralCommission.referral_id,
+        db.func.count(ReferralCommission.id),
+        db.func.coalesce(db.func.sum(ReferralCommission.amount), 0.0),
+        db.func.max(ReferralCommission.created_at)
+    ).filter(ReferralCommission.referral_id.isnot(None)).group_by(ReferralCommission.referral_id).all():
+        by_referral[referral_id] = (count, float(total or 0.0), last_at)
+
+    now = datetime.now(timezone.utc)
+    ReferralEarning.query.delete()
+    ReferralStats.query.delete()
+    for referrer_id in set(counts) | set(earned):
+        count, total, last_at = earned.get(referrer_id, (0, 0.0, None))
+        db.session.add(ReferralStats(
+            referrer_id=referrer_id,
+            referrals_count=counts.get(referrer_id, 0),
+            commissions_count=count,
+            total_earned=total,
+            earned_30d=float(recent.get(referrer_id) or 0.0),
+            earned_30d_day=today,
+            last_commission_at=last_at,
+            updated_at=now
+        ))
+    for referral_id, referrer_id, created_at in db.session.query(
+        User.id, User.referrer_id, User.created_at
+    ).filter(User.referrer_id.isnot(None)).all():
+        count, total, last_at = by_referral.get(referral_id, (0, 0.0, None))
+        db.session.add(ReferralEarning(
+            referral_id=referral_id,
+            referrer_id=referrer_id,
+            joined_at=created_at or now,
+            commissions_count=count,
+            total_earned=total,
+            last_commission_at=last_at
+        ))
+    db.session.commit()
+    return len(counts)
+
+
+__all__ = [
+    'add_referral_commission',
+    'get_referral_stats',
+    'list_referrals',
+    'forget_referral_user',
+    'rebuild_referral_stats'
+]
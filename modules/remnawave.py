@@ -0,0 +1,289 @@
+"""
+Общий клиент RemnaWave API
+
+Один пул keep-alive соединений на процесс вместо голых requests.get/patch
+в каждом модуле. Таймауты задаются на каждый вызов, временные ошибки
+(обрыв соединения, 502/503/504) повторяются с экспоненциальной задержкой и джиттером.
+
+Использование:
+    from modules.remnawave import get_remnawave_client
+
+    rw = get_remnawave_client()
+    live = rw.get_user(user.remnawave_uuid)
+    rw.patch_user(user.remnawave_uuid, expireAt=new_exp)
+"""
+import os
+import json
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Таймаут по умолчанию: (connect, read)
+DEFAULT_TIMEOUT = (
+    float(os.getenv("REMNAWAVE_CONNECT_TIMEOUT", "3")),
+    float(os.getenv("REMNAWAVE_READ_TIMEOUT", "10"))
+)
+DEFAULT_RETRIES = int(os.getenv("REMNAWAVE_RETRIES", "2"))
+DEFAULT_POOL_SIZE = int(os.getenv("REMNAWAVE_POOL_SIZE", "20"))
+
+RETRY_STATUSES = (502, 503, 504)
+# POST (создание пользователя, рестарт нод) не идемпотентен - повторяем только если соединение не установилось
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'PATCH', 'DELETE')
+
+
+def get_remnawave_headers(additional_headers=None):
+    """Получение заголовков и cookies для RemnaWave API"""
+    headers = {}
+    cookies = {}
+
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+    if ADMIN_TOKEN:
+        headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
+
+    REMNAWAVE_COOKIES_STR = os.getenv("REMNAWAVE_COOKIES", "")
+    if REMNAWAVE_COOKIES_STR:
+        try:
+            cookies = json.loads(REMNAWAVE_COOKIES_STR)
+        except json.JSONDecodeError:
+            pass
+
+    if additional_headers:
+        headers.update(additional_headers)
+
+    return headers, cookies
+
+
+def unwrap_response(resp):
+    """Достать полезную нагрузку из ответа RemnaWave ({"response": ...})"""
+    try:
+        data = resp.json()
+    except ValueError:
+        return None
+    if isinstance(data, dict) and 'response' in data:
+        return data['response']
+    return data
+
+
+class RemnaWaveClient:
+    """Клиент RemnaWave API с пулом соединений и повторами"""
+
+    def __init__(self, base_url=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, pool_size=DEFAULT_POOL_SIZE):
+        self.base_url = (base_url or os.getenv("API_URL") or "").rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+
+        headers, cookies = get_remnawave_headers()
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        if cookies:
+            self.session.cookies.update(cookies)
+
+        # Повторы делаем сами (с джиттером), поэтому у адаптера max_retries=0
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def configured(self):
+        return bool(self.base_url and self.session.headers.get("Authorization"))
+
+    def _backoff(self, attempt):
+        # Экспоненциальная задержка с полным джиттером: 0..(0.2 * 2^attempt) сек
+        time.sleep(random.uniform(0, 0.2 * (2 ** attempt)))
+
+    def request(self, method, path, timeout=None, retries=None, **kwargs):
+        """
+        Выполнить запрос к RemnaWave API
+
+        Returns:
+            requests.Response (ошибки HTTP не поднимаются, сетевые - после исчерпания повторов)
+        """
+        method = method.upper()
+        url = f"{self.base_url}{path}"
+        timeout = timeout or self.timeout
+        retries = self.retries if retries is None else retries
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectTimeout as e:
+                # Соединение не установлено - запрос точно не ушел, повтор безопасен для любого метода
+                if attempt >= retries:
+                    raise
+                print(f"[REMNAWAVE] {method} {path}: {e}, повтор {attempt + 1}/{retries}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= retries or not idempotent:
+                    raise
+                print(f"[REMNAWAVE] {method} {path}: {e}, повтор {attempt + 1}/{retries}")
+            else:
+                if resp.status_code in RETRY_STATUSES and idempotent and attempt < retries:
+                    print(f"[REMNAWAVE] {method} {path}: HTTP {resp.status_code}, повтор {attempt + 1}/{retries}")
+                else:
+                    return resp
+            self._backoff(attempt)
+            attempt += 1
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Пользователи
+    # ------------------------------------------------------------------
+
+    def get_user(self, uuid, **kwargs):
+        """Пользователь по UUID (dict) или None"""
+        if not uuid:
+            return None
+        resp = self.get(f"/api/users/{uuid}", **kwargs)
+        if resp.status_code != 200:
+            return None
+        data = unwrap_response(resp)
+        return data if isinstance(data, dict) else None
+
+    def get_user_by_short_uuid(self, short_uuid, **kwargs):
+        """Пользователь по shortUuid (dict) или None"""
+        resp = self.get(f"/api/users/by-short-uuid/{short_uuid}", **kwargs)
+        if resp.status_code != 200:
+            return None
+        data = unwrap_response(resp)
+        return data if isinstance(data, dict) else None
+
+    def get_users_by_email(self, email, **kwargs):
+        """Список пользователей с указанным email"""
+        from urllib.parse import quote
+        resp = self.get(f"/api/users/by-email/{quote(email, safe='')}", **kwargs)
+        if resp.status_code != 200:
+            return []
+        data = unwrap_response(resp)
+        return data if isinstance(data, list) else ([data] if isinstance(data, dict) else [])
+
+    def get_users_by_telegram_id(self, telegram_id, **kwargs):
+        """Список пользователей с указанным telegramId"""
+        resp = self.get(f"/api/users/by-telegram-id/{telegram_id}", **kwargs)
+        if resp.status_code != 200:
+            return []
+        data = unwrap_response(resp)
+        return data if isinstance(data, list) else ([data] if isinstance(data, dict) else [])
+
+    def list_users(self, page_size=500, **kwargs):
+        """Все пользователи панели (постранично через start/size)"""
+        return list(self.iter_users(page_size=page_size, **kwargs))
+
+    def iter_users(self, page_size=500, **kwargs):
+        """Генератор по всем пользователям панели, по одной странице за запрос"""
+        start = 0
+        while True:
+            resp = self.get("/api/users", params={"start": start, "size": page_size}, **kwargs)
+            resp.raise_for_status()
+            data = unwrap_response(resp)
+            users = data.get('users', []) if isinstance(data, dict) else (data if isinstance(data, list) else [])
+            total = data.get('total') if isinstance(data, dict) else None
+
+            for u in users:
+                if isinstance(u, dict):
+                    yield u
+
+            start += len(users)
+            if len(users) < page_size or (total is not None and start >= total):
+                break
+
+    def create_user(self, payload, **kwargs):
+        """Создать пользователя (Response)"""
+        return self.post("/api/users", json=payload, **kwargs)
+
+    def patch_user(self, uuid, **fields):
+        """
+        Обновить пользователя (uuid передается в теле запроса)
+
+        Returns:
+            requests.Response
+        """
+        timeout = fields.pop('timeout', None)
+        payload = {"uuid": uuid}
+        payload.update(fields)
+        return self.patch("/api/users", json=payload, timeout=timeout)
+
+    def delete_user(self, uuid, **kwargs):
+        """Удалить пользователя (Response)"""
+        return self.delete(f"/api/users/{uuid}", **kwargs)
+
+    def accessible_nodes(self, uuid, **kwargs):
+        """Доступные пользователю ноды (полезная нагрузка ответа) или None"""
+        resp = self.get(f"/api/users/{uuid}/accessible-nodes", **kwargs)
+        if resp.status_code != 200:
+            return None
+        return unwrap_response(resp)
+
+    # ------------------------------------------------------------------
+    # Сквады и ноды
+    # ------------------------------------------------------------------
+
+    def internal_squads(self, **kwargs):
+        """Список внутренних сквадов (поднимает HTTPError при ошибке)"""
+        resp = self.get("/api/internal-squads", **kwargs)
+        resp.raise_for_status()
+        data = unwrap_response(resp)
+        if isinstance(data, dict) and 'internalSquads' in data:
+            return data['internalSquads']
+        return data if isinstance(data, list) else []
+
+    def nodes(self, public=False, **kwargs):
+        """Список нод (поднимает HTTPError при ошибке)"""
+        resp = self.get("/api/nodes/public" if public else "/api/nodes", **kwargs)
+        resp.raise_for_status()
+        data = unwrap_response(resp)
+        return data if isinstance(data, list) else []
+
+    def node_action(self, uuid, action, **kwargs):
+        """Действие над нодой: restart, enable, disable (Response)"""
+        if action == 'restart':
+            return self.post(f"/api/nodes/{uuid}/restart", **kwargs)
+        return self.post(f"/api/nodes/{uuid}/actions/{action}", **kwargs)
+
+    def restart_all_nodes(self, **kwargs):
+        return self.post("/api/nodes/restart-all", **kwargs)
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_remnawave_client():
+    """
+    Клиент RemnaWave для текущего процесса
+
+    Создается лениво; после fork (gunicorn) каждый воркер получает свой пул соединений.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = RemnaWaveClient()
+                _client_pid = pid
+    return _client
+
+
+__all__ = [
+    'RemnaWaveClient',
+    'get_remnawave_client',
+    'get_remnawave_headers',
+    'unwrap_response',
+    'DEFAULT_TIMEOUT'
+]
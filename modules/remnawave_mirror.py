@@ -0,0 +1,234 @@
+"""
+Зеркало пользователей RemnaWave (таблица remnawave_user_state)
+
+Вместо GET /api/users/{uuid} на каждый промах live_data_{uuid} запросы читают
+локальный снимок. Снимок поддерживается:
+  - фоновой синхронизацией sync_remnawave_users() (постраничный обход /api/users);
+  - обновлением на месте после PATCH в RemnaWave (store_patch_result / update_live_data).
+
+Запись идет в транзакции db.session вызывающего кода (в точке сохранения) и
+коммитится: второе соединение на SQLite упиралось бы в "database is locked", если
+сессия запроса уже пишет, а загруженные в сессию снимки оставались бы устаревшими
+(коммит их сбрасывает). Вызывается после PATCH в RemnaWave, когда изменения
+запроса уже готовы к коммиту.
+"""
+import os
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam
+
+from modules.core import get_db
+from modules.currency import parse_iso_datetime
+from modules.models.remnawave_user import RemnaWaveUserState
+from modules.remnawave import get_remnawave_client, unwrap_response
+
+db = get_db()
+
+# Интервал фоновой синхронизации (сек)
+SYNC_INTERVAL = int(os.getenv("REMNAWAVE_SYNC_INTERVAL", "120"))
+# Если снимок старше (например, синхронизация не запущена) - читаем пользователя из API
+MAX_AGE = int(os.getenv("REMNAWAVE_MIRROR_MAX_AGE", "900"))
+SYNC_PAGE_SIZE = int(os.getenv("REMNAWAVE_SYNC_PAGE_SIZE", "500"))
+
+
+def _as_utc(dt):
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _to_int(value):
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _row_values(data, synced_at):
+    """Колонки таблицы из словаря пользователя RemnaWave"""
+    squads = data.get('activeInternalSquads') or []
+    squad_uuids = [s.get('uuid') if isinstance(s, dict) else s for s in squads]
+    used_traffic = data.get('usedTrafficBytes')
+    if used_traffic is None and isinstance(data.get('userTraffic'), dict):
+        used_traffic = data['userTraffic'].get('usedTrafficBytes')
+    telegram_id = data.get('telegramId')
+
+    return {
+        'uuid': data['uuid'],
+        'short_uuid': data.get('shortUuid'),
+        'username': data.get('username'),
+        'email': (data.get('email') or None),
+        'telegram_id': str(telegram_id) if telegram_id is not None else None,
+        'status': data.get('status'),
+        'expire_at': _as_utc(parse_iso_datetime(data.get('expireAt'))),
+        'used_traffic_bytes': _to_int(used_traffic),
+        'traffic_limit_bytes': _to_int(data.get('trafficLimitBytes')),
+        'hwid_device_limit': _to_int(data.get('hwidDeviceLimit')),
+        'active_squads': json.dumps([s for s in squad_uuids if s]),
+        'subscription_url': data.get('subscriptionUrl'),
+        'data': json.dumps(data, default=str),
+        'synced_at': synced_at
+    }
+
+
+def _upsert_rows(conn, rows):
+    """Вставить/обновить пачку строк (conn - db.session или соединение)"""
+    if not rows:
+        return
+    table = RemnaWaveUserState.__table__
+    uuids = [r['uuid'] for r in rows]
+    existing = {r[0] for r in conn.execute(table.select().with_only_columns(table.c.uuid).where(table.c.uuid.in_(uuids)))}
+
+    to_update = [dict(r, b_uuid=r['uuid']) for r in rows if r['uuid'] in existing]
+    to_insert = [r for r in rows if r['uuid'] not in existing]
+
+    if to_update:
+        columns = {k: bindparam(k) for k in rows[0] if k != 'uuid'}
+        conn.execute(table.update().where(table.c.uuid == bindparam('b_uuid')).values(**columns), to_update)
+    if to_insert:
+        conn.execute(table.insert(), to_insert)
+
+
+def _write(statement_fn):
+    """Выполнить запись в транзакции db.session и закоммитить ее"""
+    with db.session.begin_nested():
+        statement_fn(db.session)  # при ошибке откатывается только точка сохранения
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _store_row(data, synced_at):
+    if not isinstance(data, dict) or not data.get('uuid'):
+        return
+    try:
+        _write(lambda session: _upsert_rows(session, [_row_values(data, synced_at)]))
+    except Exception as e:
+        print(f"[MIRROR] Не удалось сохранить снимок {data.get('uuid')}: {e}")
+
+
+def store_live_data(data):
+    """Сохранить (или обновить) снимок пользователя по ответу RemnaWave"""
+    _store_row(data, datetime.now(timezone.utc))
+
+
+def get_live_data(uuid, force_refresh=False):
+    """
+    Данные пользователя RemnaWave (dict) из зеркала
+
+    При отсутствии/устаревании снимка или force_refresh - один GET в RemnaWave
+    с сохранением результата. Возвращает None, если пользователь не найден.
+    """
+    if not uuid:
+        return None
+
+    if not force_refresh:
+        row = db.session.get(RemnaWaveUserState, uuid)
+        if row is not None:
+            age = (datetime.now(timezone.utc) - _as_utc(row.synced_at)).total_seconds()
+            if age < MAX_AGE:
+                return row.get_data()
+
+    data = get_remnawave_client().get_user(uuid)
+    if data is not None:
+        store_live_data(data)
+    return data
+
+
+def update_live_data(uuid, **fields):
+    """
+    Обновить поля снимка на месте (например expireAt после PATCH)
+
+    Используется, когда ответ RemnaWave не содержит пользователя. synced_at не
+    меняется: остальные поля снимка не свежее, чем были.
+    """
+    if not uuid:
+        return
+    row = db.session.get(RemnaWaveUserState, uuid)
+    if row is None:
+        return
+    data = row.get_data()
+    data.update(fields)
+    _store_row(data, row.synced_at)
+
+
+def store_patch_result(resp, uuid, fields=None):
+    """
+    Обновить зеркало по ответу PATCH /api/users
+
+    RemnaWave возвращает обновленного пользователя - сохраняем его целиком;
+    иначе применяем отправленные поля (payload запроса) к текущему снимку.
+    """
+    if resp is None or not resp.ok:
+        return
+    data = unwrap_response(resp)
+    if isinstance(data, dict) and data.get('uuid'):
+        store_live_data(data)
+    elif uuid and fields:
+        update_live_data(uuid, **{k: v for k, v in fields.items() if k != 'uuid'})
+
+
+def delete_live_data(uuid):
+    """Удалить снимок (пользователь удален из RemnaWave)"""
+    if not uuid:
+        return
+    table = RemnaWaveUserState.__table__
+    _write(lambda session: session.execute(table.delete().where(table.c.uuid == uuid)))
+
+
+def sync_remnawave_users(page_size=SYNC_PAGE_SIZE):
+    """
+    Полная синхронизация зеркала: постраничный обход /api/users
+
+    Каждая страница - одна транзакция. Снимки пользователей, которых больше нет
+    в панели, удаляются только после успешного обхода всех страниц.
+
+    Returns:
+        dict со статистикой
+    """
+    rw = get_remnawave_client()
+    if not rw.configured:
+        return {'synced': 0, 'removed': 0, 'skipped': True}
+
+    started_at = datetime.now(timezone.utc)
+    table = RemnaWaveUserState.__table__
+    synced = 0
+    page = []
+
+    def flush():
+        nonlocal synced, page
+        _write(lambda session: _upsert_rows(session, page))
+        synced += len(page)
+        page = []
+
+    for u in rw.iter_users(page_size=page_size):
+        if not u.get('uuid'):
+            continue
+        page.append(_row_values(u, started_at))
+        if len(page) >= page_size:
+            flush()
+    if page:
+        flush()
+
+    removed = db.session.execute(table.delete().where(table.c.synced_at < started_at)).rowcount
+    db.session.commit()
+
+    elapsed = (datetime.now(timezone.utc) - started_at).total_seconds()
+    print(f"[MIRROR] Синхронизировано {synced} пользователей RemnaWave за {elapsed:.1f}с, удалено {removed}")
+    return {'synced': synced, 'removed': removed, 'elapsed': elapsed}
+
+
+__all__ = [
+    'get_live_data',
+    'store_live_data',
+    'store_patch_result',
+    'update_live_data',
+    'delete_live_data',
+    'sync_remnawave_users',
+    'SYNC_INTERVAL'
+]
@@ -0,0 +1,212 @@
+"""
+Реестр настроек-синглтонов (SystemSetting, BrandingSetting, BotConfig,
+ReferralSetting, PaymentSetting)
+
+Строки настроек меняются только при сохранении формы в админке, а читаются почти
+в каждом запросе. Реестр загружает строку один раз на воркер и отдает неизменяемый
+снимок (SettingsSnapshot) - без запроса к БД и без привязки к db.session.
+
+Согласованность между воркерами gunicorn - через ключи версий в общем кеше
+(Redis или FileSystemCache): админский эндпоинт после commit вызывает
+invalidate_settings(...), который записывает новую версию. Остальные воркеры
+сверяют версии не чаще раза в SETTINGS_VERSION_CHECK_INTERVAL и перечитывают
+изменившиеся строки. Без общего кеша (CACHE_TYPE=null) снимок просто живет
+SETTINGS_VERSION_CHECK_INTERVAL секунд.
+
+Снимки только для чтения. Для изменения настроек используйте модель
+(Model.query.first()) и после commit - invalidate_settings().
+"""
+import os
+import time
+import threading
+
+from modules.core import get_app, get_db
+
+app = get_app()
+db = get_db()
+
+SETTINGS_VERSION_CHECK_INTERVAL = float(os.getenv("SETTINGS_VERSION_CHECK_INTERVAL", "1"))
+
+# Имя настроек -> (модуль, класс модели)
+SETTINGS_MODELS = {
+    'system': ('modules.models.system', 'SystemSetting'),
+    'branding': ('modules.models.branding', 'BrandingSetting'),
+    'bot_config': ('modules.models.bot_config', 'BotConfig'),
+    'referral': ('modules.models.referral', 'ReferralSetting'),
+    'payment': ('modules.models.payment', 'PaymentSetting'),
+}
+
+_loaders = {}  # name -> функция загрузки для наборов, которые не являются одной строкой модели
+
+_lock = threading.Lock()
+_snapshots = {}  # name -> (version, snapshot)
+_versions = {}  # name -> версия из общего кеша
+_versions_checked_at = 0.0
+
+
+class SettingsSnapshot:
+    """Неизменяемая копия строки настроек (значения колонок)"""
+    __slots__ = ('_values',)
+
+    def __init__(self, values):
+        object.__setattr__(self, '_values', dict(values))
+
+    def __getattr__(self, name):
+        values = object.__getattribute__(self, '_values')
+        if name in values:
+            return values[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings snapshot is read-only, update the model and call invalidate_settings()")
+
+    def to_dict(self):
+        return dict(object.__getattribute__(self, '_values'))
+
+    def __repr__(self):
+        return f"<SettingsSnapshot id={self._values.get('id')}>"
+
+
+def register_settings(name, loader):
+    """
+    Зарегистрировать дополнительный набор данных, который кешируется так же, как настройки
+
+    loader() вызывается в контексте приложения и должен вернуть неизменяемое значение.
+    """
+    _loaders[name] = loader
+
+
+def _names():
+    return list(SETTINGS_MODELS) + list(_loaders)
+
+
+def _model(name):
+    module_name, class_name = SETTINGS_MODELS[name]
+    module = __import__(module_name, fromlist=[class_name])
+    return getattr(module, class_name)
+
+
+def _shared_cache():
+    """Кеш, общий для воркеров (Redis или FileSystemCache), или None"""
+    if app.config.get('CACHE_TYPE') not in ('RedisCache', 'FileSystemCache'):
+        return None
+    from modules.core import get_cache
+    return get_cache()
+
+
+def _version_key(name):
+    return f'settings_version_{name}'
+
+
+def _refresh_versions():
+    """Сверить версии с общим кешем (не чаще SETTINGS_VERSION_CHECK_INTERVAL)"""
+    global _versions_checked_at
+    now = time.monotonic()
+    if now - _versions_checked_at < SETTINGS_VERSION_CHECK_INTERVAL:
+        return
+    _versions_checked_at = now
+
+    shared = _shared_cache()
+    if shared is None:
+        # Общего кеша нет - снимки просто устаревают по времени
+        _snapshots.clear()
+        return
+    try:
+        names = _names()
+        values = shared.get_many(*[_version_key(n) for n in names])
+    except Exception as e:
+        print(f"[SETTINGS] Кеш версий недоступен: {e}")
+        _snapshots.clear()
+        return
+    for name, version in zip(names, values):
+        _versions[name] = version
+
+
+def _load(name):
+    if name in _loaders:
+        return _loaders[name]()
+    row = _model(name).query.first()
+    if row is None:
+        return None
+    columns = db.inspect(row).mapper.column_attrs
+    return SettingsSnapshot({c.key: getattr(row, c.key) for c in columns})
+
+
+def get_settings(name):
+    """
+    Снимок настроек по имени из SETTINGS_MODELS (или зарегистрированного набора)
+
+    Returns:
+        SettingsSnapshot или None, если строки настроек еще нет
+    """
+    with _lock:
+        _refresh_versions()
+        version = _versions.get(name)
+        entry = _snapshots.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+    snapshot = _load(name)
+    if snapshot is not None:
+        # Отсутствие строки не кешируем: ее создание не всегда сопровождается сбросом
+        with _lock:
+            _snapshots[name] = (version, snapshot)
+    return snapshot
+
+
+def invalidate_settings(*names):
+    """
+    Сбросить снимки после сохранения настроек (вызывать после db.session.commit())
+
+    Без аргументов сбрасываются все настройки.
+    """
+    names = names or tuple(_names())
+    with _lock:
+        for name in names:
+            _snapshots.pop(name, None)
+
+    shared = _shared_cache()
+    if shared is None:
+        return
+    version = str(time.time_ns())
+    with _lock:
+        for name in names:
+            _versions[name] = version
+    try:
+        shared.set_many({_version_key(name): version for name in names}, timeout=0)
+    except Exception as e:
+        print(f"[SETTINGS] Не удалось обновить версию настроек {names}: {e}")
+
+
+def get_system_settings():
+    return get_settings('system')
+
+
+def get_branding_settings():
+    return get_settings('branding')
+
+
+def get_bot_config():
+    return get_settings('bot_config')
+
+
+def get_referral_settings():
+    return get_settings('referral')
+
+
+def get_payment_settings():
+    return get_settings('payment')
+
+
+__all__ = [
+    'SettingsSnapshot',
+    'SETTINGS_MODELS',
+    'get_settings',
+    'invalidate_settings',
+    'register_settings',
+    'get_system_settings',
+    'get_branding_settings',
+    'get_bot_config',
+    'get_referral_settings',
+    'get_payment_settings'
+]
@@ -0,0 +1,341 @@
+"""
+Отдача статики: админка, mini app, mini app v2
+
+Корневые папки ищутся один раз, и каждая сканируется в манифест в памяти:
+относительный путь -> StaticAsset (файл, размер, mtime, ETag, gzip/brotli вариант).
+Запрос - поиск в словаре, без os.path.exists по списку кандидатов.
+
+- ETag - хеш содержимого, If-None-Match -> 304 без тела;
+- файлы с хешем в имени в static/ и assets/ (main.3f2a1b9c.js) - Cache-Control immutable
+  на год; html (index.html) - no-cache, то есть перепроверка по ETag;
+- текстовые файлы сжимаются при сканировании (gzip, brotli - если установлен пакет
+  brotli); готовые .gz/.br рядом с файлом используются как есть;
+- манифест перестраивается, если изменился корень или его index.html (новая сборка
+  фронтенда), проверка не чаще STATIC_MANIFEST_CHECK_INTERVAL.
+
+Чтобы отдавать статику nginx напрямую, без Flask:
+    python3 -m modules.static_assets nginx [--write-compressed]
+"""
+import os
+import re
+import sys
+import gzip
+import time
+import hashlib
+import mimetypes
+import threading
+from collections import namedtuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATIC_MANIFEST_CHECK_INTERVAL = float(os.getenv("STATIC_MANIFEST_CHECK_INTERVAL", "5"))
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "300"))
+IMMUTABLE_MAX_AGE = 31536000
+PRECOMPRESS_MIN_SIZE = 1024
+PRECOMPRESS_MAX_SIZE = int(os.getenv("STATIC_PRECOMPRESS_MAX_SIZE", str(5 * 1024 * 1024)))
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json', 'application/xml',
+    'image/svg+xml', 'application/manifest+json'
+)
+# main.3f2a1b9c.js, 787.5b8a1c2d.chunk.js, index-BxY3zK9a.js
+HASHED_NAME = re.compile(r'[.-](?=[A-Za-z0-9_]*\d)[A-Za-z0-9_]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+mimetypes.add_type('application/javascript', '.js')
+mimetypes.add_type('application/javascript', '.mjs')
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+StaticAsset = namedtuple('StaticAsset', 'path size mtime etag mimetype immutable variants')
+
+
+def _candidates(env_name, subdir, extra=()):
+    env_path = os.getenv(env_name, "").strip() if env_name else ""
+    paths = [env_path] if env_path else []
+    paths += [
+        f'/app/frontend/build/{subdir}',  # Docker
+        os.path.join(BASE_DIR, 'frontend', 'build', subdir),
+        os.path.join(BASE_DIR, 'admin-panel', subdir),
+        os.path.join(BASE_DIR, 'admin-panel', 'build', subdir),
+    ]
+    return paths + list(extra)
+
+
+# Имя корня -> пути-кандидаты в порядке приоритета (нужен index.html)
+STATIC_ROOTS = {
+    'miniapp_v2': _candidates('MINIAPP_V2_PATH', 'miniapp-v2'),
+    'miniapp': _candidates('MINIAPP_PATH', 'miniapp', extra=[os.path.join(BASE_DIR, 'miniapp')]),
+    'admin': [
+        os.path.join(BASE_DIR, 'frontend', 'build'),
+        os.path.join(BASE_DIR, 'admin-panel', 'build'),
+    ],
+}
+
+# URL префикс корня (для nginx)
+STATIC_URL_PREFIXES = {
+    'miniapp_v2': '/miniapp-v2/',
+    'miniapp': '/miniapp/',
+    'admin': '/',
+}
+
+_lock = threading.Lock()
+_roots = {}  # name -> путь или None
+_manifests = {}  # name -> {relative path: StaticAsset}
+_signatures = {}  # name -> (mtime корня, mtime index.html)
+_checked_at = {}  # name -> time.monotonic()
+
+
+def _resolve_root(name):
+    for path in STATIC_ROOTS[name]:
+        if path and os.path.isfile(os.path.join(path, 'index.html')):
+            return os.path.abspath(path)
+    return None
+
+
+def _signature(root):
+    try:
+        return (os.stat(root).st_mtime_ns, os.stat(os.path.join(root, 'index.html')).st_mtime_ns)
+    except OSError:
+        return None
+
+
+def _is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _read_variant(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _scan_file(root, rel_path):
+    path = os.path.join(root, rel_path)
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    variants = {}
+    if _is_compressible(mimetype) and PRECOMPRESS_MIN_SIZE <= stat.st_size <= PRECOMPRESS_MAX_SIZE:
+        # Готовые варианты из сборки, иначе сжимаем сами
+        variants['br'] = _read_variant(path + '.br')
+        if variants['br'] is None and brotli is not None:
+            variants['br'] = brotli.compress(content, quality=9)
+        variants['gzip'] = _read_variant(path + '.gz') or gzip.compress(content, compresslevel=9, mtime=0)
+        variants = {k: v for k, v in variants.items() if v is not None and len(v) < stat.st_size}
+
+    parts = rel_path.replace(os.sep, '/').split('/')
+    immutable = parts[0] in ('static', 'assets') and bool(HASHED_NAME.search(parts[-1]))
+    return StaticAsset(
+        path=path,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        etag=hashlib.sha1(content).hexdigest()[:20],
+        mimetype=mimetype,
+        immutable=immutable,
+        variants=variants
+    )
+
+
+def _scan_root(name, root):
+    # Вложенные корни (miniapp внутри frontend/build) сканируются отдельно
+    nested = {path for other, path in _roots.items() if other != name and path and path != root}
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) not in nested]
+        for filename in filenames:
+            if filename.endswith(('.gz', '.br')):
+                continue
+            rel_path = os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/')
+            try:
+                manifest[rel_path] = _scan_file(root, rel_path)
+            except OSError as e:
+                print(f"[STATIC] Не удалось прочитать {rel_path}: {e}")
+    return manifest
+
+
+def _refresh(name, force=False):
+    now = time.monotonic()
+    if not force and now - _checked_at.get(name, 0.0) < STATIC_MANIFEST_CHECK_INTERVAL:
+        return
+    _checked_at[name] = now
+
+    root = _roots.get(name)
+    if root is None:
+        root = _resolve_root(name)
+    signature = _signature(root) if root else None
+    if signature is None:
+        # Корень не найден или сборку удалили - попробуем найти заново
+        root = _resolve_root(name)
+        signature = _signature(root) if root else None
+    if root == _roots.get(name) and signature == _signatures.get(name) and name in _manifests:
+        return
+
+    started = time.monotonic()
+    _roots[name] = root
+    _manifests[name] = _scan_root(name, root) if root else {}
+    _signatures[name] = signature
+    if root:
+        compressed = sum(1 for asset in _manifests[name].values() if asset.variants)
+        print(f"[STATIC] {name}: {root}, файлов: {len(_manifests[name])}, сжатых: {compressed}, "
+              f"{time.monotonic() - started:.2f}с")
+
+
+def load_static_manifests():
+    """Найти корни и построить манифесты (при старте, до форка воркеров)"""
+    with _lock:
+        for name in STATIC_ROOTS:
+            _roots[name] = _resolve_root(name)
+        for name in STATIC_ROOTS:
+            _refresh(name, force=True)
+
+
+def get_manifest(name):
+    """Манифест корня {relative path: StaticAsset} и путь корня (None, если не найден)"""
+    with _lock:
+        if name not in _manifests:
+            for other in STATIC_ROOTS:
+                if other not in _roots:
+                    _roots[other] = _resolve_root(other)
+        _refresh(name)
+        return _manifests[name], _roots[name]
+
+
+def find_asset(name, path):
+    manifest, _ = get_manifest(name)
+    return manifest.get(path.lstrip('/'))
+
+
+def _cache_control(asset):
+    if asset.immutable:
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    if asset.mimetype == 'text/html':
+        return 'no-cache'
+    return f'public, max-age={STATIC_MAX_AGE}'
+
+
+def asset_response(asset):
+    """Ответ с файлом: 304 по ETag, сжатый вариант по Accept-Encoding"""
+    from flask import request, send_file, Response
+
+    encoding = None
+    if asset.variants:
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+    etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(asset.etag):
+        response = Response(status=304)
+    elif encoding:
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_file(asset.path, mimetype=asset.mimetype, conditional=False, etag=False, max_age=None)
+
+    response.set_etag(etag)
+    response.last_modified = asset.mtime
+    response.headers['Cache-Control'] = _cache_control(asset)
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def serve_static(name, path, spa_fallback=True):
+    """
+    Файл из корня name; если файла нет - index.html (SPA) или None
+
+    Returns:
+        Response или None, если корень не найден
+    """
+    manifest, root = get_manifest(name)
+    if not root:
+        return None
+    asset = manifest.get(path.lstrip('/')) if path and not path.endswith('/') else None
+    if asset is None and (spa_fallback or not path or path.endswith('/')):
+        asset = manifest.get('index.html')
+    if asset is None:
+        return None
+    return asset_response(asset)
+
+
+# ============================================================================
+# NGINX
+# ============================================================================
+
+def write_compressed_files():
+    """Записать .gz/.br рядом с файлами (для gzip_static / brotli_static в nginx)"""
+    written = 0
+    for name in STATIC_ROOTS:
+        manifest, root = get_manifest(name)
+        for asset in manifest.values():
+            for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+                data = asset.variants.get(encoding)
+                if data is not None and not os.path.exists(asset.path + suffix):
+                    with open(asset.path + suffix, 'wb') as f:
+                        f.write(data)
+                    written += 1
+    return written
+
+
+def nginx_snippet():
+    """location-блоки nginx для статики (вставить в server перед proxy_pass на API)"""
+    lines = ["# StealthNET: статика без Flask (python3 -m modules.static_assets nginx)"]
+    for name in ('miniapp_v2', 'miniapp', 'admin'):
+        _, root = get_manifest(name)
+        if not root:
+            lines.append(f"# {name}: сборка не найдена")
+            continue
+        prefix = STATIC_URL_PREFIXES[name]
+        if name == 'admin':
+            lines += [
+                "location /static/ {",
+                f"    alias {root}/static/;",
+                "    gzip_static on;",
+                "    # brotli_static on;  # модуль ngx_brotli",
+                f'    add_header Cache-Control "public, max-age={IMMUTABLE_MAX_AGE}, immutable";',
+                "    try_files $uri =404;",
+                "}",
+                "# /api/ и вебхуки остаются отдельными location с proxy_pass на API",
+            ]
+        lines += [
+            f"location {prefix} {{",
+            f"    alias {root}/;",
+            "    gzip_static on;",
+            "    # brotli_static on;  # модуль ngx_brotli",
+            "    etag on;",
+            '    add_header Cache-Control "no-cache";',
+            f"    try_files $uri $uri/ {prefix}index.html;",
+            "}",
+        ]
+    return "\n".join(lines)
+
+
+
+__all__ = [
+    'StaticAsset',
+    'load_static_manifests',
+    'get_manifest',
+    'find_asset',
+    'asset_response',
+    'serve_static',
+    'write_compressed_files',
+    'nginx_snippet'
+]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'nginx':
+        print("Использование: python3 -m modules.static_assets nginx [--write-compressed]")
+        sys.exit(1)
+    load_static_manifests()
+    if '--write-compressed' in sys.argv[2:]:
+        print(f"# Записано сжатых файлов: {write_compressed_files()}")
+    print(nginx_snippet())
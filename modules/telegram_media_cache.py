@@ -0,0 +1,140 @@
+"""
+Кеш file_id Telegram для повторно отправляемых медиа
+
+После первой загрузки файла Telegram возвращает file_id, по которому тот же файл
+можно отправлять без передачи байтов. Кеш хранит соответствие
+(файл / содержимое -> file_id) отдельно для каждого бота: file_id действителен
+только для бота, который загрузил файл.
+
+Ключ медиа:
+  - для файла на диске - путь + sha256 содержимого (при изменении логотипа ключ меняется);
+  - для bytes - sha256 содержимого.
+
+Кеш сохраняется в JSON (TELEGRAM_MEDIA_CACHE_PATH) и используется и ботом, и API
+(рассылки). Модуль без зависимостей от Flask - бот импортирует его напрямую.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+TELEGRAM_MEDIA_CACHE_PATH = os.getenv(
+    "TELEGRAM_MEDIA_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "stealthnet_telegram_media.json")
+)
+MAX_ENTRIES_PER_BOT = 1000
+
+# Ответы Bot API на устаревший или чужой file_id
+INVALID_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "file_id",
+)
+
+_lock = threading.Lock()
+_entries = {}  # token_hash -> {media_key: file_id}
+_loaded_mtime = None
+_file_digests = {}  # path -> (mtime_ns, size, sha256)
+
+
+def _token_hash(bot_token):
+    # Сам токен в файл не пишем
+    return hashlib.sha256((bot_token or "").encode("utf-8")).hexdigest()[:16]
+
+
+def media_key(path=None, content=None):
+    """Ключ медиа по пути к файлу или по содержимому"""
+    if path is not None:
+        stat = os.stat(path)
+        cached = _file_digests.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            digest = cached[2]
+        else:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            _file_digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return f"{os.path.abspath(path)}:{digest}"
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def _reload():
+    """Перечитать файл, если его изменил другой процесс"""
+    global _entries, _loaded_mtime
+    try:
+        mtime = os.path.getmtime(TELEGRAM_MEDIA_CACHE_PATH)
+    except OSError:
+        return
+    if mtime == _loaded_mtime:
+        return
+    try:
+        with open(TELEGRAM_MEDIA_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            _entries = data
+        _loaded_mtime = mtime
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Не удалось прочитать кеш file_id Telegram: {e}")
+
+
+def _save():
+    global _loaded_mtime
+    try:
+        directory = os.path.dirname(TELEGRAM_MEDIA_CACHE_PATH) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(_entries, f)
+        os.replace(tmp_path, TELEGRAM_MEDIA_CACHE_PATH)
+        _loaded_mtime = os.path.getmtime(TELEGRAM_MEDIA_CACHE_PATH)
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить кеш file_id Telegram: {e}")
+
+
+def get_file_id(bot_token, key):
+    """file_id ранее загруженного медиа или None"""
+    with _lock:
+        _reload()
+        return _entries.get(_token_hash(bot_token), {}).get(key)
+
+
+def set_file_id(bot_token, key, file_id):
+    """Запомнить file_id из ответа на первую загрузку"""
+    if not file_id:
+        return
+    with _lock:
+        _reload()
+        bot_entries = _entries.setdefault(_token_hash(bot_token), {})
+        if bot_entries.get(key) == file_id:
+            return
+        bot_entries.pop(key, None)
+        bot_entries[key] = file_id
+        # Самые старые записи (порядок вставки) - в начале
+        while len(bot_entries) > MAX_ENTRIES_PER_BOT:
+            del bot_entries[next(iter(bot_entries))]
+        _save()
+
+
+def forget_file_id(bot_token, key):
+    """Удалить file_id, который Telegram больше не принимает"""
+    with _lock:
+        _reload()
+        bot_entries = _entries.get(_token_hash(bot_token), {})
+        if bot_entries.pop(key, None) is not None:
+            _save()
+
+
+def is_invalid_file_id_error(error):
+    """Ошибка Bot API означает, что file_id устарел и файл нужно загрузить заново"""
+    error = str(error or "").lower()
+    return any(marker in error for marker in INVALID_FILE_ID_ERRORS)
+
+
+__all__ = [
+    'media_key',
+    'get_file_id',
+    'set_file_id',
+    'forget_file_id',
+    'is_invalid_file_id_error'
+]
@@ -1,21 +1,211 @@
 #!/usr/bin/env python3
 """
-Общий скрипт для запуска всех миграций схемы базы данных
-Выполняется автоматически перед запуском app.py
+Миграции схемы базы данных с учетом версии
+
+Все шаги подготовки БД (старые SQLite-миграции из migration/, перенос SQLite ->
+PostgreSQL, создание таблиц, дефолтные данные, скрипты add_*.py) перечислены в
+SCHEMA_MIGRATIONS по порядку, у каждого - номер версии. Примененные версии
+хранятся в таблице schema_version (modules.models.schema_version).
+
+При запуске (app.init_database) читается только MAX(version): если новых шагов
+нет, больше ничего не выполняется. Иначе по порядку выполняются только шаги с
+большей версией, все в одном процессе; после каждого шага его версия
+записывается отдельной транзакцией. Если шаг упал, следующие не выполняются -
+при следующем запуске миграции продолжатся с него.
+
+Новый шаг добавляется только в конец списка со следующим номером. Шаги должны
+быть идемпотентными: на существующей БД без schema_version выполняются все шаги.
+
+Запуск вручную:
+    python3 run_schema_migrations.py          - только новые шаги
+    python3 run_schema_migrations.py --all    - все скрипты add_*.py заново (как раньше)
 """
 
 import os
 import sys
+import runpy
 import importlib.util
+from contextlib import contextmanager
 from pathlib import Path
 
+# Получаем путь к директории со скриптами
+BASE_DIR = Path(__file__).parent.absolute()
+
+# Список скриптов миграции в порядке выполнения
+# Важно: порядок имеет значение для зависимостей между таблицами
+# Список не дополнять: по позиции в нем вычисляются версии в SCHEMA_MIGRATIONS
+MIGRATION_SCRIPTS = [
+    ('add_referral_fields.py', 'add_referral_fields'),
+    ('add_user_blocking_fields.py', 'add_user_blocking_fields'),  # Раньше, чтобы is_blocked был доступен
+    ('add_referral_percent_to_user.py', 'add_referral_percent_to_user'),
+    ('add_branding_fields.py', 'add_branding_fields'),
+    ('add_favicon_url_to_branding.py', 'add_favicon_url_to_branding'),  # После add_branding_fields, на случай если favicon_url не был добавлен
+    ('add_yookassa_receipt_field.py', 'add_yookassa_receipt_field'),
+    ('add_squad_ids_to_tariff.py', 'add_squad_ids_to_tariff'),
+    ('add_squad_id_to_promo_code.py', 'add_squad_id_to_promo_code'),
+    ('add_is_admin_to_ticket_message.py', 'add_is_admin_to_ticket_message'),
+    ('add_telegram_message_id_to_payment.py', 'add_telegram_message_id_to_payment'),
+    ('add_button_fields_to_auto_broadcast.py', 'add_button_fields_to_auto_broadcast'),  # Поля кнопок для авторассылки
+    ('add_casino_tables.py', 'add_casino_tables'),  # Таблицы казино
+    ('migration/migrate_add_trial_settings.py', 'migrate_add_trial_settings'),  # Настройки триала
+    ('add_hot_path_indexes.py', 'add_hot_path_indexes'),  # Индексы горячих запросов (после всех таблиц)
+]
+
+# Старые миграции SQLite (раньше запускались отдельными процессами из run_with_migrations.py)
+# Список не дополнять: по позиции в нем вычисляются версии в SCHEMA_MIGRATIONS
+SQLITE_MIGRATION_SCRIPTS = [
+    'migration/migrate_all.py',
+    'migration/migrate_add_active_languages_currencies.py',
+    'migration/migrate_add_bonus_days.py',
+    'migration/migrate_add_bot_config.py',
+    'migration/migrate_add_hwid_device_limit.py',
+    'migration/migrate_add_quick_download.py',
+    'migration/migrate_add_theme_colors.py',
+]
+
+DEFAULT_AUTO_BROADCAST_MESSAGES = {
+    'subscription_expiring_3days': {
+        'text': 'Подписка заканчивается через 3 дня, не забудьте продлить',
+        'enabled': True,
+        'bot_type': 'both'
+    },
+    'trial_expiring': {
+        'text': 'Тестовый период заканчивается, не желаете купить подписку?',
+        'enabled': True,
+        'bot_type': 'both'
+    },
+    'no_subscription': {
+        'text': '🔔 Вы ещё не оформили VPN? Не теряйте время — подключитесь сейчас и защитите свой трафик!',
+        'enabled': True,
+        'bot_type': 'both'
+    },
+    'trial_not_used': {
+        'text': '🚀 Бесплатная пробная подписка ждёт вас!\n\nМы заметили, что вы ещё не воспользовались пробным доступом. Активируйте его прямо сейчас и оцените все преимущества VPN! 🔥',
+        'enabled': True,
+        'bot_type': 'both'
+    },
+    'trial_active': {
+        'text': '🎉 Ваш пробный доступ ещё активен!\n\nНе упустите возможность протестировать VPN бесплатно! Никаких обязательств — просто подключитесь и наслаждайтесь безопасным интернетом. 🌍',
+        'enabled': True,
+        'bot_type': 'both'
+    }
+}
+
+
+def _is_already_applied_error(error):
+    """Некоторые ошибки ожидаемы (например, поле уже существует)"""
+    error_msg = str(error).lower()
+    return any(keyword in error_msg for keyword in [
+        'already exists', 'существует', 'duplicate', 'уже'
+    ])
+
+
+# Глобальные расширения modules.core, которые скрипты add_*.py переопределяют своим init_app
+_CORE_BINDINGS = ('app', 'db', 'bcrypt', 'fernet', 'mail', 'cache', 'limiter')
+
+
+@contextmanager
+def _core_binding_preserved():
+    """
+    Вернуть привязку modules.core (app, db, cache, ...) после шага миграции
+
+    Старые скрипты add_*.py вызывают init_app(Flask(__name__)) на временном
+    приложении - это заменяет глобальные db/cache в modules.core. Без
+    восстановления следующие шаги получают из get_db() чужой экземпляр
+    SQLAlchemy ("The current Flask app is not registered with this
+    'SQLAlchemy' instance").
+    """
+    import modules.core as core
+    saved = {name: getattr(core, name) for name in _CORE_BINDINGS}
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(core, name, value)
+
+
+def _run_schema_script(app, script_file, script_name):
+    """
+    Загрузить и выполнить скрипт миграции add_*.py в контексте приложения
+
+    Returns:
+        bool: False если файл не найден
+    """
+    script_path = BASE_DIR / script_file
+    if not script_path.exists():
+        return False
+
+    # Загружаем и выполняем скрипт миграции
+    spec = importlib.util.spec_from_file_location(script_name, str(script_path))
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Не удалось загрузить модуль {script_file}")
+
+    # Выполняем скрипт в текущем контексте приложения
+    module = importlib.util.module_from_spec(spec)
+
+    # Для скриптов, которые используют app из app.py
+    # Это нужно для add_yookassa_receipt_field.py и миграций из папки migration/
+    needs_app_substitution = (
+        script_file == 'add_yookassa_receipt_field.py' or
+        'migration/' in script_file
+    )
+
+    original_app = None
+    if needs_app_substitution:
+        # Этот скрипт импортирует app из app.py, нужно подменить
+        try:
+            import app as app_module
+            original_app = getattr(app_module, 'app', None)
+            if original_app is not None:
+                app_module.app = app
+        except ImportError:
+            # Если модуль app не найден, пропускаем
+            pass
+
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        # Восстанавливаем оригинальный app
+        if original_app is not None:
+            import app as app_module
+            app_module.app = original_app
+
+    # Большинство скриптов выполняются при импорте (в with app.app_context())
+    # Проверяем, есть ли функция для явного вызова
+    # Пробуем несколько вариантов имени функции
+    script_base_name = script_name.replace('.py', '')
+    possible_func_names = [
+        'migrate',  # Стандартное имя функции для миграций в папке migration/
+        script_base_name,  # add_branding_fields
+        script_base_name.replace('_', ''),  # addbrandingfields
+    ]
+
+    func = None
+    for func_name in possible_func_names:
+        if hasattr(module, func_name):
+            func = getattr(module, func_name)
+            if callable(func):
+                break
+
+    if func:
+        # Передаем app в функцию, если она принимает параметр
+        import inspect
+        sig = inspect.signature(func)
+        if 'app_instance' in sig.parameters or 'app' in sig.parameters:
+            func(app)
+        else:
+            func()
+
+    return True
+
+
 def run_all_schema_migrations(app=None):
     """
-    Запустить все миграции схемы базы данных
-    
+    Запустить все скрипты миграции add_*.py без учета версии схемы
+
     Args:
         app: Flask приложение (опционально, если None - создаст временное)
-    
+
     Returns:
         bool: True если все миграции выполнены успешно
     """
@@ -23,138 +213,41 @@ def run_all_schema_migrations(app=None):
     print("🔧 ЗАПУСК МИГРАЦИЙ СХЕМЫ БАЗЫ ДАННЫХ")
     print("=" * 80)
     print()
-    
-    # Получаем путь к директории со скриптами
-    base_dir = Path(__file__).parent.absolute()
-    
-    # Список скриптов миграции в порядке выполнения
-    # Важно: порядок имеет значение для зависимостей между таблицами
-    migration_scripts = [
-        ('add_referral_fields.py', 'add_referral_fields'),
-        ('add_user_blocking_fields.py', 'add_user_blocking_fields'),  # Раньше, чтобы is_blocked был доступен
-        ('add_referral_percent_to_user.py', 'add_referral_percent_to_user'),
-        ('add_branding_fields.py', 'add_branding_fields'),
-        ('add_favicon_url_to_branding.py', 'add_favicon_url_to_branding'),  # После add_branding_fields, на случай если favicon_url не был добавлен
-        ('add_yookassa_receipt_field.py', 'add_yookassa_receipt_field'),
-        ('add_squad_ids_to_tariff.py', 'add_squad_ids_to_tariff'),
-        ('add_squad_id_to_promo_code.py', 'add_squad_id_to_promo_code'),
-        ('add_is_admin_to_ticket_message.py', 'add_is_admin_to_ticket_message'),
-        ('add_telegram_message_id_to_payment.py', 'add_telegram_message_id_to_payment'),
-        ('add_button_fields_to_auto_broadcast.py', 'add_button_fields_to_auto_broadcast'),  # Поля кнопок для авторассылки
-        ('add_casino_tables.py', 'add_casino_tables'),  # Таблицы казино
-        ('migration/migrate_add_trial_settings.py', 'migrate_add_trial_settings'),  # Настройки триала
-    ]
-    
+
     success_count = 0
     skipped_count = 0
     error_count = 0
-    
+
     # Используем переданное приложение или создаем временное
-    use_temp_app = app is None
-    
-    if use_temp_app:
-        from flask import Flask
-        from modules.core import init_app
-        app = Flask(__name__)
-        init_app(app)
-    
+    if app is None:
+        app = _create_app()
+
     with app.app_context():
-        for script_file, script_name in migration_scripts:
-            script_path = base_dir / script_file
-            
-            if not script_path.exists():
-                print(f"   ⏭️  {script_file}: файл не найден")
-                skipped_count += 1
-                continue
-            
+        for script_file, script_name in MIGRATION_SCRIPTS:
             print(f"   📦 {script_file}...", end=' ', flush=True)
-            
+
             try:
-                # Загружаем и выполняем скрипт миграции
-                spec = importlib.util.spec_from_file_location(script_name, str(script_path))
-                if spec is None or spec.loader is None:
-                    print("⚠️  Не удалось загрузить модуль")
-                    error_count += 1
+                with _core_binding_preserved():
+                    found = _run_schema_script(app, script_file, script_name)
+                if not found:
+                    print("⏭️  файл не найден")
+                    skipped_count += 1
                     continue
-                
-                # Выполняем скрипт в текущем контексте приложения
-                module = importlib.util.module_from_spec(spec)
-                
-                # Для скриптов, которые используют app из app.py
-                # Это нужно для add_yookassa_receipt_field.py и миграций из папки migration/
-                needs_app_substitution = (
-                    script_file == 'add_yookassa_receipt_field.py' or 
-                    'migration/' in script_file
-                )
-                
-                if needs_app_substitution:
-                    # Этот скрипт импортирует app из app.py, нужно подменить
-                    try:
-                        import app as app_module
-                        original_app = app_module.app if hasattr(app_module, 'app') else None
-                        if hasattr(app_module, 'app'):
-                            app_module.app = app
-                    except ImportError:
-                        # Если модуль app не найден, пропускаем
-                        pass
-                
-                spec.loader.exec_module(module)
-                
-                # Восстанавливаем оригинальный app
-                if needs_app_substitution:
-                    try:
-                        import app as app_module
-                        if hasattr(app_module, 'app') and 'original_app' in locals():
-                            app_module.app = original_app
-                    except ImportError:
-                        pass
-                
-                # Большинство скриптов выполняются при импорте (в with app.app_context())
-                # Проверяем, есть ли функция для явного вызова
-                # Пробуем несколько вариантов имени функции
-                script_base_name = script_name.replace('.py', '')
-                possible_func_names = [
-                    'migrate',  # Стандартное имя функции для миграций в папке migration/
-                    script_base_name,  # add_branding_fields
-                    script_base_name.replace('_', ''),  # addbrandingfields
-                    script_base_name.replace('_', '_'),  # add_branding_fields (то же самое)
-                ]
-                
-                func = None
-                for func_name in possible_func_names:
-                    if hasattr(module, func_name):
-                        func = getattr(module, func_name)
-                        if callable(func):
-                            break
-                
-                if func:
-                    # Передаем app в функцию, если она принимает параметр
-                    import inspect
-                    sig = inspect.signature(func)
-                    if 'app_instance' in sig.parameters or 'app' in sig.parameters:
-                        func(app)
-                    else:
-                        func()
-                
                 success_count += 1
                 print("✅")
-            
+
             except Exception as e:
-                error_msg = str(e)
-                # Некоторые ошибки ожидаемы (например, поле уже существует)
-                if any(keyword in error_msg.lower() for keyword in [
-                    'already exists', 'существует', 'duplicate', 'уже'
-                ]):
+                if _is_already_applied_error(e):
                     print("ℹ️  (уже выполнено)")
                     skipped_count += 1
                     success_count += 1  # Это не ошибка
                 else:
-                    print(f"❌ {error_msg[:100]}")
+                    print(f"❌ {str(e)[:100]}")
                     error_count += 1
                     # Не прерываем выполнение, продолжаем со следующим скриптом
                     import traceback
                     traceback.print_exc()
-    
+
     print()
     print("=" * 80)
     print(f"✅ МИГРАЦИИ СХЕМЫ ЗАВЕРШЕНЫ")
@@ -165,10 +258,303 @@ def run_all_schema_migrations(app=None):
         print(f"   ⚠️  Ошибок: {error_count}")
     print("=" * 80)
     print()
-    
+
     return error_count == 0
 
+
+# ============================================================================
+# ШАГИ МИГРАЦИЙ
+# ============================================================================
+
+def _schema_script_step(script_file, script_name):
+    def step(app):
+        try:
+            if not _run_schema_script(app, script_file, script_name):
+                print(f"   ⏭️  {script_file}: файл не найден")
+        except Exception as e:
+            if not _is_already_applied_error(e):
+                raise
+    return step
+
+
+def _sqlite_script_step(script_file):
+    """Старая миграция SQLite: выполняется в этом процессе, только на существующей SQLite базе"""
+    def step(app):
+        from sqlalchemy import inspect
+        from modules.core import get_db
+
+        db = get_db()
+        if db.engine.dialect.name != 'sqlite':
+            return
+        # Новая база создается целиком из моделей - старые миграции не нужны
+        if 'user' not in inspect(db.engine).get_table_names():
+            return
+        script_path = BASE_DIR / script_file
+        if not script_path.exists():
+            print(f"   ⏭️  {script_file}: файл не найден")
+            return
+
+        db_path = db.engine.url.database
+        # Скрипты ищут базу по SQLALCHEMY_DATABASE_URI или по пути в argv
+        saved_argv, saved_uri = sys.argv, os.environ.get('SQLALCHEMY_DATABASE_URI')
+        sys.argv = [str(script_path), db_path]
+        os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+        # Соединения пула не должны держать базу во время записи скриптом
+        db.engine.dispose()
+        try:
+            runpy.run_path(str(script_path), run_name='__main__')
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f"{script_file} завершился с кодом {e.code}")
+        finally:
+            sys.argv = saved_argv
+            if saved_uri is None:
+                os.environ.pop('SQLALCHEMY_DATABASE_URI', None)
+            else:
+                os.environ['SQLALCHEMY_DATABASE_URI'] = saved_uri
+    return step
+
+
+def _migrate_sqlite_to_postgresql(app):
+    """Перенос данных из SQLite в PostgreSQL, если рядом осталась SQLite база"""
+    if not app.config.get('USE_POSTGRESQL', False):
+        return
+
+    # Ищем SQLite базу в правильном порядке: instance/stealthnet.db, затем stealthnet.db
+    sqlite_paths = [
+        os.path.join(BASE_DIR, 'instance', 'stealthnet.db'),
+        os.path.join(BASE_DIR, 'stealthnet.db')
+    ]
+
+    sqlite_path = None
+    for path in sqlite_paths:
+        if os.path.exists(path):
+            sqlite_path = path
+            break
+
+    if not sqlite_path:
+        # SQLite база не найдена - просто создаем новую базу в PostgreSQL
+        app.logger.info("ℹ️  SQLite база данных не найдена, создается новая база в PostgreSQL")
+        return
+
+    # SQLite база найдена - проверяем миграцию
+    from migrate_to_postgresql import check_migration_needed, migrate_data
+    needed, message = check_migration_needed()
+    if not needed:
+        app.logger.info(f"ℹ️  {message}")
+        return
+
+    app.logger.info("=" * 60)
+    app.logger.info(f"Обнаружена SQLite база данных: {sqlite_path}")
+    app.logger.info("Запуск автоматической миграции в PostgreSQL...")
+    app.logger.info("=" * 60)
+    if not migrate_data():
+        raise RuntimeError("Миграция SQLite -> PostgreSQL завершилась с ошибками")
+    app.logger.info("✅ Миграция завершена успешно")
+
+    # После миграции данных исправляем sequences в PostgreSQL
+    try:
+        from fix_postgresql_sequences import fix_sequences
+        app.logger.info("🔧 Исправление последовательностей PostgreSQL...")
+        database_url = app.config.get('SQLALCHEMY_DATABASE_URI')
+        if fix_sequences(database_url):
+            app.logger.info("✅ Последовательности обновлены")
+        else:
+            app.logger.warning("⚠️  Ошибка при исправлении последовательностей")
+    except Exception as e:
+        app.logger.warning(f"⚠️  Ошибка при исправлении последовательностей: {e}")
+
+
+def _create_tables(app):
+    """Создать отсутствующие таблицы по моделям"""
+    from modules.core import get_db
+    get_db().create_all()
+
+
+def _create_default_auto_broadcast_messages(app):
+    """Создать дефолтные сообщения автоматических рассылок, если их нет"""
+    from modules.core import get_db
+    from modules.models.auto_broadcast import AutoBroadcastMessage
+
+    db = get_db()
+    for msg_type, msg_data in DEFAULT_AUTO_BROADCAST_MESSAGES.items():
+        existing_msg = AutoBroadcastMessage.query.filter_by(message_type=msg_type).first()
+        if not existing_msg:
+            new_msg = AutoBroadcastMessage(
+                message_type=msg_type,
+                message_text=msg_data['text'],
+                enabled=msg_data['enabled'],
+                bot_type=msg_data['bot_type']
+            )
+            db.session.add(new_msg)
+            app.logger.info(f"✅ Создано сообщение: {msg_type}")
+
+
+def _create_referral_stats(app):
+    """Создать журнал реферальных начислений и заполнить статистику рефереров"""
+    _create_tables(app)
+    from modules.referral_ledger import rebuild_referral_stats
+    referrers = rebuild_referral_stats()
+    app.logger.info(f"✅ Реферальная статистика заполнена: {referrers} рефереров")
+
+
+def _rebuild_daily_revenue(app):
+    """Заполнить дневную сводку выручки из уже оплаченных платежей"""
+    from modules.models.payment import rebuild_daily_revenue
+    rows = rebuild_daily_revenue()
+    app.logger.info(f"✅ Сводка daily_revenue заполнена из платежей: {rows} строк")
+
+
+def _add_missing_columns(model, column_names):
+    """Добавить в существующую таблицу колонки модели, которых в ней нет (ALTER TABLE)"""
+    from sqlalchemy import inspect, text
+    from modules.core import get_db
+
+    db = get_db()
+    table = model.__table__
+    existing = {col['name'] for col in inspect(db.engine).get_columns(table.name)}
+    with db.engine.begin() as conn:
+        for name in column_names:
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(dialect=db.engine.dialect)
+            conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {name} {column_type}'))
+            print(f"   ✅ {table.name}.{name} добавлено")
+
+
+def _add_broadcast_job_lease(app):
+    """Колонки аренды задачи рассылки"""
+    from modules.models.broadcast import BroadcastJob
+    _add_missing_columns(BroadcastJob, ['lease_owner', 'lease_expires_at'])
+
+
+def _add_payment_reconcile_schedule(app):
+    """Колонки расписания сверки платежа"""
+    from modules.models.payment import Payment
+    _add_missing_columns(Payment, ['reconcile_next_at', 'reconcile_checks'])
+
+
+def _add_fulfilment_target_expire(app):
+    """Колонка срока подписки задачи выдачи"""
+    from modules.models.payment_job import PaymentFulfilmentJob
+    _add_missing_columns(PaymentFulfilmentJob, ['target_expire_at'])
+
+
+def _fix_encrypted_passwords(app):
+    """Восстановить encrypted_password для старых пользователей из бота"""
+    from fix_encrypted_passwords import fix_encrypted_passwords
+    fix_encrypted_passwords(app)
+
+
+# (версия, название, шаг) - новые шаги только в конец, со следующей версией.
+# Для новой модели (таблицы) достаточно шага _create_tables.
+SCHEMA_MIGRATIONS = [
+    (1 + i, Path(script_file).stem, _sqlite_script_step(script_file))
+    for i, script_file in enumerate(SQLITE_MIGRATION_SCRIPTS)
+] + [
+    (8, 'sqlite_to_postgresql', _migrate_sqlite_to_postgresql),
+    (9, 'create_tables', _create_tables),
+    (10, 'default_auto_broadcast_messages', _create_default_auto_broadcast_messages),
+] + [
+    (11 + i, script_name, _schema_script_step(script_file, script_name))
+    for i, (script_file, script_name) in enumerate(MIGRATION_SCRIPTS)
+] + [
+    (25, 'fix_encrypted_passwords', _fix_encrypted_passwords),
+    (26, 'payment_fulfilment_job', _create_tables),
+    (27, 'referral_commission', _create_referral_stats),
+    (28, 'daily_revenue_backfill', _rebuild_daily_revenue),
+    (29, 'broadcast_job_lease', _add_broadcast_job_lease),
+    (30, 'payment_reconcile_schedule', _add_payment_reconcile_schedule),
+    (31, 'payment_fulfilment_target_expire', _add_fulfilment_target_expire),
+]
+
+SCHEMA_HEAD = SCHEMA_MIGRATIONS[-1][0]
+
+
+def get_schema_version():
+    """
+    Текущая версия схемы
+
+    Returns:
+        int: MAX(version) из schema_version (0 - таблица пуста) или None, если таблицы нет
+    """
+    from modules.core import get_db
+    from modules.models.schema_version import SchemaVersion
+
+    db = get_db()
+    try:
+        return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+    except Exception:
+        db.session.rollback()
+        return None
+
+
+def run_pending_migrations(app=None):
+    """
+    Выполнить шаги SCHEMA_MIGRATIONS, которые еще не применены
+
+    Args:
+        app: Flask приложение (опционально, если None - создаст временное)
+
+    Returns:
+        bool: True если схема актуальна
+    """
+    if app is None:
+        app = _create_app()
+
+    from modules.core import get_db
+    from modules.models.schema_version import SchemaVersion
+
+    db = get_db()
+
+    with app.app_context():
+        current = get_schema_version()
+        if current is not None and current >= SCHEMA_HEAD:
+            print(f"✅ Схема базы данных актуальна (версия {current})")
+            return True
+
+        if current is None:
+            SchemaVersion.__table__.create(db.engine, checkfirst=True)
+            current = 0
+
+        pending = [m for m in SCHEMA_MIGRATIONS if m[0] > current]
+        print("=" * 80)
+        print(f"🔧 МИГРАЦИИ СХЕМЫ: версия {current} -> {SCHEMA_HEAD}, шагов: {len(pending)}")
+        print("=" * 80)
+
+        for version, name, step in pending:
+            print(f"   📦 {version}: {name}...", flush=True)
+            try:
+                with _core_binding_preserved():
+                    step(app)
+                db.session.add(SchemaVersion(version=version, name=name))
+                db.session.commit()
+                print(f"   ✅ {version}: {name}")
+            except Exception as e:
+                db.session.rollback()
+                print(f"   ❌ {version}: {name}: {str(e)[:200]}")
+                import traceback
+                traceback.print_exc()
+                print("   ⚠️  Следующие шаги будут выполнены при следующем запуске")
+                print("=" * 80)
+                return False
+
+        print(f"✅ Схема базы данных обновлена до версии {SCHEMA_HEAD}")
+        print("=" * 80)
+        return True
+
+
+def _create_app():
+    # То же приложение, что при запуске сервера: скрипты из migration/ все равно
+    # импортируют app.py, а второй init_app в этом процессе привязал бы модули,
+    # импортированные позже, к другому экземпляру SQLAlchemy
+    from app import app
+    return app
+
+
 if __name__ == '__main__':
-    success = run_all_schema_migrations()
+    if '--all' in sys.argv[1:]:
+        success = run_all_schema_migrations()
+    else:
+        success = run_pending_migrations()
     sys.exit(0 if success else 1)
-
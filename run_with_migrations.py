@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 """
 Скрипт для запуска приложения с автоматическими миграциями.
-Проверяет наличие БД и выполняет все миграции перед запуском app.py
+Запускает API (gunicorn или app.py); новые миграции схемы применяет app.init_database()
 """
 
+import importlib.util
 import os
 import sys
-import subprocess
 from pathlib import Path
 
 def find_database():
@@ -44,63 +44,32 @@ if __name__ == "__main__":
         print("=" * 60)
         print()
         
-        # Ищем базу данных
+        # Миграции выполняются при запуске приложения (app.init_database):
+        # применяются только новые шаги из run_schema_migrations.SCHEMA_MIGRATIONS
         db_path = find_database()
-        
-        # Проверяем наличие базы данных
         if db_path and db_path.exists():
             print(f"✅ База данных найдена: {db_path}")
-            print("🔄 Выполнение миграций...")
-            print()
-            
-            # Список миграций в правильном порядке
-            migrations = [
-                ("migration/migrate_all.py", True),  # (путь, требует db_path)
-                ("migration/migrate_add_active_languages_currencies.py", False),
-                ("migration/migrate_add_bonus_days.py", False),
-                ("migration/migrate_add_bot_config.py", False),
-                ("migration/migrate_add_hwid_device_limit.py", False),
-                ("migration/migrate_add_quick_download.py", False),
-                ("migration/migrate_add_theme_colors.py", False),
-            ]
-            
-            # Выполняем миграции
-            for migration, needs_db_path in migrations:
-                migration_path = Path(migration)
-                if migration_path.exists():
-                    print(f"📦 Выполнение {migration}...")
-                    try:
-                        if needs_db_path:
-                            result = subprocess.run(
-                                [sys.executable, str(migration_path), str(db_path)],
-                                check=False,
-                                timeout=300
-                            )
-                        else:
-                            result = subprocess.run(
-                                [sys.executable, str(migration_path)],
-                                check=False,
-                                timeout=300
-                            )
-                        
-                        if result.returncode == 0:
-                            print(f"   ✅ {migration} выполнен успешно")
-                        else:
-                            print(f"   ⚠️  {migration} завершился с кодом {result.returncode} (возможно уже выполнено)")
-                    except subprocess.TimeoutExpired:
-                        print(f"   ❌ Таймаут при выполнении {migration}")
-                    except Exception as e:
-                        print(f"   ⚠️  Ошибка: {e}")
-                    print()
-                else:
-                    print(f"   ⚠️  Файл миграции не найден: {migration}")
-            
-            print("✅ Миграции завершены")
-            print()
         else:
-            print("ℹ️  База данных не найдена")
-            print("ℹ️  База данных будет создана автоматически при первом запуске app.py")
-            print()
+            print("ℹ️  База данных будет создана автоматически при первом запуске")
+        print()
+        
+        # Production: gunicorn (wsgi.py + gunicorn_config.py)
+        # APP_SERVER=dev - встроенный сервер Flask (app.py)
+        if os.getenv("APP_SERVER", "gunicorn").lower() == "gunicorn":
+            if importlib.util.find_spec("gunicorn") is None:
+                print("⚠️  gunicorn не установлен, используется встроенный сервер Flask")
+            else:
+                try:
+                    print("🚀 Запуск приложения через gunicorn...")
+                    print("=" * 60)
+                    print()
+                    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "wsgi:application"]
+                    print(f"📝 Запуск: {' '.join(command)}")
+                    print()
+                    os.execv(sys.executable, command)
+                except OSError as e:
+                    print(f"❌ Ошибка при запуске gunicorn: {e}")
+                    print("   Используется встроенный сервер Flask")
         
         # Запускаем приложение
         print("🚀 Запуск приложения app.py...")
@@ -113,9 +82,9 @@ if __name__ == "__main__":
             # Пробуем найти в рабочей директории
             app_path = Path("/app/app.py")
             if not app_path.exists():
-                print(f"❌ Ошибка: app.py не найден")
+                print("❌ Ошибка: app.py не найден")
                 print(f"   Текущая директория: {os.getcwd()}")
-                print(f"   Проверяемые пути: app.py, /app/app.py")
+                print("   Проверяемые пути: app.py, /app/app.py")
                 sys.exit(1)
         
         # Заменяем текущий процесс на app.py
@@ -134,7 +103,7 @@ if __name__ == "__main__":
             os.execv(sys.executable, [sys.executable, app_to_run])
         except OSError as e:
             print(f"❌ Ошибка при запуске app.py: {e}")
-            print(f"   Попытка альтернативного запуска...")
+            print("   Попытка альтернативного запуска...")
             # Альтернативный способ - через subprocess (но это создаст дочерний процесс)
             import subprocess
             sys.exit(subprocess.call([sys.executable, app_to_run]))
@@ -6,39 +6,23 @@
 
 import os
 import sys
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
-import requests
 
 # Добавляем путь к проекту
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 load_dotenv()
 
-def get_user_subscription_info(remnawave_uuid):
-    """Получить информацию о подписке пользователя из RemnaWave API"""
-    try:
-        api_url = os.getenv("API_URL")
-        admin_token = os.getenv("ADMIN_TOKEN")
-        
-        if not api_url or not admin_token:
-            return None
-        
-        headers = {"Authorization": f"Bearer {admin_token}"}
-        response = requests.get(
-            f"{api_url}/api/users/{remnawave_uuid}",
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            user_data = data.get('response', {})
-            return user_data
-        return None
-    except Exception as e:
-        print(f"Error getting user info for {remnawave_uuid}: {e}")
-        return None
+# Защита от наложения запусков (cron-слот планировщика и ручной запуск скрипта)
+_run_lock = threading.Lock()
+LOCK_FILE = os.path.join(tempfile.gettempdir(), 'stealthnet_auto_broadcasts.lock')
+USER_QUERY_CHUNK = 500
+
 
 def parse_iso_datetime(iso_string):
     """Парсинг ISO datetime строки"""
@@ -52,177 +36,206 @@ def parse_iso_datetime(iso_string):
     except:
         return None
 
-def send_telegram_message(bot_token, chat_id, text, photo_file=None):
-    """Отправить сообщение в Telegram"""
+
+def classify_expiry(expire_at, now):
+    """Какие уведомления положены пользователю: (подписка через 3 дня, триал истекает)"""
+    three_days_later = now + timedelta(days=3)
+
+    # Проверяем, истекает ли подписка через 3 дня
+    days_until_expiry = (expire_at - now).days
+
+    # Проверяем подписку, истекающую через 3 дня
+    # Отправляем за 3 дня до окончания
+    is_subscription_expiring = (
+        days_until_expiry == 3 and 
+        expire_at > now and 
+        expire_at <= three_days_later
+    )
+
+    # Проверяем триал, который заканчивается сегодня или завтра
+    # Триал обычно 3 дня, поэтому если осталось 0-1 день - это триал
+    is_trial_expiring = (
+        days_until_expiry <= 1 and
+        expire_at > now and
+        expire_at <= (now + timedelta(days=1))
+    )
+    return is_subscription_expiring, is_trial_expiring
+
+
+def get_expiring_subscriptions(now):
+    """
+    Подписки, истекающие в ближайшие 3 дня: {uuid: expire_at}
+
+    Один постраничный обход /api/users вместо GET /api/users/{uuid} на каждого пользователя.
+    """
+    from modules.remnawave import get_remnawave_client
+    rw = get_remnawave_client()
+    if not rw.configured:
+        return {}
+
+    window_end = now + timedelta(days=3)
+    expiring = {}
+    scanned = 0
+    for u in rw.iter_users():
+        scanned += 1
+        expire_at = parse_iso_datetime(u.get('expireAt'))
+        if u.get('uuid') and expire_at and now < expire_at <= window_end:
+            expiring[u['uuid']] = expire_at
+    print(f"Проверено {scanned} пользователей RemnaWave, истекают в ближайшие 3 дня: {len(expiring)}")
+    return expiring
+
+
+def _acquire_process_lock():
+    """Файловая блокировка между процессами; None - рассылка уже идет"""
     try:
-        if photo_file:
-            url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
-            caption = text[:1024] if len(text) > 1024 else text
-            files = {'photo': photo_file}
-            data = {
-                "chat_id": chat_id,
-                "caption": caption,
-                "parse_mode": "HTML"
-            }
-            response = requests.post(url, files=files, data=data, timeout=30)
-        else:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            payload = {
-                "chat_id": chat_id,
-                "text": text,
-                "parse_mode": "HTML"
-            }
-            response = requests.post(url, json=payload, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            return True, result.get('result', {}).get('message_id')
-        else:
-            error_data = response.json() if response.content else {}
-            error_msg = error_data.get('description', f'HTTP {response.status_code}')
-            return False, error_msg
-    except Exception as e:
-        return False, str(e)
+        import fcntl
+    except ImportError:
+        return open(LOCK_FILE, 'w')
+    lock_file = open(LOCK_FILE, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def send_auto_broadcasts(app=None):
+    """
+    Отправить автоматические рассылки
+
+    Args:
+        app: Flask приложение (из планировщика - работающее приложение; при запуске
+             скрипта вручную создается новое)
+
+    Returns:
+        dict со статистикой или None, если предыдущий запуск еще не завершен
+    """
+    if not _run_lock.acquire(blocking=False):
+        print("⚠️  Автоматическая рассылка уже выполняется, запуск пропущен")
+        return None
+    lock_file = _acquire_process_lock()
+    if lock_file is None:
+        _run_lock.release()
+        print("⚠️  Автоматическая рассылка уже выполняется в другом процессе, запуск пропущен")
+        return None
+
+    try:
+        if app is None:
+            from modules import core
+            app = core.app
+        if app is None:
+            from flask import Flask
+            from modules.core import init_app
+            app = Flask(__name__)
+            init_app(app)
+
+        with app.app_context():
+            return _send_auto_broadcasts()
+    finally:
+        lock_file.close()
+        _run_lock.release()
+
 
-def send_auto_broadcasts():
-    """Отправить автоматические рассылки"""
-    from flask import Flask
-    from modules.core import init_app, get_db
+def _send_auto_broadcasts():
     from modules.models.user import User
     from modules.models.auto_broadcast import AutoBroadcastMessage
+    from modules.broadcast_queue import send_telegram_limited, BROADCAST_WORKERS
+
+    started = time.monotonic()
+
+    # Получаем настройки автоматических рассылок
+    subscription_msg = AutoBroadcastMessage.query.filter_by(
+        message_type='subscription_expiring_3days'
+    ).first()
+    
+    trial_msg = AutoBroadcastMessage.query.filter_by(
+        message_type='trial_expiring'
+    ).first()
     
-    app = Flask(__name__)
-    init_app(app)
+    # Получаем токены ботов
+    old_bot_token = os.getenv("CLIENT_BOT_TOKEN")
+    new_bot_token = os.getenv("CLIENT_BOT_V2_TOKEN") or os.getenv("CLIENT_BOT_TOKEN")
     
-    with app.app_context():
-        db = get_db()
-        
-        # Получаем настройки автоматических рассылок
-        subscription_msg = AutoBroadcastMessage.query.filter_by(
-            message_type='subscription_expiring_3days'
-        ).first()
-        
-        trial_msg = AutoBroadcastMessage.query.filter_by(
-            message_type='trial_expiring'
-        ).first()
-        
-        # Получаем токены ботов
-        old_bot_token = os.getenv("CLIENT_BOT_TOKEN")
-        new_bot_token = os.getenv("CLIENT_BOT_V2_TOKEN") or os.getenv("CLIENT_BOT_TOKEN")
-        
-        if not old_bot_token and not new_bot_token:
-            print("❌ Bot tokens not configured")
-            return False
-        
-        # Текущая дата
-        now = datetime.now(timezone.utc)
-        three_days_later = now + timedelta(days=3)
-        
-        # Получаем всех пользователей с telegram_id и remnawave_uuid
-        users = User.query.filter(
+    if not old_bot_token and not new_bot_token:
+        print("❌ Bot tokens not configured")
+        return {'error': 'Bot tokens not configured'}
+
+    def pick_token(msg):
+        # Выбираем токен бота
+        if not msg or not msg.enabled:
+            return None
+        if msg.bot_type == 'old' or msg.bot_type == 'both':
+            return old_bot_token
+        if msg.bot_type == 'new':
+            return new_bot_token
+        return None
+
+    subscription_token = pick_token(subscription_msg)
+    trial_token = pick_token(trial_msg)
+
+    stats = {
+        'candidates': 0,
+        'subscription_sent': 0,
+        'subscription_failed': 0,
+        'trial_sent': 0,
+        'trial_failed': 0
+    }
+
+    if not subscription_token and not trial_token:
+        print("ℹ️  Автоматические рассылки отключены")
+        return stats
+
+    # Текущая дата
+    now = datetime.now(timezone.utc)
+
+    # Кандидаты - только пользователи с истекающей подпиской
+    expiring = get_expiring_subscriptions(now)
+
+    # Формируем задания на отправку
+    tasks = []
+    uuids = list(expiring)
+    for i in range(0, len(uuids), USER_QUERY_CHUNK):
+        chunk = uuids[i:i + USER_QUERY_CHUNK]
+        rows = User.query.with_entities(User.email, User.telegram_id, User.remnawave_uuid).filter(
+            User.remnawave_uuid.in_(chunk),
             User.telegram_id != None,
-            User.telegram_id != '',
-            User.remnawave_uuid != None,
-            User.remnawave_uuid != ''
+            User.telegram_id != ''
         ).all()
-        
-        subscription_sent = 0
-        subscription_failed = 0
-        trial_sent = 0
-        trial_failed = 0
-        
-        print(f"Проверяем {len(users)} пользователей...")
-        
-        for user in users:
-            try:
-                # Получаем информацию о подписке
-                user_info = get_user_subscription_info(user.remnawave_uuid)
-                if not user_info:
-                    continue
-                
-                expire_at_str = user_info.get('expireAt')
-                if not expire_at_str:
-                    continue
-                
-                expire_at = parse_iso_datetime(expire_at_str)
-                if not expire_at:
-                    continue
-                
-                # Проверяем, истекает ли подписка через 3 дня
-                days_until_expiry = (expire_at - now).days
-                
-                # Проверяем подписку, истекающую через 3 дня
-                # Отправляем за 3 дня до окончания
-                is_subscription_expiring = (
-                    days_until_expiry == 3 and 
-                    expire_at > now and 
-                    expire_at <= three_days_later
-                )
-                
-                # Проверяем триал, который заканчивается сегодня или завтра
-                # Триал обычно 3 дня, поэтому если осталось 0-1 день - это триал
-                is_trial_expiring = (
-                    days_until_expiry <= 1 and
-                    expire_at > now and
-                    expire_at <= (now + timedelta(days=1))
-                )
-                
-                # Отправляем уведомление о подписке
-                if is_subscription_expiring and subscription_msg and subscription_msg.enabled:
-                    message_text = subscription_msg.message_text
-                    bot_type = subscription_msg.bot_type
-                    
-                    # Выбираем токен бота
-                    bot_token = None
-                    if bot_type == 'old' or bot_type == 'both':
-                        bot_token = old_bot_token
-                    elif bot_type == 'new':
-                        bot_token = new_bot_token
-                    
-                    if bot_token:
-                        success, result = send_telegram_message(bot_token, user.telegram_id, message_text)
-                        if success:
-                            subscription_sent += 1
-                            print(f"✅ Отправлено уведомление о подписке пользователю {user.email} (ID: {user.telegram_id})")
-                        else:
-                            subscription_failed += 1
-                            print(f"❌ Ошибка отправки подписки пользователю {user.email}: {result}")
-                
-                # Отправляем уведомление о триале
-                if is_trial_expiring and trial_msg and trial_msg.enabled:
-                    message_text = trial_msg.message_text
-                    bot_type = trial_msg.bot_type
-                    
-                    # Выбираем токен бота
-                    bot_token = None
-                    if bot_type == 'old' or bot_type == 'both':
-                        bot_token = old_bot_token
-                    elif bot_type == 'new':
-                        bot_token = new_bot_token
-                    
-                    if bot_token:
-                        success, result = send_telegram_message(bot_token, user.telegram_id, message_text)
-                        if success:
-                            trial_sent += 1
-                            print(f"✅ Отправлено уведомление о триале пользователю {user.email} (ID: {user.telegram_id})")
-                        else:
-                            trial_failed += 1
-                            print(f"❌ Ошибка отправки триала пользователю {user.email}: {result}")
-            
-            except Exception as e:
-                print(f"❌ Ошибка обработки пользователя {user.email}: {e}")
-                import traceback
-                traceback.print_exc()
-                continue
-        
-        print()
-        print("=" * 80)
-        print("✅ АВТОМАТИЧЕСКАЯ РАССЫЛКА ЗАВЕРШЕНА")
-        print(f"   Подписка: отправлено {subscription_sent}, ошибок {subscription_failed}")
-        print(f"   Триал: отправлено {trial_sent}, ошибок {trial_failed}")
-        print("=" * 80)
-        
-        return True
+        for email, telegram_id, remnawave_uuid in rows:
+            is_subscription_expiring, is_trial_expiring = classify_expiry(expiring[remnawave_uuid], now)
+            if is_subscription_expiring and subscription_token:
+                tasks.append(('subscription', subscription_token, telegram_id, email, subscription_msg.message_text))
+            if is_trial_expiring and trial_token:
+                tasks.append(('trial', trial_token, telegram_id, email, trial_msg.message_text))
+    stats['candidates'] = len(tasks)
+
+    def deliver(task):
+        kind, bot_token, telegram_id, email, message_text = task
+        result = send_telegram_limited(bot_token, telegram_id, message_text)
+        return kind, telegram_id, email, result
+
+    with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS) as pool:
+        for kind, telegram_id, email, result in pool.map(deliver, tasks):
+            label = "подписке" if kind == 'subscription' else "триале"
+            if result['ok']:
+                stats[f'{kind}_sent'] += 1
+                print(f"✅ Отправлено уведомление о {label} пользователю {email} (ID: {telegram_id})")
+            else:
+                stats[f'{kind}_failed'] += 1
+                print(f"❌ Ошибка отправки уведомления о {label} пользователю {email}: {result['error']}")
+
+    stats['elapsed'] = round(time.monotonic() - started, 1)
+
+    print()
+    print("=" * 80)
+    print("✅ АВТОМАТИЧЕСКАЯ РАССЫЛКА ЗАВЕРШЕНА")
+    print(f"   Подписка: отправлено {stats['subscription_sent']}, ошибок {stats['subscription_failed']}")
+    print(f"   Триал: отправлено {stats['trial_sent']}, ошибок {stats['trial_failed']}")
+    print(f"   Время: {stats['elapsed']}с")
+    print("=" * 80)
+    
+    return stats
 
 if __name__ == '__main__':
     try:
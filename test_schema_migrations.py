@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Тестирование миграций схемы на пустой базе (холодный старт)
+
+Первый запуск app.init_database() на пустой SQLite базе должен выполнить все
+шаги SCHEMA_MIGRATIONS за один раз. Проект копируется во временную папку:
+старые скрипты add_*.py создают свое приложение и ищут базу в instance/ рядом
+с собой, поэтому запуск в рабочей копии затронул бы ее базу.
+"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COPY_IGNORE = shutil.ignore_patterns('.git', 'frontend', 'instance', '__pycache__', '*.db')
+
+
+def _schema_head():
+    sys.path.insert(0, BASE_DIR)
+    from run_schema_migrations import SCHEMA_HEAD
+    return SCHEMA_HEAD
+
+
+BOOT_INIT_DATABASE = [sys.executable, '-c', 'from app import init_database; init_database()']
+BOOT_STANDALONE = [sys.executable, 'run_schema_migrations.py']
+
+
+def _boot(project_dir, command):
+    """Один запуск миграций в отдельном процессе (init_database() - как при старте gunicorn)"""
+    env = dict(os.environ, CACHE_TYPE='null')
+    for name in ('DATABASE_URL', 'DB_TYPE'):
+        env.pop(name, None)
+    return subprocess.run(
+        command,
+        cwd=project_dir, env=env, capture_output=True, text=True, timeout=600
+    )
+
+
+def _applied_versions(project_dir):
+    db_path = os.path.join(project_dir, 'instance', 'stealthnet.db')
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')]
+    finally:
+        conn.close()
+
+
+def _check_cold_start(command):
+    head = _schema_head()
+    with tempfile.TemporaryDirectory() as tmp:
+        project_dir = os.path.join(tmp, 'project')
+        shutil.copytree(BASE_DIR, project_dir, ignore=COPY_IGNORE)
+
+        first = _boot(project_dir, command)
+        versions = _applied_versions(project_dir)
+        assert versions == list(range(1, head + 1)), (
+            f"Применены версии {versions}, ожидались 1..{head}\n{first.stdout[-4000:]}\n{first.stderr[-4000:]}"
+        )
+
+        # Повторный запуск: новых шагов нет
+        second = _boot(project_dir, command)
+        assert f"Схема базы данных актуальна (версия {head})" in second.stdout, second.stdout[-4000:]
+
+
+def test_cold_start_applies_all_migrations():
+    """Пустая база: все версии 1..SCHEMA_HEAD за первый запуск init_database()"""
+    _check_cold_start(BOOT_INIT_DATABASE)
+
+
+def test_cold_start_standalone_runner():
+    """То же для ручного запуска python3 run_schema_migrations.py"""
+    _check_cold_start(BOOT_STANDALONE)
+
+
+if __name__ == '__main__':
+    test_cold_start_applies_all_migrations()
+    test_cold_start_standalone_runner()
+    print("✅ Миграции на пустой базе выполнены за один запуск")
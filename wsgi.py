@@ -0,0 +1,23 @@
+"""
+WSGI точка входа StealthNET API для production
+
+    gunicorn -c gunicorn_config.py wsgi:application
+
+Приложение собирается при импорте app.py (модули API регистрируют маршруты на
+общем экземпляре из modules.core), поэтому create_app() возвращает этот экземпляр.
+С preload_app=True импорт происходит один раз в master процессе gunicorn, и воркеры
+получают уже загруженные модули через fork (copy-on-write).
+
+Подготовка БД и планировщик здесь не запускаются - ими управляет gunicorn_config.py:
+  - init_database() - один раз в master процессе до форка воркеров;
+  - start_scheduler() - ровно в одном воркере.
+"""
+
+
+def create_app():
+    """Flask приложение со всеми зарегистрированными маршрутами"""
+    from app import app
+    return app
+
+
+application = create_app()